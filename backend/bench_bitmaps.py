@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Completion bitmap benchmark
+Builds years of synthetic history for a set of habits and compares answering
+"current streak, best streak, completion rate and gaps" from habit_logs rows
+with answering it from the yearly bitmaps: memory held, bytes stored, time
+per habit, and backfill throughput.
+
+    python bench_bitmaps.py --habits 1000 --years 5 --rate 0.8
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import tracemalloc
+import uuid
+from datetime import date, timedelta
+
+from services.completion_bitmap import YEAR_BYTES, CompletionHistory, encode, from_logs
+
+
+def history(habits: int, years: int, rate: float, today: date):
+    """habit_logs rows for `habits` habits, each day done with probability `rate`"""
+    first = date(today.year - years + 1, 1, 1)
+    logs = []
+    for h in range(habits):
+        habit_id = str(uuid.uuid4())
+        day = first
+        while day <= today:
+            if random.random() < rate:
+                logs.append({
+                    'id': str(uuid.uuid4()),
+                    'habit_id': habit_id,
+                    'user_id': f'user_{h}',
+                    'xp_earned': 15,
+                    'notes': None,
+                    'completed_at': f'{day.isoformat()}T08:30:00',
+                    'completed_on': day.isoformat(),
+                })
+            day += timedelta(days=1)
+    return logs
+
+
+def from_rows(logs: list, today: date, start: date) -> tuple:
+    """What the logs-only path does: sort the days and walk them"""
+    days = sorted(date.fromisoformat(log['completed_on']) for log in logs)
+    best = run = 0
+    previous = None
+    for day in days:
+        run = run + 1 if previous is not None and (day - previous).days == 1 else 1
+        best = max(best, run)
+        previous = day
+    current = run if previous is not None and (today - previous).days <= 1 else 0
+    done = {day for day in days if start <= day <= today}
+    gaps, missed_from = [], None
+    day = start
+    while day <= today + timedelta(days=1):
+        if day not in done and day <= today:
+            missed_from = missed_from or day
+        elif missed_from is not None:
+            gaps.append((missed_from, day - timedelta(days=1)))
+            missed_from = None
+        day += timedelta(days=1)
+    return current, best, len(done) / ((today - start).days + 1), gaps
+
+
+def from_bitmaps(rows: list, today: date, start: date) -> tuple:
+    history = CompletionHistory.from_rows(rows)
+    return (history.current_streak(today), history.best_streak(),
+            history.completion_rate(start, today), history.gaps(start, today))
+
+
+def measure(build):
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def timed(call, items):
+    latencies = []
+    for item in items:
+        started = time.perf_counter()
+        call(item)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return latencies
+
+
+def report(label: str, latencies: list):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label:<24} {len(latencies):>7} habits  p50 {statistics.median(latencies):8.1f} us  "
+          f"p99 {p99:8.1f} us  total {sum(latencies) / 1000:8.1f} ms")
+
+
+def main(args):
+    random.seed(args.seed)
+    today = date.today()
+    start = today - timedelta(days=args.window - 1)
+    logs, logs_memory = measure(lambda: history(args.habits, args.years, args.rate, today))
+
+    started = time.perf_counter()
+    bitmaps = from_logs(logs)
+    backfill = time.perf_counter() - started
+    rows, bitmap_memory = measure(lambda: [
+        {'habit_id': habit_id, 'user_id': user_id, 'year': year, 'days': encode(bitmap)}
+        for (habit_id, user_id, year), bitmap in bitmaps.items()
+    ])
+
+    by_habit_logs, by_habit_rows = {}, {}
+    for log in logs:
+        by_habit_logs.setdefault(log['habit_id'], []).append(log)
+    for row in rows:
+        by_habit_rows.setdefault(row['habit_id'], []).append(row)
+
+    print(f"{args.habits} habits x {args.years} years at {args.rate:.0%}: "
+          f"{len(logs)} habit_logs rows, {len(rows)} bitmap rows")
+    print(f"{'':<24} {'in memory':>12} {'stored':>12}")
+    print(f"{'habit_logs':<24} {logs_memory / 1024:>9.0f} KiB "
+          f"{len(json.dumps(logs)) / 1024:>9.0f} KiB")
+    print(f"{'bitmaps':<24} {bitmap_memory / 1024:>9.0f} KiB "
+          f"{len(rows) * YEAR_BYTES / 1024:>9.0f} KiB")
+    print(f"Backfill: {len(logs) / backfill:,.0f} logs/s ({backfill * 1000:.1f} ms)")
+
+    habit_ids = list(by_habit_logs)
+    for habit_id in habit_ids[:50]:
+        # Same answers either way
+        assert from_rows(by_habit_logs[habit_id], today, start) == \
+            from_bitmaps(by_habit_rows[habit_id], today, start), habit_id
+    report('from habit_logs', timed(lambda h: from_rows(by_habit_logs[h], today, start), habit_ids))
+    report('from bitmaps', timed(lambda h: from_bitmaps(by_habit_rows[h], today, start), habit_ids))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--habits', type=int, default=1000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--rate', type=float, default=0.8, help='share of days completed')
+    parser.add_argument('--window', type=int, default=90, help='days covered by rate and gaps')
+    parser.add_argument('--seed', type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark
+Profiles StreakService.complete_habit and the leaderboard routes against
+the in-memory or SQLite engine, so no Supabase project or network is needed.
+
+    python bench_offline.py --engine memory --users 1000 --completions 5000
+    python bench_offline.py --engine sqlite --sqlite-path /tmp/bench.db
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "offline")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "offline")
+os.environ.setdefault("SECRET_KEY", "offline")
+
+import httpx
+import posthog
+
+from services.database import set_engine
+from services.memory_database import InMemoryDatabase
+from services.sqlite_database import SQLiteDatabase
+
+
+async def seed(engine, users: int, habits_per_user: int) -> list:
+    habit_ids = []
+    for u in range(users):
+        await engine.create_user({
+            'clerk_user_id': f'user_{u}',
+            'username': f'user_{u}',
+            'email': f'user_{u}@bench.local',
+            'total_points': u,
+            'level': 1,
+            'xp': u,
+        })
+        for h in range(habits_per_user):
+            habit = await engine.create_habit({
+                'user_id': f'user_{u}',
+                'title': f'Habit {h}',
+                'frequency': 'daily',
+                'difficulty': 'medium',
+                'streak': 0,
+                'best_streak': 0,
+                'total_completions': 0,
+            })
+            habit_ids.append((f'user_{u}', habit['id']))
+    return habit_ids
+
+
+def report(label: str, latencies: list, elapsed: float):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label:<28} {len(latencies):>7} calls  {len(latencies) / elapsed:>9.0f} ops/s  "
+          f"p50 {statistics.median(latencies):6.2f} ms  p99 {p99:6.2f} ms")
+
+
+async def timed(calls, concurrency: int):
+    latencies = []
+    queue = list(calls)
+
+    async def worker():
+        while queue:
+            call = queue.pop()
+            started = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, time.perf_counter() - started
+
+
+async def main(args):
+    # Analytics are out of scope for storage throughput
+    posthog.capture = lambda *a, **k: None
+
+    engine = SQLiteDatabase(args.sqlite_path) if args.engine == 'sqlite' else InMemoryDatabase()
+    set_engine(engine)
+
+    from main import app
+    from services.streak_service import StreakService
+
+    habit_ids = await seed(engine, args.users, args.habits)
+    streak_service = StreakService()
+
+    completions = [
+        (lambda user_id=user_id, habit_id=habit_id: streak_service.complete_habit(user_id, habit_id))
+        for user_id, habit_id in habit_ids[:args.completions]
+    ]
+    report('StreakService.complete_habit', *await timed(completions, args.concurrency))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        for path in ('/leaderboard/users', '/leaderboard/clans', '/leaderboard/user/user_0/rank'):
+            calls = [(lambda path=path: client.get(path))] * args.requests
+            report(f'GET {path}', *await timed(calls, args.concurrency))
+
+    if hasattr(engine, 'close'):
+        await engine.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--engine', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--sqlite-path', default=':memory:')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--habits', type=int, default=4, help='habits per user')
+    parser.add_argument('--completions', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per leaderboard route')
+    parser.add_argument('--concurrency', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Single-flight benchmark
+Fires N concurrent identical requests at /leaderboard/users,
+/leaderboard/clans and /badges/all through the ASGI app, backed by the
+PostgREST stand-in, and counts the upstream requests each burst costs with
+the hot-read layer bypassed and with it in place. The users and badges routes
+already read through the leaderboard snapshot and badge catalog, whose
+reloads are single-flight themselves; the clan leaderboard is where each
+request otherwise costs 1 + N queries.
+
+    python bench_single_flight.py --requests 500 --clans 20 --latency 0.005
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "offline")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "offline")
+os.environ.setdefault("SECRET_KEY", "offline")
+
+import httpx
+
+import services.database as database
+from fake_postgrest import FakePostgrest
+from models.badge import BADGE_DEFINITIONS
+from services.badge_catalog import badge_catalog
+from services.database import SupabaseDatabase
+from services.leaderboard_snapshot import leaderboard_snapshot
+from services.single_flight import SingleFlight, hot_reads
+
+ROUTES = ['/leaderboard/users', '/leaderboard/clans', '/badges/all']
+
+
+async def seed(fake: FakePostgrest, engine, users: int, clans: int):
+    for n in range(users):
+        await engine.create_user({'clerk_user_id': f'bench_{n}', 'username': f'bench_{n}',
+                                  'email': f'bench_{n}@bench.local', 'total_points': n,
+                                  'level': 1, 'xp': n})
+    for n in range(clans):
+        clan = await engine.create_clan({'name': f'clan_{n}', 'total_xp': n, 'owner_id': f'bench_{n}',
+                                         'member_count': 0, 'max_members': 50})
+        for member in range(n, users, clans):
+            await engine.join_clan(clan['id'], f'bench_{member}', f'bench_{member}')
+    await engine.upsert_badges(BADGE_DEFINITIONS)
+
+
+async def burst(app, fake: FakePostgrest, path: str, requests: int) -> dict:
+    # Start every burst cold: no snapshot, catalog or micro-cached response
+    leaderboard_snapshot.snapshot = badge_catalog.snapshot = None
+    hot_reads.clear()
+    fake.request_count = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[client.get(path) for _ in range(requests)])
+        elapsed = time.perf_counter() - started
+    assert all(response.status_code == 200 for response in responses)
+    return {'upstream': fake.request_count, 'seconds': elapsed}
+
+
+async def main(args):
+    from main import app
+
+    fake = FakePostgrest(latency=args.latency)
+    engine = SupabaseDatabase(fake.client())
+    database._engine = engine
+    await seed(fake, engine, args.users, args.clans)
+
+    print(f"{args.requests} concurrent identical requests, {args.clans} clans, "
+          f"{args.latency * 1000:.0f} ms per upstream request")
+    print(f"{'route':<22}{'bypassed':>12}{'single-flight':>16}{'wall bypassed':>16}{'wall sf':>10}")
+    run = SingleFlight.run
+    for path in ROUTES:
+        # Bypassed: every request runs the route body itself
+        SingleFlight.run = lambda self, key, call: call()
+        bypassed = await burst(app, fake, path, args.requests)
+        SingleFlight.run = run
+        coalesced = await burst(app, fake, path, args.requests)
+        print(f"{path:<22}{bypassed['upstream']:>12}{coalesced['upstream']:>16}"
+              f"{bypassed['seconds']:>15.2f}s{coalesced['seconds']:>9.2f}s")
+    print(hot_reads.metrics())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--clans', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds per upstream request')
+    asyncio.run(main(parser.parse_args()))
@@ -8,6 +8,40 @@ class Settings(BaseSettings):
     SUPABASE_JWT_SECRET: str
     SUPABASE_SERVICE_ROLE_KEY: Optional[str] = None
     
+    # Database engine: "supabase" (PostgREST), "postgres" (asyncpg),
+    # or the offline "memory" and "sqlite" engines
+    DATABASE_BACKEND: str = "supabase"
+    DATABASE_URL: Optional[str] = None
+    SQLITE_PATH: str = "habituate.db"
+    DATABASE_POOL_MIN_SIZE: int = 2
+    DATABASE_POOL_MAX_SIZE: int = 10
+    # asyncpg's per-connection prepared statement cache (0 behind a
+    # transaction-mode pooler such as PgBouncer)
+    DATABASE_STATEMENT_CACHE_SIZE: int = 256
+    
+    # Optional read replica for lag-tolerant reads (leaderboards, discover,
+    # badges, clan chat): a Supabase replica API URL or a Postgres DSN.
+    # A user's reads stay on the primary for N seconds after they write.
+    SUPABASE_REPLICA_URL: Optional[str] = None
+    DATABASE_REPLICA_URL: Optional[str] = None
+    READ_REPLICA_PIN_SECONDS: float = 5.0
+    
+    # Storage call deadlines, read retries with jittered backoff, and the
+    # per-table circuit breaker (opens after N straight failures)
+    DB_TIMEOUT_SECONDS: float = 3.0
+    DB_READ_RETRIES: int = 2
+    DB_RETRY_BASE_SECONDS: float = 0.05
+    DB_BREAKER_THRESHOLD: int = 5
+    DB_BREAKER_RESET_SECONDS: float = 10.0
+    
+    # XP ledger compaction into user_profiles
+    XP_LEDGER_BATCH_SIZE: int = 500
+    XP_LEDGER_COMPACT_INTERVAL: float = 1.0
+    
+    # Clan XP write coalescing (flush every N ms or N buffered events)
+    CLAN_XP_FLUSH_INTERVAL_MS: int = 250
+    CLAN_XP_FLUSH_MAX_EVENTS: int = 200
+    
     # PostHog (Optional)
     POSTHOG_API_KEY: Optional[str] = None
     POSTHOG_HOST: str = "https://app.posthog.com"
@@ -15,6 +49,65 @@ class Settings(BaseSettings):
     # Redis (Optional)
     REDIS_URL: Optional[str] = None
     
+    # Row cache for profiles, habits and clans: "none", "memory" (per
+    # process LRU) or "redis" (shared, needs REDIS_URL)
+    CACHE_BACKEND: str = "none"
+    CACHE_TTL_SECONDS: float = 60.0
+    CACHE_MAX_ENTRIES: int = 10000
+    
+    # Badge catalog is held in memory and reloaded after this many seconds
+    BADGE_CATALOG_MAX_AGE_SECONDS: float = 300.0
+    
+    # Top users held in memory for the leaderboard routes
+    LEADERBOARD_SNAPSHOT_SIZE: int = 1000
+    LEADERBOARD_SNAPSHOT_MAX_AGE_SECONDS: float = 15.0
+    
+    # Complete habits with the complete_habit procedure (migration 007); set
+    # false to fall back to the step-by-step Python path
+    HABIT_COMPLETION_PROCEDURE: bool = True
+    
+    # Most completions an offline client may send to /habits/sync at once
+    HABIT_SYNC_MAX_COMPLETIONS: int = 500
+    
+    # Deferred side effects (badge checks, level-ups, analytics) after a
+    # completion or award: worker tasks, retries and the crash-recovery lease
+    SIDE_EFFECT_WORKERS: int = 4
+    SIDE_EFFECT_MAX_ATTEMPTS: int = 5
+    SIDE_EFFECT_RETRY_BASE_SECONDS: float = 1.0
+    SIDE_EFFECT_LEASE_SECONDS: float = 60.0
+    SIDE_EFFECT_SWEEP_INTERVAL_SECONDS: float = 30.0
+    SIDE_EFFECT_QUEUE_SIZE: int = 10000
+    
+    # Idempotency-Key responses for completions and XP awards: "memory" (per
+    # process) or "redis" (shared, needs REDIS_URL). A key held by a request
+    # still running elsewhere is waited on for up to IDEMPOTENCY_LOCK_SECONDS.
+    IDEMPOTENCY_BACKEND: str = "memory"
+    IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    IDEMPOTENCY_LOCK_SECONDS: float = 30.0
+    IDEMPOTENCY_MAX_ENTRIES: int = 10000
+    
+    # Outbox relay: xp_update, badge_earned and streak_milestone events drained
+    # to Socket.IO and analytics in batches (needs migration 010)
+    OUTBOX_BATCH_SIZE: int = 200
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 0.5
+    OUTBOX_LEASE_SECONDS: float = 30.0
+    
+    # Nightly reset of streaks not extended since before yesterday (needs
+    # migration 011); the hour is local time, -1 turns the sweep off
+    STREAK_SWEEP_HOUR: int = 3
+    STREAK_SWEEP_CHUNK_SIZE: int = 1000
+    STREAK_SWEEP_MAX_ROWS_PER_SECOND: float = 5000.0
+    
+    # Identical concurrent leaderboard/badge reads share one upstream call,
+    # and its response is reused for this many seconds (0 only coalesces)
+    HOT_READ_CACHE_SECONDS: float = 1.0
+    
+    # Largest page a paginated route returns, whatever `limit` asks for
+    PAGE_SIZE_MAX: int = 500
+    
+    # Longest window GET /profile/{id}/activity returns, whatever `days` asks for
+    ACTIVITY_DAYS_MAX: int = 366
+    
     # JWT
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
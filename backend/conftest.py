@@ -0,0 +1,12 @@
+"""Shared pytest setup for the backend tests"""
+import os
+import sys
+from pathlib import Path
+
+# config.Settings refuses to load without these, tests never talk to a real project
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "test-jwt-secret")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+sys.path.insert(0, str(Path(__file__).parent))
@@ -0,0 +1,477 @@
+"""
+Local stand-in for the Supabase PostgREST API
+Serves the subset of PostgREST used by services/database.py from memory,
+with optional injected latency, so the async data layer can be exercised
+and load-tested without network access.
+"""
+
+import asyncio
+import json
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import httpx
+from supabase import AsyncClient
+from supabase.lib.client_options import AsyncClientOptions
+
+from services.completion_bitmap import decode, encode, from_logs, mark
+from services.events import badge_event, streak_event, xp_event
+from services.habit_rules import STREAK_BONUSES, completion_reason, habit_xp, next_streak
+from services.leveling import level_from_xp
+
+FAKE_SUPABASE_URL = "http://supabase.test"
+
+# Column defaults from migrations/ beyond id/version/created_at
+COLUMN_DEFAULTS = {
+    "side_effect_jobs": {"status": "pending", "attempts": 0, "last_error": None},
+}
+
+
+def _coerce(value: str):
+    if value == "null":
+        return None
+    if value in ("true", "false"):
+        return value == "true"
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def _matches(row: dict, column: str, expression: str) -> bool:
+    op, _, raw = expression.partition(".")
+    current = row.get(column)
+    if op == "eq":
+        return current == _coerce(raw) or str(current) == raw
+    if op == "neq":
+        return not (current == _coerce(raw) or str(current) == raw)
+    if op == "in":
+        options = raw.strip("()").split(",") if raw.strip("()") else []
+        return str(current) in options
+    if op in ("gt", "gte", "lt", "lte"):
+        if current is None:
+            return False
+        other = _coerce(raw)
+        if isinstance(current, str) or isinstance(other, str):
+            current, other = str(current), str(other)
+        return {
+            "gt": current > other,
+            "gte": current >= other,
+            "lt": current < other,
+            "lte": current <= other,
+        }[op]
+    if op == "is":
+        return current is _coerce(raw)
+    raise ValueError(f"Unsupported PostgREST operator: {op}")
+
+
+def _split_terms(text: str) -> List[str]:
+    """Split a logic filter on the commas outside parentheses and quotes"""
+    terms, depth, quoted, current = [], 0, False, ""
+    for i, char in enumerate(text):
+        if char == '"' and (i == 0 or text[i - 1] != "\\"):
+            quoted = not quoted
+        elif not quoted and char in "()":
+            depth += 1 if char == "(" else -1
+        elif not quoted and depth == 0 and char == ",":
+            terms.append(current)
+            current = ""
+            continue
+        current += char
+    return terms + [current] if current else terms
+
+
+def _matches_logic(row: dict, operator: str, terms: str) -> bool:
+    """Evaluate `or=(a.lt.1,and(a.eq.1,id.lt.x))` style filters"""
+    results = []
+    for term in _split_terms(terms):
+        if term.startswith(("and(", "or(")):
+            nested, _, inner = term.partition("(")
+            results.append(_matches_logic(row, nested, inner[:-1]))
+            continue
+        column, _, expression = term.partition(".")
+        op, _, raw = expression.partition(".")
+        if raw.startswith('"') and raw.endswith('"'):
+            raw = raw[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+        results.append(_matches(row, column, f"{op}.{raw}"))
+    return any(results) if operator == "or" else all(results)
+
+
+class FakePostgrest:
+    """In-memory PostgREST stand-in served through an httpx transport"""
+
+    RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, List[dict]] = defaultdict(list)
+        self.request_count = 0
+        # Status every request gets while set, like a gateway in front of a down database
+        self.outage_status: Optional[int] = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def seed(self, table: str, rows: List[dict]):
+        for row in rows:
+            self._insert(table, dict(row))
+
+    def client(self) -> AsyncClient:
+        """Build a Supabase async client whose HTTP traffic is served by this stand-in"""
+        transport = httpx.MockTransport(self.handle)
+        return AsyncClient(
+            FAKE_SUPABASE_URL,
+            "fake-key",
+            AsyncClientOptions(httpx_client=httpx.AsyncClient(transport=transport)),
+        )
+
+    def _insert(self, table: str, row: dict) -> dict:
+        for column, default in COLUMN_DEFAULTS.get(table, {}).items():
+            row.setdefault(column, default)
+        row.setdefault("id", str(uuid.uuid4()))
+        if table in ("user_profiles", "habits"):
+            row.setdefault("version", 0)
+        row.setdefault("created_at", datetime.now().isoformat())
+        self.tables[table].append(row)
+        self._after_insert(table, row)
+        return row
+
+    # Triggers from migrations/010_outbox.sql, 012_completion_bitmaps.sql and
+    # 013_daily_user_activity.sql
+    def _outbox(self, event):
+        if event is not None:
+            now = datetime.now(timezone.utc).isoformat()
+            self._insert("outbox_events", {**event, "created_at": now, "locked_until": now})
+
+    def _after_insert(self, table: str, row: dict):
+        if table == "xp_transactions":
+            user = next(u for u in self.view_user_profiles_live() if u["clerk_user_id"] == row["user_id"])
+            self._outbox(xp_event(row, user.get("xp", 0) + user["pending_xp"]))
+            self._activity(row["user_id"], str(row["created_at"])[:10])["xp_earned"] += row["amount"]
+        elif table == "user_badges":
+            badge = next((b for b in self.tables["badges"] if b.get("id") == row.get("badge_id")), None)
+            if badge is not None:
+                self._outbox(badge_event(row, badge))
+        elif table == "habit_logs":
+            day = date.fromisoformat(str(row["completed_on"])[:10])
+            bitmap = next((b for b in self.tables["habit_completion_bitmaps"]
+                           if b["habit_id"] == row["habit_id"] and b["year"] == day.year), None)
+            if bitmap is None:
+                self._insert("habit_completion_bitmaps", {"habit_id": row["habit_id"], "user_id": row["user_id"],
+                                                          "year": day.year, "days": "\\x" + encode(mark(0, day))})
+            else:
+                bitmap["days"] = "\\x" + encode(mark(decode(bitmap["days"]), day))
+            self._activity(row["user_id"], day.isoformat())["completions"] += 1
+
+    def _activity(self, user_id: str, day: str) -> dict:
+        activity = next((a for a in self.tables["daily_user_activity"]
+                         if a["user_id"] == user_id and a["day"] == day), None)
+        if activity is None:
+            activity = self._insert("daily_user_activity", {"user_id": user_id, "day": day,
+                                                            "completions": 0, "xp_earned": 0})
+        return activity
+
+    def _after_update(self, table: str, before: dict, row: dict):
+        if table == "habits" and before.get("streak") != row.get("streak"):
+            self._outbox(streak_event(before, row))
+
+    def _upsert(self, table: str, on_conflict: str, payload: List[dict], request: httpx.Request) -> List[dict]:
+        ignore = "ignore-duplicates" in request.headers.get("prefer", "")
+        keys = on_conflict.split(",")
+        rows = []
+        for row in payload:
+            existing = next((r for r in self.tables[table]
+                             if all(r.get(key) == row.get(key) for key in keys)), None)
+            if existing is None:
+                rows.append(dict(self._insert(table, dict(row))))
+            elif not ignore:
+                existing.update(row)
+                rows.append(dict(existing))
+        return rows
+
+    def _filter(self, table: str, params: httpx.QueryParams) -> List[dict]:
+        view = getattr(self, f"view_{table}", None)
+        rows = view() if view else self.tables[table]
+        for column, expression in params.multi_items():
+            if column in self.RESERVED_PARAMS:
+                continue
+            if column in ("or", "and"):
+                rows = [row for row in rows if _matches_logic(row, column, expression[1:-1])]
+                continue
+            rows = [row for row in rows if _matches(row, column, expression)]
+        return rows
+
+    # SQL functions from migrations/, each runs atomically like a single statement
+    def rpc_record_xp_transaction(self, p_user_id: str, p_amount: int, p_reason: str) -> List[dict]:
+        if any(row.get("clerk_user_id") == p_user_id for row in self.tables["user_profiles"]):
+            self._insert("xp_transactions", {
+                "user_id": p_user_id,
+                "amount": p_amount,
+                "reason": p_reason,
+                "compacted_at": None,
+            })
+        return [row for row in self.view_user_profiles_live() if row["clerk_user_id"] == p_user_id]
+
+    def rpc_compact_xp_ledger(self, p_batch_size: int = 500) -> int:
+        batch = [entry for entry in self.tables["xp_transactions"] if entry.get("compacted_at") is None]
+        batch = batch[:p_batch_size]
+        compacted_at = datetime.now().isoformat()
+        for entry in batch:
+            for row in self.tables["user_profiles"]:
+                if row.get("clerk_user_id") == entry["user_id"]:
+                    row["xp"] = row.get("xp", 0) + entry["amount"]
+                    row["total_points"] = row.get("total_points", 0) + entry["amount"]
+                    row["level"] = level_from_xp(row["xp"])
+                    row["version"] = row.get("version", 0) + 1
+            entry["compacted_at"] = compacted_at
+        return len(batch)
+
+    def rpc_apply_clan_xp(self, p_clans: List[dict], p_members: List[dict]) -> None:
+        for delta in p_clans:
+            for row in self.tables["clans"]:
+                if str(row.get("id")) == str(delta["id"]):
+                    row["total_xp"] = row.get("total_xp", 0) + delta["total_xp"]
+        for delta in p_members:
+            for row in self.tables["clan_members"]:
+                if row.get("clan_id") == delta["clan_id"] and row.get("user_id") == delta["user_id"]:
+                    row["xp_contributed"] = row.get("xp_contributed", 0) + delta["xp_contributed"]
+        return None
+
+    def _clan(self, clan_id) -> dict:
+        return next((row for row in self.tables["clans"] if str(row.get("id")) == str(clan_id)), None)
+
+    def _add_member(self, clan_id, user_id: str, username: str, role: str) -> dict:
+        member = self._insert("clan_members", {
+            "clan_id": clan_id,
+            "user_id": user_id,
+            "username": username,
+            "xp_contributed": 0,
+            "role": role,
+            "joined_at": datetime.now().isoformat(),
+        })
+        for row in self.tables["user_profiles"]:
+            if row.get("clerk_user_id") == user_id:
+                row["clan_id"] = clan_id
+        return dict(member)
+
+    def rpc_create_clan_with_owner(self, p_clan: dict) -> dict:
+        clan = self._insert("clans", {**p_clan, "total_xp": 0, "level": 1, "member_count": 1})
+        owner = next((row for row in self.tables["user_profiles"]
+                      if row.get("clerk_user_id") == clan["owner_id"]), None)
+        self._add_member(clan["id"], clan["owner_id"], owner["username"] if owner else "Owner", "leader")
+        return dict(clan)
+
+    def rpc_join_clan(self, p_clan_id: str, p_user_id: str, p_username: str) -> dict:
+        clan = self._clan(p_clan_id)
+        if clan is None:
+            return {"status": "not_found"}
+        for row in self.tables["clan_members"]:
+            if row.get("clan_id") == p_clan_id and row.get("user_id") == p_user_id:
+                return {"status": "joined", "member": dict(row)}
+        if clan["member_count"] >= clan["max_members"]:
+            return {"status": "full"}
+        clan["member_count"] += 1
+        return {"status": "joined", "member": self._add_member(p_clan_id, p_user_id, p_username, "member")}
+
+    def rpc_leave_clan(self, p_clan_id: str, p_user_id: str) -> dict:
+        clan = self._clan(p_clan_id)
+        if clan is None:
+            return {"status": "not_found"}
+        members = self.tables["clan_members"]
+        remaining = [row for row in members
+                     if not (row.get("clan_id") == p_clan_id and row.get("user_id") == p_user_id)]
+        if len(remaining) == len(members):
+            return {"status": "not_member"}
+        self.tables["clan_members"] = remaining
+        clan["member_count"] = max(clan["member_count"] - 1, 0)
+        for row in self.tables["user_profiles"]:
+            if row.get("clerk_user_id") == p_user_id and row.get("clan_id") == p_clan_id:
+                row["clan_id"] = None
+        return {"status": "left"}
+
+    def rpc_complete_habit(self, p_habit_id: str, p_user_id: str, p_notes, p_today: str) -> dict:
+        today = date.fromisoformat(p_today)
+        habit = next((row for row in self.tables["habits"] if row.get("id") == p_habit_id), None)
+        if habit is None:
+            return {"status": "not_found"}
+        streak, best_streak = next_streak(habit, today)
+        xp_earned = habit_xp(habit.get("difficulty"), streak)
+        completed_on = {"habit_id": p_habit_id, "user_id": p_user_id, "completed_on": p_today}
+        if any(all(row.get(key) == value for key, value in completed_on.items())
+               for row in self.tables["habit_logs"]):
+            # ON CONFLICT (habit_id, user_id, completed_on) DO NOTHING
+            return {"status": "already_completed", "habit": dict(habit)}
+        now = datetime.now().isoformat()
+        completion = self._insert("habit_logs", {
+            **completed_on,
+            "xp_earned": xp_earned,
+            "notes": p_notes,
+            "completed_at": now,
+        })
+        before = dict(habit)
+        habit.update({
+            "streak": streak,
+            "best_streak": best_streak,
+            "total_completions": (habit.get("total_completions") or 0) + 1,
+            "last_completed": now,
+            "version": habit.get("version", 0) + 1,
+        })
+        self._after_update("habits", before, habit)
+
+        streak_bonus = None
+        awards = [(xp_earned, completion_reason(habit))]
+        if streak in STREAK_BONUSES:
+            bonus_type, bonus_xp = STREAK_BONUSES[streak]
+            streak_bonus = {"reason": f"{bonus_type}_streak_bonus", "xp": bonus_xp}
+            awards.append((bonus_xp, streak_bonus["reason"]))
+        user = None
+        for amount, reason in awards:
+            users = self.rpc_record_xp_transaction(p_user_id, amount, reason)
+            user = users[0] if users else None
+        return {
+            "status": "completed",
+            "habit": dict(habit),
+            "completion": dict(completion),
+            "xp_earned": xp_earned,
+            "streak_bonus": streak_bonus,
+            "user": user,
+        }
+
+    def rpc_claim_side_effect_jobs(self, p_limit: int, p_lease_seconds: float) -> List[dict]:
+        now = datetime.now(timezone.utc)
+        due = sorted(
+            (job for job in self.tables["side_effect_jobs"]
+             if job["status"] == "pending"
+             and datetime.fromisoformat(job["locked_until"]) <= now),
+            key=lambda job: job["locked_until"]
+        )[:p_limit]
+        for job in due:
+            job["locked_until"] = (now + timedelta(seconds=p_lease_seconds)).isoformat()
+        return [dict(job) for job in due]
+
+    def rpc_claim_outbox_events(self, p_limit: int, p_lease_seconds: float) -> List[dict]:
+        now = datetime.now(timezone.utc)
+        due = sorted(
+            (event for event in self.tables["outbox_events"]
+             if datetime.fromisoformat(event["locked_until"]) <= now),
+            key=lambda event: event["created_at"]
+        )[:p_limit]
+        for event in due:
+            event["locked_until"] = (now + timedelta(seconds=p_lease_seconds)).isoformat()
+        return [dict(event) for event in due]
+
+    def rpc_backfill_completion_bitmaps(self, p_habit_ids=None) -> int:
+        wanted = lambda row: p_habit_ids is None or row["habit_id"] in p_habit_ids
+        self.tables["habit_completion_bitmaps"] = [
+            row for row in self.tables["habit_completion_bitmaps"] if not wanted(row)
+        ]
+        bitmaps = from_logs(row for row in self.tables["habit_logs"] if wanted(row))
+        for (habit_id, user_id, year), bitmap in bitmaps.items():
+            self._insert("habit_completion_bitmaps", {"habit_id": habit_id, "user_id": user_id,
+                                                      "year": year, "days": "\\x" + encode(bitmap)})
+        return len(bitmaps)
+
+    def rpc_decay_streaks(self, p_cutoff: str, p_after, p_limit: int) -> dict:
+        chunk = sorted(
+            (habit for habit in self.tables["habits"]
+             if (habit.get("streak") or 0) > 0
+             and habit.get("last_completed") and str(habit["last_completed"])[:10] < p_cutoff
+             and (p_after is None or habit["id"] > p_after)),
+            key=lambda habit: habit["id"]
+        )[:p_limit]
+        for habit in chunk:
+            habit.update({"streak": 0, "version": habit.get("version", 0) + 1})
+        reset = [habit["id"] for habit in chunk]
+        return {"reset": reset, "cursor": reset[-1] if reset else None}
+
+    # Views from migrations/, computed from the base tables on every read
+    def view_user_profiles_live(self) -> List[dict]:
+        pending = defaultdict(int)
+        for entry in self.tables["xp_transactions"]:
+            if entry.get("compacted_at") is None:
+                pending[entry["user_id"]] += entry["amount"]
+        return [
+            {**row, "pending_xp": pending[row.get("clerk_user_id")]}
+            for row in self.tables["user_profiles"]
+        ]
+
+    @staticmethod
+    def _project(rows: List[dict], select: str) -> List[dict]:
+        """Keep only the selected columns unless the select list has a `*`"""
+        parts = [part.strip() for part in select.split(",")]
+        if any(part == "*" or part.endswith("(*)") for part in parts):
+            return rows
+        return [{part: row[part] for part in parts if part in row} for row in rows]
+
+    def _embed(self, row: dict, embeds: List[str]) -> dict:
+        """Resolve many-to-one embeds such as `*, badges(*)` through `<name>_id`"""
+        for embedded in embeds:
+            foreign_key = f"{embedded.rstrip('s')}_id"
+            matches = [r for r in self.tables[embedded] if r.get("id") == row.get(foreign_key)]
+            row[embedded] = dict(matches[0]) if matches else None
+        return row
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.request_count += 1
+        if self.outage_status:
+            return httpx.Response(self.outage_status, text="upstream unavailable")
+        if self.latency:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(self.latency)
+            finally:
+                self.in_flight -= 1
+
+        table = request.url.path.rstrip("/").split("/")[-1]
+        params = request.url.params
+
+        if "/rpc/" in request.url.path:
+            function = getattr(self, f"rpc_{table}", None)
+            if function is None:
+                return httpx.Response(404, json={"message": f"function {table} not found"})
+            return httpx.Response(200, json=function(**json.loads(request.content or b"{}")))
+
+        if request.method == "GET":
+            select = params.get("select", "*")
+            embeds = [part.strip()[:-3] for part in select.split(",") if part.strip().endswith("(*)")]
+            rows = [self._embed(dict(row), embeds) for row in self._filter(table, params)]
+            for order in reversed(params.get("order", "").split(",")):
+                if not order:
+                    continue
+                column, _, direction = order.partition(".")
+                rows.sort(
+                    key=lambda row: (row.get(column) is None, row.get(column) or 0),
+                    reverse=direction.startswith("desc"),
+                )
+            offset = int(params.get("offset", 0))
+            if "limit" in params:
+                rows = rows[offset:offset + int(params["limit"])]
+            else:
+                rows = rows[offset:]
+            rows = self._project(rows, select)
+            return httpx.Response(200, json=rows)
+
+        if request.method == "POST":
+            payload = json.loads(request.content or b"[]")
+            payload = payload if isinstance(payload, list) else [payload]
+            if "on_conflict" in params:
+                return httpx.Response(201, json=self._upsert(table, params["on_conflict"], payload, request))
+            return httpx.Response(201, json=[self._insert(table, dict(row)) for row in payload])
+
+        if request.method == "PATCH":
+            updates = json.loads(request.content or b"{}")
+            rows = self._filter(table, params)
+            for row in rows:
+                before = dict(row)
+                row.update(updates)
+                self._after_update(table, before, row)
+            return httpx.Response(200, json=[dict(row) for row in rows])
+
+        if request.method == "DELETE":
+            rows = self._filter(table, params)
+            self.tables[table] = [row for row in self.tables[table] if row not in rows]
+            return httpx.Response(200, json=rows)
+
+        return httpx.Response(405, json={"message": f"{request.method} not supported"})
@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
@@ -7,6 +8,19 @@ import socketio
 
 from routes import auth, habits, profile, leaderboard, clans, badges, quests, discover, xp
 from config import settings
+from services.database import close_engine, get_engine
+from services import dataloader, replica, resilience
+from services.cache import CachedDatabase
+from services.idempotency import IdempotencyKeyInProgressError, IdempotencyKeyReusedError, idempotency
+from services.outbox import outbox_relay, user_room
+from services.pagination import InvalidCursorError
+from services.projection import InvalidFieldsError
+from services.side_effects import side_effects
+from services.single_flight import hot_reads
+from services.streak_decay import streak_decay
+from services.warmup import warm_up
+from services.xp_ledger import XPLedgerCompactor
+from services.clan_xp_buffer import clan_xp_buffer
 
 load_dotenv()
 
@@ -23,9 +37,23 @@ async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Starting HABITUATE Backend...")
     print("🔌 Socket.IO server initialized")
+    await warm_up()
+    xp_compactor = XPLedgerCompactor()
+    xp_compactor.start()
+    side_effects.start()
+    outbox_relay.start(sio.emit)
+    streak_decay.start()
     yield
     # Shutdown
     print("👋 Shutting down HABITUATE Backend...")
+    await streak_decay.stop()
+    await outbox_relay.stop()
+    # Before the clan buffer closes, so contributions from drained jobs get flushed
+    await side_effects.stop()
+    await clan_xp_buffer.close()
+    await xp_compactor.stop()
+    await idempotency.close()
+    await close_engine()
 
 app = FastAPI(
     title="HABITUATE API",
@@ -43,6 +71,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# One DataLoader identity map per request
+@app.middleware("http")
+async def dataloader_scope(request: Request, call_next):
+    with dataloader.loader_scope(get_engine()):
+        return await call_next(request)
+
+# Reads answered from their last good result while the database is failing
+@app.middleware("http")
+async def stale_warning(request: Request, call_next):
+    with resilience.stale_scope() as served:
+        response = await call_next(request)
+    if served:
+        response.headers["Warning"] = '110 - "Response is Stale"'
+    return response
+
+# Who the request acts for, so replica reads respect their own recent writes
+@app.middleware("http")
+async def replica_pinning(request: Request, call_next):
+    user_id = request.headers.get("x-user-id") or request.query_params.get("user_id")
+    with replica.acting_as(user_id):
+        return await call_next(request)
+
+@app.exception_handler(resilience.DatabaseUnavailableError)
+async def database_unavailable(request: Request, exc: resilience.DatabaseUnavailableError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database temporarily unavailable"},
+        headers={"Retry-After": str(int(settings.DB_BREAKER_RESET_SECONDS))}
+    )
+
+# Bad `fields=` projections and tampered cursors are client errors
+@app.exception_handler(InvalidFieldsError)
+@app.exception_handler(InvalidCursorError)
+async def invalid_query(request: Request, exc: ValueError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+# An Idempotency-Key sent again with other parameters, or still held elsewhere
+@app.exception_handler(IdempotencyKeyReusedError)
+async def idempotency_key_reused(request: Request, exc: IdempotencyKeyReusedError):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+@app.exception_handler(IdempotencyKeyInProgressError)
+async def idempotency_key_in_progress(request: Request, exc: IdempotencyKeyInProgressError):
+    return JSONResponse(status_code=409, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(habits.router, prefix="/habits", tags=["Habits"])
@@ -66,6 +139,30 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "Backend is running"}
 
+def _engine_layer(kind):
+    """The wrapper of type `kind` in the engine stack, if there is one"""
+    engine = get_engine()
+    while engine is not None and not isinstance(engine, kind):
+        engine = getattr(engine, 'inner', None)
+    return engine
+
+@app.get("/metrics")
+async def metrics():
+    cache = _engine_layer(CachedDatabase)
+    resilient = _engine_layer(resilience.ResilientDatabase)
+    return {
+        "clan_xp_buffer": clan_xp_buffer.metrics,
+        "dataloader": dataloader.metrics(),
+        "replica": replica.metrics(),
+        "single_flight": hot_reads.metrics(),
+        "idempotency": idempotency.metrics(),
+        "side_effects": side_effects.metrics(),
+        "outbox": outbox_relay.metrics(),
+        "streak_decay": streak_decay.metrics(),
+        "cache": cache.metrics() if cache else None,
+        "resilience": resilient.metrics() if resilient else None
+    }
+
 # Socket.IO event handlers
 @sio.event
 async def connect(sid, environ, auth):
@@ -80,6 +177,8 @@ async def connect(sid, environ, auth):
     
     if user_id:
         await sio.save_session(sid, {'user_id': user_id})
+        # xp_update, badge_earned and streak_milestone arrive through this room
+        await sio.enter_room(sid, user_room(user_id))
     
     await sio.emit('connected', {'sid': sid}, room=sid)
 
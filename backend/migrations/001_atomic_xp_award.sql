@@ -0,0 +1,31 @@
+-- Atomic XP awards and optimistic concurrency for multi-field writes
+-- Apply with: psql "$DATABASE_URL" -f migrations/001_atomic_xp_award.sql
+
+ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 0;
+ALTER TABLE habits ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 0;
+
+-- Mirrors LEVEL_THRESHOLDS in services/leveling.py, keep both in sync
+CREATE OR REPLACE FUNCTION level_from_xp(p_xp integer)
+RETURNS integer
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT count(*)::integer
+    FROM unnest(ARRAY[
+        0, 200, 400, 800, 1200, 1800, 2600, 3600, 4800, 6200,
+        8000, 10000, 12500, 15000, 18000, 22000, 27000, 33000, 40000, 50000
+    ]) AS threshold
+    WHERE threshold <= greatest(p_xp, 0)
+$$;
+
+-- Adds XP in a single statement and returns the updated profile, so
+-- concurrent awards for the same user can never overwrite each other
+CREATE OR REPLACE FUNCTION award_user_xp(p_user_id text, p_amount integer)
+RETURNS SETOF user_profiles
+LANGUAGE sql AS $$
+    UPDATE user_profiles
+    SET xp = xp + p_amount,
+        total_points = total_points + p_amount,
+        level = level_from_xp(xp + p_amount),
+        version = version + 1
+    WHERE clerk_user_id = p_user_id
+    RETURNING *
+$$;
@@ -0,0 +1,72 @@
+-- Append-only XP ledger, folded into user_profiles by the background compactor
+-- Apply with: psql "$DATABASE_URL" -f migrations/002_xp_ledger.sql
+
+CREATE TABLE IF NOT EXISTS xp_transactions (
+    id bigserial PRIMARY KEY,
+    user_id text NOT NULL,
+    amount integer NOT NULL,
+    reason text,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    compacted_at timestamptz
+);
+
+CREATE INDEX IF NOT EXISTS xp_transactions_pending_idx
+    ON xp_transactions (user_id) WHERE compacted_at IS NULL;
+CREATE INDEX IF NOT EXISTS xp_transactions_history_idx
+    ON xp_transactions (user_id, created_at);
+
+-- Profiles plus the XP still waiting in the ledger; the API adds
+-- pending_xp onto xp/total_points when it reads a profile
+CREATE OR REPLACE VIEW user_profiles_live AS
+SELECT p.*, COALESCE(pending.amount, 0)::integer AS pending_xp
+FROM user_profiles p
+LEFT JOIN LATERAL (
+    SELECT sum(x.amount) AS amount
+    FROM xp_transactions x
+    WHERE x.user_id = p.clerk_user_id AND x.compacted_at IS NULL
+) pending ON true;
+
+-- Records an award without touching (or locking) the profile row
+CREATE OR REPLACE FUNCTION record_xp_transaction(p_user_id text, p_amount integer, p_reason text)
+RETURNS SETOF user_profiles_live
+LANGUAGE sql AS $$
+    INSERT INTO xp_transactions (user_id, amount, reason)
+    SELECT p_user_id, p_amount, p_reason
+    WHERE EXISTS (SELECT 1 FROM user_profiles WHERE clerk_user_id = p_user_id);
+
+    SELECT * FROM user_profiles_live WHERE clerk_user_id = p_user_id;
+$$;
+
+-- Folds up to p_batch_size pending entries into user_profiles in a single
+-- statement, so readers see each entry either pending or compacted, never both
+CREATE OR REPLACE FUNCTION compact_xp_ledger(p_batch_size integer DEFAULT 500)
+RETURNS integer
+LANGUAGE sql AS $$
+    WITH batch AS (
+        SELECT id FROM xp_transactions
+        WHERE compacted_at IS NULL
+        ORDER BY id
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    ), folded AS (
+        UPDATE xp_transactions x
+        SET compacted_at = now()
+        FROM batch
+        WHERE x.id = batch.id
+        RETURNING x.user_id, x.amount
+    ), totals AS (
+        SELECT user_id, sum(amount)::integer AS amount, count(*) AS entries
+        FROM folded
+        GROUP BY user_id
+    ), applied AS (
+        UPDATE user_profiles p
+        SET xp = p.xp + totals.amount,
+            total_points = p.total_points + totals.amount,
+            level = level_from_xp(p.xp + totals.amount),
+            version = p.version + 1
+        FROM totals
+        WHERE p.clerk_user_id = totals.user_id
+        RETURNING p.id
+    )
+    SELECT COALESCE(sum(entries), 0)::integer FROM totals
+$$;
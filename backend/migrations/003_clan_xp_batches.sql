@@ -0,0 +1,19 @@
+-- Batched clan XP writes from the in-process coalescing buffer
+-- Apply with: psql "$DATABASE_URL" -f migrations/003_clan_xp_batches.sql
+
+-- Applies a whole flush in one transaction. Deltas arrive as row-shaped JSON
+-- ({"id", "total_xp"} for clans, {"clan_id", "user_id", "xp_contributed"}
+-- for members) so jsonb_populate_recordset types them like the real columns.
+CREATE OR REPLACE FUNCTION apply_clan_xp(p_clans jsonb, p_members jsonb)
+RETURNS void
+LANGUAGE sql AS $$
+    UPDATE clans c
+    SET total_xp = c.total_xp + d.total_xp
+    FROM jsonb_populate_recordset(NULL::clans, p_clans) d
+    WHERE c.id = d.id;
+
+    UPDATE clan_members m
+    SET xp_contributed = m.xp_contributed + d.xp_contributed
+    FROM jsonb_populate_recordset(NULL::clan_members, p_members) d
+    WHERE m.clan_id = d.clan_id AND m.user_id = d.user_id;
+$$;
@@ -0,0 +1,83 @@
+-- Clan create, join and leave as single-call transactional procedures
+-- Apply with: psql "$DATABASE_URL" -f migrations/004_clan_procedures.sql
+--
+-- Join and leave lock the clan row first, so the capacity check and the
+-- member_count change cannot interleave with another join. Outcomes come
+-- back as {"status": ...} so every engine maps them to the same errors.
+
+CREATE OR REPLACE FUNCTION create_clan_with_owner(p_clan jsonb)
+RETURNS jsonb
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_clan clans;
+BEGIN
+    INSERT INTO clans (name, description, icon, is_private, max_members, owner_id,
+                       total_xp, level, member_count)
+    SELECT r.name, r.description, r.icon, r.is_private, r.max_members, r.owner_id, 0, 1, 1
+    FROM jsonb_populate_record(NULL::clans, p_clan) r
+    RETURNING * INTO v_clan;
+
+    INSERT INTO clan_members (clan_id, user_id, username, xp_contributed, role, joined_at)
+    SELECT v_clan.id, v_clan.owner_id,
+           COALESCE((SELECT username FROM user_profiles WHERE clerk_user_id = v_clan.owner_id), 'Owner'),
+           0, 'leader', now();
+
+    UPDATE user_profiles SET clan_id = v_clan.id WHERE clerk_user_id = v_clan.owner_id;
+
+    RETURN to_jsonb(v_clan);
+END
+$$;
+
+CREATE OR REPLACE FUNCTION join_clan(p_clan_id clans.id%TYPE, p_user_id text, p_username text)
+RETURNS jsonb
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_clan clans;
+    v_member clan_members;
+BEGIN
+    SELECT * INTO v_clan FROM clans WHERE id = p_clan_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    SELECT * INTO v_member FROM clan_members WHERE clan_id = p_clan_id AND user_id = p_user_id;
+    IF FOUND THEN
+        RETURN jsonb_build_object('status', 'joined', 'member', to_jsonb(v_member));
+    END IF;
+
+    IF v_clan.member_count >= v_clan.max_members THEN
+        RETURN jsonb_build_object('status', 'full');
+    END IF;
+
+    INSERT INTO clan_members (clan_id, user_id, username, xp_contributed, role, joined_at)
+    VALUES (p_clan_id, p_user_id, p_username, 0, 'member', now())
+    RETURNING * INTO v_member;
+
+    UPDATE clans SET member_count = member_count + 1 WHERE id = p_clan_id;
+    UPDATE user_profiles SET clan_id = p_clan_id WHERE clerk_user_id = p_user_id;
+
+    RETURN jsonb_build_object('status', 'joined', 'member', to_jsonb(v_member));
+END
+$$;
+
+CREATE OR REPLACE FUNCTION leave_clan(p_clan_id clans.id%TYPE, p_user_id text)
+RETURNS jsonb
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM 1 FROM clans WHERE id = p_clan_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    DELETE FROM clan_members WHERE clan_id = p_clan_id AND user_id = p_user_id;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_member');
+    END IF;
+
+    UPDATE clans SET member_count = greatest(member_count - 1, 0) WHERE id = p_clan_id;
+    UPDATE user_profiles SET clan_id = NULL
+    WHERE clerk_user_id = p_user_id AND clan_id = p_clan_id;
+
+    RETURN jsonb_build_object('status', 'left');
+END
+$$;
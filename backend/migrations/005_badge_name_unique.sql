@@ -0,0 +1,5 @@
+-- Badge definitions are keyed on name so startup can seed them with one upsert
+-- Apply with: psql "$DATABASE_URL" -f migrations/005_badge_name_unique.sql
+-- Resolve duplicate badge names (and the user_badges pointing at them) first.
+
+CREATE UNIQUE INDEX IF NOT EXISTS badges_name_key ON badges (name);
@@ -0,0 +1,17 @@
+-- Indexes matching the keyset orderings in services/pagination.py
+-- Apply with: psql "$DATABASE_URL" -f migrations/006_keyset_indexes.sql
+--
+-- Each page seeks with (sort column, id) < (cursor values) and reads the next
+-- rows straight off one of these, so page 500 costs the same as page 1.
+
+CREATE INDEX IF NOT EXISTS user_profiles_leaderboard_idx
+    ON user_profiles (total_points DESC NULLS LAST, id DESC);
+
+CREATE INDEX IF NOT EXISTS clans_leaderboard_idx
+    ON clans (total_xp DESC NULLS LAST, id DESC);
+
+CREATE INDEX IF NOT EXISTS clan_members_contribution_idx
+    ON clan_members (clan_id, xp_contributed DESC NULLS LAST, id DESC);
+
+CREATE INDEX IF NOT EXISTS habits_user_created_idx
+    ON habits (user_id, created_at, id);
@@ -0,0 +1,95 @@
+-- Habit completion as one transactional procedure
+-- Apply with: psql "$DATABASE_URL" -f migrations/007_complete_habit.sql
+--
+-- Replaces the get_habit / get_last_completion / create_habit_completion /
+-- update_habit / record_xp_transaction round trips of the Python path. The
+-- streak and XP rules mirror services/habit_rules.py, keep both in sync.
+
+-- int(HABIT_COMPLETE * difficulty multiplier * (1 + 5% per 10 streak days, max 50%))
+CREATE OR REPLACE FUNCTION habit_xp(p_difficulty text, p_streak integer)
+RETURNS integer
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT floor(
+        10
+        * CASE p_difficulty WHEN 'easy' THEN 1.0 WHEN 'medium' THEN 1.5 WHEN 'hard' THEN 2.0 ELSE 1.0 END
+        * (1 + least((p_streak / 10) * 0.05, 0.5))
+    )::integer
+$$;
+
+-- Locks the habit row, so two completions of the same habit serialise and
+-- only one of them gets past the same-day check. Outcomes come back as
+-- {"status": ...} like the clan procedures.
+CREATE OR REPLACE FUNCTION complete_habit(p_habit_id habits.id%TYPE, p_user_id text,
+                                          p_notes text, p_today date)
+RETURNS jsonb
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_habit habits;
+    v_completion habit_logs;
+    v_last date;
+    v_streak integer;
+    v_xp integer;
+    v_bonus jsonb;
+    v_user jsonb;
+BEGIN
+    SELECT * INTO v_habit FROM habits WHERE id = p_habit_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM habit_logs
+        WHERE habit_id = p_habit_id AND user_id = p_user_id AND completed_at::date = p_today
+    ) THEN
+        RETURN jsonb_build_object('status', 'already_completed', 'habit', to_jsonb(v_habit));
+    END IF;
+
+    v_last := v_habit.last_completed::date;
+    v_streak := CASE
+        WHEN v_last IS NULL THEN 1
+        WHEN p_today - v_last = 1 THEN COALESCE(v_habit.streak, 0) + 1
+        WHEN p_today - v_last = 0 THEN COALESCE(v_habit.streak, 0)
+        ELSE 1
+    END;
+    v_xp := habit_xp(v_habit.difficulty, v_streak);
+
+    INSERT INTO habit_logs (habit_id, user_id, xp_earned, notes, completed_at)
+    VALUES (p_habit_id, p_user_id, v_xp, p_notes, now())
+    RETURNING * INTO v_completion;
+
+    UPDATE habits
+    SET streak = v_streak,
+        best_streak = greatest(COALESCE(best_streak, 0), v_streak),
+        total_completions = COALESCE(total_completions, 0) + 1,
+        last_completed = v_completion.completed_at,
+        version = version + 1
+    WHERE id = p_habit_id
+    RETURNING * INTO v_habit;
+
+    v_bonus := CASE v_streak
+        WHEN 7 THEN jsonb_build_object('reason', 'weekly_streak_bonus', 'xp', 25)
+        WHEN 30 THEN jsonb_build_object('reason', 'monthly_streak_bonus', 'xp', 100)
+        WHEN 100 THEN jsonb_build_object('reason', 'century_streak_bonus', 'xp', 500)
+        WHEN 365 THEN jsonb_build_object('reason', 'yearly_streak_bonus', 'xp', 1000)
+    END;
+
+    -- Same ledger entries award_xp would append, one per award
+    INSERT INTO xp_transactions (user_id, amount, reason)
+    SELECT p_user_id, award.amount, award.reason
+    FROM (VALUES (v_xp, 'habit_complete_' || v_habit.title),
+                 ((v_bonus ->> 'xp')::integer, v_bonus ->> 'reason')) AS award (amount, reason)
+    WHERE award.amount IS NOT NULL
+      AND EXISTS (SELECT 1 FROM user_profiles WHERE clerk_user_id = p_user_id);
+
+    SELECT to_jsonb(u) INTO v_user FROM user_profiles_live u WHERE clerk_user_id = p_user_id;
+
+    RETURN jsonb_build_object(
+        'status', 'completed',
+        'habit', to_jsonb(v_habit),
+        'completion', to_jsonb(v_completion),
+        'xp_earned', v_xp,
+        'streak_bonus', v_bonus,
+        'user', v_user
+    );
+END
+$$;
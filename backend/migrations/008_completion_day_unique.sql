@@ -0,0 +1,88 @@
+-- One completion per habit, user and day, enforced by the database
+-- Apply with: psql "$DATABASE_URL" -f migrations/008_completion_day_unique.sql
+-- Resolve existing same-day duplicates in habit_logs first, or the unique
+-- index below fails to build.
+--
+-- Completions insert with ON CONFLICT DO NOTHING, so a double tap can't log
+-- (and award XP for) the same day twice, and no pre-read is needed to check.
+
+ALTER TABLE habit_logs ADD COLUMN IF NOT EXISTS completed_on date;
+UPDATE habit_logs SET completed_on = completed_at::date WHERE completed_on IS NULL;
+ALTER TABLE habit_logs ALTER COLUMN completed_on SET DEFAULT current_date;
+ALTER TABLE habit_logs ALTER COLUMN completed_on SET NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS habit_logs_completed_on_key
+    ON habit_logs (habit_id, user_id, completed_on);
+
+-- Same as in 007, with the same-day check done by the insert itself
+CREATE OR REPLACE FUNCTION complete_habit(p_habit_id habits.id%TYPE, p_user_id text,
+                                          p_notes text, p_today date)
+RETURNS jsonb
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_habit habits;
+    v_completion habit_logs;
+    v_last date;
+    v_streak integer;
+    v_xp integer;
+    v_bonus jsonb;
+    v_user jsonb;
+BEGIN
+    SELECT * INTO v_habit FROM habits WHERE id = p_habit_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    v_last := v_habit.last_completed::date;
+    v_streak := CASE
+        WHEN v_last IS NULL THEN 1
+        WHEN p_today - v_last = 1 THEN COALESCE(v_habit.streak, 0) + 1
+        WHEN p_today - v_last = 0 THEN COALESCE(v_habit.streak, 0)
+        ELSE 1
+    END;
+    v_xp := habit_xp(v_habit.difficulty, v_streak);
+
+    INSERT INTO habit_logs (habit_id, user_id, xp_earned, notes, completed_at, completed_on)
+    VALUES (p_habit_id, p_user_id, v_xp, p_notes, now(), p_today)
+    ON CONFLICT (habit_id, user_id, completed_on) DO NOTHING
+    RETURNING * INTO v_completion;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'already_completed', 'habit', to_jsonb(v_habit));
+    END IF;
+
+    UPDATE habits
+    SET streak = v_streak,
+        best_streak = greatest(COALESCE(best_streak, 0), v_streak),
+        total_completions = COALESCE(total_completions, 0) + 1,
+        last_completed = v_completion.completed_at,
+        version = version + 1
+    WHERE id = p_habit_id
+    RETURNING * INTO v_habit;
+
+    v_bonus := CASE v_streak
+        WHEN 7 THEN jsonb_build_object('reason', 'weekly_streak_bonus', 'xp', 25)
+        WHEN 30 THEN jsonb_build_object('reason', 'monthly_streak_bonus', 'xp', 100)
+        WHEN 100 THEN jsonb_build_object('reason', 'century_streak_bonus', 'xp', 500)
+        WHEN 365 THEN jsonb_build_object('reason', 'yearly_streak_bonus', 'xp', 1000)
+    END;
+
+    -- Same ledger entries award_xp would append, one per award
+    INSERT INTO xp_transactions (user_id, amount, reason)
+    SELECT p_user_id, award.amount, award.reason
+    FROM (VALUES (v_xp, 'habit_complete_' || v_habit.title),
+                 ((v_bonus ->> 'xp')::integer, v_bonus ->> 'reason')) AS award (amount, reason)
+    WHERE award.amount IS NOT NULL
+      AND EXISTS (SELECT 1 FROM user_profiles WHERE clerk_user_id = p_user_id);
+
+    SELECT to_jsonb(u) INTO v_user FROM user_profiles_live u WHERE clerk_user_id = p_user_id;
+
+    RETURN jsonb_build_object(
+        'status', 'completed',
+        'habit', to_jsonb(v_habit),
+        'completion', to_jsonb(v_completion),
+        'xp_earned', v_xp,
+        'streak_bonus', v_bonus,
+        'user', v_user
+    );
+END
+$$;
@@ -0,0 +1,38 @@
+-- Durable queue for the work that follows a completion or XP award
+-- Apply with: psql "$DATABASE_URL" -f migrations/009_side_effect_jobs.sql
+--
+-- services/side_effects.py writes jobs here before handing them to its
+-- in-process workers, leased to that process until locked_until. A job whose
+-- lease runs out (its process died, or its retry is due) is claimed again by
+-- the next sweep. Finished jobs are deleted; exhausted ones stay as 'dead'.
+
+CREATE TABLE IF NOT EXISTS side_effect_jobs (
+    id bigserial PRIMARY KEY,
+    kind text NOT NULL,
+    payload jsonb NOT NULL,
+    status text NOT NULL DEFAULT 'pending',
+    attempts integer NOT NULL DEFAULT 0,
+    last_error text,
+    locked_until timestamptz NOT NULL DEFAULT now(),
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS side_effect_jobs_due_idx
+    ON side_effect_jobs (locked_until) WHERE status = 'pending';
+
+-- Leases up to p_limit due jobs to the caller; SKIP LOCKED lets several
+-- processes sweep at once without claiming the same job
+CREATE OR REPLACE FUNCTION claim_side_effect_jobs(p_limit integer, p_lease_seconds double precision)
+RETURNS SETOF side_effect_jobs
+LANGUAGE sql AS $$
+    UPDATE side_effect_jobs j
+    SET locked_until = now() + make_interval(secs => p_lease_seconds)
+    WHERE j.id IN (
+        SELECT id FROM side_effect_jobs
+        WHERE status = 'pending' AND locked_until <= now()
+        ORDER BY locked_until, id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*
+$$;
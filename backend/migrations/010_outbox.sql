@@ -0,0 +1,104 @@
+-- Transactional outbox for the events the frontend listens for
+-- Apply with: psql "$DATABASE_URL" -f migrations/010_outbox.sql
+--
+-- Triggers write an outbox_events row in the same transaction as the change
+-- it describes: an xp_transactions entry (xp_update), a user_badges row
+-- (badge_earned) or a habit streak reaching a milestone (streak_milestone).
+-- services/outbox.py claims batches, emits them to Socket.IO and analytics,
+-- then deletes them. A batch leased to a process that died is claimed again
+-- once the lease runs out, so delivery is at least once.
+-- services/events.py builds the same rows for engines without triggers.
+
+CREATE TABLE IF NOT EXISTS outbox_events (
+    id bigserial PRIMARY KEY,
+    event text NOT NULL,
+    user_id text NOT NULL,
+    payload jsonb NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    locked_until timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS outbox_events_due_idx ON outbox_events (locked_until, id);
+
+-- new_total_xp reads the live view, which already includes NEW
+CREATE OR REPLACE FUNCTION outbox_xp_update()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO outbox_events (event, user_id, payload)
+    SELECT 'xp_update', NEW.user_id, jsonb_build_object(
+        'xp_earned', NEW.amount,
+        'reason', NEW.reason,
+        'new_total_xp', u.xp + u.pending_xp
+    )
+    FROM user_profiles_live u WHERE u.clerk_user_id = NEW.user_id;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS xp_transactions_outbox ON xp_transactions;
+CREATE TRIGGER xp_transactions_outbox
+    AFTER INSERT ON xp_transactions
+    FOR EACH ROW EXECUTE FUNCTION outbox_xp_update();
+
+CREATE OR REPLACE FUNCTION outbox_badge_earned()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO outbox_events (event, user_id, payload)
+    SELECT 'badge_earned', NEW.user_id, jsonb_build_object(
+        'badge_id', b.id,
+        'badge_name', b.name,
+        'badge_icon', b.icon,
+        'badge_type', b.badge_type,
+        'rarity', b.rarity
+    )
+    FROM badges b WHERE b.id = NEW.badge_id;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS user_badges_outbox ON user_badges;
+CREATE TRIGGER user_badges_outbox
+    AFTER INSERT ON user_badges
+    FOR EACH ROW EXECUTE FUNCTION outbox_badge_earned();
+
+-- Milestones are the streak lengths that earn a bonus in 007_complete_habit.sql
+CREATE OR REPLACE FUNCTION outbox_streak_milestone()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO outbox_events (event, user_id, payload)
+    VALUES ('streak_milestone', NEW.user_id, jsonb_build_object(
+        'habit_id', NEW.id,
+        'habit_title', NEW.title,
+        'streak', NEW.streak,
+        'milestone', NEW.streak
+    ));
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS habits_streak_outbox ON habits;
+CREATE TRIGGER habits_streak_outbox
+    AFTER UPDATE OF streak ON habits
+    FOR EACH ROW
+    WHEN (NEW.streak IN (7, 30, 100, 365) AND NEW.streak IS DISTINCT FROM OLD.streak)
+    EXECUTE FUNCTION outbox_streak_milestone();
+
+-- Leases up to p_limit due events, oldest first; SKIP LOCKED lets several
+-- relays drain at once without claiming the same event
+CREATE OR REPLACE FUNCTION claim_outbox_events(p_limit integer, p_lease_seconds double precision)
+RETURNS SETOF outbox_events
+LANGUAGE sql AS $$
+    UPDATE outbox_events e
+    SET locked_until = now() + make_interval(secs => p_lease_seconds)
+    WHERE e.id IN (
+        SELECT id FROM outbox_events
+        WHERE locked_until <= now()
+        ORDER BY id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING e.*
+$$;
@@ -0,0 +1,44 @@
+-- Nightly streak decay
+-- Apply with: psql "$DATABASE_URL" -f migrations/011_streak_decay.sql
+--
+-- services/streak_decay.py resets the streaks of habits not completed since
+-- before yesterday, one keyset-paged chunk per decay_streaks() call, and
+-- records its cursor in sweep_checkpoints after each chunk so a restarted
+-- sweep picks up where the last one stopped.
+
+-- Only live streaks are indexed, so reset rows drop out of every later scan
+CREATE INDEX IF NOT EXISTS habits_live_streak_idx
+    ON habits (id) WHERE streak > 0;
+
+CREATE TABLE IF NOT EXISTS sweep_checkpoints (
+    name text PRIMARY KEY,
+    cursor text,
+    finished boolean NOT NULL DEFAULT false,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+-- Resets up to p_limit broken streaks after p_after in id order. Rows a
+-- completion holds locked are skipped; that completion sets the streak.
+CREATE OR REPLACE FUNCTION decay_streaks(p_cutoff date, p_after habits.id%TYPE, p_limit integer)
+RETURNS jsonb
+LANGUAGE sql AS $$
+    WITH chunk AS (
+        SELECT id FROM habits
+        WHERE streak > 0
+          AND last_completed < p_cutoff
+          AND (p_after IS NULL OR id > p_after)
+        ORDER BY id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ), reset AS (
+        UPDATE habits h
+        SET streak = 0, version = h.version + 1
+        FROM chunk
+        WHERE h.id = chunk.id
+        RETURNING h.id
+    )
+    SELECT jsonb_build_object(
+        'reset', COALESCE((SELECT jsonb_agg(id ORDER BY id) FROM reset), '[]'::jsonb),
+        'cursor', (SELECT id FROM chunk ORDER BY id DESC LIMIT 1)
+    )
+$$;
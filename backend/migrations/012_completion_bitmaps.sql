@@ -0,0 +1,83 @@
+-- Per-habit yearly completion bitmaps
+-- Apply with: psql "$DATABASE_URL" -f migrations/012_completion_bitmaps.sql
+--
+-- habit_completion_bitmaps holds one 46-byte (366-bit) bytea per habit and
+-- year; bit n (set_bit numbering) is day n + 1 of the year. A trigger on
+-- habit_logs sets the bit for each new completion, so every insert path
+-- (complete_habit, offline sync) keeps it current. services/completion_bitmap.py
+-- reads streaks, rates and gaps out of it.
+
+-- habit_id takes whatever type habits.id has
+DO $$
+BEGIN
+    EXECUTE format($sql$
+        CREATE TABLE IF NOT EXISTS habit_completion_bitmaps (
+            habit_id %s NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+            user_id text NOT NULL,
+            year smallint NOT NULL,
+            days bytea NOT NULL,
+            PRIMARY KEY (habit_id, year)
+        )
+    $sql$, (SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'habits'::regclass AND attname = 'id'));
+END
+$$;
+
+CREATE OR REPLACE FUNCTION mark_completion_day()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_day integer := extract(doy FROM NEW.completed_on)::integer - 1;
+BEGIN
+    INSERT INTO habit_completion_bitmaps AS b (habit_id, user_id, year, days)
+    VALUES (NEW.habit_id, NEW.user_id, extract(year FROM NEW.completed_on),
+            set_bit(decode(repeat('00', 46), 'hex'), v_day, 1))
+    ON CONFLICT (habit_id, year) DO UPDATE SET days = set_bit(b.days, v_day, 1);
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS habit_logs_bitmap ON habit_logs;
+CREATE TRIGGER habit_logs_bitmap
+    AFTER INSERT ON habit_logs
+    FOR EACH ROW EXECUTE FUNCTION mark_completion_day();
+
+-- Rebuilds the bitmaps of the given habits (all of them when NULL) from
+-- habit_logs; returns how many habit-years were written
+CREATE OR REPLACE FUNCTION backfill_completion_bitmaps(p_habit_ids text[] DEFAULT NULL)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_rows integer;
+BEGIN
+    DELETE FROM habit_completion_bitmaps
+    WHERE p_habit_ids IS NULL OR habit_id::text = ANY (p_habit_ids);
+
+    WITH days AS (
+        SELECT DISTINCT habit_id, user_id,
+               extract(year FROM completed_on)::smallint AS year,
+               extract(doy FROM completed_on)::integer - 1 AS day
+        FROM habit_logs
+        WHERE p_habit_ids IS NULL OR habit_id::text = ANY (p_habit_ids)
+    ), bytes AS (
+        -- Distinct days, so summing the bits of one byte is OR-ing them
+        SELECT habit_id, user_id, year, day / 8 AS byte, sum(1 << (day % 8))::integer AS bits
+        FROM days
+        GROUP BY habit_id, user_id, year, day / 8
+    ), years AS (
+        SELECT DISTINCT habit_id, user_id, year FROM bytes
+    )
+    INSERT INTO habit_completion_bitmaps (habit_id, user_id, year, days)
+    SELECT y.habit_id, y.user_id, y.year,
+           decode(string_agg(lpad(to_hex(COALESCE(b.bits, 0)), 2, '0'), '' ORDER BY n), 'hex')
+    FROM years y
+    CROSS JOIN generate_series(0, 45) AS n
+    LEFT JOIN bytes b ON b.habit_id = y.habit_id AND b.year = y.year AND b.byte = n
+    GROUP BY y.habit_id, y.user_id, y.year
+    ON CONFLICT (habit_id, year) DO NOTHING;
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END
+$$;
+
+SELECT backfill_completion_bitmaps();
@@ -0,0 +1,68 @@
+-- Daily activity rollup for the profile heatmap
+-- Apply with: psql "$DATABASE_URL" -f migrations/013_daily_user_activity.sql
+--
+-- daily_user_activity keeps one row per user and day with the completions
+-- logged for that day and the XP awarded on it. Triggers add each new
+-- habit_logs row to its completed_on day and each xp_transactions entry to the
+-- day it was recorded, so streak bonuses and other awards are counted and a
+-- day's XP matches what it added to total_points. GET /profile/{id}/activity
+-- reads at most one row per day of its window instead of aggregating both.
+
+CREATE TABLE IF NOT EXISTS daily_user_activity (
+    user_id text NOT NULL,
+    day date NOT NULL,
+    completions integer NOT NULL DEFAULT 0,
+    xp_earned integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE OR REPLACE FUNCTION record_daily_activity()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO daily_user_activity AS a (user_id, day, completions)
+    VALUES (NEW.user_id, NEW.completed_on, 1)
+    ON CONFLICT (user_id, day) DO UPDATE
+    SET completions = a.completions + 1;
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION record_daily_xp()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO daily_user_activity AS a (user_id, day, xp_earned)
+    VALUES (NEW.user_id, NEW.created_at::date, NEW.amount)
+    ON CONFLICT (user_id, day) DO UPDATE
+    SET xp_earned = a.xp_earned + EXCLUDED.xp_earned;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS habit_logs_daily_activity ON habit_logs;
+CREATE TRIGGER habit_logs_daily_activity
+    AFTER INSERT ON habit_logs
+    FOR EACH ROW EXECUTE FUNCTION record_daily_activity();
+
+DROP TRIGGER IF EXISTS xp_transactions_daily_activity ON xp_transactions;
+CREATE TRIGGER xp_transactions_daily_activity
+    AFTER INSERT ON xp_transactions
+    FOR EACH ROW EXECUTE FUNCTION record_daily_xp();
+
+-- Existing history; run before completions resume, as the triggers only
+-- count rows inserted after they were created
+INSERT INTO daily_user_activity (user_id, day, completions, xp_earned)
+SELECT user_id, day, sum(completions), sum(xp_earned)
+FROM (
+    SELECT user_id, completed_on AS day, count(*) AS completions, 0 AS xp_earned
+    FROM habit_logs
+    GROUP BY user_id, completed_on
+    UNION ALL
+    SELECT user_id, created_at::date, 0, sum(amount)
+    FROM xp_transactions
+    GROUP BY user_id, created_at::date
+) history
+GROUP BY user_id, day
+ON CONFLICT (user_id, day) DO UPDATE
+SET completions = EXCLUDED.completions, xp_earned = EXCLUDED.xp_earned;
@@ -0,0 +1,6 @@
+-- XP reaches user_profiles only through the xp_transactions ledger
+-- Apply with: psql "$DATABASE_URL" -f migrations/014_drop_award_user_xp.sql
+-- award_user_xp() wrote profile totals directly, bypassing the ledger and its
+-- xp_update outbox event; compact_xp_ledger() folds entries without it.
+
+DROP FUNCTION IF EXISTS award_user_xp(text, integer);
@@ -31,6 +31,15 @@ class HabitCompletion(BaseModel):
     xp_earned: int = 0
     notes: Optional[str] = None
 
+class OfflineCompletion(BaseModel):
+    habit_id: str
+    completed_at: datetime
+    notes: Optional[str] = None
+
+class HabitSyncRequest(BaseModel):
+    user_id: str
+    completions: List[OfflineCompletion]
+
 class HabitWithStats(Habit):
     completion_rate: float = 0.0
     xp_earned: int = 0
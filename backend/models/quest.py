@@ -20,7 +20,7 @@ class QuestBase(BaseModel):
     xp_reward: int
     requirement: int
     requirement_type: str  # completions, streak, clan_xp, etc.
-    expires_at: Optional<datetime> = None
+    expires_at: Optional[datetime] = None
 
 class Quest(QuestBase):
     id: str
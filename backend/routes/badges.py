@@ -1,5 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from services.badge_service import BadgeService
+from services.badge_catalog import badge_catalog
+from services.single_flight import hot_reads
 from typing import List
 
 router = APIRouter()
@@ -26,7 +28,7 @@ async def check_badges(user_id: str):
 @router.get("/all")
 async def get_all_badges():
     """Get all available badges"""
-    from services.database import Database
-    db = Database()
-    badges = await db.get_all_badges()
-    return {'badges': badges}
+    return await hot_reads.run('badges/all', _all_badges)
+
+async def _all_badges() -> dict:
+    return {'badges': await badge_catalog.all()}
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, HTTPException
 from models.clan import ClanCreate, Clan, ClanMessage
 from services.database import Database
+from services.pagination import CLAN_MEMBERS, decode_cursor, next_cursor, page_size
+from services.projection import parse_fields, project_all, with_columns
+from services.repository import ClanFullError, ClanNotFoundError
 from services.websocket_manager import ConnectionManager
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 router = APIRouter()
@@ -12,21 +15,8 @@ manager = ConnectionManager()
 @router.post("/", response_model=Clan)
 async def create_clan(clan: ClanCreate):
     """Create a new clan"""
-    clan_data = clan.dict()
-    clan_data['total_xp'] = 0
-    clan_data['level'] = 1
-    clan_data['member_count'] = 1
-    
-    created_clan = await db.create_clan(clan_data)
-    
-    # Add owner as first member
-    await db.join_clan(
-        created_clan['id'],
-        clan.owner_id,
-        'Owner'  # Replace with actual username
-    )
-    
-    return created_clan
+    # The owner joins as leader in the same transaction
+    return await db.create_clan_with_owner(clan.model_dump())
 
 @router.get("/{clan_id}", response_model=Clan)
 async def get_clan(clan_id: str):
@@ -39,15 +29,14 @@ async def get_clan(clan_id: str):
 @router.post("/{clan_id}/join")
 async def join_clan(clan_id: str, user_id: str, username: str):
     """Join a clan"""
-    clan = await db.get_clan(clan_id)
-    if not clan:
+    # Capacity is checked inside the join transaction
+    try:
+        member = await db.join_clan(clan_id, user_id, username)
+    except ClanNotFoundError:
         raise HTTPException(status_code=404, detail="Clan not found")
-    
-    if clan['member_count'] >= clan['max_members']:
+    except ClanFullError:
         raise HTTPException(status_code=400, detail="Clan is full")
     
-    member = await db.join_clan(clan_id, user_id, username)
-    
     # Notify clan members
     await manager.notify_clan(clan_id, 'member_joined', {
         'user_id': user_id,
@@ -56,22 +45,40 @@ async def join_clan(clan_id: str, user_id: str, username: str):
     
     return {'message': 'Joined clan successfully', 'member': member}
 
-@router.get("/{clan_id}/members")
-async def get_clan_members(clan_id: str):
-    """Get all clan members"""
-    members = await db.get_clan_members(clan_id)
+@router.post("/{clan_id}/leave")
+async def leave_clan(clan_id: str, user_id: str):
+    """Leave a clan"""
+    try:
+        left = await db.leave_clan(clan_id, user_id)
+    except ClanNotFoundError:
+        raise HTTPException(status_code=404, detail="Clan not found")
+    if not left:
+        raise HTTPException(status_code=400, detail="Not a member of this clan")
+    
+    await manager.notify_clan(clan_id, 'member_left', {
+        'user_id': user_id
+    })
     
-    # Sort by XP contribution
-    members.sort(key=lambda m: m.get('xp_contributed', 0), reverse=True)
+    return {'message': 'Left clan successfully'}
+
+@router.get("/{clan_id}/members")
+async def get_clan_members(clan_id: str, limit: int = 50, cursor: Optional[str] = None,
+                           fields: Optional[str] = None):
+    """Get clan members by XP contribution, a page at a time"""
+    columns = parse_fields(fields, 'clan_members')
+    after, _ = decode_cursor(CLAN_MEMBERS, cursor)
+    limit = page_size(limit)
+    members = await db.get_clan_members(clan_id, with_columns(columns, *CLAN_MEMBERS.columns), limit, after)
     
-    return {'members': members}
+    return {
+        'members': project_all(members, columns),
+        'next_cursor': next_cursor(CLAN_MEMBERS, members, limit)
+    }
 
 @router.post("/{clan_id}/messages")
 async def send_clan_message(clan_id: str, user_id: str, username: str, message: str, avatar: str = '/avatars/default.png'):
     """Send a message in clan chat"""
     try:
-        from services.database import supabase
-        
         message_data = {
             'clan_id': clan_id,
             'user_id': user_id,
@@ -81,14 +88,9 @@ async def send_clan_message(clan_id: str, user_id: str, username: str, message:
             'timestamp': datetime.now().isoformat()
         }
         
-        response = supabase.table('clan_messages')\
-            .insert(message_data)\
-            .execute()
-        
-        if response.data:
-            return response.data[0]
+        created = await db.create_clan_message(message_data)
         
-        return message_data
+        return created or message_data
     except Exception as e:
         print(f"Error creating message: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -96,23 +98,13 @@ async def send_clan_message(clan_id: str, user_id: str, username: str, message:
 @router.get("/{clan_id}/messages")
 async def get_clan_messages(clan_id: str, limit: int = 50):
     """Get clan chat messages"""
-    try:
-        from services.database import supabase
-        
-        response = supabase.table('clan_messages')\
-            .select('*')\
-            .eq('clan_id', clan_id)\
-            .order('timestamp', desc=True)\
-            .limit(limit)\
-            .execute()
-        
-        # Reverse to get chronological order
-        messages = list(reversed(response.data)) if response.data else []
-        
-        return {'messages': messages}
-    except Exception as e:
-        print(f"Error fetching messages: {e}")
-        return {'messages': []}
+    # Failures surface as 503 (or stale messages) instead of an empty chat
+    messages = await db.get_clan_messages(clan_id, limit)
+    
+    # Reverse to get chronological order
+    messages = list(reversed(messages)) if messages else []
+    
+    return {'messages': messages}
 
 @router.get("/{clan_id}/stats")
 async def get_clan_stats(clan_id: str):
@@ -121,12 +113,9 @@ async def get_clan_stats(clan_id: str):
     if not clan:
         raise HTTPException(status_code=404, detail="Clan not found")
     
-    members = await db.get_clan_members(clan_id)
-    top_contributors = sorted(
-        members,
-        key=lambda m: m.get('xp_contributed', 0),
-        reverse=True
-    )[:5]
+    top_contributors = await db.get_clan_members(
+        clan_id, ['user_id', 'username', 'xp_contributed', 'role'], limit=5
+    )
     
     # Get clan rank
     leaderboard = await db.get_clan_leaderboard(1000)
@@ -16,26 +16,17 @@ async def discover_habits(
     # This would query public habits from all users
     # For now, returning a mock response
     
-    habits = await db.client.table('habits') \
-        .select('*') \
-        .eq('is_public', True) \
-        .limit(limit) \
-        .execute()
+    habits = await db.get_public_habits(limit)
     
-    return {'habits': habits.data}
+    return {'habits': habits}
 
 @router.get("/popular")
 async def get_popular_habits(limit: int = 10):
     """Get most popular public habits"""
     # This would aggregate habits by adoption count
-    habits = await db.client.table('habits') \
-        .select('*') \
-        .eq('is_public', True) \
-        .order('total_completions', desc=True) \
-        .limit(limit) \
-        .execute()
+    habits = await db.get_popular_habits(limit)
     
-    return {'habits': habits.data}
+    return {'habits': habits}
 
 @router.get("/categories")
 async def get_habit_categories():
@@ -1,8 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
-from models.habit import HabitCreate, Habit, HabitCompletion
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from config import settings
+from models.habit import HabitCreate, Habit, HabitCompletion, HabitSyncRequest
 from services.streak_service import StreakService
 from services.database import Database
-from typing import List
+from services.idempotency import idempotency
+from services.pagination import HABITS, decode_cursor, next_cursor, page_size
+from services.projection import parse_fields, project_all, with_columns
+from services.repository import HabitNotFoundError
+from typing import List, Optional
 from datetime import date
 
 router = APIRouter()
@@ -21,9 +28,26 @@ async def create_habit(habit: HabitCreate):
     return created_habit
 
 @router.get("/user/{user_id}", response_model=List[Habit])
-async def get_user_habits(user_id: str):
-    """Get all habits for a user"""
-    habits = await db.get_user_habits(user_id)
+async def get_user_habits(user_id: str, response: Response, limit: Optional[int] = None,
+                          cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Get a user's habits, oldest first.
+
+    Without `limit` or `cursor` every habit comes back in one response, as
+    before paging existed. With either, X-Next-Cursor points at the next page.
+    """
+    columns = parse_fields(fields, 'habits')
+    after, _ = decode_cursor(HABITS, cursor)
+    if limit is not None or cursor is not None:
+        limit = page_size(limit if limit is not None else settings.PAGE_SIZE_MAX)
+    habits = await db.get_user_habits(user_id, with_columns(columns, *HABITS.columns), limit, after)
+    headers = {}
+    next_page = next_cursor(HABITS, habits, limit)
+    if next_page:
+        headers['X-Next-Cursor'] = next_page
+    if columns is not None:
+        # Sparse rows don't satisfy the Habit model, so skip response validation
+        return JSONResponse(jsonable_encoder(project_all(habits, columns)), headers=headers)
+    response.headers.update(headers)
     return habits
 
 @router.get("/{habit_id}", response_model=Habit)
@@ -35,9 +59,36 @@ async def get_habit(habit_id: str):
     return habit
 
 @router.post("/{habit_id}/complete")
-async def complete_habit(habit_id: str, user_id: str, notes: str = None):
-    """Complete a habit for today"""
-    result = await streak_service.complete_habit(user_id, habit_id, notes)
+async def complete_habit(habit_id: str, user_id: str, response: Response, notes: str = None,
+                         idempotency_key: Optional[str] = Header(None)):
+    """Complete a habit for today; a retry with the same Idempotency-Key gets the first response"""
+    try:
+        result, replayed = await idempotency.run(
+            idempotency_key, 'habits/complete',
+            {'habit_id': habit_id, 'user_id': user_id, 'notes': notes},
+            lambda: streak_service.complete_habit(user_id, habit_id, notes)
+        )
+    except HabitNotFoundError:
+        raise HTTPException(status_code=404, detail="Habit not found")
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return result
+
+@router.post("/sync")
+async def sync_completions(request: HabitSyncRequest, response: Response,
+                           idempotency_key: Optional[str] = Header(None)):
+    """Apply completions an offline client queued, in one batch with a result per completion"""
+    if len(request.completions) > settings.HABIT_SYNC_MAX_COMPLETIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.HABIT_SYNC_MAX_COMPLETIONS} completions per sync"
+        )
+    result, replayed = await idempotency.run(
+        idempotency_key, 'habits/sync', request.model_dump(),
+        lambda: streak_service.sync_completions(request.user_id, [c.model_dump() for c in request.completions])
+    )
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
     return result
 
 @router.get("/missed-days/{user_id}")
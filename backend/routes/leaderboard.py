@@ -1,49 +1,77 @@
 from fastapi import APIRouter, HTTPException
 from services.database import Database
-from typing import List
+from services.leaderboard_snapshot import leaderboard_snapshot
+from services.pagination import CLAN_LEADERBOARD, LEADERBOARD, decode_cursor, next_cursor, page_size
+from services.projection import LEADERBOARD_COLUMNS, parse_fields, project_all
+from services.single_flight import hot_reads
+from typing import List, Optional
 
 router = APIRouter()
 db = Database()
 
 @router.get("/users")
-async def get_user_leaderboard(limit: int = 100):
-    """Get user leaderboard ranked by total points"""
-    leaderboard = await db.get_leaderboard(limit)
+async def get_user_leaderboard(limit: int = 100, cursor: Optional[str] = None,
+                               fields: Optional[str] = None):
+    """Get user leaderboard ranked by total points, a page at a time"""
+    columns = parse_fields(fields, 'leaderboard')
+    after, position = decode_cursor(LEADERBOARD, cursor)
+    limit = page_size(limit)
+    # Every client asks for the same pages; concurrent identical requests share one read
+    return await hot_reads.run(
+        ('leaderboard/users', limit, cursor, tuple(columns or ())),
+        lambda: _user_page(limit, after, position, columns)
+    )
+
+async def _user_page(limit: int, after: Optional[dict], position: int,
+                     columns: Optional[List[str]]) -> dict:
+    if after is None:
+        leaderboard = await leaderboard_snapshot.top(limit)
+    else:
+        # Later pages seek from the cursor in the database
+        leaderboard = await db.get_leaderboard(limit, LEADERBOARD_COLUMNS, after)
+    next_page = next_cursor(LEADERBOARD, leaderboard, limit, position)
+    leaderboard = project_all(leaderboard, columns)
     
     # Add rank to each user
-    for idx, user in enumerate(leaderboard, 1):
+    for idx, user in enumerate(leaderboard, position + 1):
         user['rank'] = idx
     
     return {
         'leaderboard': leaderboard,
-        'total_users': len(leaderboard)
+        'total_users': len(leaderboard),
+        'next_cursor': next_page
     }
 
 @router.get("/clans")
-async def get_clan_leaderboard(limit: int = 50):
-    """Get clan leaderboard ranked by total XP"""
-    leaderboard = await db.get_clan_leaderboard(limit)
+async def get_clan_leaderboard(limit: int = 50, cursor: Optional[str] = None):
+    """Get clan leaderboard ranked by total XP, a page at a time"""
+    after, position = decode_cursor(CLAN_LEADERBOARD, cursor)
+    limit = page_size(limit)
+    return await hot_reads.run(
+        ('leaderboard/clans', limit, cursor),
+        lambda: _clan_page(limit, after, position)
+    )
+
+async def _clan_page(limit: int, after: Optional[dict], position: int) -> dict:
+    leaderboard = await db.get_clan_leaderboard(limit, after)
     
     # Add rank and get top contributors for each clan
-    for idx, clan in enumerate(leaderboard, 1):
+    for idx, clan in enumerate(leaderboard, position + 1):
         clan['rank'] = idx
-        members = await db.get_clan_members(clan['id'])
-        top_contributors = sorted(
-            members,
-            key=lambda m: m.get('xp_contributed', 0),
-            reverse=True
-        )[:3]
-        clan['top_contributors'] = top_contributors
+        clan['top_contributors'] = await db.get_clan_members(
+            clan['id'], ['user_id', 'username', 'xp_contributed'], limit=3
+        )
     
     return {
         'leaderboard': leaderboard,
-        'total_clans': len(leaderboard)
+        'total_clans': len(leaderboard),
+        'next_cursor': next_cursor(CLAN_LEADERBOARD, leaderboard, limit, position)
     }
 
 @router.get("/user/{user_id}/rank")
 async def get_user_rank(user_id: str):
     """Get a specific user's rank"""
-    leaderboard = await db.get_leaderboard(1000)
+    leaderboard = await leaderboard_snapshot.top(1000)
     
     for idx, user in enumerate(leaderboard, 1):
         if user['clerk_user_id'] == user_id:
@@ -1,5 +1,9 @@
+from datetime import date, timedelta
 from fastapi import APIRouter, HTTPException
+from config import settings
 from services.database import Database
+from services.projection import HABIT_STATS_COLUMNS, parse_fields
+from typing import Optional
 from models.user import UserProfile, UserStats
 from services.leveling import level_from_xp, progress_from_xp
 
@@ -7,11 +11,14 @@ router = APIRouter()
 db = Database()
 
 @router.get("/{clerk_user_id}")
-async def get_profile(clerk_user_id: str):
+async def get_profile(clerk_user_id: str, fields: Optional[str] = None):
     """Get user profile"""
-    user = await db.get_user(clerk_user_id)
+    columns = parse_fields(fields, 'user_profiles')
+    user = await db.get_user(clerk_user_id, columns)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if columns is not None and not {'xp', 'level'} <= set(columns):
+        return user
     # Ensure level matches current XP
     current_xp = user.get('xp', 0)
     computed_level = level_from_xp(current_xp)
@@ -34,7 +41,7 @@ async def get_user_stats(clerk_user_id: str):
     # Get internal user ID for other operations
     internal_user_id = user['id']
     
-    habits = await db.get_user_habits(internal_user_id)
+    habits = await db.get_user_habits(internal_user_id, HABIT_STATS_COLUMNS)
     badges = await db.get_user_badges(internal_user_id) if hasattr(db, 'get_user_badges') else []
     
     # Calculate stats
@@ -67,6 +74,23 @@ async def get_user_stats(clerk_user_id: str):
         'clan_xp_contribution': clan_contribution
     }
 
+@router.get("/{clerk_user_id}/activity")
+async def get_activity(clerk_user_id: str, days: int = 30):
+    """Completions and XP awarded per day over the last `days` days, oldest first.
+
+    Every day of the window is present (zero when nothing was done), read in
+    one query from the daily_user_activity rollup. XP includes streak bonuses
+    and every other ledger award, so the days add up to total_points.
+    """
+    user = await db.get_user(clerk_user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    days = max(1, min(days, settings.ACTIVITY_DAYS_MAX))
+    today = date.today()
+    # The rollup is keyed like xp_transactions, by the profile's clerk_user_id
+    return await db.get_user_activity(user['clerk_user_id'], today - timedelta(days=days - 1), today)
+
 @router.get("/{clerk_user_id}/level-progress")
 async def get_level_progress(clerk_user_id: str):
     """Get user's current level and progress to next level"""
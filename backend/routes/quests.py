@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 from services.database import Database
+from services.quest_catalog import quest_definitions
 
 router = APIRouter()
 db = Database()
@@ -19,11 +20,9 @@ async def update_quest_progress(user_quest_id: str, progress: int):
 @router.get("/daily")
 async def get_daily_quests():
     """Get available daily quests"""
-    from models.quest import DAILY_QUESTS
-    return {'quests': DAILY_QUESTS}
+    return {'quests': quest_definitions('daily')}
 
 @router.get("/weekly")
 async def get_weekly_quests():
     """Get available weekly quests"""
-    from models.quest import WEEKLY_QUESTS
-    return {'quests': WEEKLY_QUESTS}
+    return {'quests': quest_definitions('weekly')}
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Response
 from pydantic import BaseModel
 from services.xp_service import XPService
 from services.database import Database
+from services.idempotency import idempotency
 
 router = APIRouter()
 xp_service = XPService()
@@ -13,8 +15,18 @@ class AwardXPRequest(BaseModel):
     reason: str = "manual_award"
 
 @router.post("/award")
-async def award_xp(request: AwardXPRequest):
-    """Award XP to a user (for testing/admin purposes)"""
+async def award_xp(request: AwardXPRequest, response: Response,
+                   idempotency_key: Optional[str] = Header(None)):
+    """Award XP to a user (for testing/admin purposes); a retry with the same
+    Idempotency-Key gets the first response instead of a second award"""
+    result, replayed = await idempotency.run(
+        idempotency_key, 'xp/award', request.model_dump(), lambda: _award(request)
+    )
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return result
+
+async def _award(request: AwardXPRequest):
     try:
         result = await xp_service.award_xp(
             request.user_id,
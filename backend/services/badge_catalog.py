@@ -0,0 +1,69 @@
+"""
+In-memory badge catalog
+The badge definitions almost never change, so they are loaded once into an
+immutable index keyed by name, id and (badge_type, requirement). Lookups
+cost no round trips; refresh() swaps in a new versioned snapshot.
+"""
+
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import List, Mapping, Optional, Tuple
+
+from config import settings
+from services.database import Database
+from services.snapshot import Snapshotted
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    loaded_at: float
+    badges: Tuple[Mapping, ...] = ()
+    by_name: Mapping[str, Mapping] = field(default_factory=lambda: MappingProxyType({}))
+    by_id: Mapping[str, Mapping] = field(default_factory=lambda: MappingProxyType({}))
+    by_requirement: Mapping[Tuple[str, int], Mapping] = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def build(cls, version: int, rows: List[dict]) -> 'CatalogSnapshot':
+        badges = tuple(MappingProxyType(dict(row)) for row in rows)
+        by_requirement = {}
+        for badge in badges:
+            # First definition wins, matching the LIMIT 1 lookups it replaces
+            by_requirement.setdefault((badge['badge_type'], badge['requirement']), badge)
+        return cls(
+            version=version,
+            loaded_at=time.monotonic(),
+            badges=badges,
+            by_name=MappingProxyType({badge['name']: badge for badge in reversed(badges)}),
+            by_id=MappingProxyType({str(badge['id']): badge for badge in badges}),
+            by_requirement=MappingProxyType(by_requirement),
+        )
+
+
+def _copy(badge: Optional[Mapping]) -> Optional[dict]:
+    return dict(badge) if badge is not None else None
+
+
+class BadgeCatalog(Snapshotted[CatalogSnapshot]):
+    def __init__(self, db: Optional[Database] = None, max_age: Optional[float] = None):
+        super().__init__(db, max_age if max_age is not None else settings.BADGE_CATALOG_MAX_AGE_SECONDS)
+
+    async def load(self, source, version: int) -> CatalogSnapshot:
+        """Every badge, indexed"""
+        return CatalogSnapshot.build(version, await source.get_all_badges())
+
+    async def get_by_name(self, name: str) -> Optional[dict]:
+        return _copy((await self.current()).by_name.get(name))
+
+    async def get_by_id(self, badge_id: str) -> Optional[dict]:
+        return _copy((await self.current()).by_id.get(str(badge_id)))
+
+    async def get_by_type_and_requirement(self, badge_type: str, requirement: int) -> Optional[dict]:
+        return _copy((await self.current()).by_requirement.get((badge_type, requirement)))
+
+    async def all(self) -> List[dict]:
+        return [dict(badge) for badge in (await self.current()).badges]
+
+
+badge_catalog = BadgeCatalog()
@@ -1,16 +1,20 @@
 from typing import List
 from models.badge import Badge, UserBadge, BADGE_DEFINITIONS
 from services.database import Database
-import posthog
+from services.badge_catalog import badge_catalog
 
 class BadgeService:
     def __init__(self):
         self.db = Database()
     
+    async def seed_badges(self) -> List[dict]:
+        """Upsert every badge definition, keyed on name, in one call"""
+        return await self.db.upsert_badges(BADGE_DEFINITIONS)
+    
     async def initialize_badges(self):
         """Initialize badge definitions in database"""
-        for badge_def in BADGE_DEFINITIONS:
-            await self.db.create_badge_if_not_exists(badge_def)
+        await self.seed_badges()
+        await badge_catalog.refresh()
     
     async def check_and_award_badges(self, user_id: str):
         """Check all badge criteria and award new badges"""
@@ -77,25 +81,20 @@ class BadgeService:
     
     async def award_badge(self, user_id: str, badge_name: str) -> dict:
         """Award a specific badge by name"""
-        badge = await self.db.get_badge_by_name(badge_name)
+        badge = await badge_catalog.get_by_name(badge_name)
         if not badge:
             return {'success': False, 'message': 'Badge not found'}
-        
+        return await self._award(user_id, badge)
+    
+    async def _award(self, user_id: str, badge: dict) -> dict:
         # Check if already earned
         has_badge = await self.db.user_has_badge(user_id, badge['id'])
         if has_badge:
             return {'success': False, 'message': 'Badge already earned'}
         
-        # Award badge
+        # Award badge; its badge_earned event goes out through the outbox
         user_badge = await self.db.create_user_badge(user_id, badge['id'])
         
-        # Track in PostHog
-        posthog.capture(user_id, 'badge_earned', {
-            'badge_name': badge_name,
-            'badge_type': badge.get('badge_type'),
-            'rarity': badge.get('rarity')
-        })
-        
         return {
             'success': True,
             'badge': badge,
@@ -104,9 +103,10 @@ class BadgeService:
     
     async def _award_badge_by_requirement(self, user_id: str, badge_type: str, requirement: int):
         """Internal method to award badge by type and requirement"""
-        badge = await self.db.get_badge_by_type_and_requirement(badge_type, requirement)
+        # Catalog lookup, no round trip
+        badge = await badge_catalog.get_by_type_and_requirement(badge_type, requirement)
         if badge:
-            await self.award_badge(user_id, badge['name'])
+            await self._award(user_id, badge)
     
     async def get_user_badges(self, user_id: str) -> List[UserBadge]:
         """Get all badges earned by a user"""
@@ -126,7 +126,7 @@ class BadgeService:
             'locked': []
         }
         
-        all_badges = await self.db.get_all_badges()
+        all_badges = await badge_catalog.all()
         earned_badge_ids = [b['badge_id'] for b in progress['earned']]
         
         for badge in all_badges:
@@ -0,0 +1,269 @@
+"""
+Read-through row cache
+CachedDatabase wraps any storage engine and serves user_profiles, habits and
+clans rows from a bounded in-process LRU or from Redis. Every write that can
+change one of those rows evicts it, so the next read goes to the database.
+"""
+
+import json
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import settings
+from services.projection import project
+
+
+class LRUCache:
+    """Bounded in-process cache with a per-entry TTL"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    async def get_many(self, keys: List[str]) -> Dict[str, dict]:
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            found[key] = json.loads(value)
+        return found
+
+    async def set_many(self, rows: Dict[str, dict]):
+        expires_at = time.monotonic() + self.ttl
+        for key, row in rows.items():
+            # Stored serialised so callers can never mutate a cached row
+            self._entries[key] = (expires_at, json.dumps(row, default=str))
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete_many(self, keys: Iterable[str]):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def close(self):
+        self._entries.clear()
+
+
+class RedisCache:
+    """Cache shared by every worker through Redis"""
+
+    def __init__(self, client, ttl: float, prefix: str = 'habituate:row:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float) -> 'RedisCache':
+        import redis.asyncio as redis
+        return cls(redis.Redis.from_url(url), ttl)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, dict]:
+        if not keys:
+            return {}
+        values = await self.client.mget([self.prefix + key for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    async def set_many(self, rows: Dict[str, dict]):
+        if not rows:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, row in rows.items():
+                pipe.set(self.prefix + key, json.dumps(row, default=str), px=int(self.ttl * 1000))
+            await pipe.execute()
+
+    async def delete_many(self, keys: Iterable[str]):
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            await self.client.delete(*keys)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_cache(backend: Optional[str] = None):
+    """Build the cache named by settings.CACHE_BACKEND, or None when disabled"""
+    backend = backend or settings.CACHE_BACKEND
+    if backend == 'none':
+        return None
+    if backend == 'memory':
+        return LRUCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+    if backend == 'redis':
+        if not settings.REDIS_URL:
+            raise ValueError("CACHE_BACKEND=redis requires REDIS_URL")
+        return RedisCache.from_url(settings.REDIS_URL, settings.CACHE_TTL_SECONDS)
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+
+class CachedDatabase:
+    """Storage engine wrapper adding a read-through cache for hot rows.
+
+    Everything not overridden here is forwarded to the wrapped engine.
+    """
+
+    def __init__(self, engine, cache):
+        self.inner = engine
+        self.cache = cache
+        self.stats = {table: {'hits': 0, 'misses': 0} for table in ('user_profiles', 'habits', 'clans')}
+        # Bumped on every eviction; a fill that raced with a write is dropped
+        self._generations: Dict[str, int] = {}
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def metrics(self) -> dict:
+        report = {}
+        for table, counts in self.stats.items():
+            lookups = counts['hits'] + counts['misses']
+            report[table] = {**counts, 'hit_ratio': counts['hits'] / lookups if lookups else 0.0}
+        return report
+
+    async def close(self):
+        await self.cache.close()
+        if hasattr(self.inner, 'close'):
+            await self.inner.close()
+
+    async def _read_many(self, table: str, ids: List[str], key_column: str, fetch) -> List[dict]:
+        ids = list(dict.fromkeys(ids))
+        keys = {f'{table}:{id_}': id_ for id_ in ids}
+        cached = await self.cache.get_many(list(keys))
+        self.stats[table]['hits'] += len(cached)
+        missing = [id_ for key, id_ in keys.items() if key not in cached]
+        self.stats[table]['misses'] += len(missing)
+        if not missing:
+            return list(cached.values())
+
+        generations = {id_: self._generations.get(f'{table}:{id_}', 0) for id_ in missing}
+        rows = await fetch(missing)
+        await self.cache.set_many({
+            f'{table}:{row[key_column]}': row for row in rows
+            if self._generations.get(f'{table}:{row[key_column]}', 0) == generations.get(row[key_column])
+        })
+        return list(cached.values()) + rows
+
+    async def _read(self, table: str, id_: str, key_column: str, fetch_many) -> Optional[dict]:
+        rows = await self._read_many(table, [id_], key_column, fetch_many)
+        return rows[0] if rows else None
+
+    async def _evict(self, table: str, *ids):
+        keys = [f'{table}:{id_}' for id_ in ids]
+        for key in keys:
+            self._generations[key] = self._generations.get(key, 0) + 1
+        await self.cache.delete_many(keys)
+
+    # Cached reads
+    async def get_user(self, user_id: str,
+                       columns: Optional[Sequence[str]] = None) -> Optional[dict]:
+        if columns is None:
+            return await self._read('user_profiles', user_id, 'clerk_user_id', self.inner.get_users)
+        # A cached whole row answers any projection; a miss reads just the columns
+        cached = await self.cache.get_many([f'user_profiles:{user_id}'])
+        if cached:
+            self.stats['user_profiles']['hits'] += 1
+            return project(cached[f'user_profiles:{user_id}'], columns)
+        return await self.inner.get_user(user_id, columns)
+
+    async def get_users(self, user_ids: List[str]) -> List[dict]:
+        return await self._read_many('user_profiles', user_ids, 'clerk_user_id', self.inner.get_users)
+
+    async def get_habit(self, habit_id: str) -> Optional[dict]:
+        return await self._read('habits', habit_id, 'id', self.inner.get_habits)
+
+    async def get_habits(self, habit_ids: List[str]) -> List[dict]:
+        return await self._read_many('habits', habit_ids, 'id', self.inner.get_habits)
+
+    async def get_clan(self, clan_id: str) -> Optional[dict]:
+        return await self._read('clans', clan_id, 'id', self.inner.get_clans)
+
+    async def get_clans(self, clan_ids: List[str]) -> List[dict]:
+        return await self._read_many('clans', clan_ids, 'id', self.inner.get_clans)
+
+    # Writes that change cached rows
+    async def update_user(self, user_id: str, updates: dict,
+                          expected_version: Optional[int] = None) -> dict:
+        try:
+            return await self.inner.update_user(user_id, updates, expected_version)
+        finally:
+            await self._evict('user_profiles', user_id)
+
+    async def record_xp_transaction(self, user_id: str, xp_amount: int,
+                                    reason: str) -> Optional[dict]:
+        try:
+            return await self.inner.record_xp_transaction(user_id, xp_amount, reason)
+        finally:
+            await self._evict('user_profiles', user_id)
+
+    async def update_habit(self, habit_id: str, updates: dict,
+                           expected_version: Optional[int] = None) -> dict:
+        try:
+            return await self.inner.update_habit(habit_id, updates, expected_version)
+        finally:
+            await self._evict('habits', habit_id)
+
+    async def delete_habit(self, habit_id: str):
+        try:
+            await self.inner.delete_habit(habit_id)
+        finally:
+            await self._evict('habits', habit_id)
+    
+    async def complete_habit(self, habit_id: str, user_id: str, notes: Optional[str] = None,
+                             today: Optional[date] = None) -> dict:
+        try:
+            return await self.inner.complete_habit(habit_id, user_id, notes, today)
+        finally:
+            await self._evict('habits', habit_id)
+            await self._evict('user_profiles', user_id)
+
+    async def update_clan(self, clan_id: str, updates: dict) -> dict:
+        try:
+            return await self.inner.update_clan(clan_id, updates)
+        finally:
+            await self._evict('clans', clan_id)
+
+    async def increment_clan_xp(self, clan_id: str, xp_amount: int):
+        try:
+            await self.inner.increment_clan_xp(clan_id, xp_amount)
+        finally:
+            await self._evict('clans', clan_id)
+
+    async def apply_clan_xp(self, clan_deltas: Dict[str, int],
+                            member_deltas: Dict[Tuple[str, str], int]):
+        try:
+            await self.inner.apply_clan_xp(clan_deltas, member_deltas)
+        finally:
+            await self._evict('clans', *clan_deltas)
+
+    async def decay_streaks(self, cutoff: date, after: Optional[str], limit: int) -> dict:
+        result = await self.inner.decay_streaks(cutoff, after, limit)
+        await self._evict('habits', *result['reset'])
+        return result
+
+    async def create_clan_with_owner(self, clan_data: dict) -> dict:
+        try:
+            return await self.inner.create_clan_with_owner(clan_data)
+        finally:
+            await self._evict('user_profiles', clan_data['owner_id'])
+
+    async def join_clan(self, clan_id: str, user_id: str, username: str) -> dict:
+        try:
+            return await self.inner.join_clan(clan_id, user_id, username)
+        finally:
+            await self._evict('clans', clan_id)
+            await self._evict('user_profiles', user_id)
+
+    async def leave_clan(self, clan_id: str, user_id: str) -> bool:
+        try:
+            return await self.inner.leave_clan(clan_id, user_id)
+        finally:
+            await self._evict('clans', clan_id)
+            await self._evict('user_profiles', user_id)
@@ -0,0 +1,107 @@
+"""
+Write-coalescing buffer for clan XP
+Every completion by a clan member used to rewrite the same `clans` row. XP
+deltas are now summed in process per clan and per (clan, member) and written
+in one batch every CLAN_XP_FLUSH_INTERVAL_MS or CLAN_XP_FLUSH_MAX_EVENTS.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from config import settings
+from services.database import Database
+
+
+class ClanXPBuffer:
+    def __init__(self, db: Optional[Database] = None, interval_ms: Optional[int] = None,
+                 max_events: Optional[int] = None):
+        self.db = db or Database()
+        self.interval = (interval_ms if interval_ms is not None else settings.CLAN_XP_FLUSH_INTERVAL_MS) / 1000
+        self.max_events = max_events or settings.CLAN_XP_FLUSH_MAX_EVENTS
+        self._clans: Dict[str, int] = defaultdict(int)
+        self._members: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._events = 0
+        self._first_event_at: Optional[float] = None
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self.metrics = {
+            'events': 0,
+            'flushes': 0,
+            'rows_written': 0,
+            'failed_flushes': 0,
+            'last_flush_lag_ms': 0.0,
+            'max_flush_lag_ms': 0.0,
+        }
+
+    def add(self, clan_id: str, user_id: str, xp_amount: int):
+        """Buffer a contribution; the write happens on the next flush"""
+        if self._first_event_at is None:
+            self._first_event_at = time.perf_counter()
+        self._clans[clan_id] += xp_amount
+        self._members[(clan_id, user_id)] += xp_amount
+        self._events += 1
+        self.metrics['events'] += 1
+
+        if self._events >= self.max_events:
+            self._spawn_flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    def pending_contribution(self, clan_id: str, user_id: str) -> int:
+        """XP buffered for a member but not yet handed to the database"""
+        return self._members.get((clan_id, user_id), 0)
+
+    def _spawn_flush(self):
+        # Writes run in their own tasks so cancelling the timer never aborts one midway
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        self._spawn_flush()
+
+    async def flush(self):
+        """Write every buffered delta in one batch"""
+        if not self._events:
+            return
+        clans, members, first_event_at = dict(self._clans), dict(self._members), self._first_event_at
+        self._clans, self._members = defaultdict(int), defaultdict(int)
+        self._events = 0
+        self._first_event_at = None
+
+        try:
+            await self.db.apply_clan_xp(clans, members)
+        except Exception as e:
+            # Keep the deltas so the next flush retries them
+            print(f"⚠️ Clan XP flush failed: {e}")
+            self.metrics['failed_flushes'] += 1
+            for clan_id, amount in clans.items():
+                self._clans[clan_id] += amount
+            for key, amount in members.items():
+                self._members[key] += amount
+            self._events += len(members)
+            self._first_event_at = min(filter(None, [self._first_event_at, first_event_at]))
+            if self._timer is None or self._timer.done():
+                self._timer = asyncio.create_task(self._flush_later())
+            return
+
+        lag_ms = (time.perf_counter() - first_event_at) * 1000
+        self.metrics['flushes'] += 1
+        self.metrics['rows_written'] += len(clans) + len(members)
+        self.metrics['last_flush_lag_ms'] = lag_ms
+        self.metrics['max_flush_lag_ms'] = max(self.metrics['max_flush_lag_ms'], lag_ms)
+
+    async def close(self):
+        """Cancel the pending timer, wait for running writes and flush what is left"""
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        self._timer = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes)
+        await self.flush()
+
+
+clan_xp_buffer = ClanXPBuffer()
@@ -0,0 +1,165 @@
+"""
+Completion bitmaps
+One 366-bit bitmap per habit and year, kept in habit_completion_bitmaps next
+to habit_logs (see migrations/012_completion_bitmaps.sql): bit n is set when
+the habit was done on day n + 1 of the year. A year of history is 46 bytes,
+and streaks, completion rates and gaps come out of a few integer operations
+instead of a scan over the habit's logs.
+
+Bitmaps are stored as the 46 bytes in little-endian order, the layout
+Postgres' set_bit() uses on a bytea, and travel as hex strings.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Tuple, Union
+
+from services.habit_rules import as_date
+
+YEAR_BITS = 366
+YEAR_BYTES = (YEAR_BITS + 7) // 8
+
+
+def day_index(day: date) -> int:
+    """Bit holding `day` in its year's bitmap"""
+    return day.timetuple().tm_yday - 1
+
+
+def days_in_year(year: int) -> int:
+    return (date(year + 1, 1, 1) - date(year, 1, 1)).days
+
+
+def encode(bitmap: int) -> str:
+    return bitmap.to_bytes(YEAR_BYTES, 'little').hex()
+
+
+def decode(value: Union[None, str, bytes, memoryview]) -> int:
+    """Bitmap from its stored form: bytes, hex, or PostgREST's '\\x' bytea text"""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        value = bytes.fromhex(value[2:] if value.startswith('\\x') else value)
+    return int.from_bytes(value, 'little')
+
+
+def mark(bitmap: int, day: date) -> int:
+    return bitmap | 1 << day_index(day)
+
+
+def popcount(bitmap: int) -> int:
+    return bitmap.bit_count()
+
+
+def runs(bitmap: int) -> List[Tuple[int, int]]:
+    """(first bit, length) of every run of set bits, lowest first"""
+    found = []
+    while bitmap:
+        start = (bitmap & -bitmap).bit_length() - 1
+        shifted = bitmap >> start
+        # Trailing ones of `shifted`: the lowest clear bit of it, less one
+        length = (~shifted & (shifted + 1)).bit_length() - 1
+        found.append((start, length))
+        bitmap &= ~((1 << (start + length)) - 1)
+    return found
+
+
+def longest_run(bitmap: int) -> int:
+    """Length of the longest run of set bits; one pass per bit of that length"""
+    length = 0
+    while bitmap:
+        bitmap &= bitmap >> 1
+        length += 1
+    return length
+
+
+def run_ending_at(bitmap: int, index: int) -> int:
+    """Length of the run of set bits ending at bit `index` (0 if it isn't set)"""
+    if index < 0 or not bitmap >> index & 1:
+        return 0
+    below = (1 << (index + 1)) - 1
+    clear = ~bitmap & below
+    return index + 1 if not clear else index - (clear.bit_length() - 1)
+
+
+def from_days(days: Iterable[date]) -> Dict[int, int]:
+    """year -> bitmap for a set of completion days"""
+    bitmaps: Dict[int, int] = {}
+    for day in days:
+        bitmaps[day.year] = mark(bitmaps.get(day.year, 0), day)
+    return bitmaps
+
+
+def from_logs(logs: Iterable[dict]) -> Dict[Tuple[str, str, int], int]:
+    """(habit_id, user_id, year) -> bitmap for habit_logs rows; the backfill"""
+    bitmaps: Dict[Tuple[str, str, int], int] = {}
+    for log in logs:
+        day = as_date(log.get('completed_on') or log.get('completed_at'))
+        if day is None:
+            continue
+        key = (log['habit_id'], log['user_id'], day.year)
+        bitmaps[key] = mark(bitmaps.get(key, 0), day)
+    return bitmaps
+
+
+class CompletionHistory:
+    """A habit's bitmaps laid end to end from 1 January of its first year,
+    so streaks that cross New Year are a single run of bits."""
+
+    def __init__(self, bitmaps: Dict[int, int]):
+        self.start = date(min(bitmaps), 1, 1) if bitmaps else None
+        self.timeline = 0
+        if bitmaps:
+            offset = 0
+            for year in range(min(bitmaps), max(bitmaps) + 1):
+                self.timeline |= bitmaps.get(year, 0) << offset
+                offset += days_in_year(year)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict]) -> 'CompletionHistory':
+        """From habit_completion_bitmaps rows"""
+        return cls({int(row['year']): decode(row['days']) for row in rows})
+
+    def _index(self, day: date) -> int:
+        return (day - self.start).days
+
+    def _window(self, start: date, end: date) -> int:
+        """Bits for start..end inclusive, bit 0 being `start`"""
+        length = (end - start).days + 1
+        if self.start is None or length <= 0:
+            return 0
+        offset = self._index(start)
+        timeline = self.timeline >> offset if offset >= 0 else self.timeline << -offset
+        return timeline & ((1 << length) - 1)
+
+    def done(self, day: date) -> bool:
+        return self.start is not None and day >= self.start and bool(self.timeline >> self._index(day) & 1)
+
+    def days(self, start: date, end: date) -> List[date]:
+        return [start + timedelta(days=first + n)
+                for first, length in runs(self._window(start, end)) for n in range(length)]
+
+    def total(self) -> int:
+        return popcount(self.timeline)
+
+    def current_streak(self, today: date) -> int:
+        """Run ending today, or ending yesterday while today is still open"""
+        if self.start is None or today < self.start:
+            return 0
+        index = self._index(today)
+        return run_ending_at(self.timeline, index) or run_ending_at(self.timeline, index - 1)
+
+    def best_streak(self) -> int:
+        return longest_run(self.timeline)
+
+    def completion_rate(self, start: date, end: date) -> float:
+        length = (end - start).days + 1
+        return popcount(self._window(start, end)) / length if length > 0 else 0.0
+
+    def gaps(self, start: date, end: date, min_days: int = 1) -> List[Tuple[date, date]]:
+        """(first, last) day of every stretch of at least `min_days` missed days"""
+        length = (end - start).days + 1
+        if length <= 0:
+            return []
+        missed = ~self._window(start, end) & ((1 << length) - 1)
+        return [(start + timedelta(days=first), start + timedelta(days=first + size - 1))
+                for first, size in runs(missed) if size >= min_days]
+
@@ -1,66 +1,166 @@
-from supabase import create_client, Client
+from supabase import AsyncClient
 from config import settings
-from typing import Optional, List, Dict
-from datetime import datetime, date
+from services.repository import (
+    Repository, StaleWriteError, apply_pending_xp, clan_join_result, clan_leave_result,
+    dense_activity, habit_completion_result
+)
+from typing import Optional, List, Dict, Sequence, Tuple
+from datetime import datetime, date, timedelta, timezone
+from services.dataloader import current_loaders
+from services.cache import CachedDatabase, create_cache
+from services.replica import ReplicaRouter
+from services.resilience import ResilientDatabase
+from services.pagination import CLAN_LEADERBOARD, CLAN_MEMBERS, HABITS, LEADERBOARD, Keyset
+from services.projection import live_user_columns, project
 
-# Create a global supabase client instance for direct use
-supabase: Client = create_client(
+# Create a global supabase client instance for direct use.
+# The async client keeps PostgREST round trips off the event loop, so a slow
+# query never stalls other requests or the Socket.IO clan chat.
+supabase: AsyncClient = AsyncClient(
     settings.SUPABASE_URL,
     settings.SUPABASE_KEY
 )
 
-class Database:
-    def __init__(self):
-        self.client: Client = supabase
+def _quote(value) -> str:
+    """Quote a value for a PostgREST logic filter, where `,.()` are syntax"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _keyset(query, keyset: Keyset, limit: Optional[int], after: Optional[dict]):
+    """Order by the keyset and seek past `after`, so deep pages use the index too"""
+    query = query.order(keyset.column, desc=keyset.desc, nullsfirst=False) \
+        .order(keyset.tiebreak, desc=keyset.desc)
+    if after is not None:
+        op = 'lt' if keyset.desc else 'gt'
+        value, tiebreak = _quote(after[keyset.column]), _quote(after[keyset.tiebreak])
+        query = query.or_(
+            f"{keyset.column}.{op}.{value},"
+            f"and({keyset.column}.eq.{value},{keyset.tiebreak}.{op}.{tiebreak})"
+        )
+    return query.limit(limit) if limit else query
+
+class SupabaseDatabase:
+    """Storage engine backed by Supabase's PostgREST API"""
+    
+    def __init__(self, client: Optional[AsyncClient] = None):
+        self._client = client
+    
+    @property
+    def client(self) -> AsyncClient:
+        # Resolved on every call so the shared client can be swapped at runtime
+        return self._client or supabase
     
     # User operations
-    async def get_user(self, user_id: str) -> Optional[dict]:
-        response = self.client.table('user_profiles').select('*').eq('clerk_user_id', user_id).execute()
-        return response.data[0] if response.data else None
+    async def get_user(self, user_id: str,
+                       columns: Optional[Sequence[str]] = None) -> Optional[dict]:
+        # user_profiles_live adds the XP still waiting in the ledger
+        select = ','.join(live_user_columns(columns)) if columns else '*'
+        response = await self.client.table('user_profiles_live').select(select).eq('clerk_user_id', user_id).execute()
+        return project(apply_pending_xp(response.data[0]), columns) if response.data else None
+    
+    async def get_users(self, user_ids: List[str]) -> List[dict]:
+        response = await self.client.table('user_profiles_live').select('*').in_('clerk_user_id', user_ids).execute()
+        return [apply_pending_xp(user) for user in response.data]
     
     async def create_user(self, user_data: dict) -> dict:
-        response = self.client.table('user_profiles').insert(user_data).execute()
+        response = await self.client.table('user_profiles').insert(user_data).execute()
         return response.data[0]
     
-    async def update_user(self, user_id: str, updates: dict) -> dict:
-        response = self.client.table('user_profiles').update(updates).eq('clerk_user_id', user_id).execute()
+    async def update_user(self, user_id: str, updates: dict,
+                          expected_version: Optional[int] = None) -> dict:
+        query = self.client.table('user_profiles')
+        if expected_version is None:
+            response = await query.update(updates).eq('clerk_user_id', user_id).execute()
+        else:
+            response = await query.update({**updates, 'version': expected_version + 1}) \
+                .eq('clerk_user_id', user_id) \
+                .eq('version', expected_version) \
+                .execute()
+            if not response.data:
+                raise StaleWriteError(f"user_profiles row changed since version {expected_version}")
         return response.data[0]
     
+    # XP ledger operations
+    async def record_xp_transaction(self, user_id: str, xp_amount: int,
+                                    reason: str) -> Optional[dict]:
+        # Appends to xp_transactions without locking the profile row
+        response = await self.client.rpc('record_xp_transaction', {
+            'p_user_id': user_id,
+            'p_amount': xp_amount,
+            'p_reason': reason
+        }).execute()
+        return apply_pending_xp(response.data[0]) if response.data else None
+    
+    async def compact_xp_ledger(self, batch_size: int = 500) -> int:
+        response = await self.client.rpc('compact_xp_ledger', {'p_batch_size': batch_size}).execute()
+        return response.data or 0
+    
     # Habit operations
     async def get_habit(self, habit_id: str) -> Optional[dict]:
-        response = self.client.table('habits').select('*').eq('id', habit_id).execute()
+        response = await self.client.table('habits').select('*').eq('id', habit_id).execute()
         return response.data[0] if response.data else None
     
-    async def get_user_habits(self, user_id: str) -> List[dict]:
-        response = self.client.table('habits').select('*').eq('user_id', user_id).execute()
+    async def get_habits(self, habit_ids: List[str]) -> List[dict]:
+        response = await self.client.table('habits').select('*').in_('id', habit_ids).execute()
+        return response.data
+    
+    async def get_user_habits(self, user_id: str, columns: Optional[Sequence[str]] = None,
+                              limit: Optional[int] = None, after: Optional[dict] = None) -> List[dict]:
+        select = ','.join(columns) if columns else '*'
+        query = self.client.table('habits').select(select).eq('user_id', user_id)
+        response = await _keyset(query, HABITS, limit, after).execute()
         return response.data
     
     async def create_habit(self, habit_data: dict) -> dict:
-        response = self.client.table('habits').insert(habit_data).execute()
+        response = await self.client.table('habits').insert(habit_data).execute()
         return response.data[0]
     
-    async def update_habit(self, habit_id: str, updates: dict) -> dict:
-        response = self.client.table('habits').update(updates).eq('id', habit_id).execute()
+    async def update_habit(self, habit_id: str, updates: dict,
+                           expected_version: Optional[int] = None) -> dict:
+        query = self.client.table('habits')
+        if expected_version is None:
+            response = await query.update(updates).eq('id', habit_id).execute()
+        else:
+            response = await query.update({**updates, 'version': expected_version + 1}) \
+                .eq('id', habit_id) \
+                .eq('version', expected_version) \
+                .execute()
+            if not response.data:
+                raise StaleWriteError(f"habits row changed since version {expected_version}")
         return response.data[0]
     
     async def delete_habit(self, habit_id: str):
-        self.client.table('habits').delete().eq('id', habit_id).execute()
+        await self.client.table('habits').delete().eq('id', habit_id).execute()
     
     # Habit completion operations
-    async def create_habit_completion(self, habit_id: str, user_id: str, 
-                                     xp_earned: int, notes: Optional[str] = None) -> dict:
+    async def create_habit_completion(self, habit_id: str, user_id: str, xp_earned: int,
+                                      notes: Optional[str] = None,
+                                      completed_on: Optional[date] = None) -> Optional[dict]:
+        now = datetime.now()
         completion_data = {
             'habit_id': habit_id,
             'user_id': user_id,
             'xp_earned': xp_earned,
             'notes': notes,
-            'completed_at': datetime.now().isoformat()
+            'completed_at': now.isoformat(),
+            'completed_on': (completed_on or now.date()).isoformat()
         }
-        response = self.client.table('habit_logs').insert(completion_data).execute()
-        return response.data[0]
+        # Insert-or-skip on the one-completion-per-day constraint
+        response = await self.client.table('habit_logs') \
+            .upsert(completion_data, on_conflict='habit_id,user_id,completed_on', ignore_duplicates=True) \
+            .execute()
+        return response.data[0] if response.data else None
+    
+    async def create_habit_completions(self, completions: List[dict]) -> List[dict]:
+        if not completions:
+            return []
+        # One request for the whole batch; days already logged are skipped
+        response = await self.client.table('habit_logs') \
+            .upsert(completions, on_conflict='habit_id,user_id,completed_on', ignore_duplicates=True) \
+            .execute()
+        return response.data
     
     async def get_last_completion(self, habit_id: str, user_id: str) -> Optional[dict]:
-        response = self.client.table('habit_logs') \
+        response = await self.client.table('habit_logs') \
             .select('*') \
             .eq('habit_id', habit_id) \
             .eq('user_id', user_id) \
@@ -69,18 +169,38 @@ class Database:
             .execute()
         return response.data[0] if response.data else None
     
+    async def complete_habit(self, habit_id: str, user_id: str, notes: Optional[str] = None,
+                             today: Optional[date] = None) -> dict:
+        # One round trip: dedupe, streak, log, habit update and XP in a transaction
+        response = await self.client.rpc('complete_habit', {
+            'p_habit_id': habit_id,
+            'p_user_id': user_id,
+            'p_notes': notes,
+            'p_today': (today or date.today()).isoformat()
+        }).execute()
+        return habit_completion_result(response.data)
+    
     # Badge operations
     async def create_badge_if_not_exists(self, badge_data: dict):
-        existing = self.client.table('badges').select('*').eq('name', badge_data['name']).execute()
+        existing = await self.client.table('badges').select('*').eq('name', badge_data['name']).execute()
         if not existing.data:
-            self.client.table('badges').insert(badge_data).execute()
+            await self.client.table('badges').insert(badge_data).execute()
+    
+    async def upsert_badges(self, badges: List[dict]) -> List[dict]:
+        # One request for the whole catalog; needs the unique index on badges.name
+        response = await self.client.table('badges').upsert(badges, on_conflict='name').execute()
+        return response.data
     
     async def get_badge_by_name(self, name: str) -> Optional[dict]:
-        response = self.client.table('badges').select('*').eq('name', name).execute()
+        response = await self.client.table('badges').select('*').eq('name', name).execute()
         return response.data[0] if response.data else None
     
+    async def get_badges_by_name(self, names: List[str]) -> List[dict]:
+        response = await self.client.table('badges').select('*').in_('name', names).execute()
+        return response.data
+    
     async def get_badge_by_type_and_requirement(self, badge_type: str, requirement: int) -> Optional[dict]:
-        response = self.client.table('badges') \
+        response = await self.client.table('badges') \
             .select('*') \
             .eq('badge_type', badge_type) \
             .eq('requirement', requirement) \
@@ -88,11 +208,11 @@ class Database:
         return response.data[0] if response.data else None
     
     async def get_all_badges(self) -> List[dict]:
-        response = self.client.table('badges').select('*').execute()
+        response = await self.client.table('badges').select('*').execute()
         return response.data
     
     async def user_has_badge(self, user_id: str, badge_id: str) -> bool:
-        response = self.client.table('user_badges') \
+        response = await self.client.table('user_badges') \
             .select('*') \
             .eq('user_id', user_id) \
             .eq('badge_id', badge_id) \
@@ -105,11 +225,11 @@ class Database:
             'badge_id': badge_id,
             'earned_at': datetime.now().isoformat()
         }
-        response = self.client.table('user_badges').insert(badge_data).execute()
+        response = await self.client.table('user_badges').insert(badge_data).execute()
         return response.data[0]
     
     async def get_user_badges(self, user_id: str) -> List[dict]:
-        response = self.client.table('user_badges') \
+        response = await self.client.table('user_badges') \
             .select('*, badges(*)') \
             .eq('user_id', user_id) \
             .execute()
@@ -117,15 +237,19 @@ class Database:
     
     # Clan operations
     async def create_clan(self, clan_data: dict) -> dict:
-        response = self.client.table('clans').insert(clan_data).execute()
+        response = await self.client.table('clans').insert(clan_data).execute()
         return response.data[0]
     
     async def get_clan(self, clan_id: str) -> Optional[dict]:
-        response = self.client.table('clans').select('*').eq('id', clan_id).execute()
+        response = await self.client.table('clans').select('*').eq('id', clan_id).execute()
         return response.data[0] if response.data else None
     
+    async def get_clans(self, clan_ids: List[str]) -> List[dict]:
+        response = await self.client.table('clans').select('*').in_('id', clan_ids).execute()
+        return response.data
+    
     async def update_clan(self, clan_id: str, updates: dict) -> dict:
-        response = self.client.table('clans').update(updates).eq('id', clan_id).execute()
+        response = await self.client.table('clans').update(updates).eq('id', clan_id).execute()
         return response.data[0]
     
     async def increment_clan_xp(self, clan_id: str, xp_amount: int):
@@ -133,32 +257,36 @@ class Database:
         new_xp = clan['total_xp'] + xp_amount
         await self.update_clan(clan_id, {'total_xp': new_xp})
     
+    async def create_clan_with_owner(self, clan_data: dict) -> dict:
+        # Clan row, owner membership and the owner's clan_id in one transaction
+        response = await self.client.rpc('create_clan_with_owner', {'p_clan': clan_data}).execute()
+        return response.data
+    
     async def join_clan(self, clan_id: str, user_id: str, username: str) -> dict:
-        member_data = {
-            'clan_id': clan_id,
-            'user_id': user_id,
-            'username': username,
-            'xp_contributed': 0,
-            'role': 'member',
-            'joined_at': datetime.now().isoformat()
-        }
-        response = self.client.table('clan_members').insert(member_data).execute()
-        
-        # Update user's clan_id
-        await self.update_user(user_id, {'clan_id': clan_id})
-        
-        # Increment clan member count
-        clan = await self.get_clan(clan_id)
-        await self.update_clan(clan_id, {'member_count': clan['member_count'] + 1})
-        
-        return response.data[0]
+        # join_clan() locks the clan row, so the capacity check can't race
+        response = await self.client.rpc('join_clan', {
+            'p_clan_id': clan_id,
+            'p_user_id': user_id,
+            'p_username': username
+        }).execute()
+        return clan_join_result(response.data)
+    
+    async def leave_clan(self, clan_id: str, user_id: str) -> bool:
+        response = await self.client.rpc('leave_clan', {
+            'p_clan_id': clan_id,
+            'p_user_id': user_id
+        }).execute()
+        return clan_leave_result(response.data)
     
-    async def get_clan_members(self, clan_id: str) -> List[dict]:
-        response = self.client.table('clan_members').select('*').eq('clan_id', clan_id).execute()
+    async def get_clan_members(self, clan_id: str, columns: Optional[Sequence[str]] = None,
+                               limit: Optional[int] = None, after: Optional[dict] = None) -> List[dict]:
+        select = ','.join(columns) if columns else '*'
+        query = self.client.table('clan_members').select(select).eq('clan_id', clan_id)
+        response = await _keyset(query, CLAN_MEMBERS, limit, after).execute()
         return response.data
     
     async def increment_clan_member_contribution(self, clan_id: str, user_id: str, xp_amount: int):
-        member = self.client.table('clan_members') \
+        member = await self.client.table('clan_members') \
             .select('*') \
             .eq('clan_id', clan_id) \
             .eq('user_id', user_id) \
@@ -166,26 +294,40 @@ class Database:
         
         if member.data:
             new_contribution = member.data[0]['xp_contributed'] + xp_amount
-            self.client.table('clan_members') \
+            await self.client.table('clan_members') \
                 .update({'xp_contributed': new_contribution}) \
                 .eq('clan_id', clan_id) \
                 .eq('user_id', user_id) \
                 .execute()
     
     async def get_clan_member_contribution(self, clan_id: str, user_id: str) -> int:
-        response = self.client.table('clan_members') \
+        response = await self.client.table('clan_members') \
             .select('xp_contributed') \
             .eq('clan_id', clan_id) \
             .eq('user_id', user_id) \
             .execute()
         return response.data[0]['xp_contributed'] if response.data else 0
     
+    async def apply_clan_xp(self, clan_deltas: Dict[str, int],
+                            member_deltas: Dict[Tuple[str, str], int]):
+        # apply_clan_xp() writes a whole buffer flush in one transaction
+        await self.client.rpc('apply_clan_xp', {
+            'p_clans': [
+                {'id': clan_id, 'total_xp': amount}
+                for clan_id, amount in clan_deltas.items()
+            ],
+            'p_members': [
+                {'clan_id': clan_id, 'user_id': user_id, 'xp_contributed': amount}
+                for (clan_id, user_id), amount in member_deltas.items()
+            ]
+        }).execute()
+    
     async def create_clan_message(self, message_data: dict) -> dict:
-        response = self.client.table('clan_messages').insert(message_data).execute()
+        response = await self.client.table('clan_messages').insert(message_data).execute()
         return response.data[0]
     
     async def get_clan_messages(self, clan_id: str, limit: int = 50) -> List[dict]:
-        response = self.client.table('clan_messages') \
+        response = await self.client.table('clan_messages') \
             .select('*') \
             .eq('clan_id', clan_id) \
             .order('timestamp', desc=True) \
@@ -194,25 +336,38 @@ class Database:
         return response.data
     
     # Leaderboard operations
-    async def get_leaderboard(self, limit: int = 100) -> List[dict]:
-        response = self.client.table('user_profiles') \
+    async def get_leaderboard(self, limit: int = 100, columns: Optional[Sequence[str]] = None,
+                              after: Optional[dict] = None) -> List[dict]:
+        query = self.client.table('user_profiles').select(','.join(columns) if columns else '*')
+        response = await _keyset(query, LEADERBOARD, limit, after).execute()
+        return response.data
+    
+    async def get_clan_leaderboard(self, limit: int = 50, after: Optional[dict] = None) -> List[dict]:
+        query = self.client.table('clans').select('*')
+        response = await _keyset(query, CLAN_LEADERBOARD, limit, after).execute()
+        return response.data
+    
+    # Discover operations
+    async def get_public_habits(self, limit: int = 20) -> List[dict]:
+        response = await self.client.table('habits') \
             .select('*') \
-            .order('total_points', desc=True) \
+            .eq('is_public', True) \
             .limit(limit) \
             .execute()
         return response.data
     
-    async def get_clan_leaderboard(self, limit: int = 50) -> List[dict]:
-        response = self.client.table('clans') \
+    async def get_popular_habits(self, limit: int = 10) -> List[dict]:
+        response = await self.client.table('habits') \
             .select('*') \
-            .order('total_xp', desc=True) \
+            .eq('is_public', True) \
+            .order('total_completions', desc=True) \
             .limit(limit) \
             .execute()
         return response.data
     
     # Quest operations
     async def get_active_quests(self, user_id: str) -> List[dict]:
-        response = self.client.table('user_quests') \
+        response = await self.client.table('user_quests') \
             .select('*, quests(*)') \
             .eq('user_id', user_id) \
             .eq('status', 'active') \
@@ -220,7 +375,288 @@ class Database:
         return response.data
     
     async def update_quest_progress(self, user_quest_id: str, progress: int):
-        self.client.table('user_quests') \
+        await self.client.table('user_quests') \
             .update({'progress': progress}) \
             .eq('id', user_quest_id) \
             .execute()
+    
+    # Side-effect job queue operations
+    async def enqueue_side_effects(self, jobs: List[dict], lease_seconds: float) -> List[dict]:
+        locked_until = (datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)).isoformat()
+        response = await self.client.table('side_effect_jobs').insert([
+            {'kind': job['kind'], 'payload': job['payload'], 'locked_until': locked_until}
+            for job in jobs
+        ]).execute()
+        return response.data
+    
+    async def claim_side_effects(self, limit: int, lease_seconds: float) -> List[dict]:
+        response = await self.client.rpc('claim_side_effect_jobs', {
+            'p_limit': limit,
+            'p_lease_seconds': lease_seconds
+        }).execute()
+        return response.data or []
+    
+    async def finish_side_effect(self, job_id):
+        await self.client.table('side_effect_jobs').delete().eq('id', job_id).execute()
+    
+    async def retry_side_effect(self, job_id, attempts: int, error: str,
+                                retry_in: Optional[float]):
+        updates = {'attempts': attempts, 'last_error': error}
+        if retry_in is None:
+            updates['status'] = 'dead'
+        else:
+            updates['locked_until'] = (datetime.now(timezone.utc) + timedelta(seconds=retry_in)).isoformat()
+        await self.client.table('side_effect_jobs').update(updates).eq('id', job_id).execute()
+    
+    # Outbox operations; events are written by the migration 010 triggers
+    async def claim_outbox_events(self, limit: int, lease_seconds: float) -> List[dict]:
+        response = await self.client.rpc('claim_outbox_events', {
+            'p_limit': limit,
+            'p_lease_seconds': lease_seconds
+        }).execute()
+        return response.data or []
+    
+    async def ack_outbox_events(self, event_ids: List):
+        if event_ids:
+            await self.client.table('outbox_events').delete().in_('id', event_ids).execute()
+    
+    # Completion bitmap operations
+    async def get_completion_bitmaps(self, habit_id: str) -> List[dict]:
+        response = await self.client.table('habit_completion_bitmaps') \
+            .select('*') \
+            .eq('habit_id', habit_id) \
+            .order('year') \
+            .execute()
+        return response.data
+    
+    async def backfill_completion_bitmaps(self, habit_ids: Optional[List[str]] = None) -> int:
+        response = await self.client.rpc('backfill_completion_bitmaps', {'p_habit_ids': habit_ids}).execute()
+        return response.data
+    
+    # Activity rollup operations
+    async def get_user_activity(self, user_id: str, start: date, end: date) -> List[dict]:
+        response = await self.client.table('daily_user_activity') \
+            .select('day,completions,xp_earned') \
+            .eq('user_id', user_id) \
+            .gte('day', start.isoformat()) \
+            .lte('day', end.isoformat()) \
+            .execute()
+        return dense_activity(response.data, start, end)
+    
+    # Streak decay operations
+    async def decay_streaks(self, cutoff: date, after: Optional[str], limit: int) -> dict:
+        response = await self.client.rpc('decay_streaks', {
+            'p_cutoff': cutoff.isoformat(),
+            'p_after': after,
+            'p_limit': limit
+        }).execute()
+        return response.data
+    
+    async def get_sweep_checkpoint(self, name: str) -> Optional[dict]:
+        response = await self.client.table('sweep_checkpoints').select('*').eq('name', name).execute()
+        return response.data[0] if response.data else None
+    
+    async def save_sweep_checkpoint(self, name: str, cursor: Optional[str], finished: bool):
+        await self.client.table('sweep_checkpoints').upsert({
+            'name': name,
+            'cursor': cursor,
+            'finished': finished,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }, on_conflict='name').execute()
+
+
+def create_engine(backend: Optional[str] = None) -> Repository:
+    """Build the storage engine named by settings.DATABASE_BACKEND, routing
+    lag-tolerant reads to a configured replica, with deadlines and circuit
+    breakers, behind the row cache when settings.CACHE_BACKEND enables one"""
+    backend = backend or settings.DATABASE_BACKEND
+    engine = _create_storage_engine(backend)
+    replica = _create_replica_engine(backend)
+    if replica is not None:
+        engine = ReplicaRouter(engine, replica)
+    engine = ResilientDatabase(engine)
+    cache = create_cache()
+    return CachedDatabase(engine, cache) if cache is not None else engine
+
+def _create_replica_engine(backend: str) -> Optional[Repository]:
+    if backend == 'supabase' and settings.SUPABASE_REPLICA_URL:
+        return SupabaseDatabase(AsyncClient(settings.SUPABASE_REPLICA_URL, settings.SUPABASE_KEY))
+    if backend == 'postgres' and settings.DATABASE_REPLICA_URL:
+        from services.postgres_database import PostgresDatabase
+        return PostgresDatabase(settings.DATABASE_REPLICA_URL)
+    return None
+
+def _create_storage_engine(backend: str) -> Repository:
+    if backend == 'supabase':
+        return SupabaseDatabase()
+    if backend == 'postgres':
+        from services.postgres_database import PostgresDatabase
+        return PostgresDatabase(settings.DATABASE_URL)
+    if backend == 'memory':
+        from services.memory_database import InMemoryDatabase
+        return InMemoryDatabase()
+    if backend == 'sqlite':
+        from services.sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(settings.SQLITE_PATH)
+    raise ValueError(f"Unknown DATABASE_BACKEND: {backend}")
+
+_engine = None
+
+def get_engine() -> Repository:
+    """Return the process-wide storage engine, creating it on first use"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine()
+    return _engine
+
+def set_engine(engine: Repository):
+    """Replace the process-wide storage engine (tests, benchmarks)"""
+    global _engine
+    _engine = engine
+
+async def close_engine():
+    """Release connections held by the current engine"""
+    if _engine is not None and hasattr(_engine, 'close'):
+        await _engine.close()
+
+class Database:
+    """Data access entry point used by routes and services.
+    
+    Every call is forwarded to the configured engine, so the backend can be
+    chosen through config.Settings without touching call sites.
+    """
+    
+    def __init__(self, engine=None, replica=None):
+        # An explicit replica wraps the engine in its own ReplicaRouter;
+        # the process-wide engine gets one from settings in create_engine
+        if replica is not None:
+            engine = ReplicaRouter(engine or get_engine(), replica)
+        self._engine = engine
+    
+    @property
+    def engine(self) -> Repository:
+        return self._engine or get_engine()
+    
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+    
+    def _loaders(self):
+        # Only inside a request scope opened for this same engine
+        loaders = current_loaders()
+        return loaders if loaders is not None and loaders.engine is self.engine else None
+    
+    # Entity reads go through the request's DataLoaders when one is active
+    async def get_user(self, user_id: str,
+                       columns: Optional[Sequence[str]] = None) -> Optional[dict]:
+        loaders = self._loaders()
+        if loaders is None or columns is not None:
+            # Projected reads skip the identity map, which holds whole rows
+            return await self.engine.get_user(user_id, columns)
+        return await loaders.users.load(user_id)
+    
+    async def get_habit(self, habit_id: str) -> Optional[dict]:
+        loaders = self._loaders()
+        if loaders is None:
+            return await self.engine.get_habit(habit_id)
+        return await loaders.habits.load(habit_id)
+    
+    async def get_clan(self, clan_id: str) -> Optional[dict]:
+        loaders = self._loaders()
+        if loaders is None:
+            return await self.engine.get_clan(clan_id)
+        return await loaders.clans.load(clan_id)
+    
+    async def get_badge_by_name(self, name: str) -> Optional[dict]:
+        loaders = self._loaders()
+        if loaders is None:
+            return await self.engine.get_badge_by_name(name)
+        return await loaders.badges.load(name)
+    
+    async def get_badge_by_type_and_requirement(self, badge_type: str, requirement: int) -> Optional[dict]:
+        badge = await self.engine.get_badge_by_type_and_requirement(badge_type, requirement)
+        loaders = self._loaders()
+        if loaders is not None and badge is not None:
+            loaders.badges.prime(badge['name'], badge)
+        return badge
+    
+    # Writes keep the request's identity map in step with the database
+    async def update_user(self, user_id: str, updates: dict,
+                          expected_version: Optional[int] = None) -> dict:
+        user = await self.engine.update_user(user_id, updates, expected_version)
+        self._forget('users', user_id)
+        return user
+    
+    async def record_xp_transaction(self, user_id: str, xp_amount: int,
+                                    reason: str) -> Optional[dict]:
+        user = await self.engine.record_xp_transaction(user_id, xp_amount, reason)
+        loaders = self._loaders()
+        if loaders is not None:
+            loaders.users.prime(user_id, user)
+        return user
+    
+    async def update_habit(self, habit_id: str, updates: dict,
+                           expected_version: Optional[int] = None) -> dict:
+        habit = await self.engine.update_habit(habit_id, updates, expected_version)
+        loaders = self._loaders()
+        if loaders is not None:
+            loaders.habits.prime(habit_id, habit)
+        return habit
+    
+    async def delete_habit(self, habit_id: str):
+        await self.engine.delete_habit(habit_id)
+        self._forget('habits', habit_id)
+    
+    async def complete_habit(self, habit_id: str, user_id: str, notes: Optional[str] = None,
+                             today: Optional[date] = None) -> dict:
+        try:
+            return await self.engine.complete_habit(habit_id, user_id, notes, today)
+        finally:
+            self._forget('habits', habit_id)
+            self._forget('users', user_id)
+    
+    async def update_clan(self, clan_id: str, updates: dict) -> dict:
+        clan = await self.engine.update_clan(clan_id, updates)
+        loaders = self._loaders()
+        if loaders is not None:
+            loaders.clans.prime(clan_id, clan)
+        return clan
+    
+    async def increment_clan_xp(self, clan_id: str, xp_amount: int):
+        await self.engine.increment_clan_xp(clan_id, xp_amount)
+        self._forget('clans', clan_id)
+    
+    async def apply_clan_xp(self, clan_deltas: Dict[str, int],
+                            member_deltas: Dict[Tuple[str, str], int]):
+        await self.engine.apply_clan_xp(clan_deltas, member_deltas)
+        for clan_id in clan_deltas:
+            self._forget('clans', clan_id)
+    
+    async def decay_streaks(self, cutoff: date, after: Optional[str], limit: int) -> dict:
+        result = await self.engine.decay_streaks(cutoff, after, limit)
+        for habit_id in result['reset']:
+            self._forget('habits', habit_id)
+        return result
+    
+    async def join_clan(self, clan_id: str, user_id: str, username: str) -> dict:
+        try:
+            return await self.engine.join_clan(clan_id, user_id, username)
+        finally:
+            self._forget('clans', clan_id)
+            self._forget('users', user_id)
+    
+    async def leave_clan(self, clan_id: str, user_id: str) -> bool:
+        try:
+            return await self.engine.leave_clan(clan_id, user_id)
+        finally:
+            self._forget('clans', clan_id)
+            self._forget('users', user_id)
+    
+    async def create_clan_with_owner(self, clan_data: dict) -> dict:
+        clan = await self.engine.create_clan_with_owner(clan_data)
+        self._forget('users', clan['owner_id'])
+        return clan
+    
+    def _forget(self, loader: str, key: str):
+        loaders = self._loaders()
+        if loaders is not None:
+            getattr(loaders, loader).clear(key)
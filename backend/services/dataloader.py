@@ -0,0 +1,101 @@
+"""
+Request-scoped DataLoader
+Loads of users, habits, clans and badges made while handling one request
+share an identity map, and loads issued in the same event-loop tick are
+coalesced into a single `in.(...)` query.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+# Process-wide counters, exposed through GET /metrics
+METRICS = {'loads': 0, 'queries': 0}
+
+
+def metrics() -> dict:
+    return {**METRICS, 'calls_saved': METRICS['loads'] - METRICS['queries']}
+
+
+class DataLoader:
+    def __init__(self, batch_fn: Callable[[List], Awaitable[List[dict]]], key: str):
+        self.batch_fn = batch_fn
+        self.key = key
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[tuple] = []
+
+    async def load(self, key: Hashable) -> Optional[dict]:
+        METRICS['loads'] += 1
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._cache[key] = loop.create_future()
+            if not self._queue:
+                # Runs after every task already scheduled for this tick has queued its key
+                loop.call_soon(self._dispatch)
+            self._queue.append((key, future))
+        # Shielded so one cancelled caller can't cancel the load for everyone
+        row = await asyncio.shield(future)
+        # Callers get their own copy so they can decorate it freely
+        return dict(row) if row is not None else None
+
+    def prime(self, key: Hashable, row: Optional[dict]):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(dict(row) if row is not None else None)
+        self._cache[key] = future
+
+    def clear(self, key: Hashable):
+        self._cache.pop(key, None)
+
+    def clear_all(self):
+        self._cache.clear()
+
+    def _dispatch(self):
+        batch, self._queue = self._queue, []
+        asyncio.ensure_future(self._fetch(batch))
+
+    async def _fetch(self, batch: List[tuple]):
+        METRICS['queries'] += 1
+        try:
+            rows = await self.batch_fn([key for key, _ in batch])
+        except Exception as e:
+            for key, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+                # Don't remember failures; the next load retries
+                if self._cache.get(key) is future:
+                    del self._cache[key]
+            return
+        found = {row[self.key]: row for row in rows}
+        for key, future in batch:
+            if not future.done():
+                future.set_result(found.get(key))
+
+
+class Loaders:
+    """The loaders for one request, bound to the engine they read from"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.users = DataLoader(engine.get_users, key='clerk_user_id')
+        self.habits = DataLoader(engine.get_habits, key='id')
+        self.clans = DataLoader(engine.get_clans, key='id')
+        self.badges = DataLoader(engine.get_badges_by_name, key='name')
+
+
+_loaders: ContextVar[Optional[Loaders]] = ContextVar('loaders', default=None)
+
+
+def current_loaders() -> Optional[Loaders]:
+    return _loaders.get()
+
+
+@contextmanager
+def loader_scope(engine):
+    """Give everything running inside the block (and tasks it starts) one set of loaders"""
+    token = _loaders.set(Loaders(engine))
+    try:
+        yield _loaders.get()
+    finally:
+        _loaders.reset(token)
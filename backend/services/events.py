@@ -0,0 +1,49 @@
+"""
+Outbox events
+The rows the migrations/010_outbox.sql triggers write to outbox_events when
+XP is recorded, a badge is earned or a streak reaches a milestone. The
+in-process engines and the PostgREST stand-in have no triggers, so they
+build the same rows with these helpers; keep both in sync.
+"""
+
+from typing import Optional
+
+from services.habit_rules import STREAK_BONUSES
+
+STREAK_MILESTONES = frozenset(STREAK_BONUSES)
+
+
+def xp_event(entry: dict, new_total_xp: int) -> dict:
+    """Event for one xp_transactions entry; `new_total_xp` already includes it"""
+    return {
+        'event': 'xp_update',
+        'user_id': entry['user_id'],
+        'payload': {'xp_earned': entry['amount'], 'reason': entry['reason'], 'new_total_xp': new_total_xp}
+    }
+
+
+def badge_event(user_badge: dict, badge: dict) -> dict:
+    return {
+        'event': 'badge_earned',
+        'user_id': user_badge['user_id'],
+        'payload': {
+            'badge_id': badge['id'],
+            'badge_name': badge['name'],
+            'badge_icon': badge.get('icon'),
+            'badge_type': badge.get('badge_type'),
+            'rarity': badge.get('rarity')
+        }
+    }
+
+
+def streak_event(before: Optional[dict], habit: dict) -> Optional[dict]:
+    """Event for a habit write that moved its streak onto a milestone, else None"""
+    streak = habit.get('streak')
+    if streak not in STREAK_MILESTONES or (before is not None and before.get('streak') == streak):
+        return None
+    return {
+        'event': 'streak_milestone',
+        'user_id': habit['user_id'],
+        'payload': {'habit_id': habit['id'], 'habit_title': habit.get('title'),
+                    'streak': streak, 'milestone': streak}
+    }
@@ -0,0 +1,69 @@
+"""
+Habit completion rules for Habituate
+Streak progression and completion XP, shared by the Python completion path
+and the engines that run it as a single procedure. Mirrored in SQL by
+migrations/007_complete_habit.sql, keep both in sync.
+"""
+
+from datetime import date, datetime
+from typing import Optional, Tuple, Union
+
+from models.user import XP_CONFIG
+
+DIFFICULTY_MULTIPLIERS = {
+    'easy': 1.0,
+    'medium': 1.5,
+    'hard': 2.0,
+}
+
+# Streak length -> (bonus name, XP) awarded on the day the streak reaches it
+STREAK_BONUSES = {
+    7: ('weekly', XP_CONFIG['WEEKLY_STREAK']),
+    30: ('monthly', XP_CONFIG['MONTHLY_STREAK']),
+    100: ('century', 500),
+    365: ('yearly', 1000),
+}
+
+
+def as_date(value: Union[None, str, date, datetime]) -> Optional[date]:
+    """Day part of a timestamp as stored (PostgREST returns ISO strings)"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).date()
+
+
+def next_streak(habit: dict, today: date) -> Tuple[int, int]:
+    """(streak, best_streak) after completing `habit` on `today`"""
+    last_date = as_date(habit.get('last_completed'))
+    if last_date is None:
+        # First completion
+        streak = 1
+    else:
+        days_diff = (today - last_date).days
+        if days_diff == 1:
+            # Consecutive day
+            streak = (habit.get('streak') or 0) + 1
+        elif days_diff == 0:
+            # Same day
+            streak = habit.get('streak') or 0
+        else:
+            # Streak broken, start over
+            streak = 1
+    return streak, max(habit.get('best_streak') or 0, streak)
+
+
+def habit_xp(difficulty: Optional[str], streak: int) -> int:
+    """XP for one completion: base XP scaled by difficulty, plus 5% per
+    10 streak days up to 50%"""
+    base_xp = XP_CONFIG['HABIT_COMPLETE']
+    multiplier = DIFFICULTY_MULTIPLIERS.get(difficulty, 1.0)
+    streak_bonus = min(streak // 10 * 0.05, 0.5)
+    return int(base_xp * multiplier * (1 + streak_bonus))
+
+
+def completion_reason(habit: dict) -> str:
+    return f'habit_complete_{habit["title"]}'
@@ -0,0 +1,198 @@
+"""
+Idempotency keys
+Mobile clients retry completions and XP awards on flaky networks. A request
+carrying an Idempotency-Key runs once: its response is kept for
+IDEMPOTENCY_TTL_SECONDS and a retry gets it back without touching the
+database. A duplicate that arrives while the first is still running waits for
+it, in process on the same task, across processes by polling the store.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from config import settings
+
+
+class IdempotencyKeyReusedError(ValueError):
+    """The key was already used for a request with different parameters"""
+
+
+class IdempotencyKeyInProgressError(RuntimeError):
+    """Another process is still running the request holding this key"""
+
+
+def _encode(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+class MemoryIdempotencyStore:
+    """Bounded in-process store with a per-record TTL"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._records: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._records.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._records[key]
+            return None
+        return json.loads(value)
+
+    async def set(self, key: str, record: dict, ttl: float):
+        self._records[key] = (time.monotonic() + ttl, json.dumps(record))
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+
+    async def reserve(self, key: str, record: dict, ttl: float) -> Optional[dict]:
+        """Store `record` unless the key is taken; returns the record holding it"""
+        existing = await self.get(key)
+        if existing is not None:
+            return existing
+        await self.set(key, record, ttl)
+        return None
+
+    async def delete(self, key: str):
+        self._records.pop(key, None)
+
+    async def close(self):
+        self._records.clear()
+
+
+class RedisIdempotencyStore:
+    """Store shared by every worker through Redis"""
+
+    def __init__(self, client, prefix: str = 'habituate:idempotency:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> 'RedisIdempotencyStore':
+        import redis.asyncio as redis
+        return cls(redis.Redis.from_url(url))
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = await self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, record: dict, ttl: float):
+        await self.client.set(self.prefix + key, json.dumps(record), px=int(ttl * 1000))
+
+    async def reserve(self, key: str, record: dict, ttl: float) -> Optional[dict]:
+        while True:
+            if await self.client.set(self.prefix + key, json.dumps(record), px=int(ttl * 1000), nx=True):
+                return None
+            existing = await self.get(key)
+            # Gone between the two calls: the holder failed or it expired, try again
+            if existing is not None:
+                return existing
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_idempotency_store(backend: Optional[str] = None):
+    """Build the store named by settings.IDEMPOTENCY_BACKEND"""
+    backend = backend or settings.IDEMPOTENCY_BACKEND
+    if backend == 'memory':
+        return MemoryIdempotencyStore(settings.IDEMPOTENCY_MAX_ENTRIES)
+    if backend == 'redis':
+        if not settings.REDIS_URL:
+            raise ValueError("IDEMPOTENCY_BACKEND=redis requires REDIS_URL")
+        return RedisIdempotencyStore.from_url(settings.REDIS_URL)
+    raise ValueError(f"Unknown IDEMPOTENCY_BACKEND: {backend}")
+
+
+class IdempotencyKeys:
+    def __init__(self, store=None, ttl: Optional[float] = None, lock_seconds: Optional[float] = None,
+                 poll_interval: float = 0.05):
+        self.store = store or create_idempotency_store()
+        self.ttl = ttl or settings.IDEMPOTENCY_TTL_SECONDS
+        self.lock_seconds = lock_seconds or settings.IDEMPOTENCY_LOCK_SECONDS
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, Tuple[str, asyncio.Task]] = {}
+        self.stats = {'executed': 0, 'replayed': 0, 'joined': 0}
+
+    def metrics(self) -> dict:
+        return {**self.stats, 'in_flight': len(self._flights)}
+
+    async def run(self, key: Optional[str], scope: str, request: dict,
+                  call: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """(response, replayed) for `call()` under `key`, run at most once per key.
+
+        `request` holds the parameters the key was issued for; reusing the key
+        with different ones raises IdempotencyKeyReusedError. Without a key the
+        call just runs. Failures aren't kept, so a retry runs the call again.
+        """
+        if not key:
+            return await call(), False
+        store_key = f'{scope}:{key}'
+        fingerprint = hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+        flight = self._flights.get(store_key)
+        if flight is not None and flight[1].get_loop() is asyncio.get_running_loop():
+            if flight[0] != fingerprint:
+                raise IdempotencyKeyReusedError(f"Idempotency-Key {key} was used for a different request")
+            self.stats['joined'] += 1
+            body, _ = await asyncio.shield(flight[1])
+            return body, True
+
+        task = asyncio.ensure_future(self._execute(key, store_key, fingerprint, call))
+        self._flights[store_key] = (fingerprint, task)
+        task.add_done_callback(lambda done: self._land(store_key, done))
+        # A client hanging up doesn't cancel the call its duplicates wait on
+        return await asyncio.shield(task)
+
+    def _land(self, store_key: str, task: asyncio.Task):
+        if self._flights.get(store_key, (None, None))[1] is task:
+            del self._flights[store_key]
+
+    async def _execute(self, key: str, store_key: str, fingerprint: str, call: Callable[[], Awaitable]):
+        record = await self._claim(key, store_key, fingerprint)
+        if record is not None:
+            self.stats['replayed'] += 1
+            return record['body'], True
+        try:
+            result = await call()
+        except BaseException:
+            await self.store.delete(store_key)
+            raise
+        # Kept as JSON so the first response and every replay are identical
+        body = json.loads(json.dumps(result, default=_encode))
+        await self.store.set(store_key, {'status': 'done', 'fingerprint': fingerprint, 'body': body}, self.ttl)
+        self.stats['executed'] += 1
+        return body, False
+
+    async def _claim(self, key: str, store_key: str, fingerprint: str) -> Optional[dict]:
+        """None once this call holds the key, else the finished record it maps to"""
+        deadline = time.monotonic() + self.lock_seconds
+        pending = {'status': 'in_progress', 'fingerprint': fingerprint}
+        while True:
+            record = await self.store.reserve(store_key, pending, self.lock_seconds)
+            if record is None:
+                return None
+            if record['fingerprint'] != fingerprint:
+                raise IdempotencyKeyReusedError(f"Idempotency-Key {key} was used for a different request")
+            if record['status'] == 'done':
+                return record
+            # Held by another process; wait for it to finish, or fail and let go
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInProgressError(f"Idempotency-Key {key} is still being processed")
+            await asyncio.sleep(self.poll_interval)
+
+    async def close(self):
+        await self.store.close()
+
+
+idempotency = IdempotencyKeys()
@@ -0,0 +1,44 @@
+"""
+Leaderboard snapshot
+The top LEADERBOARD_SNAPSHOT_SIZE users are held in memory and reloaded at
+most every LEADERBOARD_SNAPSHOT_MAX_AGE_SECONDS. The leaderboard routes slice
+this list instead of each re-running the ORDER BY over user_profiles.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import List, Mapping, Optional, Sequence, Tuple
+
+from config import settings
+from services.database import Database
+from services.projection import LEADERBOARD_COLUMNS, project_all
+from services.snapshot import Snapshotted
+
+
+@dataclass(frozen=True)
+class LeaderboardSnapshot:
+    version: int
+    loaded_at: float
+    users: Tuple[Mapping, ...] = ()
+
+
+class Leaderboard(Snapshotted[LeaderboardSnapshot]):
+    def __init__(self, db: Optional[Database] = None, size: Optional[int] = None,
+                 max_age: Optional[float] = None):
+        super().__init__(db, max_age if max_age is not None else settings.LEADERBOARD_SNAPSHOT_MAX_AGE_SECONDS)
+        self.size = size or settings.LEADERBOARD_SNAPSHOT_SIZE
+
+    async def load(self, source, version: int) -> LeaderboardSnapshot:
+        """The top users"""
+        rows = await source.get_leaderboard(self.size, LEADERBOARD_COLUMNS)
+        return LeaderboardSnapshot(version=version, loaded_at=time.monotonic(), users=tuple(rows))
+
+    async def top(self, limit: int, columns: Optional[Sequence[str]] = None) -> List[dict]:
+        """The first `limit` users, falling back to a query past the snapshot size"""
+        if limit > self.size:
+            return await self.db.get_leaderboard(limit, columns or LEADERBOARD_COLUMNS)
+        users = [dict(user) for user in (await self.current()).users[:limit]]
+        return project_all(users, columns)
+
+
+leaderboard_snapshot = Leaderboard()
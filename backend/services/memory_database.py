@@ -0,0 +1,79 @@
+"""
+In-memory storage engine
+Keeps every table as a list of dicts in the process. Used for offline load
+tests, profiling and unit tests; nothing is persisted.
+"""
+
+import heapq
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from services.repository import TableDatabase
+
+
+def _matches(row: dict, filters: Optional[dict]) -> bool:
+    return all(row.get(column) == value for column, value in (filters or {}).items())
+
+
+class InMemoryDatabase(TableDatabase):
+    """Storage engine that keeps all rows in process memory"""
+
+    def __init__(self):
+        self.tables: Dict[str, List[dict]] = defaultdict(list)
+
+    async def _select(self, table: str, filters: Optional[dict] = None,
+                      order: Optional[str] = None, desc: bool = False,
+                      limit: Optional[int] = None) -> List[dict]:
+        rows = [row for row in self.tables[table] if _matches(row, filters)]
+        if order:
+            present = [row for row in rows if row.get(order) is not None]
+            missing = [row for row in rows if row.get(order) is None]
+            rows = sorted(present, key=lambda row: row[order], reverse=desc) + missing
+        if limit is not None:
+            rows = rows[:limit]
+        # Hand out copies so callers can decorate rows without touching storage
+        return [dict(row) for row in rows]
+
+    async def _select_in(self, table: str, column: str, values: List,
+                         filters: Optional[dict] = None) -> List[dict]:
+        wanted = set(values)
+        return [
+            dict(row) for row in self.tables[table]
+            if row.get(column) in wanted and _matches(row, filters)
+        ]
+
+    async def _select_after(self, table: str, column: str, after, limit: int,
+                            filters: Optional[dict] = None) -> List[dict]:
+        rows = (row for row in self.tables[table]
+                if (after is None or row[column] > after) and _matches(row, filters))
+        # A bounded heap rather than sorting the whole table for every page
+        return [dict(row) for row in heapq.nsmallest(limit, rows, key=lambda row: row[column])]
+
+    async def _insert(self, table: str, row: dict) -> dict:
+        row = self._with_defaults(table, row)
+        self.tables[table].append(row)
+        return dict(row)
+
+    async def _update(self, table: str, filters: dict, updates: dict) -> List[dict]:
+        updated = []
+        for row in self.tables[table]:
+            if _matches(row, filters):
+                row.update(updates)
+                updated.append(dict(row))
+        return updated
+
+    async def _increment(self, table: str, filters: dict, deltas: Dict[str, int],
+                         derived: Optional[Dict[str, Callable[[dict], object]]] = None) -> List[dict]:
+        # No await between read and write, so this is atomic on the event loop
+        updated = []
+        for row in self.tables[table]:
+            if _matches(row, filters):
+                for column, delta in deltas.items():
+                    row[column] = (row.get(column) or 0) + delta
+                for column, compute in (derived or {}).items():
+                    row[column] = compute(row)
+                updated.append(dict(row))
+        return updated
+
+    async def _delete(self, table: str, filters: dict):
+        self.tables[table] = [row for row in self.tables[table] if not _matches(row, filters)]
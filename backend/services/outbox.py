@@ -0,0 +1,145 @@
+"""
+Outbox relay
+xp_update, badge_earned and streak_milestone events are written to
+outbox_events in the same transaction as the change they describe (see
+migrations/010_outbox.sql), so neither a crash nor a slow socket can lose
+one or hold up the request. The relay drains them in batches to each user's
+Socket.IO room and only deletes what went out, so every event is delivered
+at least once; clients dedupe on `event_id`. Analytics is best effort on
+top: an event that reached the socket is acked even if its capture fails.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional
+
+import posthog
+
+from config import settings
+from services.database import Database
+from services.leveling import level_from_xp
+from services.xp_service import POSTHOG_ENABLED
+
+Emit = Callable[..., Awaitable]
+
+# Outbox event -> analytics event name and properties
+ANALYTICS = {
+    'xp_update': lambda p: ('xp_awarded', {'amount': p['xp_earned'], 'reason': p['reason'],
+                                           'new_xp': p['new_total_xp'], 'new_level': p['new_level']}),
+    'badge_earned': lambda p: ('badge_earned', {'badge_name': p['badge_name'], 'badge_type': p['badge_type'],
+                                                'rarity': p['rarity']}),
+    'streak_milestone': lambda p: ('streak_milestone', {'habit_id': p['habit_id'], 'milestone': p['milestone']}),
+}
+
+
+def user_room(user_id: str) -> str:
+    """Socket.IO room every connection of `user_id` joins"""
+    return f'user_{user_id}'
+
+
+def _age(created_at: str) -> float:
+    created = datetime.fromisoformat(str(created_at).replace('Z', '+00:00'))
+    now = datetime.now(timezone.utc) if created.tzinfo else datetime.now()
+    return max((now - created).total_seconds(), 0.0)
+
+
+class OutboxRelay:
+    def __init__(self, db: Optional[Database] = None, batch_size: Optional[int] = None,
+                 poll_interval: Optional[float] = None, lease_seconds: Optional[float] = None,
+                 analytics: Optional[bool] = None):
+        self.db = db or Database()
+        self.analytics = POSTHOG_ENABLED if analytics is None else analytics
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.poll_interval = poll_interval or settings.OUTBOX_POLL_INTERVAL_SECONDS
+        self.lease_seconds = lease_seconds or settings.OUTBOX_LEASE_SECONDS
+        self.emit: Optional[Emit] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'delivered': 0, 'failed': 0, 'batches': 0, 'analytics_failed': 0}
+        # Age of the oldest event in the last batch, and the worst seen
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def metrics(self) -> dict:
+        return {**self.stats, 'lag_seconds': round(self.lag_seconds, 3),
+                'max_lag_seconds': round(self.max_lag_seconds, 3), 'running': self.running}
+
+    async def drain(self) -> int:
+        """Deliver one batch of due events; returns how many were claimed"""
+        events = await self.db.claim_outbox_events(self.batch_size, self.lease_seconds)
+        if not events:
+            self.lag_seconds = 0.0
+            return 0
+        events.sort(key=lambda event: str(event['created_at']))
+        self.lag_seconds = max(_age(event['created_at']) for event in events)
+        self.max_lag_seconds = max(self.max_lag_seconds, self.lag_seconds)
+
+        delivered: List = []
+        for event in events:
+            try:
+                payload = await self._deliver(event)
+            except Exception as e:
+                # Not acked, so it goes out again once its lease runs out
+                self.stats['failed'] += 1
+                print(f"⚠️ Could not relay {event['event']} {event['id']}: {e}")
+                continue
+            delivered.append(event['id'])
+            self._capture(event, payload)
+        await self.db.ack_outbox_events(delivered)
+        self.stats['delivered'] += len(delivered)
+        self.stats['batches'] += 1
+        return len(events)
+
+    async def _deliver(self, event: dict) -> dict:
+        """Emit `event` to its user's room; returns the payload sent"""
+        user_id = event['user_id']
+        payload = {'event_id': event['id'], 'user_id': user_id, **event['payload']}
+        if event['event'] == 'xp_update':
+            new_level = level_from_xp(payload['new_total_xp'])
+            payload['new_level'] = new_level
+            payload['level_up'] = new_level > level_from_xp(payload['new_total_xp'] - payload['xp_earned'])
+        await self.emit(event['event'], payload, room=user_room(user_id))
+        return payload
+
+    def _capture(self, event: dict, payload: dict):
+        analytics = ANALYTICS.get(event['event'])
+        if not self.analytics or analytics is None:
+            return
+        try:
+            posthog.capture(event['user_id'], *analytics(payload))
+        except Exception as e:
+            # Already on the socket; resending it would only repeat the emit
+            self.stats['analytics_failed'] += 1
+            print(f"⚠️ Could not capture {event['event']} {event['id']}: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await self.drain()
+            except Exception as e:
+                print(f"⚠️ Outbox relay failed: {e}")
+                claimed = 0
+            # A full batch means more are waiting; go straight back for them
+            if claimed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self, emit: Emit):
+        """Relay through `emit(event, data, room=...)`, e.g. AsyncServer.emit"""
+        if self.running:
+            return
+        self.emit = emit
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop relaying; undelivered events stay in outbox_events for the next start"""
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+outbox_relay = OutboxRelay()
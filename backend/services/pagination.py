@@ -0,0 +1,94 @@
+"""
+Keyset pagination
+Pages are ordered by a sort column plus `id` as the tiebreak, and the next
+page starts strictly after the last row of the previous one. Cursors are
+opaque to clients: base64 JSON holding that row's sort key and its rank.
+"""
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from config import settings
+
+
+class InvalidCursorError(ValueError):
+    """A cursor was malformed or issued for a different listing"""
+
+
+@dataclass(frozen=True)
+class Keyset:
+    name: str
+    column: str
+    desc: bool
+    tiebreak: str = 'id'
+
+    @property
+    def columns(self) -> tuple:
+        return (self.column, self.tiebreak)
+
+    def key(self, row: dict) -> tuple:
+        return (row.get(self.column), row.get(self.tiebreak))
+
+
+LEADERBOARD = Keyset('leaderboard', 'total_points', desc=True)
+CLAN_LEADERBOARD = Keyset('clan_leaderboard', 'total_xp', desc=True)
+CLAN_MEMBERS = Keyset('clan_members', 'xp_contributed', desc=True)
+HABITS = Keyset('habits', 'created_at', desc=False)
+
+
+def page_size(limit: int) -> int:
+    """Clamp a requested page size to 1..PAGE_SIZE_MAX"""
+    return max(1, min(limit, settings.PAGE_SIZE_MAX))
+
+
+def encode_cursor(keyset: Keyset, row: dict, position: int = 0) -> str:
+    payload = {'k': keyset.name, 'v': list(keyset.key(row)), 'p': position}
+    raw = json.dumps(payload, separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(keyset: Keyset, cursor: Optional[str]) -> Tuple[Optional[dict], int]:
+    """The row key to resume after, as {sort column: value, id: value}, and its rank"""
+    if not cursor:
+        return None, 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value, tiebreak = payload['v']
+        position = int(payload.get('p', 0))
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursorError("Malformed cursor") from e
+    if payload.get('k') != keyset.name:
+        raise InvalidCursorError(f"Cursor is not for {keyset.name}")
+    return {keyset.column: value, keyset.tiebreak: tiebreak}, position
+
+
+def next_cursor(keyset: Keyset, rows: List[dict], limit: Optional[int],
+                position: int = 0) -> Optional[str]:
+    """Cursor for the page after `rows`, or None when this was the last page"""
+    if not limit or len(rows) < limit:
+        return None
+    return encode_cursor(keyset, rows[-1], position + len(rows))
+
+
+def keyset_slice(rows: List[dict], keyset: Keyset, limit: Optional[int] = None,
+                 after: Optional[dict] = None) -> List[dict]:
+    """Order, seek and limit rows in Python, for engines without a query planner"""
+    def sort_key(row):
+        value = row.get(keyset.column)
+        # NULLs sort last in either direction, as in Postgres for DESC
+        return (value is None, value if value is not None else 0, str(row.get(keyset.tiebreak)))
+
+    present = sorted((r for r in rows if r.get(keyset.column) is not None), key=sort_key, reverse=keyset.desc)
+    ordered = present + [r for r in rows if r.get(keyset.column) is None]
+    if after is not None:
+        bound = (after[keyset.column], str(after[keyset.tiebreak]))
+        if keyset.desc:
+            ordered = [r for r in present if (r[keyset.column], str(r[keyset.tiebreak])) < bound]
+        else:
+            ordered = [r for r in present if (r[keyset.column], str(r[keyset.tiebreak])) > bound]
+    return ordered[:limit] if limit else ordered
+
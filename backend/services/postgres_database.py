@@ -0,0 +1,548 @@
+"""
+Postgres-native storage engine
+Talks to the Supabase Postgres instance directly through an asyncpg pool,
+skipping the PostgREST HTTP hop. Rows are returned as the same JSON-shaped
+dicts PostgREST produces, so routes cannot tell the engines apart.
+"""
+
+import asyncio
+import json
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from config import settings
+from services.pagination import CLAN_LEADERBOARD, CLAN_MEMBERS, HABITS, LEADERBOARD, Keyset
+from services.projection import LEADERBOARD_COLUMNS, live_user_columns, project
+from services.repository import (
+    StaleWriteError, apply_pending_xp, clan_join_result, clan_leave_result, habit_completion_result
+)
+
+# Hot queries, kept as fixed SQL text so asyncpg's per-connection statement
+# cache prepares each once per pooled connection
+HOT_QUERIES = {
+    'get_user': "SELECT to_jsonb(t) FROM user_profiles_live t WHERE clerk_user_id = $1",
+    'get_habit': "SELECT to_jsonb(t) FROM habits t WHERE id = $1",
+    'get_last_completion': """
+        SELECT to_jsonb(t) FROM habit_logs t
+        WHERE habit_id = $1 AND user_id = $2
+        ORDER BY completed_at DESC
+        LIMIT 1
+    """,
+    # First pages in keyset order; later pages go through _page
+    'get_leaderboard': """
+        SELECT to_jsonb(t) FROM user_profiles t
+        ORDER BY total_points DESC NULLS LAST, id DESC
+        LIMIT $1
+    """,
+    # The column set the leaderboard snapshot loads
+    'get_leaderboard_projected': f"""
+        SELECT to_jsonb(t) FROM (
+            SELECT {', '.join(LEADERBOARD_COLUMNS)} FROM user_profiles
+            ORDER BY total_points DESC NULLS LAST, id DESC
+            LIMIT $1
+        ) t
+    """,
+    'get_clan_members': """
+        SELECT to_jsonb(t) FROM clan_members t
+        WHERE clan_id = $1
+        ORDER BY xp_contributed DESC NULLS LAST, id DESC
+        LIMIT $2
+    """,
+    'record_xp_transaction': "SELECT to_jsonb(t) FROM record_xp_transaction($1, $2, $3) t",
+}
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _columns(data: dict) -> str:
+    return ', '.join(_ident(column) for column in data)
+
+
+def _select_list(columns: Optional[Sequence[str]]) -> str:
+    return _columns(columns) if columns else '*'
+
+
+class PostgresDatabase:
+    """Storage engine backed by an asyncpg connection pool"""
+
+    def __init__(self, dsn: Optional[str] = None, min_size: Optional[int] = None,
+                 max_size: Optional[int] = None, statement_cache_size: Optional[int] = None):
+        if not (dsn or settings.DATABASE_URL):
+            raise ValueError("DATABASE_URL is required for the postgres backend")
+        self.dsn = dsn or settings.DATABASE_URL
+        self.min_size = min_size or settings.DATABASE_POOL_MIN_SIZE
+        self.max_size = max_size or settings.DATABASE_POOL_MAX_SIZE
+        self._pool: Optional[asyncpg.Pool] = None
+        self.statement_cache_size = (statement_cache_size if statement_cache_size is not None
+                                     else settings.DATABASE_STATEMENT_CACHE_SIZE)
+        self._pool_lock = asyncio.Lock()
+
+    async def _init_connection(self, conn):
+        await conn.set_type_codec('jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+    async def pool(self) -> asyncpg.Pool:
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await asyncpg.create_pool(
+                        self.dsn,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        statement_cache_size=self.statement_cache_size,
+                        init=self._init_connection,
+                    )
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def _fetch_hot(self, key: str, *args) -> List[dict]:
+        return await self._fetch(HOT_QUERIES[key], *args)
+
+    async def _fetch(self, query: str, *args) -> List[dict]:
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            return [record[0] for record in await conn.fetch(query, *args)]
+
+    async def _fetchrow(self, query: str, *args) -> Optional[dict]:
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            return await conn.fetchval(query, *args)
+
+    async def _execute(self, query: str, *args):
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            return await conn.execute(query, *args)
+
+    async def _page(self, table: str, keyset: Keyset, columns: Optional[Sequence[str]],
+                    limit: Optional[int], after: Optional[dict], where: str = '', *args) -> List[dict]:
+        """One page in keyset order. The seek compares (sort column, id) as a row
+        against the cursor, so the index serves deep pages like the first one;
+        json_populate_record casts the cursor values to the column types."""
+        args = list(args)
+        clauses = [where] if where else []
+        sort, tiebreak = _ident(keyset.column), _ident(keyset.tiebreak)
+        if after is not None:
+            args.append(json.dumps(after, default=str))
+            clauses.append(
+                f"({sort}, {tiebreak}) {'<' if keyset.desc else '>'} "
+                f"(SELECT c.{sort}, c.{tiebreak} FROM json_populate_record(NULL::{table}, ${len(args)}::json) c)"
+            )
+        args.append(limit)
+        direction = 'DESC' if keyset.desc else 'ASC'
+        return await self._fetch(
+            f"SELECT to_jsonb(t) FROM (SELECT {_select_list(columns)} FROM {table} "
+            f"{'WHERE ' + ' AND '.join(clauses) if clauses else ''} "
+            f"ORDER BY {sort} {direction} NULLS LAST, {tiebreak} {direction} "
+            f"LIMIT ${len(args)}) t",
+            *args
+        )
+
+    # Writes go through json_populate_record so string timestamps and JSON
+    # numbers are coerced to column types exactly like PostgREST does.
+    @staticmethod
+    def _insert_sql(table: str, data: dict, skip_conflicts_on: Optional[str] = None) -> str:
+        columns = _columns(data)
+        on_conflict = f"ON CONFLICT ({skip_conflicts_on}) DO NOTHING " if skip_conflicts_on else ""
+        return (
+            f"INSERT INTO {table} AS t ({columns}) "
+            f"SELECT {columns} FROM json_populate_record(NULL::{table}, $1::json) "
+            f"{on_conflict}RETURNING to_jsonb(t)"
+        )
+
+    @staticmethod
+    def _update_sql(table: str, updates: dict, where: str) -> str:
+        columns = _columns(updates)
+        return (
+            f"UPDATE {table} AS t SET ({columns}) = "
+            f"(SELECT {columns} FROM json_populate_record(NULL::{table}, $1::json)) "
+            f"WHERE {where} RETURNING to_jsonb(t)"
+        )
+
+    async def _insert(self, table: str, data: dict, skip_conflicts_on: Optional[str] = None) -> Optional[dict]:
+        return await self._fetchrow(
+            self._insert_sql(table, data, skip_conflicts_on), json.dumps(data, default=str)
+        )
+
+    # User operations
+    async def get_user(self, user_id: str,
+                       columns: Optional[Sequence[str]] = None) -> Optional[dict]:
+        if columns is None:
+            rows = await self._fetch_hot('get_user', user_id)
+        else:
+            rows = await self._fetch(
+                f"SELECT to_jsonb(t) FROM (SELECT {_columns(live_user_columns(columns))} "
+                f"FROM user_profiles_live WHERE clerk_user_id = $1) t",
+                user_id
+            )
+        return project(apply_pending_xp(rows[0]), columns) if rows else None
+
+    async def get_users(self, user_ids: List[str]) -> List[dict]:
+        rows = await self._fetch(
+            "SELECT to_jsonb(t) FROM user_profiles_live t WHERE clerk_user_id = ANY($1)", user_ids
+        )
+        return [apply_pending_xp(row) for row in rows]
+
+    async def create_user(self, user_data: dict) -> dict:
+        return await self._insert('user_profiles', user_data)
+
+    async def update_user(self, user_id: str, updates: dict,
+                          expected_version: Optional[int] = None) -> dict:
+        where = 'clerk_user_id = $2'
+        args = [user_id]
+        if expected_version is not None:
+            updates = {**updates, 'version': expected_version + 1}
+            where += ' AND version = $3'
+            args.append(expected_version)
+        # One statement per distinct column set; profile updates reuse a handful
+        # of shapes, so they stay in the statement cache
+        query = self._update_sql('user_profiles', updates, where)
+        row = await self._fetchrow(query, json.dumps(updates, default=str), *args)
+        if row is None and expected_version is not None:
+            raise StaleWriteError(f"user_profiles row changed since version {expected_version}")
+        return row
+
+    # XP ledger operations
+    async def record_xp_transaction(self, user_id: str, xp_amount: int,
+                                    reason: str) -> Optional[dict]:
+        rows = await self._fetch_hot('record_xp_transaction', user_id, xp_amount, reason)
+        return apply_pending_xp(rows[0]) if rows else None
+
+    async def compact_xp_ledger(self, batch_size: int = 500) -> int:
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            return await conn.fetchval("SELECT compact_xp_ledger($1)", batch_size)
+
+    # Habit operations
+    async def get_habit(self, habit_id: str) -> Optional[dict]:
+        rows = await self._fetch_hot('get_habit', habit_id)
+        return rows[0] if rows else None
+
+    async def get_habits(self, habit_ids: List[str]) -> List[dict]:
+        return await self._fetch("SELECT to_jsonb(t) FROM habits t WHERE id = ANY($1)", habit_ids)
+
+    async def get_user_habits(self, user_id: str, columns: Optional[Sequence[str]] = None,
+                              limit: Optional[int] = None, after: Optional[dict] = None) -> List[dict]:
+        return await self._page('habits', HABITS, columns, limit, after, 'user_id = $1', user_id)
+
+    async def create_habit(self, habit_data: dict) -> dict:
+        return await self._insert('habits', habit_data)
+
+    async def update_habit(self, habit_id: str, updates: dict,
+                           expected_version: Optional[int] = None) -> dict:
+        if expected_version is None:
+            return await self._fetchrow(
+                self._update_sql('habits', updates, 'id = $2'),
+                json.dumps(updates, default=str), habit_id
+            )
+        updates = {**updates, 'version': expected_version + 1}
+        row = await self._fetchrow(
+            self._update_sql('habits', updates, 'id = $2 AND version = $3'),
+            json.dumps(updates, default=str), habit_id, expected_version
+        )
+        if row is None:
+            raise StaleWriteError(f"habits row changed since version {expected_version}")
+        return row
+
+    async def delete_habit(self, habit_id: str):
+        await self._execute("DELETE FROM habits WHERE id = $1", habit_id)
+
+    # Habit completion operations
+    async def create_habit_completion(self, habit_id: str, user_id: str, xp_earned: int,
+                                      notes: Optional[str] = None,
+                                      completed_on: Optional[date] = None) -> Optional[dict]:
+        now = datetime.now()
+        completion_data = {
+            'habit_id': habit_id,
+            'user_id': user_id,
+            'xp_earned': xp_earned,
+            'notes': notes,
+            'completed_at': now.isoformat(),
+            'completed_on': (completed_on or now.date()).isoformat()
+        }
+        # The unique (habit_id, user_id, completed_on) index turns a second
+        # completion on the same day into no row
+        return await self._insert('habit_logs', completion_data, 'habit_id, user_id, completed_on')
+
+    async def create_habit_completions(self, completions: List[dict]) -> List[dict]:
+        if not completions:
+            return []
+        return await self._fetch("""
+            INSERT INTO habit_logs AS t (habit_id, user_id, xp_earned, notes, completed_at, completed_on)
+            SELECT c.habit_id, c.user_id, c.xp_earned, c.notes, c.completed_at, c.completed_on
+            FROM json_populate_recordset(NULL::habit_logs, $1::json) AS c
+            ON CONFLICT (habit_id, user_id, completed_on) DO NOTHING
+            RETURNING to_jsonb(t)
+        """, json.dumps(completions, default=str))
+
+    async def get_last_completion(self, habit_id: str, user_id: str) -> Optional[dict]:
+        rows = await self._fetch_hot('get_last_completion', habit_id, user_id)
+        return rows[0] if rows else None
+
+    async def complete_habit(self, habit_id: str, user_id: str, notes: Optional[str] = None,
+                             today: Optional[date] = None) -> dict:
+        result = await self._fetchrow(
+            "SELECT complete_habit($1, $2, $3, $4)", habit_id, user_id, notes, today or date.today()
+        )
+        return habit_completion_result(result)
+
+    # Badge operations
+    async def create_badge_if_not_exists(self, badge_data: dict):
+        existing = await self.get_badge_by_name(badge_data['name'])
+        if not existing:
+            await self._insert('badges', badge_data)
+
+    async def upsert_badges(self, badges: List[dict]) -> List[dict]:
+        if not badges:
+            return []
+        columns = list(dict.fromkeys(column for badge in badges for column in badge))
+        column_list = _columns(dict.fromkeys(columns))
+        updates = ', '.join(f"{_ident(c)} = EXCLUDED.{_ident(c)}" for c in columns if c != 'name')
+        return await self._fetch(
+            f"INSERT INTO badges AS t ({column_list}) "
+            f"SELECT {column_list} FROM json_populate_recordset(NULL::badges, $1::json) "
+            f"ON CONFLICT (name) DO UPDATE SET {updates} "
+            f"RETURNING to_jsonb(t)",
+            json.dumps(badges, default=str)
+        )
+
+    async def get_badge_by_name(self, name: str) -> Optional[dict]:
+        return await self._fetchrow("SELECT to_jsonb(t) FROM badges t WHERE name = $1 LIMIT 1", name)
+
+    async def get_badges_by_name(self, names: List[str]) -> List[dict]:
+        return await self._fetch("SELECT to_jsonb(t) FROM badges t WHERE name = ANY($1)", names)
+
+    async def get_badge_by_type_and_requirement(self, badge_type: str, requirement: int) -> Optional[dict]:
+        return await self._fetchrow(
+            "SELECT to_jsonb(t) FROM badges t WHERE badge_type = $1 AND requirement = $2 LIMIT 1",
+            badge_type, requirement
+        )
+
+    async def get_all_badges(self) -> List[dict]:
+        return await self._fetch("SELECT to_jsonb(t) FROM badges t")
+
+    async def user_has_badge(self, user_id: str, badge_id: str) -> bool:
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            return await conn.fetchval(
+                "SELECT EXISTS (SELECT 1 FROM user_badges WHERE user_id = $1 AND badge_id = $2)",
+                user_id, badge_id
+            )
+
+    async def create_user_badge(self, user_id: str, badge_id: str) -> dict:
+        badge_data = {
+            'user_id': user_id,
+            'badge_id': badge_id,
+            'earned_at': datetime.now().isoformat()
+        }
+        return await self._insert('user_badges', badge_data)
+
+    async def get_user_badges(self, user_id: str) -> List[dict]:
+        # Same shape as PostgREST's `*, badges(*)` embed
+        return await self._fetch("""
+            SELECT to_jsonb(ub) || jsonb_build_object('badges', to_jsonb(b))
+            FROM user_badges ub
+            LEFT JOIN badges b ON b.id = ub.badge_id
+            WHERE ub.user_id = $1
+        """, user_id)
+
+    # Clan operations
+    async def create_clan(self, clan_data: dict) -> dict:
+        return await self._insert('clans', clan_data)
+
+    async def get_clan(self, clan_id: str) -> Optional[dict]:
+        return await self._fetchrow("SELECT to_jsonb(t) FROM clans t WHERE id = $1", clan_id)
+
+    async def get_clans(self, clan_ids: List[str]) -> List[dict]:
+        return await self._fetch("SELECT to_jsonb(t) FROM clans t WHERE id = ANY($1)", clan_ids)
+
+    async def update_clan(self, clan_id: str, updates: dict) -> dict:
+        return await self._fetchrow(
+            self._update_sql('clans', updates, 'id = $2'),
+            json.dumps(updates, default=str), clan_id
+        )
+
+    async def increment_clan_xp(self, clan_id: str, xp_amount: int):
+        await self._execute(
+            "UPDATE clans SET total_xp = total_xp + $2 WHERE id = $1",
+            clan_id, xp_amount
+        )
+
+    async def create_clan_with_owner(self, clan_data: dict) -> dict:
+        return await self._fetchrow("SELECT create_clan_with_owner($1::jsonb)", clan_data)
+
+    async def join_clan(self, clan_id: str, user_id: str, username: str) -> dict:
+        result = await self._fetchrow("SELECT join_clan($1, $2, $3)", clan_id, user_id, username)
+        return clan_join_result(result)
+
+    async def leave_clan(self, clan_id: str, user_id: str) -> bool:
+        result = await self._fetchrow("SELECT leave_clan($1, $2)", clan_id, user_id)
+        return clan_leave_result(result)
+
+    async def get_clan_members(self, clan_id: str, columns: Optional[Sequence[str]] = None,
+                               limit: Optional[int] = None, after: Optional[dict] = None) -> List[dict]:
+        if columns is None and after is None:
+            return await self._fetch_hot('get_clan_members', clan_id, limit)
+        return await self._page('clan_members', CLAN_MEMBERS, columns, limit, after, 'clan_id = $1', clan_id)
+
+    async def increment_clan_member_contribution(self, clan_id: str, user_id: str, xp_amount: int):
+        await self._execute(
+            "UPDATE clan_members SET xp_contributed = xp_contributed + $3 "
+            "WHERE clan_id = $1 AND user_id = $2",
+            clan_id, user_id, xp_amount
+        )
+
+    async def get_clan_member_contribution(self, clan_id: str, user_id: str) -> int:
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            contribution = await conn.fetchval(
+                "SELECT xp_contributed FROM clan_members WHERE clan_id = $1 AND user_id = $2",
+                clan_id, user_id
+            )
+        return contribution or 0
+
+    async def apply_clan_xp(self, clan_deltas: Dict[str, int],
+                            member_deltas: Dict[Tuple[str, str], int]):
+        await self._execute(
+            "SELECT apply_clan_xp($1::jsonb, $2::jsonb)",
+            [{'id': clan_id, 'total_xp': amount} for clan_id, amount in clan_deltas.items()],
+            [
+                {'clan_id': clan_id, 'user_id': user_id, 'xp_contributed': amount}
+                for (clan_id, user_id), amount in member_deltas.items()
+            ]
+        )
+
+    async def create_clan_message(self, message_data: dict) -> dict:
+        return await self._insert('clan_messages', message_data)
+
+    async def get_clan_messages(self, clan_id: str, limit: int = 50) -> List[dict]:
+        return await self._fetch(
+            "SELECT to_jsonb(t) FROM clan_messages t WHERE clan_id = $1 "
+            "ORDER BY timestamp DESC LIMIT $2",
+            clan_id, limit
+        )
+
+    # Leaderboard operations
+    async def get_leaderboard(self, limit: int = 100, columns: Optional[Sequence[str]] = None,
+                              after: Optional[dict] = None) -> List[dict]:
+        if after is None and columns is None:
+            return await self._fetch_hot('get_leaderboard', limit)
+        if after is None and tuple(columns) == LEADERBOARD_COLUMNS:
+            return await self._fetch_hot('get_leaderboard_projected', limit)
+        return await self._page('user_profiles', LEADERBOARD, columns, limit, after)
+
+    async def get_clan_leaderboard(self, limit: int = 50, after: Optional[dict] = None) -> List[dict]:
+        return await self._page('clans', CLAN_LEADERBOARD, None, limit, after)
+
+    # Discover operations
+    async def get_public_habits(self, limit: int = 20) -> List[dict]:
+        return await self._fetch(
+            "SELECT to_jsonb(t) FROM habits t WHERE is_public LIMIT $1",
+            limit
+        )
+
+    async def get_popular_habits(self, limit: int = 10) -> List[dict]:
+        return await self._fetch(
+            "SELECT to_jsonb(t) FROM habits t WHERE is_public "
+            "ORDER BY total_completions DESC LIMIT $1",
+            limit
+        )
+
+    # Quest operations
+    async def get_active_quests(self, user_id: str) -> List[dict]:
+        return await self._fetch("""
+            SELECT to_jsonb(uq) || jsonb_build_object('quests', to_jsonb(q))
+            FROM user_quests uq
+            LEFT JOIN quests q ON q.id = uq.quest_id
+            WHERE uq.user_id = $1 AND uq.status = 'active'
+        """, user_id)
+
+    async def update_quest_progress(self, user_quest_id: str, progress: int):
+        await self._execute(
+            "UPDATE user_quests SET progress = $2 WHERE id = $1",
+            user_quest_id, progress
+        )
+
+    # Side-effect job queue operations
+    async def enqueue_side_effects(self, jobs: List[dict], lease_seconds: float) -> List[dict]:
+        return await self._fetch("""
+            INSERT INTO side_effect_jobs AS t (kind, payload, locked_until)
+            SELECT j.kind, j.payload, now() + make_interval(secs => $2)
+            FROM jsonb_to_recordset($1::jsonb) AS j (kind text, payload jsonb)
+            RETURNING to_jsonb(t)
+        """, json.dumps(jobs, default=str), lease_seconds)
+
+    async def claim_side_effects(self, limit: int, lease_seconds: float) -> List[dict]:
+        return await self._fetch(
+            "SELECT to_jsonb(t) FROM claim_side_effect_jobs($1, $2) t", limit, lease_seconds
+        )
+
+    async def finish_side_effect(self, job_id):
+        await self._execute("DELETE FROM side_effect_jobs WHERE id = $1", job_id)
+
+    async def retry_side_effect(self, job_id, attempts: int, error: str,
+                                retry_in: Optional[float]):
+        if retry_in is None:
+            await self._execute(
+                "UPDATE side_effect_jobs SET attempts = $2, last_error = $3, status = 'dead' WHERE id = $1",
+                job_id, attempts, error
+            )
+        else:
+            await self._execute(
+                "UPDATE side_effect_jobs SET attempts = $2, last_error = $3, "
+                "locked_until = now() + make_interval(secs => $4) WHERE id = $1",
+                job_id, attempts, error, retry_in
+            )
+
+    # Outbox operations; events are written by the migration 010 triggers
+    async def claim_outbox_events(self, limit: int, lease_seconds: float) -> List[dict]:
+        return await self._fetch(
+            "SELECT to_jsonb(t) FROM claim_outbox_events($1, $2) t", limit, lease_seconds
+        )
+
+    async def ack_outbox_events(self, event_ids: List):
+        if event_ids:
+            await self._execute("DELETE FROM outbox_events WHERE id = ANY($1::bigint[])", event_ids)
+
+    # Completion bitmap operations
+    async def get_completion_bitmaps(self, habit_id: str) -> List[dict]:
+        return await self._fetch(
+            "SELECT to_jsonb(t) FROM habit_completion_bitmaps t WHERE habit_id = $1 ORDER BY year", habit_id
+        )
+
+    async def backfill_completion_bitmaps(self, habit_ids: Optional[List[str]] = None) -> int:
+        return await self._fetchrow("SELECT backfill_completion_bitmaps($1::text[])", habit_ids)
+
+    # Activity rollup operations
+    async def get_user_activity(self, user_id: str, start: date, end: date) -> List[dict]:
+        # Zero-filled in the same query, one entry per day of the window
+        return await self._fetchrow("""
+            SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                'date', d::date,
+                'completions', COALESCE(a.completions, 0),
+                'xp_earned', COALESCE(a.xp_earned, 0)
+            ) ORDER BY d), '[]'::jsonb)
+            FROM generate_series($2::date, $3::date, interval '1 day') AS d
+            LEFT JOIN daily_user_activity a ON a.user_id = $1 AND a.day = d::date
+        """, user_id, start, end)
+
+    # Streak decay operations
+    async def decay_streaks(self, cutoff: date, after: Optional[str], limit: int) -> dict:
+        return await self._fetchrow("SELECT decay_streaks($1, $2, $3)", cutoff, after, limit)
+
+    async def get_sweep_checkpoint(self, name: str) -> Optional[dict]:
+        return await self._fetchrow("SELECT to_jsonb(t) FROM sweep_checkpoints t WHERE name = $1", name)
+
+    async def save_sweep_checkpoint(self, name: str, cursor: Optional[str], finished: bool):
+        await self._execute("""
+            INSERT INTO sweep_checkpoints (name, cursor, finished, updated_at)
+            VALUES ($1, $2, $3, now())
+            ON CONFLICT (name) DO UPDATE
+            SET cursor = EXCLUDED.cursor, finished = EXCLUDED.finished, updated_at = now()
+        """, name, cursor, finished)
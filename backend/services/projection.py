@@ -0,0 +1,76 @@
+"""
+Column projections
+Hot paths ask the engines for just the columns they use instead of whole
+rows, and the `fields=` query parameter on read routes is validated against
+the columns each table exposes before it is pushed down to the database.
+"""
+
+from typing import Iterable, List, Optional, Sequence
+
+# Columns a client may ask for through `fields=`, per table
+FIELDS = {
+    'user_profiles': (
+        'id', 'clerk_user_id', 'username', 'email', 'avatar_url', 'total_points',
+        'level', 'xp', 'clan_id', 'created_at', 'updated_at',
+    ),
+    'habits': (
+        'id', 'user_id', 'title', 'description', 'frequency', 'category', 'difficulty',
+        'is_public', 'streak', 'best_streak', 'total_completions', 'last_completed',
+        'created_at', 'updated_at',
+    ),
+    'clan_members': (
+        'id', 'clan_id', 'user_id', 'username', 'xp_contributed', 'role', 'joined_at',
+    ),
+}
+
+# What the leaderboard routes render; notably no email
+LEADERBOARD_COLUMNS = ('id', 'clerk_user_id', 'username', 'avatar_url', 'level', 'xp', 'total_points', 'clan_id')
+FIELDS['leaderboard'] = LEADERBOARD_COLUMNS
+
+# Habit columns the streak statistics are computed from
+HABIT_STATS_COLUMNS = ('id', 'streak', 'best_streak', 'total_completions')
+
+# Profile columns that user_profiles_live adjusts with the pending ledger XP
+_XP_COLUMNS = {'xp', 'total_points', 'level'}
+
+
+class InvalidFieldsError(ValueError):
+    """A `fields=` parameter named a column the table does not expose"""
+
+
+def parse_fields(fields: Optional[str], table: str) -> Optional[List[str]]:
+    """Turn `fields=a,b` into a column list, or None for whole rows"""
+    if not fields:
+        return None
+    columns = list(dict.fromkeys(column.strip() for column in fields.split(',') if column.strip()))
+    unknown = [column for column in columns if column not in FIELDS[table]]
+    if unknown or not columns:
+        raise InvalidFieldsError(f"Unknown fields for {table}: {', '.join(unknown) or fields}")
+    return columns
+
+
+def with_columns(columns: Optional[Sequence[str]], *extra: str) -> Optional[List[str]]:
+    """Add the columns a route needs itself (sort keys, ids) to a projection"""
+    if columns is None:
+        return None
+    return list(dict.fromkeys([*columns, *extra]))
+
+
+def live_user_columns(columns: Sequence[str]) -> List[str]:
+    """Columns to read from user_profiles_live so pending XP can still be folded in"""
+    if _XP_COLUMNS.intersection(columns):
+        return list(dict.fromkeys([*columns, 'xp', 'total_points', 'pending_xp']))
+    return list(columns)
+
+
+def project(row: Optional[dict], columns: Optional[Iterable[str]]) -> Optional[dict]:
+    if row is None or columns is None:
+        return row
+    return {column: row[column] for column in columns if column in row}
+
+
+def project_all(rows: List[dict], columns: Optional[Iterable[str]]) -> List[dict]:
+    if columns is None:
+        return rows
+    columns = list(columns)
+    return [project(row, columns) for row in rows]
@@ -0,0 +1,32 @@
+"""
+Quest definitions
+DAILY_QUESTS and WEEKLY_QUESTS are static, so they are validated against
+QuestBase once per process and served from memory afterwards.
+"""
+
+from functools import lru_cache
+from typing import List, Tuple
+
+from models.quest import DAILY_QUESTS, WEEKLY_QUESTS, QuestBase, QuestType
+
+_DEFINITIONS = {
+    QuestType.DAILY: DAILY_QUESTS,
+    QuestType.WEEKLY: WEEKLY_QUESTS,
+}
+
+
+@lru_cache(maxsize=None)
+def _validated(quest_type: QuestType) -> Tuple[dict, ...]:
+    return tuple(
+        QuestBase(**definition).model_dump(mode='json')
+        for definition in _DEFINITIONS[quest_type]
+    )
+
+
+def quest_definitions(quest_type: QuestType) -> List[dict]:
+    return [dict(quest) for quest in _validated(QuestType(quest_type))]
+
+
+def warm() -> int:
+    """Validate every definition up front; returns how many were loaded"""
+    return sum(len(_validated(quest_type)) for quest_type in _DEFINITIONS)
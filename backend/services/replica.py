@@ -0,0 +1,115 @@
+"""
+Read-replica routing
+ReplicaRouter wraps the primary engine and sends the pure reads listed in
+REPLICA_READS to a replica. A write pins the acting user (and the request
+that made it) to the primary for READ_REPLICA_PIN_SECONDS, so nobody reads
+around their own write while the replica catches up.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from config import settings
+
+# Reads that tolerate replica lag; everything else stays on the primary
+REPLICA_READS = frozenset({
+    'get_leaderboard',
+    'get_clan_leaderboard',
+    'get_all_badges',
+    'get_public_habits',
+    'get_popular_habits',
+    'get_clan_messages',
+})
+
+# Calls that never change data and so never pin anyone
+_READ_PREFIXES = ('get_', 'user_has_')
+_NON_WRITES = frozenset({'close', 'metrics'})
+
+# Process-wide counters, exposed through GET /metrics
+METRICS = {'replica_reads': 0, 'pinned_reads': 0, 'replica_errors': 0}
+
+
+def metrics() -> dict:
+    return dict(METRICS)
+
+
+# The user the current request acts for, and when this context last wrote
+_acting_user: ContextVar[Optional[str]] = ContextVar('acting_user', default=None)
+_last_write: ContextVar[float] = ContextVar('last_write', default=0.0)
+
+
+@contextmanager
+def acting_as(user_id: Optional[str]):
+    """Attribute the writes and reads inside the block to `user_id`"""
+    token = _acting_user.set(user_id)
+    try:
+        yield
+    finally:
+        _acting_user.reset(token)
+
+
+class ReplicaRouter:
+    """Storage engine wrapper routing lag-tolerant reads to a replica.
+
+    Everything not routed is forwarded to the primary unchanged.
+    """
+
+    def __init__(self, primary, replica, pin_seconds: Optional[float] = None):
+        self.primary = primary
+        self.replica = replica
+        self.pin_seconds = pin_seconds if pin_seconds is not None else settings.READ_REPLICA_PIN_SECONDS
+        self._pins: Dict[str, float] = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.primary, name)
+        if name in REPLICA_READS:
+            return self._routed_read(name)
+        if not callable(attr) or name.startswith(_READ_PREFIXES) or name in _NON_WRITES:
+            return attr
+
+        async def write(*args, **kwargs):
+            try:
+                return await attr(*args, **kwargs)
+            finally:
+                self.pin()
+        return write
+
+    def pin(self, user_id: Optional[str] = None):
+        until = time.monotonic() + self.pin_seconds
+        _last_write.set(until)
+        user_id = user_id or _acting_user.get()
+        if user_id is not None:
+            self._pins[user_id] = until
+        if len(self._pins) > 10000:
+            now = time.monotonic()
+            self._pins = {user: expiry for user, expiry in self._pins.items() if expiry > now}
+
+    def is_pinned(self) -> bool:
+        now = time.monotonic()
+        if _last_write.get() > now:
+            return True
+        user_id = _acting_user.get()
+        return user_id is not None and self._pins.get(user_id, 0.0) > now
+
+    def _routed_read(self, name: str):
+        async def read(*args, **kwargs):
+            if self.is_pinned():
+                METRICS['pinned_reads'] += 1
+                return await getattr(self.primary, name)(*args, **kwargs)
+            try:
+                result = await getattr(self.replica, name)(*args, **kwargs)
+            except Exception as e:
+                # An unreachable replica degrades to primary reads, not errors
+                print(f"⚠️ Replica read {name} failed, using primary: {e}")
+                METRICS['replica_errors'] += 1
+                return await getattr(self.primary, name)(*args, **kwargs)
+            METRICS['replica_reads'] += 1
+            return result
+        return read
+
+    async def close(self):
+        for engine in (self.primary, self.replica):
+            if hasattr(engine, 'close'):
+                await engine.close()
@@ -0,0 +1,786 @@
+"""
+Storage contract shared by every database engine
+Routes and services only rely on the Repository protocol, so the Supabase,
+asyncpg, in-memory and SQLite engines are interchangeable.
+"""
+
+import asyncio
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Protocol, Sequence, Tuple, runtime_checkable
+
+from services.completion_bitmap import decode, encode, from_logs, mark
+from services.events import STREAK_MILESTONES, badge_event, streak_event, xp_event
+from services.habit_rules import STREAK_BONUSES, completion_reason, habit_xp, next_streak
+from services.leveling import level_from_xp
+from services.pagination import CLAN_LEADERBOARD, CLAN_MEMBERS, HABITS, LEADERBOARD, keyset_slice
+from services.projection import project, project_all
+
+
+class StaleWriteError(Exception):
+    """Raised when an optimistic write finds the row at a newer version"""
+
+
+class ClanNotFoundError(LookupError):
+    """Raised when a clan procedure targets a clan that does not exist"""
+
+
+class ClanFullError(Exception):
+    """Raised when a join finds the clan already at max_members"""
+
+
+def clan_join_result(result: dict) -> dict:
+    """Map the {"status": ...} payload of the join_clan procedure to a member row"""
+    if result['status'] == 'not_found':
+        raise ClanNotFoundError("Clan not found")
+    if result['status'] == 'full':
+        raise ClanFullError("Clan is full")
+    return result['member']
+
+
+def clan_leave_result(result: dict) -> bool:
+    """Map the leave_clan payload; False when the user was not a member"""
+    if result['status'] == 'not_found':
+        raise ClanNotFoundError("Clan not found")
+    return result['status'] == 'left'
+
+
+class HabitNotFoundError(LookupError):
+    """Raised when a habit completion targets a habit that does not exist"""
+
+
+def habit_completion_result(result: dict) -> dict:
+    """Check the complete_habit payload and fold pending XP into its profile.
+
+    Statuses are "completed" (with habit, completion, xp_earned, streak_bonus
+    and user) and "already_completed" (with habit).
+    """
+    if result['status'] == 'not_found':
+        raise HabitNotFoundError("Habit not found")
+    if result.get('user') is not None:
+        apply_pending_xp(result['user'])
+    return result
+
+
+def apply_pending_xp(user: Optional[dict]) -> Optional[dict]:
+    """Fold a profile's uncompacted ledger XP (`pending_xp`) into its totals"""
+    if user is None:
+        return None
+    pending = user.pop('pending_xp', 0) or 0
+    if pending:
+        user['xp'] = (user.get('xp') or 0) + pending
+        user['total_points'] = (user.get('total_points') or 0) + pending
+        user['level'] = level_from_xp(user['xp'])
+    return user
+
+
+def dense_activity(rows: Sequence[dict], start: date, end: date) -> List[dict]:
+    """One {date, completions, xp_earned} entry per day from start to end,
+    zero-filled, from daily_user_activity rows"""
+    by_day = {str(row['day'])[:10]: row for row in rows}
+    activity = []
+    for n in range((end - start).days + 1):
+        day = (start + timedelta(days=n)).isoformat()
+        row = by_day.get(day, {})
+        activity.append({'date': day, 'completions': row.get('completions', 0),
+                         'xp_earned': row.get('xp_earned', 0)})
+    return activity
+
+
+@runtime_checkable
+class Repository(Protocol):
+    # User operations
+    async def get_user(self, user_id: str,
+                       columns: Optional[Sequence[str]] = None) -> Optional[dict]: ...
+    async def get_users(self, user_ids: List[str]) -> List[dict]: ...
+    async def create_user(self, user_data: dict) -> dict: ...
+    async def update_user(self, user_id: str, updates: dict,
+                          expected_version: Optional[int] = None) -> dict: ...
+
+    # XP ledger operations
+    async def record_xp_transaction(self, user_id: str, xp_amount: int,
+                                    reason: str) -> Optional[dict]: ...
+    async def compact_xp_ledger(self, batch_size: int = 500) -> int: ...
+
+    # Habit operations
+    async def get_habit(self, habit_id: str) -> Optional[dict]: ...
+    async def get_habits(self, habit_ids: List[str]) -> List[dict]: ...
+    async def get_user_habits(self, user_id: str, columns: Optional[Sequence[str]] = None,
+                              limit: Optional[int] = None, after: Optional[dict] = None) -> List[dict]: ...
+    async def create_habit(self, habit_data: dict) -> dict: ...
+    async def update_habit(self, habit_id: str, updates: dict,
+                           expected_version: Optional[int] = None) -> dict: ...
+    async def delete_habit(self, habit_id: str): ...
+
+    # Habit completion operations
+    async def create_habit_completion(self, habit_id: str, user_id: str, xp_earned: int,
+                                      notes: Optional[str] = None,
+                                      completed_on: Optional[date] = None) -> Optional[dict]: ...
+    async def create_habit_completions(self, completions: List[dict]) -> List[dict]: ...
+    async def get_last_completion(self, habit_id: str, user_id: str) -> Optional[dict]: ...
+    async def complete_habit(self, habit_id: str, user_id: str, notes: Optional[str] = None,
+                             today: Optional[date] = None) -> dict: ...
+
+    # Badge operations
+    async def create_badge_if_not_exists(self, badge_data: dict): ...
+    async def upsert_badges(self, badges: List[dict]) -> List[dict]: ...
+    async def get_badge_by_name(self, name: str) -> Optional[dict]: ...
+    async def get_badges_by_name(self, names: List[str]) -> List[dict]: ...
+    async def get_badge_by_type_and_requirement(self, badge_type: str, requirement: int) -> Optional[dict]: ...
+    async def get_all_badges(self) -> List[dict]: ...
+    async def user_has_badge(self, user_id: str, badge_id: str) -> bool: ...
+    async def create_user_badge(self, user_id: str, badge_id: str) -> dict: ...
+    async def get_user_badges(self, user_id: str) -> List[dict]: ...
+
+    # Clan operations
+    async def create_clan(self, clan_data: dict) -> dict: ...
+    async def create_clan_with_owner(self, clan_data: dict) -> dict: ...
+    async def get_clan(self, clan_id: str) -> Optional[dict]: ...
+    async def get_clans(self, clan_ids: List[str]) -> List[dict]: ...
+    async def update_clan(self, clan_id: str, updates: dict) -> dict: ...
+    async def increment_clan_xp(self, clan_id: str, xp_amount: int): ...
+    async def join_clan(self, clan_id: str, user_id: str, username: str) -> dict: ...
+    async def leave_clan(self, clan_id: str, user_id: str) -> bool: ...
+    async def get_clan_members(self, clan_id: str, columns: Optional[Sequence[str]] = None,
+                               limit: Optional[int] = None, after: Optional[dict] = None) -> List[dict]: ...
+    async def increment_clan_member_contribution(self, clan_id: str, user_id: str, xp_amount: int): ...
+    async def get_clan_member_contribution(self, clan_id: str, user_id: str) -> int: ...
+    async def apply_clan_xp(self, clan_deltas: Dict[str, int],
+                            member_deltas: Dict[Tuple[str, str], int]): ...
+    async def create_clan_message(self, message_data: dict) -> dict: ...
+    async def get_clan_messages(self, clan_id: str, limit: int = 50) -> List[dict]: ...
+
+    # Leaderboard operations
+    async def get_leaderboard(self, limit: int = 100, columns: Optional[Sequence[str]] = None,
+                              after: Optional[dict] = None) -> List[dict]: ...
+    async def get_clan_leaderboard(self, limit: int = 50, after: Optional[dict] = None) -> List[dict]: ...
+
+    # Discover operations
+    async def get_public_habits(self, limit: int = 20) -> List[dict]: ...
+    async def get_popular_habits(self, limit: int = 10) -> List[dict]: ...
+
+    # Quest operations
+    async def get_active_quests(self, user_id: str) -> List[dict]: ...
+    async def update_quest_progress(self, user_quest_id: str, progress: int): ...
+
+    # Side-effect job queue operations
+    async def enqueue_side_effects(self, jobs: List[dict], lease_seconds: float) -> List[dict]: ...
+    async def claim_side_effects(self, limit: int, lease_seconds: float) -> List[dict]: ...
+    async def finish_side_effect(self, job_id): ...
+    async def retry_side_effect(self, job_id, attempts: int, error: str,
+                                retry_in: Optional[float]): ...
+
+    # Outbox operations
+    async def claim_outbox_events(self, limit: int, lease_seconds: float) -> List[dict]: ...
+    async def ack_outbox_events(self, event_ids: List) -> None: ...
+
+    # Completion bitmap operations
+    async def get_completion_bitmaps(self, habit_id: str) -> List[dict]: ...
+    async def backfill_completion_bitmaps(self, habit_ids: Optional[List[str]] = None) -> int: ...
+
+    # Activity rollup operations
+    async def get_user_activity(self, user_id: str, start: date, end: date) -> List[dict]: ...
+
+    # Streak decay operations
+    async def decay_streaks(self, cutoff: date, after: Optional[str], limit: int) -> dict: ...
+    async def get_sweep_checkpoint(self, name: str) -> Optional[dict]: ...
+    async def save_sweep_checkpoint(self, name: str, cursor: Optional[str], finished: bool): ...
+
+
+# Tables whose rows carry created_at/updated_at columns filled in by the database
+TIMESTAMPED_TABLES = {'user_profiles', 'habits', 'badges', 'clans', 'quests'}
+
+# Tables carrying an optimistic concurrency `version` column
+VERSIONED_TABLES = {'user_profiles', 'habits'}
+
+
+class TableDatabase:
+    """Repository implemented on top of a few table primitives.
+
+    Engines without a query language of their own (in-memory, SQLite) only
+    implement `_select`, `_insert`, `_update`, `_delete` and `_increment`;
+    filters are equality matches on top-level columns.
+    """
+
+    async def _select(self, table: str, filters: Optional[dict] = None,
+                      order: Optional[str] = None, desc: bool = False,
+                      limit: Optional[int] = None) -> List[dict]:
+        raise NotImplementedError
+
+    async def _insert(self, table: str, row: dict) -> dict:
+        raise NotImplementedError
+
+    async def _update(self, table: str, filters: dict, updates: dict) -> List[dict]:
+        raise NotImplementedError
+
+    async def _delete(self, table: str, filters: dict):
+        raise NotImplementedError
+
+    async def _select_in(self, table: str, column: str, values: List,
+                         filters: Optional[dict] = None) -> List[dict]:
+        """Rows whose `column` is one of `values`; engines override this with one query"""
+        rows = []
+        for value in dict.fromkeys(values):
+            rows.extend(await self._select(table, {**(filters or {}), column: value}))
+        return rows
+
+    async def _select_after(self, table: str, column: str, after, limit: int,
+                            filters: Optional[dict] = None) -> List[dict]:
+        """Up to `limit` rows whose `column` sorts after `after` (all when None),
+        in `column` order: one keyset page; engines override this with one query"""
+        rows = await self._select(table, filters, order=column)
+        return [row for row in rows if after is None or row[column] > after][:limit]
+
+    async def _increment(self, table: str, filters: dict, deltas: Dict[str, int],
+                         derived: Optional[Dict[str, Callable[[dict], object]]] = None) -> List[dict]:
+        """Atomically add `deltas` to numeric columns, then recompute `derived` columns"""
+        raise NotImplementedError
+
+    async def _versioned_update(self, table: str, filters: dict, updates: dict,
+                                expected_version: Optional[int]) -> dict:
+        if expected_version is None:
+            rows = await self._update(table, filters, updates)
+        else:
+            rows = await self._update(
+                table, {**filters, 'version': expected_version},
+                {**updates, 'version': expected_version + 1}
+            )
+            if not rows:
+                raise StaleWriteError(f"{table} row changed since version {expected_version}")
+        return rows[0]
+
+    @staticmethod
+    def _with_defaults(table: str, row: dict) -> dict:
+        """Fill the columns the real schema would default"""
+        row = dict(row)
+        row.setdefault('id', str(uuid.uuid4()))
+        if table in VERSIONED_TABLES:
+            row.setdefault('version', 0)
+        if table in TIMESTAMPED_TABLES:
+            now = datetime.now().isoformat()
+            row.setdefault('created_at', now)
+            row.setdefault('updated_at', now)
+        return row
+
+    async def _first(self, table: str, filters: dict, **kwargs) -> Optional[dict]:
+        rows = await self._select(table, filters, limit=1, **kwargs)
+        return rows[0] if rows else None
+
+    def _lock(self, name: str) -> asyncio.Lock:
+        """Serialise operations that span several primitives, standing in
+        for the transactions the SQL engines get from their procedures"""
+        locks = self.__dict__.setdefault('_locks', {})
+        if name not in locks:
+            locks[name] = asyncio.Lock()
+        return locks[name]
+
+    async def _get_user_with_pending(self, user_id: str) -> Optional[dict]:
+        user = await self._first('user_profiles', {'clerk_user_id': user_id})
+        if user is not None:
+            pending = await self._select('xp_transactions', {'user_id': user_id, 'compacted_at': None})
+            user['pending_xp'] = sum(entry['amount'] for entry in pending)
+        return apply_pending_xp(user)
+
+    # User operations
+    async def get_user(self, user_id: str,
+                       columns: Optional[Sequence[str]] = None) -> Optional[dict]:
+        async with self._lock('xp_ledger'):
+            return project(await self._get_user_with_pending(user_id), columns)
+
+    async def get_users(self, user_ids: List[str]) -> List[dict]:
+        async with self._lock('xp_ledger'):
+            users = await self._select_in('user_profiles', 'clerk_user_id', user_ids)
+            pending = await self._select_in('xp_transactions', 'user_id', user_ids, {'compacted_at': None})
+        totals: Dict[str, int] = {}
+        for entry in pending:
+            totals[entry['user_id']] = totals.get(entry['user_id'], 0) + entry['amount']
+        for user in users:
+            user['pending_xp'] = totals.get(user['clerk_user_id'], 0)
+        return [apply_pending_xp(user) for user in users]
+
+    async def create_user(self, user_data: dict) -> dict:
+        return await self._insert('user_profiles', user_data)
+
+    async def update_user(self, user_id: str, updates: dict,
+                          expected_version: Optional[int] = None) -> dict:
+        return await self._versioned_update(
+            'user_profiles', {'clerk_user_id': user_id}, updates, expected_version
+        )
+
+    # XP ledger operations
+    async def record_xp_transaction(self, user_id: str, xp_amount: int,
+                                    reason: str) -> Optional[dict]:
+        async with self._lock('xp_ledger'):
+            if await self._first('user_profiles', {'clerk_user_id': user_id}) is None:
+                return None
+            return await self._ledger_entry(user_id, xp_amount, reason)
+
+    async def _ledger_entry(self, user_id: str, xp_amount: int, reason: str) -> Optional[dict]:
+        """Append an XP ledger entry plus its xp_update outbox event, under the
+        xp_ledger lock; returns the profile including the entry"""
+        entry = await self._insert('xp_transactions', {
+            'user_id': user_id,
+            'amount': xp_amount,
+            'reason': reason,
+            'created_at': datetime.now().isoformat(),
+            'compacted_at': None
+        })
+        user = await self._get_user_with_pending(user_id)
+        await self._outbox(xp_event(entry, user['xp']))
+        await self._record_activity(user_id, entry['created_at'], xp_earned=xp_amount)
+        return user
+
+    async def _outbox(self, event: Optional[dict]):
+        """Stands in for the migrations/010_outbox.sql triggers"""
+        if event is None:
+            return
+        now = datetime.now().isoformat()
+        await self._insert('outbox_events', {**event, 'created_at': now, 'locked_until': now})
+
+    async def compact_xp_ledger(self, batch_size: int = 500) -> int:
+        async with self._lock('xp_ledger'):
+            batch = await self._select(
+                'xp_transactions', {'compacted_at': None},
+                order='created_at', limit=batch_size
+            )
+            totals: Dict[str, int] = {}
+            for entry in batch:
+                totals[entry['user_id']] = totals.get(entry['user_id'], 0) + entry['amount']
+            for user_id, amount in totals.items():
+                await self._increment(
+                    'user_profiles', {'clerk_user_id': user_id},
+                    {'xp': amount, 'total_points': amount, 'version': 1},
+                    {'level': lambda row: level_from_xp(row['xp'])}
+                )
+            compacted_at = datetime.now().isoformat()
+            for entry in batch:
+                await self._update('xp_transactions', {'id': entry['id']}, {'compacted_at': compacted_at})
+            return len(batch)
+
+    # Habit operations
+    async def get_habit(self, habit_id: str) -> Optional[dict]:
+        return await self._first('habits', {'id': habit_id})
+
+    async def get_habits(self, habit_ids: List[str]) -> List[dict]:
+        return await self._select_in('habits', 'id', habit_ids)
+
+    async def get_user_habits(self, user_id: str, columns: Optional[Sequence[str]] = None,
+                              limit: Optional[int] = None, after: Optional[dict] = None) -> List[dict]:
+        rows = await self._select('habits', {'user_id': user_id})
+        return project_all(keyset_slice(rows, HABITS, limit, after), columns)
+
+    async def create_habit(self, habit_data: dict) -> dict:
+        return await self._insert('habits', habit_data)
+
+    async def update_habit(self, habit_id: str, updates: dict,
+                           expected_version: Optional[int] = None) -> dict:
+        before = None
+        if updates.get('streak') in STREAK_MILESTONES:
+            before = await self._first('habits', {'id': habit_id})
+        habit = await self._versioned_update('habits', {'id': habit_id}, updates, expected_version)
+        if 'streak' in updates:
+            await self._outbox(streak_event(before, habit))
+        return habit
+
+    async def delete_habit(self, habit_id: str):
+        await self._delete('habits', {'id': habit_id})
+
+    # Habit completion operations
+    async def create_habit_completion(self, habit_id: str, user_id: str, xp_earned: int,
+                                      notes: Optional[str] = None,
+                                      completed_on: Optional[date] = None) -> Optional[dict]:
+        now = datetime.now()
+        completed_on = (completed_on or now.date()).isoformat()
+        # Stands in for the unique (habit_id, user_id, completed_on) constraint
+        async with self._lock('habit_logs'):
+            day = {'habit_id': habit_id, 'user_id': user_id, 'completed_on': completed_on}
+            if await self._first('habit_logs', day) is not None:
+                return None
+            completion = await self._insert('habit_logs', {
+                **day,
+                'xp_earned': xp_earned,
+                'notes': notes,
+                'completed_at': now.isoformat()
+            })
+            await self._mark_completion(completion)
+            await self._record_activity(user_id, completed_on, completions=1)
+            return completion
+
+    async def create_habit_completions(self, completions: List[dict]) -> List[dict]:
+        async with self._lock('habit_logs'):
+            created = []
+            for completion in completions:
+                day = {key: completion[key] for key in ('habit_id', 'user_id', 'completed_on')}
+                if await self._first('habit_logs', day) is None:
+                    created.append(await self._insert('habit_logs', dict(completion)))
+                    await self._mark_completion(created[-1])
+                    await self._record_activity(completion['user_id'], completion['completed_on'], completions=1)
+            return created
+
+    async def _mark_completion(self, completion: dict):
+        """Stands in for the migrations/012_completion_bitmaps.sql trigger;
+        called under the habit_logs lock"""
+        day = date.fromisoformat(str(completion['completed_on'])[:10])
+        key = {'habit_id': completion['habit_id'], 'year': day.year}
+        row = await self._first('habit_completion_bitmaps', key)
+        if row is None:
+            await self._insert('habit_completion_bitmaps', {
+                **key, 'user_id': completion['user_id'], 'days': encode(mark(0, day))
+            })
+        else:
+            await self._update('habit_completion_bitmaps', key, {'days': encode(mark(decode(row['days']), day))})
+
+    async def get_last_completion(self, habit_id: str, user_id: str) -> Optional[dict]:
+        return await self._first(
+            'habit_logs', {'habit_id': habit_id, 'user_id': user_id},
+            order='completed_at', desc=True
+        )
+
+    async def _record_activity(self, user_id: str, day, completions: int = 0, xp_earned: int = 0):
+        """Stands in for the migrations/013_daily_user_activity.sql triggers on
+        habit_logs and xp_transactions"""
+        key = {'user_id': user_id, 'day': str(day)[:10]}
+        deltas = {'completions': completions, 'xp_earned': xp_earned}
+        async with self._lock('daily_user_activity'):
+            if not await self._increment('daily_user_activity', key, deltas):
+                await self._insert('daily_user_activity', {**key, **deltas})
+
+    async def get_completion_bitmaps(self, habit_id: str) -> List[dict]:
+        return await self._select('habit_completion_bitmaps', {'habit_id': habit_id}, order='year')
+
+    async def get_user_activity(self, user_id: str, start: date, end: date) -> List[dict]:
+        # Rows are keyed by day, so the window is read as the set of its days
+        days = [(start + timedelta(days=n)).isoformat() for n in range((end - start).days + 1)]
+        rows = await self._select_in('daily_user_activity', 'day', days, {'user_id': user_id})
+        return dense_activity(rows, start, end)
+
+    async def backfill_completion_bitmaps(self, habit_ids: Optional[List[str]] = None) -> int:
+        async with self._lock('habit_logs'):
+            if habit_ids is None:
+                logs = await self._select('habit_logs')
+                stale = await self._select('habit_completion_bitmaps')
+            else:
+                logs = await self._select_in('habit_logs', 'habit_id', habit_ids)
+                stale = await self._select_in('habit_completion_bitmaps', 'habit_id', habit_ids)
+            for row in stale:
+                await self._delete('habit_completion_bitmaps', {'habit_id': row['habit_id'], 'year': row['year']})
+            bitmaps = from_logs(logs)
+            for (habit_id, user_id, year), bitmap in bitmaps.items():
+                await self._insert('habit_completion_bitmaps', {
+                    'habit_id': habit_id, 'user_id': user_id, 'year': year, 'days': encode(bitmap)
+                })
+            return len(bitmaps)
+
+    async def complete_habit(self, habit_id: str, user_id: str, notes: Optional[str] = None,
+                             today: Optional[date] = None) -> dict:
+        today = today or date.today()
+        async with self._lock(f'habit:{habit_id}'):
+            habit = await self._first('habits', {'id': habit_id})
+            if habit is None:
+                raise HabitNotFoundError("Habit not found")
+            streak, best_streak = next_streak(habit, today)
+            xp_earned = habit_xp(habit.get('difficulty', 'medium'), streak)
+            completion = await self.create_habit_completion(habit_id, user_id, xp_earned, notes, today)
+            if completion is None:
+                return {'status': 'already_completed', 'habit': habit}
+            before, habit = habit, await self._versioned_update('habits', {'id': habit_id}, {
+                'streak': streak,
+                'best_streak': best_streak,
+                'total_completions': (habit.get('total_completions') or 0) + 1,
+                'last_completed': completion['completed_at']
+            }, habit.get('version'))
+            await self._outbox(streak_event(before, habit))
+
+            awards = [(xp_earned, completion_reason(habit))]
+            streak_bonus = None
+            if streak in STREAK_BONUSES:
+                bonus_type, bonus_xp = STREAK_BONUSES[streak]
+                streak_bonus = {'reason': f'{bonus_type}_streak_bonus', 'xp': bonus_xp}
+                awards.append((bonus_xp, streak_bonus['reason']))
+            async with self._lock('xp_ledger'):
+                if await self._first('user_profiles', {'clerk_user_id': user_id}) is not None:
+                    for amount, reason in awards:
+                        await self._ledger_entry(user_id, amount, reason)
+                user = await self._get_user_with_pending(user_id)
+        return {
+            'status': 'completed',
+            'habit': habit,
+            'completion': completion,
+            'xp_earned': xp_earned,
+            'streak_bonus': streak_bonus,
+            'user': user
+        }
+
+    # Badge operations
+    async def create_badge_if_not_exists(self, badge_data: dict):
+        if not await self.get_badge_by_name(badge_data['name']):
+            await self._insert('badges', badge_data)
+
+    async def upsert_badges(self, badges: List[dict]) -> List[dict]:
+        existing = {
+            badge['name']: badge
+            for badge in await self._select_in('badges', 'name', [b['name'] for b in badges])
+        }
+        upserted = []
+        for badge in badges:
+            if badge['name'] in existing:
+                upserted.extend(await self._update('badges', {'name': badge['name']}, badge))
+            else:
+                upserted.append(await self._insert('badges', badge))
+        return upserted
+
+    async def get_badge_by_name(self, name: str) -> Optional[dict]:
+        return await self._first('badges', {'name': name})
+
+    async def get_badges_by_name(self, names: List[str]) -> List[dict]:
+        return await self._select_in('badges', 'name', names)
+
+    async def get_badge_by_type_and_requirement(self, badge_type: str, requirement: int) -> Optional[dict]:
+        return await self._first('badges', {'badge_type': badge_type, 'requirement': requirement})
+
+    async def get_all_badges(self) -> List[dict]:
+        return await self._select('badges')
+
+    async def user_has_badge(self, user_id: str, badge_id: str) -> bool:
+        return await self._first('user_badges', {'user_id': user_id, 'badge_id': badge_id}) is not None
+
+    async def create_user_badge(self, user_id: str, badge_id: str) -> dict:
+        badge_data = {
+            'user_id': user_id,
+            'badge_id': badge_id,
+            'earned_at': datetime.now().isoformat()
+        }
+        user_badge = await self._insert('user_badges', badge_data)
+        badge = await self._first('badges', {'id': badge_id})
+        if badge is not None:
+            await self._outbox(badge_event(user_badge, badge))
+        return user_badge
+
+    async def get_user_badges(self, user_id: str) -> List[dict]:
+        user_badges = await self._select('user_badges', {'user_id': user_id})
+        for user_badge in user_badges:
+            user_badge['badges'] = await self._first('badges', {'id': user_badge['badge_id']})
+        return user_badges
+
+    # Clan operations
+    async def create_clan(self, clan_data: dict) -> dict:
+        return await self._insert('clans', clan_data)
+
+    async def get_clan(self, clan_id: str) -> Optional[dict]:
+        return await self._first('clans', {'id': clan_id})
+
+    async def get_clans(self, clan_ids: List[str]) -> List[dict]:
+        return await self._select_in('clans', 'id', clan_ids)
+
+    async def update_clan(self, clan_id: str, updates: dict) -> dict:
+        rows = await self._update('clans', {'id': clan_id}, updates)
+        return rows[0]
+
+    async def increment_clan_xp(self, clan_id: str, xp_amount: int):
+        clan = await self.get_clan(clan_id)
+        await self.update_clan(clan_id, {'total_xp': clan['total_xp'] + xp_amount})
+
+    async def create_clan_with_owner(self, clan_data: dict) -> dict:
+        async with self._lock('clans'):
+            clan = await self._insert('clans', {
+                **clan_data, 'total_xp': 0, 'level': 1, 'member_count': 1
+            })
+            owner = await self._first('user_profiles', {'clerk_user_id': clan['owner_id']})
+            await self._insert('clan_members', {
+                'clan_id': clan['id'],
+                'user_id': clan['owner_id'],
+                'username': owner['username'] if owner else 'Owner',
+                'xp_contributed': 0,
+                'role': 'leader',
+                'joined_at': datetime.now().isoformat()
+            })
+            await self._update('user_profiles', {'clerk_user_id': clan['owner_id']}, {'clan_id': clan['id']})
+            return clan
+
+    async def join_clan(self, clan_id: str, user_id: str, username: str) -> dict:
+        async with self._lock('clans'):
+            clan = await self.get_clan(clan_id)
+            if clan is None:
+                raise ClanNotFoundError("Clan not found")
+            member = await self._first('clan_members', {'clan_id': clan_id, 'user_id': user_id})
+            if member is None:
+                if clan['member_count'] >= clan['max_members']:
+                    raise ClanFullError("Clan is full")
+                member = await self._insert('clan_members', {
+                    'clan_id': clan_id,
+                    'user_id': user_id,
+                    'username': username,
+                    'xp_contributed': 0,
+                    'role': 'member',
+                    'joined_at': datetime.now().isoformat()
+                })
+                await self._increment('clans', {'id': clan_id}, {'member_count': 1})
+                await self._update('user_profiles', {'clerk_user_id': user_id}, {'clan_id': clan_id})
+            return member
+
+    async def leave_clan(self, clan_id: str, user_id: str) -> bool:
+        async with self._lock('clans'):
+            if await self.get_clan(clan_id) is None:
+                raise ClanNotFoundError("Clan not found")
+            if await self._first('clan_members', {'clan_id': clan_id, 'user_id': user_id}) is None:
+                return False
+            await self._delete('clan_members', {'clan_id': clan_id, 'user_id': user_id})
+            await self._increment(
+                'clans', {'id': clan_id}, {'member_count': -1},
+                {'member_count': lambda row: max(row['member_count'], 0)}
+            )
+            await self._update(
+                'user_profiles', {'clerk_user_id': user_id, 'clan_id': clan_id}, {'clan_id': None}
+            )
+            return True
+
+    async def get_clan_members(self, clan_id: str, columns: Optional[Sequence[str]] = None,
+                               limit: Optional[int] = None, after: Optional[dict] = None) -> List[dict]:
+        rows = await self._select('clan_members', {'clan_id': clan_id})
+        return project_all(keyset_slice(rows, CLAN_MEMBERS, limit, after), columns)
+
+    async def increment_clan_member_contribution(self, clan_id: str, user_id: str, xp_amount: int):
+        member = await self._first('clan_members', {'clan_id': clan_id, 'user_id': user_id})
+        if member:
+            await self._update(
+                'clan_members', {'clan_id': clan_id, 'user_id': user_id},
+                {'xp_contributed': member['xp_contributed'] + xp_amount}
+            )
+
+    async def get_clan_member_contribution(self, clan_id: str, user_id: str) -> int:
+        member = await self._first('clan_members', {'clan_id': clan_id, 'user_id': user_id})
+        return member['xp_contributed'] if member else 0
+
+    async def apply_clan_xp(self, clan_deltas: Dict[str, int],
+                            member_deltas: Dict[Tuple[str, str], int]):
+        for clan_id, amount in clan_deltas.items():
+            await self._increment('clans', {'id': clan_id}, {'total_xp': amount})
+        for (clan_id, user_id), amount in member_deltas.items():
+            await self._increment(
+                'clan_members', {'clan_id': clan_id, 'user_id': user_id},
+                {'xp_contributed': amount}
+            )
+
+    async def create_clan_message(self, message_data: dict) -> dict:
+        return await self._insert('clan_messages', message_data)
+
+    async def get_clan_messages(self, clan_id: str, limit: int = 50) -> List[dict]:
+        return await self._select(
+            'clan_messages', {'clan_id': clan_id},
+            order='timestamp', desc=True, limit=limit
+        )
+
+    # Leaderboard operations
+    async def get_leaderboard(self, limit: int = 100, columns: Optional[Sequence[str]] = None,
+                              after: Optional[dict] = None) -> List[dict]:
+        # Ranks on compacted totals; the compactor keeps them seconds behind
+        rows = await self._select('user_profiles')
+        return project_all(keyset_slice(rows, LEADERBOARD, limit, after), columns)
+
+    async def get_clan_leaderboard(self, limit: int = 50, after: Optional[dict] = None) -> List[dict]:
+        return keyset_slice(await self._select('clans'), CLAN_LEADERBOARD, limit, after)
+
+    # Discover operations
+    async def get_public_habits(self, limit: int = 20) -> List[dict]:
+        return await self._select('habits', {'is_public': True}, limit=limit)
+
+    async def get_popular_habits(self, limit: int = 10) -> List[dict]:
+        return await self._select(
+            'habits', {'is_public': True},
+            order='total_completions', desc=True, limit=limit
+        )
+
+    # Quest operations
+    async def get_active_quests(self, user_id: str) -> List[dict]:
+        user_quests = await self._select('user_quests', {'user_id': user_id, 'status': 'active'})
+        for user_quest in user_quests:
+            user_quest['quests'] = await self._first('quests', {'id': user_quest['quest_id']})
+        return user_quests
+
+    async def update_quest_progress(self, user_quest_id: str, progress: int):
+        await self._update('user_quests', {'id': user_quest_id}, {'progress': progress})
+
+    # Side-effect job queue operations
+    async def enqueue_side_effects(self, jobs: List[dict], lease_seconds: float) -> List[dict]:
+        locked_until = (datetime.now() + timedelta(seconds=lease_seconds)).isoformat()
+        now = datetime.now().isoformat()
+        return [
+            await self._insert('side_effect_jobs', {
+                'kind': job['kind'],
+                'payload': job['payload'],
+                'status': 'pending',
+                'attempts': 0,
+                'last_error': None,
+                'locked_until': locked_until,
+                'created_at': now
+            })
+            for job in jobs
+        ]
+
+    async def claim_side_effects(self, limit: int, lease_seconds: float) -> List[dict]:
+        async with self._lock('side_effect_jobs'):
+            now = datetime.now()
+            pending = await self._select('side_effect_jobs', {'status': 'pending'}, order='locked_until')
+            due = [job for job in pending if datetime.fromisoformat(job['locked_until']) <= now][:limit]
+            locked_until = (now + timedelta(seconds=lease_seconds)).isoformat()
+            for job in due:
+                await self._update('side_effect_jobs', {'id': job['id']}, {'locked_until': locked_until})
+                job['locked_until'] = locked_until
+            return due
+
+    async def finish_side_effect(self, job_id):
+        await self._delete('side_effect_jobs', {'id': job_id})
+
+    async def retry_side_effect(self, job_id, attempts: int, error: str,
+                                retry_in: Optional[float]):
+        updates = {'attempts': attempts, 'last_error': error}
+        if retry_in is None:
+            updates['status'] = 'dead'
+        else:
+            updates['locked_until'] = (datetime.now() + timedelta(seconds=retry_in)).isoformat()
+        await self._update('side_effect_jobs', {'id': job_id}, updates)
+
+    # Outbox operations
+    async def claim_outbox_events(self, limit: int, lease_seconds: float) -> List[dict]:
+        async with self._lock('outbox_events'):
+            now = datetime.now()
+            events = await self._select('outbox_events', order='created_at')
+            due = [event for event in events if datetime.fromisoformat(event['locked_until']) <= now][:limit]
+            locked_until = (now + timedelta(seconds=lease_seconds)).isoformat()
+            for event in due:
+                await self._update('outbox_events', {'id': event['id']}, {'locked_until': locked_until})
+                event['locked_until'] = locked_until
+            return due
+
+    async def ack_outbox_events(self, event_ids: List):
+        for event_id in event_ids:
+            await self._delete('outbox_events', {'id': event_id})
+
+    # Streak decay operations
+    async def decay_streaks(self, cutoff: date, after: Optional[str], limit: int) -> dict:
+        cutoff = cutoff.isoformat()
+        # Without the partial index each chunk is the next `limit` habits by id;
+        # the cursor moves past all of them, broken or not
+        page = await self._select_after('habits', 'id', after, limit)
+        chunk = [
+            habit for habit in page
+            if (habit.get('streak') or 0) > 0
+            and habit.get('last_completed') and str(habit['last_completed'])[:10] < cutoff
+        ]
+        reset = []
+        for habit in chunk:
+            try:
+                await self._versioned_update('habits', {'id': habit['id']}, {'streak': 0}, habit.get('version', 0))
+            except StaleWriteError:
+                # Changed since the scan, most likely completed; that write owns the streak
+                continue
+            reset.append(habit['id'])
+        return {'reset': reset, 'cursor': page[-1]['id'] if page else None}
+
+    async def get_sweep_checkpoint(self, name: str) -> Optional[dict]:
+        return await self._first('sweep_checkpoints', {'name': name})
+
+    async def save_sweep_checkpoint(self, name: str, cursor: Optional[str], finished: bool):
+        checkpoint = {'cursor': cursor, 'finished': finished, 'updated_at': datetime.now().isoformat()}
+        if not await self._update('sweep_checkpoints', {'name': name}, checkpoint):
+            await self._insert('sweep_checkpoints', {'name': name, **checkpoint})
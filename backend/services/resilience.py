@@ -0,0 +1,258 @@
+"""
+Deadlines, circuit breakers and stale fallbacks for storage calls
+ResilientDatabase wraps an engine so every call gets a deadline, each table
+gets a circuit breaker that fails fast once the database keeps timing out,
+idempotent reads are retried with jittered backoff, and the reads in
+STALE_READS fall back to their last good result when all of that fails.
+"""
+
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import asyncpg
+import httpx
+from postgrest.exceptions import APIError
+
+from config import settings
+
+
+class DatabaseUnavailableError(Exception):
+    """The database timed out, failed or has its circuit open, and no stale copy exists"""
+
+
+class CircuitOpenError(DatabaseUnavailableError):
+    """Calls to a table are being refused while its circuit is open"""
+
+
+# Failures that say the database is unhealthy. Domain errors such as
+# StaleWriteError, ClanFullError or a constraint violation never count
+# against a breaker.
+TRANSIENT_ERRORS = (asyncio.TimeoutError, ConnectionError, OSError, httpx.TransportError,
+                    asyncpg.InterfaceError, asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError)
+
+# PostgREST error codes from an unreachable or overloaded database:
+# PGRST00x connection and pool errors, Postgres class 08 (connection
+# exception), 53 (insufficient resources), 57014 (statement timeout) and
+# 57P0x (shutdown, cannot connect now)
+TRANSIENT_API_CODES = ('PGRST00', '08', '53', '57014', '57P0')
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    if isinstance(error, APIError):
+        code = str(error.code or '')
+        # A body PostgREST didn't write (gateway 502/503/504) carries the HTTP status
+        return (code.isdigit() and code.startswith('5')) or code.startswith(TRANSIENT_API_CODES)
+    return False
+
+# Calls grouped by the table whose breaker guards them
+TABLES = {
+    'user_profiles': ('get_user', 'get_users', 'create_user', 'update_user', 'record_xp_transaction',
+                      'compact_xp_ledger', 'get_leaderboard'),
+    'habits': ('get_habit', 'get_habits', 'get_user_habits', 'create_habit', 'update_habit',
+               'delete_habit', 'get_public_habits', 'get_popular_habits', 'decay_streaks'),
+    'habit_logs': ('create_habit_completion', 'create_habit_completions', 'get_last_completion',
+                   'complete_habit'),
+    'badges': ('create_badge_if_not_exists', 'upsert_badges', 'get_badge_by_name',
+               'get_badges_by_name', 'get_badge_by_type_and_requirement', 'get_all_badges'),
+    'user_badges': ('user_has_badge', 'create_user_badge', 'get_user_badges'),
+    'clans': ('create_clan', 'create_clan_with_owner', 'get_clan', 'get_clans', 'update_clan',
+              'increment_clan_xp', 'join_clan', 'leave_clan', 'apply_clan_xp', 'get_clan_leaderboard'),
+    'clan_members': ('get_clan_members', 'increment_clan_member_contribution',
+                     'get_clan_member_contribution'),
+    'clan_messages': ('create_clan_message', 'get_clan_messages'),
+    'side_effect_jobs': ('enqueue_side_effects', 'claim_side_effects', 'finish_side_effect',
+                         'retry_side_effect'),
+    'outbox_events': ('claim_outbox_events', 'ack_outbox_events'),
+    'habit_completion_bitmaps': ('get_completion_bitmaps', 'backfill_completion_bitmaps'),
+    'daily_user_activity': ('get_user_activity',),
+    'sweep_checkpoints': ('get_sweep_checkpoint', 'save_sweep_checkpoint'),
+}
+TABLE_OF = {method: table for table, methods in TABLES.items() for method in methods}
+
+# Reads that may be answered from their last good result while the database is down
+STALE_READS = frozenset({
+    'get_user', 'get_users', 'get_leaderboard', 'get_clan_leaderboard',
+    'get_clan_members', 'get_clan_messages', 'get_all_badges', 'get_user_activity',
+})
+
+# Per-operation deadlines in seconds; anything else gets DB_TIMEOUT_SECONDS
+DEADLINES = {
+    'compact_xp_ledger': 10.0,
+    'upsert_badges': 10.0,
+    'apply_clan_xp': 5.0,
+}
+
+_READ_PREFIXES = ('get_', 'user_has_')
+_NOT_WRAPPED = frozenset({'close', 'metrics'})
+
+
+# Filled in by the stale_warning middleware; reads append what they served stale
+_stale_reads: ContextVar[Optional[List[str]]] = ContextVar('stale_reads', default=None)
+
+
+@contextmanager
+def stale_scope():
+    """Collect the stale fallbacks served inside the block"""
+    served: List[str] = []
+    token = _stale_reads.set(served)
+    try:
+        yield served
+    finally:
+        _stale_reads.reset(token)
+
+
+def mark_stale(reads):
+    """Report stale fallbacks served for this request by a shared task"""
+    served = _stale_reads.get()
+    if served is not None:
+        served.extend(reads)
+
+
+def _copy(result):
+    # Routes decorate the rows they get back, so the kept copy stays private
+    if isinstance(result, dict):
+        return dict(result)
+    if isinstance(result, list):
+        return [dict(row) if isinstance(row, dict) else row for row in result]
+    return result
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, lets one trial call
+    through after `reset_timeout`, and closes again when that succeeds"""
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self, table: str):
+        state = self.state
+        if state == 'open' or (state == 'half_open' and self._trial_running):
+            raise CircuitOpenError(f"Circuit open for {table}")
+        if state == 'half_open':
+            self._trial_running = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            # A failed trial re-opens for another full reset_timeout
+            self.opened_at = time.monotonic()
+
+
+class ResilientDatabase:
+    """Storage engine wrapper adding deadlines, breakers, retries and stale reads.
+
+    Every call is forwarded to the wrapped engine.
+    """
+
+    def __init__(self, engine, timeout: Optional[float] = None, retries: Optional[int] = None,
+                 breaker_threshold: Optional[int] = None, breaker_reset: Optional[float] = None,
+                 stale_entries: int = 1000):
+        self.inner = engine
+        self.timeout = timeout if timeout is not None else settings.DB_TIMEOUT_SECONDS
+        self.retries = retries if retries is not None else settings.DB_READ_RETRIES
+        self.breaker_threshold = breaker_threshold or settings.DB_BREAKER_THRESHOLD
+        self.breaker_reset = breaker_reset if breaker_reset is not None else settings.DB_BREAKER_RESET_SECONDS
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.stale_entries = stale_entries
+        self._last_good: "OrderedDict[tuple, object]" = OrderedDict()
+        self.stats = {'timeouts': 0, 'retries': 0, 'rejected': 0, 'stale_served': 0}
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if not callable(attr) or name in _NOT_WRAPPED or name.startswith('_'):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self._call(name, attr, args, kwargs)
+        return call
+
+    def breaker(self, table: str) -> CircuitBreaker:
+        breaker = self.breakers.get(table)
+        if breaker is None:
+            breaker = self.breakers[table] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            'circuits': {table: breaker.state for table, breaker in self.breakers.items()},
+        }
+
+    async def close(self):
+        if hasattr(self.inner, 'close'):
+            await self.inner.close()
+
+    async def _call(self, name: str, method, args: tuple, kwargs: dict):
+        table = TABLE_OF.get(name, 'other')
+        breaker = self.breaker(table)
+        is_read = name.startswith(_READ_PREFIXES)
+        attempts = 1 + (self.retries if is_read else 0)
+        key = (name, repr(args), repr(sorted(kwargs.items()))) if name in STALE_READS else None
+
+        for attempt in range(attempts):
+            try:
+                breaker.before_call(table)
+            except CircuitOpenError:
+                self.stats['rejected'] += 1
+                return self._stale_or_raise(key, CircuitOpenError(f"{name} rejected: circuit open for {table}"))
+            try:
+                # Writes get the deadline too; a timed-out write may still have committed
+                result = await asyncio.wait_for(method(*args, **kwargs), DEADLINES.get(name, self.timeout))
+            except Exception as e:
+                if not is_transient(e):
+                    # The database answered; domain errors say nothing about its health
+                    breaker.record_success()
+                    raise
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats['timeouts'] += 1
+                breaker.record_failure()
+                if attempt + 1 < attempts:
+                    self.stats['retries'] += 1
+                    # Full jitter keeps retrying callers from arriving in lockstep
+                    await asyncio.sleep(random.uniform(0, settings.DB_RETRY_BASE_SECONDS * 2 ** attempt))
+                    continue
+                return self._stale_or_raise(key, DatabaseUnavailableError(f"{name} failed: {str(e) or 'timed out'}"))
+            breaker.record_success()
+            if key is not None:
+                self._remember(key, result)
+            return result
+
+    def _remember(self, key: tuple, result):
+        self._last_good[key] = _copy(result)
+        self._last_good.move_to_end(key)
+        while len(self._last_good) > self.stale_entries:
+            self._last_good.popitem(last=False)
+
+    def _stale_or_raise(self, key: Optional[tuple], error: DatabaseUnavailableError):
+        if key is not None and key in self._last_good:
+            self.stats['stale_served'] += 1
+            served = _stale_reads.get()
+            if served is not None:
+                served.append(key[0])
+            return _copy(self._last_good[key])
+        raise error
@@ -0,0 +1,235 @@
+"""
+Deferred side effects
+Badge checks, level-up handling and analytics used to run inline before a
+completion's response went out. Callers now defer() them as jobs; each batch
+is written to side_effect_jobs in one insert, then handed to in-process
+workers that run it with retries. A job leased to a process that died is
+picked up again by the next sweep, so effects run at least once. A batch
+whose insert fails runs inline instead, as the state it follows from has
+already been committed.
+"""
+
+import asyncio
+import random
+import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import posthog
+
+from config import settings
+from services.database import Database
+
+Handler = Callable[[dict], Awaitable[None]]
+
+# kind -> handler(payload), filled in by the modules owning each effect
+HANDLERS: Dict[str, Handler] = {}
+
+# Jobs deferred inside the innermost collect() block
+_batch: ContextVar[Optional[List[dict]]] = ContextVar('side_effect_batch', default=None)
+
+# Id of the side_effect_jobs row whose handler is running, None when run inline
+_job_id: ContextVar[Optional[object]] = ContextVar('side_effect_job_id', default=None)
+
+
+def side_effect(kind: str):
+    """Register the decorated coroutine function as the handler for `kind`"""
+    def register(handler: Handler) -> Handler:
+        HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def defer(kind: str, payload: dict):
+    """Queue a job in the enclosing collect() block; it runs after the block"""
+    batch = _batch.get()
+    if batch is None:
+        raise RuntimeError(f"defer({kind!r}) outside side_effects.collect()")
+    batch.append({'kind': kind, 'payload': payload})
+
+
+def job_uuid() -> Optional[str]:
+    """Stable UUID for the running job, so a sink can drop the repeat when a
+    job whose lease ran out is run again"""
+    job_id = _job_id.get()
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f'side_effect_jobs/{job_id}')) if job_id is not None else None
+
+
+@side_effect('analytics')
+async def _capture(payload: dict):
+    event_uuid = job_uuid()
+    extra = {'uuid': event_uuid} if event_uuid else {}
+    posthog.capture(payload['user_id'], payload['event'], payload['properties'], **extra)
+
+
+class SideEffectPipeline:
+    def __init__(self, db: Optional[Database] = None, workers: Optional[int] = None,
+                 max_attempts: Optional[int] = None, lease_seconds: Optional[float] = None,
+                 sweep_interval: Optional[float] = None, queue_size: Optional[int] = None):
+        self.db = db or Database()
+        self.workers = workers or settings.SIDE_EFFECT_WORKERS
+        self.max_attempts = max_attempts or settings.SIDE_EFFECT_MAX_ATTEMPTS
+        self.lease_seconds = lease_seconds or settings.SIDE_EFFECT_LEASE_SECONDS
+        self.sweep_interval = sweep_interval or settings.SIDE_EFFECT_SWEEP_INTERVAL_SECONDS
+        self.queue_size = queue_size or settings.SIDE_EFFECT_QUEUE_SIZE
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retries: set = set()
+        self.stats = {'enqueued': 0, 'completed': 0, 'retried': 0, 'dead': 0, 'recovered': 0, 'inline': 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def metrics(self) -> dict:
+        return {**self.stats, 'queued': self.queue.qsize() if self.queue else 0, 'running': self.running}
+
+    @asynccontextmanager
+    async def collect(self):
+        """Gather the jobs deferred inside the block and submit them as one batch.
+
+        Nested blocks join the outermost one. Nothing is submitted if the block raises.
+        """
+        if _batch.get() is not None:
+            yield
+            return
+        batch: List[dict] = []
+        token = _batch.set(batch)
+        try:
+            yield
+        finally:
+            _batch.reset(token)
+        if batch:
+            await self.submit(batch)
+
+    async def submit(self, jobs: List[dict]):
+        if not self.running:
+            # No workers (tests, scripts): run them now, as the inline code did
+            self.stats['inline'] += len(jobs)
+            for job in jobs:
+                await HANDLERS[job['kind']](job['payload'])
+            return
+        try:
+            rows = await self.db.enqueue_side_effects(jobs, self.lease_seconds)
+        except Exception as e:
+            # The state these jobs follow from is already committed; failing the
+            # request now would lose them anyway and its retry sees the change as done
+            print(f"⚠️ Could not enqueue {len(jobs)} side effects, running them inline: {e}")
+            await self._run_inline(jobs)
+            return
+        self.stats['enqueued'] += len(rows)
+        for row in rows:
+            self._offer(row)
+
+    async def _run_inline(self, jobs: List[dict]):
+        self.stats['inline'] += len(jobs)
+        for job in jobs:
+            try:
+                await HANDLERS[job['kind']](job['payload'])
+            except Exception as e:
+                self.stats['dead'] += 1
+                print(f"⚠️ Side effect {job['kind']} failed inline: {e}")
+
+    def _offer(self, job: dict):
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            # It stays in side_effect_jobs; a sweep picks it up once its lease runs out
+            pass
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: dict):
+        try:
+            handler = HANDLERS.get(job['kind'])
+            if handler is None:
+                raise LookupError(f"No handler for side effect {job['kind']!r}")
+            token = _job_id.set(job['id'])
+            try:
+                await handler(job['payload'])
+            finally:
+                _job_id.reset(token)
+        except Exception as e:
+            await self._failed(job, e)
+            return
+        self.stats['completed'] += 1
+        try:
+            await self.db.finish_side_effect(job['id'])
+        except Exception as e:
+            # The lease runs out and a sweep runs it again; handlers tolerate repeats,
+            # analytics by sending job_uuid() for the sink to dedupe on
+            print(f"⚠️ Could not mark side effect {job['id']} done: {e}")
+
+    async def _failed(self, job: dict, error: Exception):
+        attempts = job.get('attempts', 0) + 1
+        retry_in = None
+        if attempts < self.max_attempts:
+            retry_in = random.uniform(0, settings.SIDE_EFFECT_RETRY_BASE_SECONDS * 2 ** attempts)
+        try:
+            # Holding the lease past the retry keeps sweeps off it while it waits here
+            await self.db.retry_side_effect(
+                job['id'], attempts, str(error),
+                retry_in + self.lease_seconds if retry_in is not None else None
+            )
+        except Exception as e:
+            print(f"⚠️ Could not record side effect {job['id']} failure: {e}")
+        if retry_in is None:
+            self.stats['dead'] += 1
+            print(f"⚠️ Side effect {job['kind']} {job['id']} gave up after {attempts} attempts: {error}")
+            return
+        self.stats['retried'] += 1
+        task = asyncio.create_task(self._retry_later({**job, 'attempts': attempts}, retry_in))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, job: dict, delay: float):
+        await asyncio.sleep(delay)
+        self._offer(job)
+
+    async def sweep(self) -> int:
+        """Queue jobs whose lease ran out, e.g. left behind by a crashed process"""
+        jobs = await self.db.claim_side_effects(max(self.queue.maxsize - self.queue.qsize(), 0),
+                                                self.lease_seconds)
+        for job in jobs:
+            self._offer(job)
+        self.stats['recovered'] += len(jobs)
+        return len(jobs)
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"⚠️ Side effect sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self):
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep_loop()))
+
+    async def stop(self, timeout: float = 10.0):
+        """Let the workers drain the queue for up to `timeout` seconds, then cancel
+        them; anything unfinished stays in side_effect_jobs for the next start"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self.queue.qsize()} side effects left for the next start")
+        for task in [*self._tasks, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retries, return_exceptions=True)
+        self._tasks = []
+
+
+side_effects = SideEffectPipeline()
@@ -0,0 +1,76 @@
+"""
+Single-flight coalescing for hot identical reads
+Every page load asks the leaderboard and badge routes the same questions.
+Concurrent identical calls share one in-flight upstream call, and its result
+is kept for HOT_READ_CACHE_SECONDS so the burst that follows reuses it too.
+A stale fallback is shared with the callers already waiting, each of whom
+gets the Warning header, but is never kept.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from config import settings
+from services.database import Database
+from services.resilience import mark_stale, stale_scope
+
+
+class SingleFlight:
+    def __init__(self, db: Optional[Database] = None, ttl: Optional[float] = None,
+                 max_entries: int = 256):
+        self.db = db or Database()
+        self.ttl = ttl if ttl is not None else settings.HOT_READ_CACHE_SECONDS
+        self.max_entries = max_entries
+        self._results: "OrderedDict[Tuple, Tuple[float, object]]" = OrderedDict()
+        self._flights: Dict[Tuple, asyncio.Task] = {}
+        self.stats = {'upstream': 0, 'joined': 0, 'cached': 0}
+
+    def metrics(self) -> dict:
+        return {**self.stats, 'in_flight': len(self._flights), 'cached_keys': len(self._results)}
+
+    def clear(self):
+        self._results.clear()
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable]):
+        """Result of `call()`, shared with every concurrent caller of `key`.
+
+        The result is handed to all of them as-is, so callers must not mutate it.
+        """
+        # A swapped storage engine (set_engine) never sees the old results
+        key = (self.db.engine, key)
+        cached = self._results.get(key)
+        if cached is not None and time.monotonic() - cached[0] <= self.ttl:
+            self.stats['cached'] += 1
+            return cached[1]
+
+        flight = self._flights.get(key)
+        if flight is None or flight.get_loop() is not asyncio.get_running_loop():
+            flight = self._flights[key] = asyncio.ensure_future(self._fly(key, call))
+            self.stats['upstream'] += 1
+        else:
+            self.stats['joined'] += 1
+        # One caller going away doesn't cancel the call the others are waiting on
+        result, stale = await asyncio.shield(flight)
+        # Every caller sharing a stale fallback gets its Warning header
+        mark_stale(stale)
+        return result
+
+    async def _fly(self, key: Tuple, call: Callable[[], Awaitable]):
+        try:
+            with stale_scope() as served:
+                result = await call()
+        finally:
+            if self._flights.get(key) is asyncio.current_task():
+                del self._flights[key]
+        # Failures and stale fallbacks aren't kept; the next caller starts a fresh attempt
+        if self.ttl > 0 and not served:
+            self._results[key] = (time.monotonic(), result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result, tuple(served)
+
+
+hot_reads = SingleFlight()
@@ -0,0 +1,59 @@
+"""
+Reloadable in-memory snapshots
+Base for read-mostly data held in memory as immutable, versioned snapshots
+(the badge catalog, the leaderboard). A snapshot is served until it is older
+than max_age or the storage engine is swapped; concurrent callers then share
+a single reload. A snapshot built from stale fallbacks is handed out with its
+Warning header and rebuilt on the next call.
+"""
+
+import asyncio
+import time
+from typing import Any, Generic, Optional, TypeVar
+
+from services.database import Database
+from services.resilience import mark_stale, stale_scope
+
+S = TypeVar('S')
+
+
+class Snapshotted(Generic[S]):
+    def __init__(self, db: Optional[Database], max_age: float):
+        self.db = db or Database()
+        self.max_age = max_age
+        self.snapshot: Optional[S] = None
+        self._source = None
+        # Reads that fell back to stale results while building the snapshot
+        self._stale = ()
+        self._reload: Optional[asyncio.Task] = None
+
+    @property
+    def version(self) -> int:
+        return self.snapshot.version if self.snapshot else 0
+
+    async def load(self, source: Any, version: int) -> S:
+        """Read from `source` and build snapshot `version`"""
+        raise NotImplementedError
+
+    async def refresh(self) -> S:
+        """Reload and publish the next snapshot version"""
+        source = self.db.engine
+        with stale_scope() as served:
+            snapshot = await self.load(source, self.version + 1)
+        self.snapshot, self._source, self._stale = snapshot, source, tuple(served)
+        return snapshot
+
+    async def current(self) -> S:
+        snapshot = self.snapshot
+        fresh = snapshot is not None and time.monotonic() - snapshot.loaded_at <= self.max_age
+        # A swapped storage engine (set_engine) invalidates the snapshot too,
+        # and one built from stale fallbacks is rebuilt as soon as asked for
+        if fresh and self._source is self.db.engine and not self._stale:
+            return snapshot
+        # Concurrent callers share one reload instead of each querying
+        reload = self._reload
+        if reload is None or reload.done() or reload.get_loop() is not asyncio.get_running_loop():
+            reload = self._reload = asyncio.ensure_future(self.refresh())
+        snapshot = await asyncio.shield(reload)
+        mark_stale(self._stale)
+        return snapshot
@@ -0,0 +1,195 @@
+"""
+SQLite storage engine
+Stores each table as JSON documents in a local SQLite file so the backend
+can run and be benchmarked without network access. All SQLite work happens
+on one dedicated thread, keeping the event loop free.
+"""
+
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from services.repository import TableDatabase
+
+# Expression indexes for the lookups the routes and services run most
+INDEXES = {
+    'user_profiles': [('clerk_user_id',), ('total_points',)],
+    'habits': [('user_id',), ('id',)],
+    'habit_logs': [('habit_id', 'user_id', 'completed_at'), ('habit_id', 'user_id', 'completed_on')],
+    'badges': [('name',), ('badge_type', 'requirement')],
+    'user_badges': [('user_id', 'badge_id')],
+    'clans': [('total_xp',)],
+    'clan_members': [('clan_id', 'user_id')],
+    'clan_messages': [('clan_id', 'timestamp')],
+    'user_quests': [('user_id', 'status')],
+    'xp_transactions': [('user_id', 'compacted_at'), ('compacted_at', 'created_at')],
+    'daily_user_activity': [('user_id', 'day')],
+}
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _field(column: str) -> str:
+    return f"json_extract(data, '$.{column}')"
+
+
+def _where(filters: Optional[dict]):
+    if not filters:
+        return '', []
+    clauses = [f"{_field(column)} IS ?" for column in filters]
+    return ' WHERE ' + ' AND '.join(clauses), list(filters.values())
+
+
+class SQLiteDatabase(TableDatabase):
+    """Storage engine backed by a local SQLite file"""
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._tables = set()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            if self.path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+        return self._conn
+
+    def _ensure_table(self, conn: sqlite3.Connection, table: str):
+        if table in self._tables:
+            return
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {_ident(table)} (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        for columns in INDEXES.get(table, []):
+            name = _ident(f"idx_{table}_{'_'.join(columns)}")
+            fields = ', '.join(_field(column) for column in columns)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {_ident(table)} ({fields})")
+        self._tables.add(table)
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._run(_close)
+        self._executor.shutdown(wait=True)
+
+    def _select_sync(self, table, filters, order, desc, limit) -> List[dict]:
+        conn = self._connection()
+        self._ensure_table(conn, table)
+        where, params = _where(filters)
+        query = f"SELECT data FROM {_ident(table)}{where}"
+        if order:
+            direction = 'DESC' if desc else 'ASC'
+            query += f" ORDER BY {_field(order)} IS NULL, {_field(order)} {direction}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [json.loads(data) for (data,) in conn.execute(query, params)]
+
+    def _select_in_sync(self, table, column, values, filters) -> List[dict]:
+        conn = self._connection()
+        self._ensure_table(conn, table)
+        where, params = _where(filters)
+        placeholders = ', '.join('?' for _ in values)
+        clause = f"{_field(column)} IN ({placeholders})"
+        where = f"{where} AND {clause}" if where else f" WHERE {clause}"
+        query = f"SELECT data FROM {_ident(table)}{where}"
+        return [json.loads(data) for (data,) in conn.execute(query, params + list(values))]
+
+    def _select_after_sync(self, table, column, after, limit, filters) -> List[dict]:
+        conn = self._connection()
+        self._ensure_table(conn, table)
+        where, params = _where(filters)
+        if after is not None:
+            clause = f"{_field(column)} > ?"
+            where = f"{where} AND {clause}" if where else f" WHERE {clause}"
+            params.append(after)
+        query = f"SELECT data FROM {_ident(table)}{where} ORDER BY {_field(column)} LIMIT ?"
+        return [json.loads(data) for (data,) in conn.execute(query, params + [limit])]
+
+    def _insert_sync(self, table, row) -> dict:
+        conn = self._connection()
+        self._ensure_table(conn, table)
+        conn.execute(
+            f"INSERT INTO {_ident(table)} (id, data) VALUES (?, ?)",
+            (str(row['id']), json.dumps(row, default=str))
+        )
+        conn.commit()
+        return row
+
+    def _update_sync(self, table, filters, updates) -> List[dict]:
+        conn = self._connection()
+        self._ensure_table(conn, table)
+        where, params = _where(filters)
+        rows = [json.loads(data) for (data,) in conn.execute(f"SELECT data FROM {_ident(table)}{where}", params)]
+        for row in rows:
+            row.update(updates)
+        conn.executemany(
+            f"UPDATE {_ident(table)} SET data = ? WHERE id = ?",
+            [(json.dumps(row, default=str), str(row['id'])) for row in rows]
+        )
+        conn.commit()
+        return json.loads(json.dumps(rows, default=str))
+
+    def _increment_sync(self, table, filters, deltas, derived) -> List[dict]:
+        # Runs on the single SQLite thread, so the read and write cannot interleave
+        conn = self._connection()
+        self._ensure_table(conn, table)
+        where, params = _where(filters)
+        rows = [json.loads(data) for (data,) in conn.execute(f"SELECT data FROM {_ident(table)}{where}", params)]
+        for row in rows:
+            for column, delta in deltas.items():
+                row[column] = (row.get(column) or 0) + delta
+            for column, compute in (derived or {}).items():
+                row[column] = compute(row)
+        conn.executemany(
+            f"UPDATE {_ident(table)} SET data = ? WHERE id = ?",
+            [(json.dumps(row, default=str), str(row['id'])) for row in rows]
+        )
+        conn.commit()
+        return rows
+
+    def _delete_sync(self, table, filters):
+        conn = self._connection()
+        self._ensure_table(conn, table)
+        where, params = _where(filters)
+        conn.execute(f"DELETE FROM {_ident(table)}{where}", params)
+        conn.commit()
+
+    async def _select(self, table: str, filters: Optional[dict] = None,
+                      order: Optional[str] = None, desc: bool = False,
+                      limit: Optional[int] = None) -> List[dict]:
+        return await self._run(self._select_sync, table, filters, order, desc, limit)
+
+    async def _select_in(self, table: str, column: str, values: List,
+                         filters: Optional[dict] = None) -> List[dict]:
+        if not values:
+            return []
+        return await self._run(self._select_in_sync, table, column, list(values), filters)
+
+    async def _select_after(self, table: str, column: str, after, limit: int,
+                            filters: Optional[dict] = None) -> List[dict]:
+        return await self._run(self._select_after_sync, table, column, after, limit, filters)
+
+    async def _insert(self, table: str, row: dict) -> dict:
+        row = json.loads(json.dumps(self._with_defaults(table, row), default=str))
+        return await self._run(self._insert_sync, table, row)
+
+    async def _update(self, table: str, filters: dict, updates: dict) -> List[dict]:
+        return await self._run(self._update_sync, table, filters, updates)
+
+    async def _delete(self, table: str, filters: dict):
+        await self._run(self._delete_sync, table, filters)
+
+    async def _increment(self, table: str, filters: dict, deltas: Dict[str, int],
+                         derived: Optional[Dict[str, Callable[[dict], object]]] = None) -> List[dict]:
+        return await self._run(self._increment_sync, table, filters, deltas, derived)
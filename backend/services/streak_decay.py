@@ -0,0 +1,113 @@
+"""
+Streak decay sweeper
+A streak only reset when its habit was next completed, so a habit abandoned
+for a week still showed its old streak everywhere it was read. Once a night
+this walks the habits not completed since before yesterday in id order, a
+chunk per decay_streaks() call, and zeroes their streaks. The cursor is saved
+after every chunk, so a sweep cut short by a restart resumes where it stopped,
+and chunks are paced to STREAK_SWEEP_MAX_ROWS_PER_SECOND to keep it from
+crowding out request traffic.
+"""
+
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from config import settings
+from services.database import Database
+
+
+class StreakDecaySweeper:
+    def __init__(self, db: Optional[Database] = None, chunk_size: Optional[int] = None,
+                 max_rows_per_second: Optional[float] = None, hour: Optional[int] = None):
+        self.db = db or Database()
+        self.chunk_size = chunk_size or settings.STREAK_SWEEP_CHUNK_SIZE
+        self.max_rows_per_second = (max_rows_per_second if max_rows_per_second is not None
+                                    else settings.STREAK_SWEEP_MAX_ROWS_PER_SECOND)
+        self.hour = hour if hour is not None else settings.STREAK_SWEEP_HOUR
+        self._task: Optional[asyncio.Task] = None
+        self.last_sweep: Optional[dict] = None
+        self.stats = {'sweeps': 0, 'rows': 0, 'chunks': 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def metrics(self) -> dict:
+        return {**self.stats, 'last_sweep': self.last_sweep, 'running': self.running}
+
+    async def sweep(self, today: Optional[date] = None) -> dict:
+        """Reset every streak broken as of `today`, resuming a sweep already under way"""
+        cutoff = (today or date.today()) - timedelta(days=1)
+        name = f'streak_decay:{cutoff.isoformat()}'
+        checkpoint = await self.db.get_sweep_checkpoint(name)
+        if checkpoint is not None and checkpoint['finished']:
+            return {'cutoff': cutoff.isoformat(), 'rows': 0, 'chunks': 0, 'seconds': 0.0,
+                    'rows_per_second': 0.0, 'resumed': False, 'finished': True}
+
+        after = checkpoint['cursor'] if checkpoint is not None else None
+        resumed = after is not None
+        rows = chunks = 0
+        started = time.monotonic()
+        while True:
+            chunk = await self.db.decay_streaks(cutoff, after, self.chunk_size)
+            if chunk['cursor'] is None:
+                break
+            after = chunk['cursor']
+            rows += len(chunk['reset'])
+            chunks += 1
+            await self.db.save_sweep_checkpoint(name, after, False)
+            if self.max_rows_per_second:
+                # Sleep off whatever this chunk took less than its share of the budget
+                ahead = rows / self.max_rows_per_second - (time.monotonic() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        await self.db.save_sweep_checkpoint(name, after, True)
+
+        seconds = time.monotonic() - started
+        result = {
+            'cutoff': cutoff.isoformat(),
+            'rows': rows,
+            'chunks': chunks,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds, 1) if seconds > 0 else 0.0,
+            'resumed': resumed,
+            'finished': True,
+        }
+        self.stats['sweeps'] += 1
+        self.stats['rows'] += rows
+        self.stats['chunks'] += chunks
+        self.last_sweep = result
+        print(f"🌙 Streak decay reset {rows} streaks in {chunks} chunks "
+              f"({result['rows_per_second']} rows/s{', resumed' if resumed else ''})")
+        return result
+
+    async def run(self):
+        while True:
+            now = datetime.now()
+            run_at = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+            if now >= run_at:
+                # Also covers starting after tonight's hour: finishes an interrupted
+                # sweep, and is a no-op once the night's sweep is recorded as done
+                try:
+                    await self.sweep()
+                except Exception as e:
+                    print(f"⚠️ Streak decay sweep failed: {e}")
+                run_at += timedelta(days=1)
+            await asyncio.sleep(max((run_at - datetime.now()).total_seconds(), 0))
+
+    def start(self):
+        """Sweep nightly at STREAK_SWEEP_HOUR (local time); a negative hour disables it"""
+        if self._task is None and self.hour >= 0:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Cancel the loop; an interrupted sweep resumes from its checkpoint"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+streak_decay = StreakDecaySweeper()
@@ -1,49 +1,61 @@
-from typing import Optional
+import asyncio
+from typing import Dict, List, Optional
 from datetime import datetime, date, timedelta
+from config import settings
 from services.database import Database
+from services.habit_rules import STREAK_BONUSES, as_date, completion_reason, habit_xp, next_streak
+from services.repository import HabitNotFoundError, StaleWriteError
+from services.side_effects import defer, side_effects
 from services.xp_service import XPService
-import posthog
 
 class StreakService:
+    MAX_WRITE_ATTEMPTS = 3
+    
     def __init__(self):
         self.db = Database()
         self.xp_service = XPService()
     
     async def complete_habit(self, user_id: str, habit_id: str, notes: Optional[str] = None) -> dict:
         """Complete a habit and update streak"""
-        habit = await self.db.get_habit(habit_id)
-        today = date.today()
+        if not settings.HABIT_COMPLETION_PROCEDURE:
+            return await self._complete_habit_steps(user_id, habit_id, notes)
         
-        # Check if already completed today
-        last_completion = await self.db.get_last_completion(habit_id, user_id)
-        if last_completion and last_completion['completed_at'].date() == today:
+        # Dedupe, streak, log, habit update and XP ledger entries in one call
+        result = await self.db.complete_habit(habit_id, user_id, notes, date.today())
+        habit = result['habit']
+        if result['status'] == 'already_completed':
             return {
                 'success': False,
                 'message': 'Habit already completed today',
                 'habit': habit
             }
         
-        # Calculate new streak
-        last_completed_date = habit.get('last_completed')
-        if last_completed_date:
-            last_date = last_completed_date.date() if isinstance(last_completed_date, datetime) else last_completed_date
-            days_diff = (today - last_date).days
-            
-            if days_diff == 1:
-                # Consecutive day
-                new_streak = habit['streak'] + 1
-            elif days_diff == 0:
-                # Same day (shouldn't happen due to check above)
-                new_streak = habit['streak']
+        user = result['user']
+        if user is None:
+            raise ValueError(f"User {user_id} not found")
+        
+        # Level-up and clan follow-ups award_xp would have run, once per award,
+        # written as one batch of deferred side effects
+        xp_earned = result['xp_earned']
+        streak_bonus = result['streak_bonus']
+        async with side_effects.collect():
+            if streak_bonus:
+                before_bonus = {**user, 'xp': user['xp'] - streak_bonus['xp']}
+                await self.xp_service.after_award(before_bonus, xp_earned, completion_reason(habit))
+                await self.xp_service.after_award(user, streak_bonus['xp'], streak_bonus['reason'])
             else:
-                # Streak broken, start over
-                new_streak = 1
-        else:
-            # First completion
-            new_streak = 1
+                await self.xp_service.after_award(user, xp_earned, completion_reason(habit))
+            return self._completed(user_id, habit, habit['streak'], habit['best_streak'], xp_earned)
+    
+    async def _complete_habit_steps(self, user_id: str, habit_id: str, notes: Optional[str] = None) -> dict:
+        """The step-by-step completion, for databases without the complete_habit procedure"""
+        habit = await self.db.get_habit(habit_id)
+        if habit is None:
+            raise HabitNotFoundError("Habit not found")
+        today = date.today()
         
-        # Update best streak
-        best_streak = max(habit.get('best_streak', 0), new_streak)
+        # Calculate new streak and best streak
+        new_streak, best_streak = next_streak(habit, today)
         
         # Calculate XP
         xp_earned = await self.xp_service.calculate_habit_xp(
@@ -51,47 +63,200 @@ class StreakService:
             new_streak
         )
         
-        # Log completion
+        # Log completion; a second completion today is refused by the
+        # (habit_id, user_id, completed_on) constraint instead of a pre-read
         completion = await self.db.create_habit_completion(
             habit_id=habit_id,
             user_id=user_id,
             xp_earned=xp_earned,
-            notes=notes
-        )
-        
-        # Update habit
-        await self.db.update_habit(habit_id, {
-            'streak': new_streak,
-            'best_streak': best_streak,
-            'total_completions': habit.get('total_completions', 0) + 1,
-            'last_completed': datetime.now()
-        })
-        
-        # Award XP
-        xp_result = await self.xp_service.award_xp(
-            user_id,
-            xp_earned,
-            f'habit_complete_{habit["title"]}'
+            notes=notes,
+            completed_on=today
         )
+        if completion is None:
+            return {
+                'success': False,
+                'message': 'Habit already completed today',
+                'habit': habit
+            }
         
-        # Check for streak bonuses
-        streak_bonus = await self.xp_service.award_streak_bonus(user_id, new_streak)
+        # Update habit, guarded by its version so a racing write isn't clobbered
+        for attempt in range(self.MAX_WRITE_ATTEMPTS):
+            try:
+                await self.db.update_habit(habit_id, {
+                    'streak': new_streak,
+                    'best_streak': best_streak,
+                    'total_completions': habit.get('total_completions', 0) + 1,
+                    'last_completed': datetime.now().isoformat()
+                }, expected_version=habit.get('version'))
+                break
+            except StaleWriteError:
+                if attempt == self.MAX_WRITE_ATTEMPTS - 1:
+                    raise
+                habit = await self.db.get_habit(habit_id)
+                best_streak = max(habit.get('best_streak', 0), new_streak)
         
+        async with side_effects.collect():
+            # Award XP
+            xp_result = await self.xp_service.award_xp(
+                user_id,
+                xp_earned,
+                completion_reason(habit)
+            )
+            
+            # Check for streak bonuses
+            streak_bonus = await self.xp_service.award_streak_bonus(user_id, new_streak)
+            
+            return self._completed(user_id, habit, new_streak, best_streak, xp_earned)
+    
+    def _completed(self, user_id: str, habit: dict, new_streak: int, best_streak: int,
+                   xp_earned: int) -> dict:
         # Track in PostHog
-        posthog.capture(user_id, 'habit_completed', {
-            'habit_id': habit_id,
-            'streak': new_streak,
-            'xp_earned': xp_earned,
-            'difficulty': habit.get('difficulty')
+        defer('analytics', {
+            'user_id': user_id,
+            'event': 'habit_completed',
+            'properties': {
+                'habit_id': habit['id'],
+                'streak': new_streak,
+                'xp_earned': xp_earned,
+                'difficulty': habit.get('difficulty')
+            }
         })
         
         return {
-            'habit_id': habit_id,
+            'habit_id': habit['id'],
             'new_streak': new_streak,
             'best_streak': best_streak,
             'xp_earned': xp_earned
         }
     
+    async def sync_completions(self, user_id: str, completions: List[dict]) -> dict:
+        """Apply completions queued by an offline client, oldest first.
+
+        Each habit is read once and written once, all logs go in one insert,
+        and the summed XP is awarded in one ledger entry whose follow-ups
+        (level-up badges, clan badges) run once. Results come back in request
+        order with a status per completion.
+        """
+        today = date.today()
+        habits = {habit['id']: habit for habit in
+                  await self.db.get_habits(list({c['habit_id'] for c in completions}))}
+        results: List[Optional[dict]] = [None] * len(completions)
+        state: Dict[str, dict] = {}
+        logs, applied = [], []
+        
+        # By the client's wall clock, so timestamps with and without an offset still sort
+        order = sorted(range(len(completions)),
+                       key=lambda i: completions[i]['completed_at'].replace(tzinfo=None))
+        for index in order:
+            completion = completions[index]
+            habit_id = completion['habit_id']
+            habit = habits.get(habit_id)
+            day = as_date(completion['completed_at'])
+            result = results[index] = {'habit_id': habit_id, 'completed_on': day.isoformat()}
+            if habit is None or habit.get('user_id') != user_id:
+                result['status'] = 'not_found'
+                continue
+            if day > today:
+                result['status'] = 'in_future'
+                continue
+            current = state.setdefault(habit_id, dict(habit))
+            last_date = as_date(current.get('last_completed'))
+            if last_date == day:
+                result['status'] = 'already_completed'
+                continue
+            if last_date is not None and day < last_date:
+                # Streaks only move forward; a day older than the last completion can't be replayed
+                result['status'] = 'out_of_order'
+                continue
+            
+            streak, best_streak = next_streak(current, day)
+            xp_earned = habit_xp(current.get('difficulty', 'medium'), streak)
+            current.update({
+                'streak': streak,
+                'best_streak': best_streak,
+                'total_completions': (current.get('total_completions') or 0) + 1,
+                'last_completed': completion['completed_at'].isoformat()
+            })
+            logs.append({
+                'habit_id': habit_id,
+                'user_id': user_id,
+                'xp_earned': xp_earned,
+                'notes': completion.get('notes'),
+                'completed_at': completion['completed_at'].isoformat(),
+                'completed_on': day.isoformat()
+            })
+            applied.append((result, streak, xp_earned))
+        
+        # Days logged since the habits were read come back missing; count them as done
+        created: Dict[str, List[dict]] = {}
+        for log in await self.db.create_habit_completions(logs):
+            created.setdefault(log['habit_id'], []).append(log)
+        created_days = {(habit_id, str(log['completed_on'])[:10])
+                        for habit_id, habit_logs in created.items() for log in habit_logs}
+        total_xp = 0
+        completed = 0
+        for result, streak, xp_earned in applied:
+            if (result['habit_id'], result['completed_on']) not in created_days:
+                result['status'] = 'already_completed'
+                continue
+            bonus = STREAK_BONUSES.get(streak)
+            result.update({
+                'status': 'completed',
+                'streak': streak,
+                'xp_earned': xp_earned,
+                'streak_bonus': bonus[1] if bonus else 0
+            })
+            completed += 1
+            total_xp += xp_earned + result['streak_bonus']
+        
+        written = await asyncio.gather(*[self._write_synced_habit(habits[habit_id], habit_logs)
+                                         for habit_id, habit_logs in created.items()])
+        
+        xp_result = None
+        async with side_effects.collect():
+            if total_xp:
+                xp_result = await self.xp_service.award_xp(user_id, total_xp, 'habit_sync')
+                defer('analytics', {
+                    'user_id': user_id,
+                    'event': 'habits_synced',
+                    'properties': {'completions': completed, 'habits': len(created), 'xp_earned': total_xp}
+                })
+        
+        return {
+            'results': results,
+            'xp_earned': total_xp,
+            'xp': xp_result,
+            'habits': {habit['id']: {'streak': habit['streak'], 'best_streak': habit['best_streak']}
+                       for habit in written}
+        }
+    
+    @staticmethod
+    def _replay(habit: dict, logs: List[dict]) -> dict:
+        """Streak columns of `habit` once `logs`, all actually inserted, are applied"""
+        state = {key: habit.get(key) for key in ('streak', 'best_streak', 'total_completions', 'last_completed')}
+        for log in sorted(logs, key=lambda log: str(log['completed_at'])):
+            state['total_completions'] = (state['total_completions'] or 0) + 1
+            day = as_date(log['completed_on'])
+            last_date = as_date(state['last_completed'])
+            if last_date is not None and day <= last_date:
+                # A completion that landed meanwhile is newer; it owns the streak
+                continue
+            state['streak'], state['best_streak'] = next_streak(state, day)
+            state['last_completed'] = log['completed_at']
+        return state
+    
+    async def _write_synced_habit(self, habit: dict, logs: List[dict]) -> dict:
+        """Apply a habit's inserted sync logs, guarded by its version like the
+        single completion; on a conflict the logs are replayed onto a fresh read"""
+        for attempt in range(self.MAX_WRITE_ATTEMPTS):
+            updates = self._replay(habit, logs)
+            try:
+                return await self.db.update_habit(habit['id'], updates, expected_version=habit.get('version'))
+            except StaleWriteError:
+                if attempt == self.MAX_WRITE_ATTEMPTS - 1:
+                    raise
+                habit = await self.db.get_habit(habit['id'])
+    
     async def check_missed_days(self, user_id: str) -> list:
         """Check for missed habit completions"""
         habits = await self.db.get_user_habits(user_id)
@@ -0,0 +1,59 @@
+"""
+Startup warm-up
+Seeds the badge definitions and loads the in-memory structures the hot
+routes read from, so the first requests after a deploy don't pay for it.
+Each step is timed; a failing step is logged and the rest still run.
+"""
+
+import time
+from typing import Awaitable, Callable, Dict
+
+from services import quest_catalog
+from services.badge_catalog import badge_catalog
+from services.badge_service import BadgeService
+from services.leaderboard_snapshot import leaderboard_snapshot
+
+
+async def _seed_badges() -> str:
+    badges = await BadgeService().seed_badges()
+    return f"{len(badges)} definitions upserted"
+
+
+async def _badge_catalog() -> str:
+    catalog = await badge_catalog.refresh()
+    return f"{len(catalog.badges)} badges, v{catalog.version}"
+
+
+async def _quest_definitions() -> str:
+    return f"{quest_catalog.warm()} quests"
+
+
+async def _leaderboard() -> str:
+    snapshot = await leaderboard_snapshot.refresh()
+    return f"top {len(snapshot.users)} users"
+
+
+STEPS: Dict[str, Callable[[], Awaitable[str]]] = {
+    'seed badges': _seed_badges,
+    'badge catalog': _badge_catalog,
+    'quest definitions': _quest_definitions,
+    'leaderboard snapshot': _leaderboard,
+}
+
+
+async def warm_up() -> Dict[str, float]:
+    """Run every step in order; returns the milliseconds each one took"""
+    timings = {}
+    for name, step in STEPS.items():
+        started = time.perf_counter()
+        try:
+            detail = await step()
+        except Exception as e:
+            # Everything here also loads lazily once the database is reachable
+            timings[name] = (time.perf_counter() - started) * 1000
+            print(f"⚠️ Warm-up '{name}' failed after {timings[name]:.1f}ms: {e}")
+            continue
+        timings[name] = (time.perf_counter() - started) * 1000
+        print(f"🔥 Warm-up '{name}' took {timings[name]:.1f}ms ({detail})")
+    print(f"🔥 Warm-up finished in {sum(timings.values()):.1f}ms")
+    return timings
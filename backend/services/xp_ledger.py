@@ -0,0 +1,52 @@
+"""
+XP ledger compaction
+XPService.award_xp only appends to xp_transactions; this background task
+folds pending entries into user_profiles.xp and total_points in batches.
+"""
+
+import asyncio
+from typing import Optional
+
+from config import settings
+from services.database import Database
+
+
+class XPLedgerCompactor:
+    def __init__(self, db: Optional[Database] = None, batch_size: Optional[int] = None,
+                 interval: Optional[float] = None):
+        self.db = db or Database()
+        self.batch_size = batch_size or settings.XP_LEDGER_BATCH_SIZE
+        self.interval = interval if interval is not None else settings.XP_LEDGER_COMPACT_INTERVAL
+        self._task: Optional[asyncio.Task] = None
+
+    async def compact(self) -> int:
+        """Fold every pending ledger entry, one batch at a time"""
+        total = 0
+        while True:
+            folded = await self.db.compact_xp_ledger(self.batch_size)
+            total += folded
+            if folded < self.batch_size:
+                return total
+
+    async def run(self):
+        while True:
+            try:
+                await self.compact()
+            except Exception as e:
+                print(f"⚠️ XP ledger compaction failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Cancel the loop, then fold whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.compact()
@@ -1,9 +1,11 @@
 from typing import Optional
 from datetime import datetime
-from models.user import XP_CONFIG
 from services.leveling import level_from_xp, progress_from_xp, check_level_up
+from services.habit_rules import STREAK_BONUSES, habit_xp
 from services.badge_service import BadgeService
 from services.database import Database
+from services.clan_xp_buffer import clan_xp_buffer
+from services.side_effects import defer, side_effect, side_effects
 from config import settings
 try:
     import posthog
@@ -23,45 +25,36 @@ class XPService:
     
     async def award_xp(self, user_id: str, xp_amount: int, reason: str) -> dict:
         """Award XP to a user and handle level ups"""
-        # Get current user data
-        user = await self.db.get_user(user_id)
-        
-        old_xp = user['xp']
-        old_level = user['level']
-        
-        new_xp = old_xp + xp_amount
+        # Append to the XP ledger instead of rewriting the profile row;
+        # the returned profile already includes the pending entries
+        user = await self.db.record_xp_transaction(user_id, xp_amount, reason)
+        if user is None:
+            raise ValueError(f"User {user_id} not found")
+        return await self.after_award(user, xp_amount, reason)
+    
+    async def after_award(self, user: dict, xp_amount: int, reason: str) -> dict:
+        """Level-up and clan follow-ups for an award already recorded;
+        `user` is the profile as it stood right after the award. The follow-ups
+        that touch the database run as deferred side effects."""
+        user_id = user['clerk_user_id']
+        new_xp = user['xp']
         new_level = level_from_xp(new_xp)
-        
-        # Update user XP and level
-        await self.db.update_user(user_id, {
-            'xp': new_xp,
-            'level': new_level,
-            'total_points': user['total_points'] + xp_amount
-        })
-        
-        # Track in PostHog
-        if POSTHOG_ENABLED:
-            posthog.capture(
-                user_id,
-                'xp_awarded',
-                {
-                    'amount': xp_amount,
-                    'reason': reason,
-                    'new_xp': new_xp,
-                    'new_level': new_level
-                }
-            )
-        
-        # Check for level up
-        level_ups = []
-        if new_level > old_level:
-            for level in range(old_level + 1, new_level + 1):
-                level_ups.append(level)
-                await self._handle_level_up(user_id, level)
-        
-        # If user is in a clan, contribute to clan XP
-        if user.get('clan_id'):
-            await self._contribute_clan_xp(user_id, user['clan_id'], xp_amount)
+        old_xp = new_xp - xp_amount
+        old_level = level_from_xp(old_xp)
+        level_ups = list(range(old_level + 1, new_level + 1))
+        
+        # The xp_awarded analytics event goes out with the ledger entry's
+        # xp_update outbox event (services/outbox.py)
+        async with side_effects.collect():
+            # Level-up rewards and badges
+            for level in level_ups:
+                defer('level_up', {'user_id': user_id, 'level': level})
+            
+            # If user is in a clan, contribute to clan XP. The buffer is in
+            # process and flushed in batches, so only the badge check is deferred.
+            if user.get('clan_id'):
+                clan_xp_buffer.add(user['clan_id'], user_id, xp_amount)
+                defer('clan_badges', {'user_id': user_id, 'clan_id': user['clan_id']})
         
         # Get level progress info
         level_progress = progress_from_xp(new_xp)
@@ -93,48 +86,35 @@ class XPService:
                     'bonus_xp': bonus_xp
                 })
     
-    async def _contribute_clan_xp(self, user_id: str, clan_id: str, xp_amount: int):
-        """Contribute XP to user's clan"""
-        # Update clan total XP
-        await self.db.increment_clan_xp(clan_id, xp_amount)
-        
-        # Update user's contribution
-        await self.db.increment_clan_member_contribution(clan_id, user_id, xp_amount)
-        
-        # Check for clan contribution badges
+    async def _check_clan_badges(self, user_id: str, clan_id: str):
+        """Check for clan contribution badges against stored plus buffered XP"""
+        # Read the stored value first: a flush landing in between can only
+        # under-count, which delays a badge rather than awarding it early.
         member_contribution = await self.db.get_clan_member_contribution(clan_id, user_id)
+        member_contribution += clan_xp_buffer.pending_contribution(clan_id, user_id)
         await self.badge_service.check_clan_badges(user_id, member_contribution)
     
     async def calculate_habit_xp(self, habit_difficulty: str, streak: int) -> int:
         """Calculate XP for completing a habit based on difficulty and streak"""
-        base_xp = XP_CONFIG['HABIT_COMPLETE']
-        
-        # Difficulty multiplier
-        difficulty_multipliers = {
-            'easy': 1.0,
-            'medium': 1.5,
-            'hard': 2.0
-        }
-        multiplier = difficulty_multipliers.get(habit_difficulty, 1.0)
-        
-        # Streak bonus (5% per 10 days, max 50%)
-        streak_bonus = min(streak // 10 * 0.05, 0.5)
-        
-        xp = int(base_xp * multiplier * (1 + streak_bonus))
-        return xp
+        return habit_xp(habit_difficulty, streak)
     
     async def award_streak_bonus(self, user_id: str, streak: int) -> Optional[dict]:
         """Award bonus XP for streak milestones"""
-        bonuses = {
-            7: ('weekly', XP_CONFIG['WEEKLY_STREAK']),
-            30: ('monthly', XP_CONFIG['MONTHLY_STREAK']),
-            100: ('century', 500),
-            365: ('yearly', 1000)
-        }
-        
-        if streak in bonuses:
-            bonus_type, xp_amount = bonuses[streak]
+        if streak in STREAK_BONUSES:
+            bonus_type, xp_amount = STREAK_BONUSES[streak]
             result = await self.award_xp(user_id, xp_amount, f'{bonus_type}_streak_bonus')
             return result
         
         return None
+
+
+# Deferred follow-ups of an award; badge awards check ownership first, so a
+# job that runs twice doesn't award twice
+@side_effect('level_up')
+async def _level_up(payload: dict):
+    await XPService()._handle_level_up(payload['user_id'], payload['level'])
+
+
+@side_effect('clan_badges')
+async def _clan_badges(payload: dict):
+    await XPService()._check_clan_badges(payload['user_id'], payload['clan_id'])
@@ -0,0 +1,123 @@
+"""
+Tests for the activity heatmap endpoint
+GET /profile/{id}/activity must return every day of the window, oldest
+first, read from the daily_user_activity rollup in a single request after
+the profile lookup, with each day's XP matching the ledger.
+"""
+
+import asyncio
+from datetime import date, timedelta
+
+import httpx
+import posthog
+import pytest
+
+import services.database as database
+from config import settings
+from fake_postgrest import FakePostgrest
+from services.database import SupabaseDatabase
+from services.memory_database import InMemoryDatabase
+from services.sqlite_database import SQLiteDatabase
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(posthog, 'capture', lambda *a, **k: None)
+    fake = FakePostgrest()
+    fake.seed('user_profiles', [{'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                                 'xp': 0, 'level': 1, 'total_points': 0, 'clan_id': None}])
+    fake.seed('habits', [{'id': f'habit_{n}', 'user_id': 'user_1', 'title': f'Habit {n}', 'difficulty': 'easy',
+                          'streak': 0, 'best_streak': 0, 'total_completions': 0, 'last_completed': None}
+                         for n in range(2)])
+    monkeypatch.setattr(database, '_engine', SupabaseDatabase(fake.client()))
+    return fake
+
+
+def call(fake, *requests):
+    async def scenario():
+        from main import app
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            responses = []
+            for method, url, kwargs in requests:
+                before = fake.request_count
+                responses.append((await client.request(method, url, **kwargs), fake.request_count - before))
+            return responses
+
+    return asyncio.run(scenario())
+
+
+def test_activity_is_a_dense_window_read_in_one_query(fake):
+    complete = [('POST', f'/habits/habit_{n}/complete', {'params': {'user_id': 'user_1'}}) for n in range(2)]
+    *_, (response, queries) = call(fake, *complete, ('GET', '/profile/user_1/activity', {'params': {'days': 365}}))
+
+    # The profile, then the window
+    assert response.status_code == 200 and queries == 2
+    activity = response.json()
+    assert len(activity) == 365
+    assert activity[0]['date'] == (date.today() - timedelta(days=364)).isoformat()
+    assert activity[-1] == {'date': date.today().isoformat(), 'completions': 2, 'xp_earned': 20}
+    assert sum(entry['completions'] for entry in activity) == 2
+
+
+def test_activity_xp_includes_streak_bonuses(fake):
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    fake.tables['habits'][0].update({'streak': 6, 'best_streak': 6, 'total_completions': 6,
+                                     'last_completed': yesterday})
+    _, (response, _), (profile, _) = call(
+        fake,
+        ('POST', '/habits/habit_0/complete', {'params': {'user_id': 'user_1'}}),
+        ('GET', '/profile/user_1/activity', {'params': {'days': 1}}),
+        ('GET', '/profile/user_1', {}),
+    )
+    # 10 for the easy habit plus the 25 weekly streak bonus
+    assert response.json() == [{'date': date.today().isoformat(), 'completions': 1, 'xp_earned': 35}]
+    assert profile.json()['total_points'] == 35
+
+
+def test_unknown_user_has_no_activity(fake):
+    (response, _), = call(fake, ('GET', '/profile/nobody/activity', {}))
+    assert response.status_code == 404
+
+
+def test_activity_window_is_clamped(fake):
+    (default, _), (longest, _), (shortest, _) = call(
+        fake,
+        ('GET', '/profile/user_1/activity', {}),
+        ('GET', '/profile/user_1/activity', {'params': {'days': 10000}}),
+        ('GET', '/profile/user_1/activity', {'params': {'days': 0}}),
+    )
+    assert len(default.json()) == 30
+    assert len(longest.json()) == settings.ACTIVITY_DAYS_MAX
+    assert shortest.json() == [{'date': date.today().isoformat(), 'completions': 0, 'xp_earned': 0}]
+
+
+@pytest.mark.parametrize('engine_class', [InMemoryDatabase, SQLiteDatabase])
+def test_table_engines_read_only_the_window(engine_class):
+    class Recording(engine_class):
+        read = []
+
+        async def _select_in(self, table, column, values, filters=None):
+            rows = await super()._select_in(table, column, values, filters)
+            self.read.extend(rows)
+            return rows
+
+        async def _select(self, table, filters=None, **kwargs):
+            rows = await super()._select(table, filters, **kwargs)
+            self.read.extend(rows)
+            return rows
+
+    engine = Recording()
+    start, end = date(2026, 3, 1), date(2026, 3, 7)
+
+    async def scenario():
+        for day, user_id in [('2026-02-28', 'user_1'), ('2026-03-01', 'user_1'), ('2026-03-07', 'user_1'),
+                             ('2026-03-08', 'user_1'), ('2026-03-03', 'user_2')]:
+            await engine._insert('daily_user_activity',
+                                 {'user_id': user_id, 'day': day, 'completions': 1, 'xp_earned': 10})
+        return await engine.get_user_activity('user_1', start, end)
+
+    activity = asyncio.run(scenario())
+    assert [entry['completions'] for entry in activity] == [1, 0, 0, 0, 0, 0, 1]
+    assert sorted(row['day'] for row in engine.read) == ['2026-03-01', '2026-03-07']
@@ -0,0 +1,63 @@
+"""
+Concurrency test for XPService.award_xp
+100 awards for the same user run in parallel; the final totals must account
+for every one of them on each storage engine.
+"""
+
+import asyncio
+
+import pytest
+
+import services.database as database
+from fake_postgrest import FakePostgrest
+from services.database import SupabaseDatabase
+from services.memory_database import InMemoryDatabase
+from services.sqlite_database import SQLiteDatabase
+from services.xp_service import XPService
+
+PARALLEL_AWARDS = 100
+XP_PER_AWARD = 15
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'supabase'])
+def engine(request, monkeypatch):
+    if request.param == 'memory':
+        engine = InMemoryDatabase()
+    elif request.param == 'sqlite':
+        engine = SQLiteDatabase(':memory:')
+    else:
+        # Latency forces the awards to interleave upstream
+        engine = SupabaseDatabase(FakePostgrest(latency=0.005).client())
+    monkeypatch.setattr(database, '_engine', engine)
+    return engine
+
+
+def test_parallel_awards_lose_no_xp(engine):
+    async def scenario():
+        await engine.create_user({
+            'clerk_user_id': 'user_1',
+            'username': 'racer',
+            'email': 'racer@test.dev',
+            'xp': 0,
+            'level': 1,
+            'total_points': 0,
+        })
+        xp_service = XPService()
+        results = await asyncio.gather(*[
+            xp_service.award_xp('user_1', XP_PER_AWARD, 'race')
+            for _ in range(PARALLEL_AWARDS)
+        ])
+        return results, await engine.get_user('user_1')
+
+    results, user = asyncio.run(scenario())
+
+    expected = PARALLEL_AWARDS * XP_PER_AWARD
+    assert user['xp'] == expected
+    assert user['total_points'] == expected
+    assert user['level'] == 5
+
+    # Each award saw a distinct running total, and the level-ups add up
+    assert sorted(r['total_xp'] for r in results) == [
+        XP_PER_AWARD * (i + 1) for i in range(PARALLEL_AWARDS)
+    ]
+    assert sorted(level for r in results for level in r['level_ups']) == [2, 3, 4, 5]
@@ -0,0 +1,115 @@
+"""
+Tests for the in-memory badge catalog
+Badge lookups must be served from the loaded snapshot without touching the
+database, and refresh must publish a new version atomically.
+"""
+
+import asyncio
+
+import posthog
+import pytest
+
+import services.database as database
+from models.badge import BADGE_DEFINITIONS
+from services.badge_catalog import BadgeCatalog, badge_catalog
+from services.badge_service import BadgeService
+from services.database import Database
+from services.memory_database import InMemoryDatabase
+
+
+class CountingEngine(InMemoryDatabase):
+    def __init__(self):
+        super().__init__()
+        self.catalog_loads = 0
+        self.badge_queries = 0
+
+    async def get_all_badges(self):
+        self.catalog_loads += 1
+        await asyncio.sleep(0)
+        return await super().get_all_badges()
+
+    async def get_badge_by_name(self, name):
+        self.badge_queries += 1
+        return await super().get_badge_by_name(name)
+
+    async def get_badge_by_type_and_requirement(self, badge_type, requirement):
+        self.badge_queries += 1
+        return await super().get_badge_by_type_and_requirement(badge_type, requirement)
+
+
+async def seeded_engine() -> CountingEngine:
+    engine = CountingEngine()
+    for badge in BADGE_DEFINITIONS:
+        await engine.create_badge_if_not_exists(badge)
+    engine.badge_queries = 0
+    return engine
+
+
+def test_lookups_cost_no_round_trips():
+    async def scenario():
+        engine = await seeded_engine()
+        catalog = BadgeCatalog(Database(engine))
+        await catalog.refresh()
+        first = BADGE_DEFINITIONS[0]
+        by_name = await catalog.get_by_name(first['name'])
+        by_requirement = await catalog.get_by_type_and_requirement(first['badge_type'], first['requirement'])
+        by_id = await catalog.get_by_id(by_name['id'])
+        missing = await catalog.get_by_type_and_requirement('streak', 9999)
+        return engine, by_name, by_requirement, by_id, missing
+
+    engine, by_name, by_requirement, by_id, missing = asyncio.run(scenario())
+    assert by_name['id'] == by_requirement['id'] == by_id['id']
+    assert missing is None
+    assert engine.catalog_loads == 1
+    assert engine.badge_queries == 0
+
+
+def test_snapshot_is_immutable_and_refresh_bumps_version():
+    async def scenario():
+        engine = await seeded_engine()
+        catalog = BadgeCatalog(Database(engine))
+        before = await catalog.refresh()
+
+        badge = await catalog.get_by_name(BADGE_DEFINITIONS[0]['name'])
+        badge['name'] = 'mutated'
+        with pytest.raises(TypeError):
+            before.by_name[BADGE_DEFINITIONS[0]['name']]['name'] = 'mutated'
+
+        await engine.create_badge_if_not_exists({'name': 'Night Owl', 'badge_type': 'special', 'requirement': 1})
+        stale = await catalog.get_by_name('Night Owl')
+        after = await catalog.refresh()
+        return before, after, stale, await catalog.get_by_name('Night Owl')
+
+    before, after, stale, fresh = asyncio.run(scenario())
+    assert after.version == before.version + 1
+    assert stale is None and fresh['badge_type'] == 'special'
+    assert BADGE_DEFINITIONS[0]['name'] in before.by_name
+
+
+def test_concurrent_first_use_loads_once():
+    async def scenario():
+        engine = await seeded_engine()
+        catalog = BadgeCatalog(Database(engine))
+        await asyncio.gather(*[catalog.get_by_name('anything') for _ in range(20)])
+        return engine
+
+    assert asyncio.run(scenario()).catalog_loads == 1
+
+
+def test_badge_checks_only_query_ownership(monkeypatch):
+    monkeypatch.setattr(posthog, 'capture', lambda *a, **k: None)
+
+    async def scenario():
+        engine = await seeded_engine()
+        monkeypatch.setattr(database, '_engine', engine)
+        await badge_catalog.refresh()
+        service = BadgeService()
+        await service.check_streak_badges('user_1', 400)
+        await service.check_level_badges('user_1', 20)
+        return engine
+
+    engine = asyncio.run(scenario())
+    assert engine.badge_queries == 0
+    # 5 streak and 3 level badges, each awarded once
+    earned = {b['badge_id'] for b in engine.tables['user_badges']}
+    assert len(earned) == len(engine.tables['user_badges']) == 8
@@ -0,0 +1,121 @@
+"""
+Tests for the read-through row cache
+Both cache backends must serve repeat reads without touching the database
+and must never hand out a row older than the last write.
+"""
+
+import asyncio
+
+import fakeredis
+import pytest
+
+from services.cache import CachedDatabase, LRUCache, RedisCache
+from services.memory_database import InMemoryDatabase
+
+
+class CountingEngine(InMemoryDatabase):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.read_delay = 0.0
+
+    async def get_users(self, user_ids):
+        self.reads += 1
+        rows = await super().get_users(user_ids)
+        await asyncio.sleep(self.read_delay)
+        return rows
+
+
+@pytest.fixture(params=['lru', 'redis'])
+def cache(request):
+    if request.param == 'lru':
+        return LRUCache(max_entries=100, ttl=60)
+    return RedisCache(fakeredis.aioredis.FakeRedis(), ttl=60)
+
+
+def new_user(user_id='user_1'):
+    return {'clerk_user_id': user_id, 'username': user_id, 'email': f'{user_id}@test.dev',
+            'xp': 0, 'level': 1, 'total_points': 0}
+
+
+def test_repeat_reads_are_served_from_cache(cache):
+    async def scenario():
+        engine = CountingEngine()
+        db = CachedDatabase(engine, cache)
+        await engine.create_user(new_user())
+        first = await db.get_user('user_1')
+        first['xp'] = 999
+        second = await db.get_user('user_1')
+        return engine, db, second
+
+    engine, db, second = asyncio.run(scenario())
+    assert engine.reads == 1
+    assert second['xp'] == 0
+    assert db.metrics()['user_profiles'] == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+
+
+def test_writes_evict_cached_rows(cache):
+    async def scenario():
+        engine = CountingEngine()
+        db = CachedDatabase(engine, cache)
+        await engine.create_user(new_user())
+        await db.get_user('user_1')
+        await db.update_user('user_1', {'username': 'renamed'})
+        renamed = await db.get_user('user_1')
+        await db.record_xp_transaction('user_1', 30, 'habit_completion')
+        awarded = await db.get_user('user_1')
+        return renamed, awarded
+
+    renamed, awarded = asyncio.run(scenario())
+    assert renamed['username'] == 'renamed'
+    assert awarded['xp'] == 30
+
+
+def test_batch_reads_only_fetch_misses(cache):
+    async def scenario():
+        engine = CountingEngine()
+        db = CachedDatabase(engine, cache)
+        for user_id in ('user_1', 'user_2'):
+            await engine.create_user(new_user(user_id))
+        await db.get_user('user_1')
+        users = await db.get_users(['user_1', 'user_2', 'missing'])
+        return db, users
+
+    db, users = asyncio.run(scenario())
+    assert sorted(u['clerk_user_id'] for u in users) == ['user_1', 'user_2']
+    assert db.metrics()['user_profiles']['hits'] == 1
+
+
+def test_fill_racing_a_write_is_dropped(cache):
+    async def scenario():
+        engine = CountingEngine()
+        db = CachedDatabase(engine, cache)
+        await engine.create_user(new_user())
+        engine.read_delay = 0.01
+        read = asyncio.create_task(db.get_user('user_1'))
+        await asyncio.sleep(0.005)
+        # The write lands while the read holds the old row
+        await db.update_user('user_1', {'username': 'renamed'})
+        await read
+        engine.read_delay = 0.0
+        return await db.get_user('user_1')
+
+    assert asyncio.run(scenario())['username'] == 'renamed'
+
+
+def test_lru_evicts_oldest_and_expires():
+    async def scenario():
+        lru = LRUCache(max_entries=2, ttl=60)
+        await lru.set_many({'a': {'v': 1}, 'b': {'v': 2}})
+        await lru.get_many(['a'])
+        await lru.set_many({'c': {'v': 3}})
+        kept = await lru.get_many(['a', 'b', 'c'])
+
+        short = LRUCache(max_entries=2, ttl=0.01)
+        await short.set_many({'a': {'v': 1}})
+        await asyncio.sleep(0.02)
+        return kept, await short.get_many(['a'])
+
+    kept, expired = asyncio.run(scenario())
+    assert sorted(kept) == ['a', 'c']
+    assert expired == {}
@@ -0,0 +1,84 @@
+"""
+Tests for the per-habit completion bitmaps
+The bit helpers must agree with a plain walk over the days, including across
+New Year and on 31 December of a leap year.
+"""
+
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from services.completion_bitmap import (YEAR_BYTES, CompletionHistory, decode, encode, from_days, from_logs,
+                                        longest_run, popcount, run_ending_at, runs)
+
+
+def brute_runs(bitmap: int, width: int = 366):
+    found, start = [], None
+    for bit in range(width + 1):
+        if bit < width and bitmap >> bit & 1:
+            start = bit if start is None else start
+        elif start is not None:
+            found.append((start, bit - start))
+            start = None
+    return found
+
+
+def test_run_helpers_match_a_walk_over_the_bits():
+    rng = random.Random(3)
+    for _ in range(200):
+        bitmap = rng.getrandbits(366) & rng.getrandbits(366)
+        expected = brute_runs(bitmap)
+        assert runs(bitmap) == expected
+        assert longest_run(bitmap) == max((length for _, length in expected), default=0)
+        assert popcount(bitmap) == sum(length for _, length in expected)
+        index = rng.randrange(366)
+        assert run_ending_at(bitmap, index) == next(
+            (index - start + 1 for start, length in expected if start <= index < start + length), 0
+        )
+
+
+def test_bitmaps_round_trip_through_storage():
+    leap_eve = date(2024, 12, 31)
+    bitmap = from_days([date(2024, 1, 1), leap_eve])[2024]
+    assert bitmap == 1 | 1 << 365
+    assert len(encode(bitmap)) == YEAR_BYTES * 2
+    # set_bit() numbering: bit 0 is the low bit of the first byte
+    assert encode(bitmap).startswith('01') and encode(bitmap).endswith('20')
+    assert decode(encode(bitmap)) == decode('\\x' + encode(bitmap)) == decode(bytes.fromhex(encode(bitmap)))
+    assert decode(None) == 0
+
+
+def test_history_spans_new_year():
+    days = {date(2024, 12, 20) + timedelta(days=n) for n in range(20)} | {date(2025, 2, 1), date(2025, 2, 2)}
+    history = CompletionHistory(from_days(days))
+
+    assert history.total() == 22
+    assert history.best_streak() == 20
+    # Today still open: yesterday's run still counts
+    assert history.current_streak(date(2025, 1, 9)) == 20
+    assert history.current_streak(date(2025, 1, 10)) == 0
+    assert history.current_streak(date(2025, 2, 2)) == 2
+    assert history.done(date(2024, 12, 31)) and not history.done(date(2023, 5, 5))
+    assert history.days(date(2025, 1, 7), date(2025, 2, 10)) == \
+        [date(2025, 1, 7), date(2025, 1, 8), date(2025, 2, 1), date(2025, 2, 2)]
+    assert history.completion_rate(date(2025, 1, 1), date(2025, 1, 16)) == pytest.approx(0.5)
+    assert history.gaps(date(2025, 1, 1), date(2025, 2, 5)) == [
+        (date(2025, 1, 9), date(2025, 1, 31)), (date(2025, 2, 3), date(2025, 2, 5))
+    ]
+    assert history.gaps(date(2025, 1, 1), date(2025, 2, 5), min_days=5) == [(date(2025, 1, 9), date(2025, 1, 31))]
+
+
+def test_backfill_groups_logs_by_habit_and_year():
+    logs = [
+        {'habit_id': 'h1', 'user_id': 'u1', 'completed_on': '2024-12-31'},
+        {'habit_id': 'h1', 'user_id': 'u1', 'completed_on': '2025-01-01'},
+        # Logged before completed_on existed
+        {'habit_id': 'h1', 'user_id': 'u1', 'completed_on': None, 'completed_at': '2025-01-02T23:00:00'},
+        {'habit_id': 'h2', 'user_id': 'u2', 'completed_on': '2025-01-01'},
+    ]
+    assert from_logs(logs) == {('h1', 'u1', 2024): 1 << 365, ('h1', 'u1', 2025): 0b11, ('h2', 'u2', 2025): 1}
+    assert CompletionHistory.from_rows(
+        [{'year': year, 'days': encode(bitmap)} for (habit, _, year), bitmap in from_logs(logs).items()
+         if habit == 'h1']
+    ).current_streak(date(2025, 1, 2)) == 3
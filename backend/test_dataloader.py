@@ -0,0 +1,107 @@
+"""
+Tests for the request-scoped DataLoader
+Concurrent loads must share one batched query, repeated loads must hit the
+identity map, and writes through Database must never leave it stale.
+"""
+
+import asyncio
+
+from services import dataloader
+from services.database import Database
+from services.dataloader import loader_scope
+from services.memory_database import InMemoryDatabase
+
+
+class CountingEngine(InMemoryDatabase):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def get_users(self, user_ids):
+        self.calls.append(('get_users', list(user_ids)))
+        return await super().get_users(user_ids)
+
+    async def get_badges_by_name(self, names):
+        self.calls.append(('get_badges_by_name', list(names)))
+        return await super().get_badges_by_name(names)
+
+
+async def seeded_engine() -> CountingEngine:
+    engine = CountingEngine()
+    for user_id in ('user_1', 'user_2', 'user_3'):
+        await engine.create_user({'clerk_user_id': user_id, 'username': user_id, 'email': f'{user_id}@test.dev',
+                                  'xp': 0, 'level': 1, 'total_points': 0})
+    return engine
+
+
+def test_concurrent_loads_share_one_query():
+    async def scenario():
+        engine = await seeded_engine()
+        db = Database(engine)
+        before = dataloader.metrics()['calls_saved']
+        with loader_scope(engine):
+            users = await asyncio.gather(*[db.get_user(u) for u in ('user_1', 'user_2', 'user_1', 'missing')])
+            again = await db.get_user('user_2')
+        return engine, users, again, dataloader.metrics()['calls_saved'] - before
+
+    engine, users, again, saved = asyncio.run(scenario())
+    assert engine.calls == [('get_users', ['user_1', 'user_2', 'missing'])]
+    assert [u and u['clerk_user_id'] for u in users] == ['user_1', 'user_2', 'user_1', None]
+    assert again['clerk_user_id'] == 'user_2'
+    assert saved == 4
+
+
+def test_callers_get_private_copies():
+    async def scenario():
+        engine = await seeded_engine()
+        db = Database(engine)
+        with loader_scope(engine):
+            first = await db.get_user('user_1')
+            first['xp'] = 999
+            return await db.get_user('user_1')
+
+    assert asyncio.run(scenario())['xp'] == 0
+
+
+def test_writes_invalidate_the_identity_map():
+    async def scenario():
+        engine = await seeded_engine()
+        db = Database(engine)
+        with loader_scope(engine):
+            await db.get_user('user_1')
+            await db.update_user('user_1', {'username': 'renamed'})
+            renamed = await db.get_user('user_1')
+            awarded = await db.record_xp_transaction('user_1', 50, 'habit_completion')
+            after_award = await db.get_user('user_1')
+        return engine, renamed, awarded, after_award
+
+    engine, renamed, awarded, after_award = asyncio.run(scenario())
+    assert renamed['username'] == 'renamed'
+    assert after_award['xp'] == awarded['xp'] == 50
+    # The award primed the map, so only two batched reads were issued
+    assert [name for name, _ in engine.calls] == ['get_users', 'get_users']
+
+
+def test_badge_lookup_by_requirement_primes_name_lookup():
+    async def scenario():
+        engine = await seeded_engine()
+        await engine.create_badge_if_not_exists({'name': 'Week Warrior', 'badge_type': 'streak', 'requirement': 7})
+        db = Database(engine)
+        with loader_scope(engine):
+            badge = await db.get_badge_by_type_and_requirement('streak', 7)
+            by_name = await db.get_badge_by_name(badge['name'])
+        return engine, by_name
+
+    engine, by_name = asyncio.run(scenario())
+    assert by_name['requirement'] == 7
+    assert engine.calls == []
+
+
+def test_without_scope_calls_go_straight_to_the_engine():
+    async def scenario():
+        engine = await seeded_engine()
+        db = Database(engine)
+        await db.get_user('user_1')
+        return engine
+
+    assert asyncio.run(scenario()).calls == []
@@ -0,0 +1,101 @@
+"""
+Tests for the one-round-trip habit completion
+The complete_habit procedure must give the same results as the step-by-step
+Python path it replaces, in a single call to the database.
+"""
+
+import asyncio
+from datetime import date, timedelta
+
+import httpx
+import posthog
+import pytest
+
+import services.database as database
+from config import settings
+from fake_postgrest import FakePostgrest
+from services.database import SupabaseDatabase
+from services.streak_service import StreakService
+
+
+def seed(fake: FakePostgrest, streak: int):
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    fake.seed('user_profiles', [{'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                                 'xp': 190, 'level': 1, 'total_points': 190, 'clan_id': None}])
+    fake.seed('habits', [{'id': 'habit_1', 'user_id': 'user_1', 'title': 'Read', 'difficulty': 'hard',
+                          'streak': streak, 'best_streak': streak, 'total_completions': streak,
+                          'last_completed': yesterday}])
+
+
+def complete_twice(monkeypatch, procedure: bool, streak: int = 6):
+    monkeypatch.setattr(posthog, 'capture', lambda *a, **k: None)
+    monkeypatch.setattr(settings, 'HABIT_COMPLETION_PROCEDURE', procedure)
+    fake = FakePostgrest()
+    seed(fake, streak)
+    monkeypatch.setattr(database, '_engine', SupabaseDatabase(fake.client()))
+
+    async def scenario():
+        service = StreakService()
+        before = fake.request_count
+        first = await service.complete_habit('user_1', 'habit_1')
+        round_trips = fake.request_count - before
+        second = await service.complete_habit('user_1', 'habit_1')
+        return first, second, round_trips
+
+    first, second, round_trips = asyncio.run(scenario())
+    ledger = [(entry['amount'], entry['reason']) for entry in fake.tables['xp_transactions']]
+    return first, second, round_trips, ledger
+
+
+@pytest.mark.parametrize('streak', [0, 6, 29])
+def test_procedure_matches_the_python_path(monkeypatch, streak):
+    procedure = complete_twice(monkeypatch, True, streak)
+    steps = complete_twice(monkeypatch, False, streak)
+
+    first, second, _, ledger = procedure
+    assert (first, ledger) == (steps[0], steps[3])
+    assert second['success'] is False and second['message'] == steps[1]['message']
+
+
+def test_streak_bonus_lands_in_the_same_call(monkeypatch):
+    first, _, round_trips, ledger = complete_twice(monkeypatch, True, streak=6)
+    assert first['new_streak'] == 7
+    assert ledger == [(20, 'habit_complete_Read'), (25, 'weekly_streak_bonus')]
+    # 190 + 45 XP crosses level 2, whose follow-ups cost their own reads
+    assert round_trips < complete_twice(monkeypatch, False, streak=6)[2]
+
+
+def test_plain_completion_is_one_round_trip(monkeypatch):
+    _, _, round_trips, _ = complete_twice(monkeypatch, True, streak=1)
+    assert round_trips == 1
+
+
+def test_unknown_habit_is_a_404(monkeypatch):
+    fake = FakePostgrest()
+    monkeypatch.setattr(database, '_engine', SupabaseDatabase(fake.client()))
+
+    async def scenario():
+        from main import app
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post('/habits/missing/complete', params={'user_id': 'user_1'})
+
+    assert asyncio.run(scenario()).status_code == 404
+
+
+def test_double_tap_on_the_python_path_awards_once(monkeypatch):
+    monkeypatch.setattr(posthog, 'capture', lambda *a, **k: None)
+    monkeypatch.setattr(settings, 'HABIT_COMPLETION_PROCEDURE', False)
+    # Latency lets both requests read the habit before either logs it
+    fake = FakePostgrest(latency=0.005)
+    seed(fake, streak=0)
+    monkeypatch.setattr(database, '_engine', SupabaseDatabase(fake.client()))
+
+    async def scenario():
+        service = StreakService()
+        return await asyncio.gather(*[service.complete_habit('user_1', 'habit_1') for _ in range(2)])
+
+    results = asyncio.run(scenario())
+    assert sorted('new_streak' in result for result in results) == [False, True]
+    assert len(fake.tables['habit_logs']) == len(fake.tables['xp_transactions']) == 1
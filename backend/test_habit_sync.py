@@ -0,0 +1,163 @@
+"""
+Tests for the offline-sync batch completion
+A queued batch must give the streaks and XP the same completions would have
+given one by one, in a number of requests that doesn't grow with the batch.
+"""
+
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+import httpx
+import posthog
+import pytest
+
+import services.database as database
+from config import settings
+from fake_postgrest import FakePostgrest
+from services.database import SupabaseDatabase
+from services.memory_database import InMemoryDatabase
+from services.streak_service import StreakService
+
+
+def days_ago(days: int, hour: int = 9) -> datetime:
+    return datetime.combine(date.today() - timedelta(days=days), time(hour))
+
+
+def seed(fake: FakePostgrest):
+    fake.seed('user_profiles', [{'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                                 'xp': 0, 'level': 1, 'total_points': 0, 'clan_id': None}])
+    fake.seed('habits', [
+        {'id': f'habit_{n}', 'user_id': 'user_1', 'title': f'Habit {n}', 'difficulty': 'easy',
+         'streak': 0, 'best_streak': 0, 'total_completions': 0, 'last_completed': None}
+        for n in range(3)
+    ] + [{'id': 'theirs', 'user_id': 'user_2', 'title': 'Theirs', 'difficulty': 'easy',
+          'streak': 0, 'best_streak': 0, 'total_completions': 0, 'last_completed': None}])
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(posthog, 'capture', lambda *a, **k: None)
+    fake = FakePostgrest()
+    seed(fake)
+    monkeypatch.setattr(database, '_engine', SupabaseDatabase(fake.client()))
+    return fake
+
+
+def test_week_of_queued_completions_in_a_bounded_number_of_requests(fake):
+    # Seven days for each of three habits, sent newest first
+    completions = [{'habit_id': f'habit_{n}', 'completed_at': days_ago(days)}
+                   for days in range(7) for n in range(3)]
+
+    async def scenario():
+        before = fake.request_count
+        result = await StreakService().sync_completions('user_1', completions)
+        return result, fake.request_count - before
+
+    result, requests = asyncio.run(scenario())
+    assert [item['status'] for item in result['results']] == ['completed'] * 21
+    assert result['habits'] == {f'habit_{n}': {'streak': 7, 'best_streak': 7} for n in range(3)}
+    # 10 XP a day plus the weekly bonus, per habit, in one ledger entry
+    assert result['xp_earned'] == 3 * (7 * 10 + 25)
+    assert [(e['amount'], e['reason']) for e in fake.tables['xp_transactions']] == [(285, 'habit_sync')]
+    assert len(fake.tables['habit_logs']) == 21
+    assert {h['id']: h['total_completions'] for h in fake.tables['habits']}['habit_0'] == 7
+    # Habit read, log insert, one write per habit, the ledger entry and level-up follow-ups
+    assert requests < 21
+
+
+def test_each_completion_gets_a_status(fake):
+    completions = [
+        {'habit_id': 'habit_0', 'completed_at': days_ago(1)},
+        {'habit_id': 'habit_0', 'completed_at': days_ago(1, hour=20)},
+        {'habit_id': 'missing', 'completed_at': days_ago(1)},
+        {'habit_id': 'theirs', 'completed_at': days_ago(1)},
+        {'habit_id': 'habit_1', 'completed_at': days_ago(-1)},
+    ]
+    result = asyncio.run(StreakService().sync_completions('user_1', completions))
+
+    assert [item['status'] for item in result['results']] == \
+        ['completed', 'already_completed', 'not_found', 'not_found', 'in_future']
+    assert result['xp_earned'] == 10
+
+
+def test_days_before_the_last_completion_are_not_replayed(fake):
+    async def scenario():
+        service = StreakService()
+        first = await service.sync_completions('user_1', [{'habit_id': 'habit_0', 'completed_at': days_ago(1)}])
+        second = await service.sync_completions('user_1', [
+            {'habit_id': 'habit_0', 'completed_at': days_ago(3)},
+            {'habit_id': 'habit_0', 'completed_at': days_ago(0)},
+        ])
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [item['status'] for item in second['results']] == ['out_of_order', 'completed']
+    assert second['habits'] == {'habit_0': {'streak': 2, 'best_streak': 2}}
+
+
+def test_sync_matches_completing_one_by_one(monkeypatch):
+    monkeypatch.setattr(posthog, 'capture', lambda *a, **k: None)
+    monkeypatch.setattr(settings, 'HABIT_COMPLETION_PROCEDURE', False)
+    engine = InMemoryDatabase()
+    monkeypatch.setattr(database, '_engine', engine)
+
+    async def scenario():
+        await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                                  'xp': 0, 'level': 1, 'total_points': 0})
+        habit = await engine.create_habit({'user_id': 'user_1', 'title': 'Read', 'frequency': 'daily',
+                                           'difficulty': 'hard', 'streak': 0, 'best_streak': 0,
+                                           'total_completions': 0})
+        result = await StreakService().sync_completions(
+            'user_1', [{'habit_id': habit['id'], 'completed_at': days_ago(days)} for days in range(8)]
+        )
+        return result, await engine.get_habit(habit['id']), await engine.get_user('user_1')
+
+    result, habit, user = asyncio.run(scenario())
+    assert (habit['streak'], habit['best_streak'], habit['total_completions']) == (8, 8, 8)
+    assert result['xp_earned'] == user['xp'] == 8 * 20 + 25
+
+
+def test_completion_landing_mid_sync_is_not_counted_twice(fake, monkeypatch):
+    captured = []
+    monkeypatch.setattr(posthog, 'capture', lambda user_id, event, properties: captured.append((event, properties)))
+    service = StreakService()
+    insert = service.db.create_habit_completions
+
+    async def racing_insert(logs):
+        # A normal /complete for today lands after the sync read the habit
+        await StreakService().complete_habit('user_1', 'habit_0')
+        return await insert(logs)
+
+    monkeypatch.setattr(service.db, 'create_habit_completions', racing_insert, raising=False)
+    result = asyncio.run(service.sync_completions('user_1', [
+        {'habit_id': 'habit_0', 'completed_at': days_ago(1)},
+        {'habit_id': 'habit_0', 'completed_at': days_ago(0)},
+    ]))
+
+    habit = next(h for h in fake.tables['habits'] if h['id'] == 'habit_0')
+    assert [item['status'] for item in result['results']] == ['completed', 'already_completed']
+    assert len(fake.tables['habit_logs']) == habit['total_completions'] == 2
+    # Today's completion is the newer one and keeps its streak and timestamp
+    assert habit['last_completed'][:10] == date.today().isoformat()
+    assert result['xp_earned'] == 10
+    assert ('habits_synced', {'completions': 1, 'habits': 1, 'xp_earned': 10}) in captured
+
+
+def test_sync_route_rejects_oversized_batches(fake, monkeypatch):
+    monkeypatch.setattr(settings, 'HABIT_SYNC_MAX_COMPLETIONS', 2)
+    body = {'user_id': 'user_1',
+            'completions': [{'habit_id': 'habit_0', 'completed_at': days_ago(days).isoformat()} for days in range(3)]}
+
+    async def scenario():
+        from main import app
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            too_many = await client.post('/habits/sync', json=body)
+            body['completions'].pop()
+            synced = await client.post('/habits/sync', json=body)
+            return too_many, synced
+
+    too_many, synced = asyncio.run(scenario())
+    assert too_many.status_code == 413
+    assert synced.status_code == 200 and synced.json()['xp_earned'] == 20
@@ -0,0 +1,147 @@
+"""
+Tests for Idempotency-Key handling
+A retried completion or award must get the first response back without
+touching the database, and duplicates racing the first must wait for it.
+"""
+
+import asyncio
+
+import fakeredis
+import httpx
+import posthog
+import pytest
+
+import services.database as database
+from fake_postgrest import FakePostgrest
+from services.database import SupabaseDatabase
+from services.idempotency import (IdempotencyKeyInProgressError, IdempotencyKeyReusedError, IdempotencyKeys,
+                                  MemoryIdempotencyStore, RedisIdempotencyStore, idempotency)
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def store(request):
+    if request.param == 'memory':
+        return MemoryIdempotencyStore(max_entries=100)
+    return RedisIdempotencyStore(fakeredis.aioredis.FakeRedis())
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(posthog, 'capture', lambda *a, **k: None)
+    monkeypatch.setattr(idempotency, 'store', MemoryIdempotencyStore(max_entries=100))
+    fake = FakePostgrest(latency=0.002)
+    fake.seed('user_profiles', [{'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                                 'xp': 0, 'level': 1, 'total_points': 0, 'clan_id': None}])
+    fake.seed('habits', [{'id': 'habit_1', 'user_id': 'user_1', 'title': 'Read', 'difficulty': 'easy',
+                          'streak': 0, 'best_streak': 0, 'total_completions': 0, 'last_completed': None}])
+    monkeypatch.setattr(database, '_engine', SupabaseDatabase(fake.client()))
+    return fake
+
+
+def post(*requests):
+    async def scenario():
+        from main import app
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await asyncio.gather(*[client.post(url, **kwargs) for url, kwargs in requests])
+
+    return asyncio.run(scenario())
+
+
+def test_retried_completion_replays_without_touching_the_database(fake):
+    complete = ('/habits/habit_1/complete', {'params': {'user_id': 'user_1'},
+                                              'headers': {'Idempotency-Key': 'tap-1'}})
+    first, = post(complete)
+    before = fake.request_count
+    retry, = post(complete)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json() and first.json()['new_streak'] == 1
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert fake.request_count == before
+    assert len(fake.tables['habit_logs']) == 1
+
+
+def test_concurrent_duplicate_awards_wait_on_the_first(fake):
+    award = ('/xp/award', {'json': {'user_id': 'user_1', 'xp_amount': 50},
+                           'headers': {'Idempotency-Key': 'award-1'}})
+    responses = post(*[award] * 5)
+
+    assert {response.status_code for response in responses} == {200}
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert sum('Idempotent-Replayed' in response.headers for response in responses) == 4
+    assert len(fake.tables['xp_transactions']) == 1
+    assert idempotency.stats['joined'] >= 4
+
+
+def test_key_reused_with_other_parameters_is_rejected(fake):
+    headers = {'Idempotency-Key': 'award-2'}
+    first, = post(('/xp/award', {'json': {'user_id': 'user_1', 'xp_amount': 50}, 'headers': headers}))
+    other, = post(('/xp/award', {'json': {'user_id': 'user_1', 'xp_amount': 500}, 'headers': headers}))
+    plain = post(*[('/xp/award', {'json': {'user_id': 'user_1', 'xp_amount': 5}})] * 2)
+
+    assert first.status_code == 200 and other.status_code == 422
+    # No key, no deduplication
+    assert [response.status_code for response in plain] == [200, 200]
+    assert len(fake.tables['xp_transactions']) == 3
+
+
+def test_other_process_waits_for_the_holder_then_replays(store):
+    # Two workers sharing one store: the second sees the first's reservation
+    first, second = IdempotencyKeys(store, ttl=60, lock_seconds=5, poll_interval=0.005), \
+        IdempotencyKeys(store, ttl=60, lock_seconds=5, poll_interval=0.005)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {'call': len(calls)}
+
+    async def scenario():
+        async def later():
+            await asyncio.sleep(0.01)
+            return await second.run('key', 'scope', {'a': 1}, call)
+        return await asyncio.gather(first.run('key', 'scope', {'a': 1}, call), later())
+
+    assert asyncio.run(scenario()) == [({'call': 1}, False), ({'call': 1}, True)]
+    assert len(calls) == 1
+
+
+def test_failures_release_the_key(store):
+    keys = IdempotencyKeys(store, ttl=60, lock_seconds=0.05, poll_interval=0.005)
+
+    async def failing():
+        raise ConnectionError('down')
+
+    async def succeeding():
+        return {'ok': True}
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await keys.run('key', 'scope', {}, failing)
+        # The failure isn't kept, so the retry runs
+        retried = await keys.run('key', 'scope', {}, succeeding)
+        with pytest.raises(IdempotencyKeyReusedError):
+            await keys.run('key', 'scope', {'other': True}, succeeding)
+        return retried
+
+    assert asyncio.run(scenario()) == ({'ok': True}, False)
+
+
+def test_holder_that_never_finishes_times_out(store):
+    keys = IdempotencyKeys(store, ttl=60, lock_seconds=0.05, poll_interval=0.005)
+
+    async def succeeding():
+        return {'ok': True}
+
+    async def scenario():
+        await keys.run('seed', 'scope', {}, succeeding)
+        record = await store.get('scope:seed')
+        # Same request, reserved by a process that died before finishing
+        await store.set('scope:held', {'status': 'in_progress', 'fingerprint': record['fingerprint']}, 60)
+        with pytest.raises(IdempotencyKeyInProgressError):
+            await keys.run('held', 'scope', {}, succeeding)
+
+    asyncio.run(scenario())
@@ -0,0 +1,169 @@
+"""
+Tests for the outbox relay
+Events written with a state change must reach the user's Socket.IO room and
+analytics, and an event whose delivery fails must go out again later.
+"""
+
+import asyncio
+from datetime import date, timedelta
+
+import posthog
+import pytest
+
+import services.database as database
+import services.outbox as outbox
+from config import settings
+from services.memory_database import InMemoryDatabase
+from services.outbox import OutboxRelay
+from services.streak_service import StreakService
+
+
+class Sio:
+    """Records emits like socketio.AsyncServer.emit; fails the first `failures` calls"""
+
+    def __init__(self, failures: int = 0):
+        self.emitted = []
+        self.failures = failures
+
+    async def emit(self, event, data, room=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('socket down')
+        self.emitted.append((event, data, room))
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(settings, 'HABIT_COMPLETION_PROCEDURE', True)
+    engine = InMemoryDatabase()
+    monkeypatch.setattr(database, '_engine', engine)
+    return engine
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    events = []
+    monkeypatch.setattr(posthog, 'capture', lambda user_id, event, properties: events.append((event, properties)))
+    return events
+
+
+async def complete_seventh_day(engine):
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                              'xp': 170, 'level': 1, 'total_points': 170, 'clan_id': None})
+    habit = await engine.create_habit({'user_id': 'user_1', 'title': 'Read', 'difficulty': 'medium',
+                                       'streak': 6, 'best_streak': 6, 'total_completions': 6,
+                                       'last_completed': yesterday})
+    await StreakService().complete_habit('user_1', habit['id'])
+    return habit
+
+
+def test_completion_events_reach_the_users_room_and_analytics(engine, captured):
+    sio = Sio()
+    relay = OutboxRelay(batch_size=10, analytics=True)
+    relay.emit = sio.emit
+
+    async def scenario():
+        habit = await complete_seventh_day(engine)
+        claimed = await relay.drain()
+        return habit, claimed, await relay.drain()
+
+    habit, claimed, again = asyncio.run(scenario())
+    assert (claimed, again) == (3, 0)
+    assert [(event, room) for event, _, room in sio.emitted] == [
+        ('streak_milestone', 'user_user_1'), ('xp_update', 'user_user_1'), ('xp_update', 'user_user_1')
+    ]
+    milestone, earned, bonus = (data for _, data, _ in sio.emitted)
+    assert milestone['habit_id'] == habit['id'] and milestone['milestone'] == 7
+    # 170 + 15 stays on level 1, the weekly bonus crosses into level 2
+    assert (earned['xp_earned'], earned['new_total_xp'], earned['level_up']) == (15, 185, False)
+    assert (bonus['xp_earned'], bonus['new_total_xp'], bonus['level_up'], bonus['new_level']) == (25, 210, True, 2)
+    assert len({data['event_id'] for _, data, _ in sio.emitted}) == 3
+    # habit_completed is a side effect of the completion, run inline without workers
+    assert [event for event, _ in captured] == ['habit_completed', 'streak_milestone', 'xp_awarded', 'xp_awarded']
+    assert engine.tables['outbox_events'] == []
+    assert relay.stats == {'delivered': 3, 'failed': 0, 'batches': 1, 'analytics_failed': 0}
+    assert relay.metrics()['lag_seconds'] == 0
+
+
+def test_failed_delivery_is_retried_once_the_lease_runs_out(engine, captured):
+    sio = Sio(failures=1)
+    relay = OutboxRelay(batch_size=10, lease_seconds=0.05)
+    relay.emit = sio.emit
+
+    async def scenario():
+        await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                                  'xp': 0, 'level': 1, 'total_points': 0})
+        await engine.record_xp_transaction('user_1', 10, 'first')
+        await engine.record_xp_transaction('user_1', 20, 'second')
+        await relay.drain()
+        left = len(engine.tables['outbox_events'])
+        # Still leased, so an immediate drain doesn't resend it
+        leased = await relay.drain()
+        await asyncio.sleep(0.06)
+        return left, leased, await relay.drain()
+
+    left, leased, redelivered = asyncio.run(scenario())
+    assert (left, leased, redelivered) == (1, 0, 1)
+    assert [data['reason'] for _, data, _ in sio.emitted] == ['second', 'first']
+    assert relay.stats['failed'] == 1 and relay.stats['delivered'] == 2
+    assert relay.max_lag_seconds >= 0.05
+
+
+def test_analytics_failure_does_not_resend_the_event(engine, monkeypatch):
+    def capture(*args, **kwargs):
+        raise TypeError('capture() takes 1 positional argument but 3 were given')
+
+    monkeypatch.setattr(posthog, 'capture', capture)
+    sio = Sio()
+    relay = OutboxRelay(batch_size=10, lease_seconds=0.01, analytics=True)
+    relay.emit = sio.emit
+
+    async def scenario():
+        await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                                  'xp': 0, 'level': 1, 'total_points': 0})
+        await engine.record_xp_transaction('user_1', 10, 'first')
+        claimed = await relay.drain()
+        await asyncio.sleep(0.02)
+        return claimed, await relay.drain()
+
+    assert asyncio.run(scenario()) == (1, 0)
+    assert len(sio.emitted) == 1 and engine.tables['outbox_events'] == []
+    assert relay.stats == {'delivered': 1, 'failed': 0, 'batches': 1, 'analytics_failed': 1}
+
+
+def test_analytics_is_off_without_a_posthog_key(engine, captured, monkeypatch):
+    monkeypatch.setattr(outbox, 'POSTHOG_ENABLED', False)
+    sio = Sio()
+    relay = OutboxRelay(batch_size=10)
+    relay.emit = sio.emit
+
+    async def scenario():
+        await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                                  'xp': 0, 'level': 1, 'total_points': 0})
+        await engine.record_xp_transaction('user_1', 10, 'first')
+        return await relay.drain()
+
+    assert asyncio.run(scenario()) == 1
+    assert len(sio.emitted) == 1 and captured == []
+
+
+def test_relay_task_drains_in_the_background(engine, captured):
+    sio = Sio()
+    relay = OutboxRelay(batch_size=2, poll_interval=0.01)
+
+    async def scenario():
+        await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                                  'xp': 0, 'level': 1, 'total_points': 0})
+        relay.start(sio.emit)
+        for n in range(5):
+            await engine.record_xp_transaction('user_1', 1, f'award_{n}')
+        for _ in range(100):
+            if len(sio.emitted) == 5:
+                break
+            await asyncio.sleep(0.01)
+        await relay.stop()
+
+    asyncio.run(scenario())
+    assert [data['reason'] for _, data, _ in sio.emitted] == [f'award_{n}' for n in range(5)]
+    assert not relay.running
@@ -0,0 +1,97 @@
+"""
+Tests for keyset pagination
+Cursors must round-trip, reject tampering and reuse across listings, and
+walking the paginated routes must visit every row exactly once in order.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import services.database as database
+from services.memory_database import InMemoryDatabase
+from services.pagination import (
+    CLAN_MEMBERS, HABITS, LEADERBOARD, InvalidCursorError, decode_cursor, encode_cursor
+)
+
+
+def test_cursor_round_trip_and_validation():
+    row = {'total_points': 120, 'id': 'abc'}
+    cursor = encode_cursor(LEADERBOARD, row, position=40)
+    assert decode_cursor(LEADERBOARD, cursor) == ({'total_points': 120, 'id': 'abc'}, 40)
+    assert decode_cursor(LEADERBOARD, None) == (None, 0)
+
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(CLAN_MEMBERS, cursor)
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(LEADERBOARD, 'not-a-cursor')
+
+
+def test_routes_page_through_everything(monkeypatch):
+    engine = InMemoryDatabase()
+    monkeypatch.setattr(database, '_engine', engine)
+
+    async def scenario():
+        from main import app
+
+        for i in range(7):
+            await engine.create_user({'clerk_user_id': f'user_{i}', 'username': f'owl_{i}',
+                                      'email': f'owl_{i}@test.dev', 'total_points': i * 10 % 40,
+                                      'level': 1, 'xp': 0})
+            await engine.create_habit({'user_id': 'user_0', 'title': f'Habit {i}', 'frequency': 'daily',
+                                       'difficulty': 'medium', 'streak': 0, 'best_streak': 0,
+                                       'total_completions': 0, 'created_at': f'2025-01-0{i + 1}T00:00:00'})
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            leaders, cursor = [], None
+            while True:
+                params = {'limit': 3, **({'cursor': cursor} if cursor else {})}
+                body = (await client.get('/leaderboard/users', params=params)).json()
+                leaders.extend(body['leaderboard'])
+                cursor = body['next_cursor']
+                if cursor is None:
+                    break
+
+            habits, cursor = [], None
+            while True:
+                params = {'limit': 3, 'fields': 'title', **({'cursor': cursor} if cursor else {})}
+                response = await client.get('/habits/user/user_0', params=params)
+                habits.extend(response.json())
+                cursor = response.headers.get('x-next-cursor')
+                if cursor is None:
+                    break
+
+            bad = await client.get('/leaderboard/users', params={'cursor': encode_cursor(HABITS, {})})
+        return leaders, habits, bad
+
+    leaders, habits, bad = asyncio.run(scenario())
+    assert [user['rank'] for user in leaders] == list(range(1, 8))
+    assert sorted(user['clerk_user_id'] for user in leaders) == [f'user_{i}' for i in range(7)]
+    points = [user['total_points'] for user in leaders]
+    assert points == sorted(points, reverse=True)
+    assert 'email' not in leaders[0]
+    assert habits == [{'title': f'Habit {i}'} for i in range(7)]
+    assert bad.status_code == 400
+
+
+def test_habits_are_unpaged_unless_asked(monkeypatch):
+    engine = InMemoryDatabase()
+    monkeypatch.setattr(database, '_engine', engine)
+
+    async def scenario():
+        from main import app
+
+        for i in range(120):
+            await engine.create_habit({'user_id': 'user_0', 'title': f'Habit {i}', 'frequency': 'daily',
+                                       'difficulty': 'medium', 'streak': 0, 'best_streak': 0,
+                                       'total_completions': 0})
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get('/habits/user/user_0'), \
+                await client.get('/habits/user/user_0', params={'limit': 100})
+
+    everything, paged = asyncio.run(scenario())
+    assert len(everything.json()) == 120 and 'x-next-cursor' not in everything.headers
+    assert len(paged.json()) == 100 and 'x-next-cursor' in paged.headers
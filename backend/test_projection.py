@@ -0,0 +1,57 @@
+"""
+Tests for sparse fieldsets on the read routes
+`fields=` must trim rows to the requested columns, keep the routes' own
+ordering working and reject columns a table does not expose.
+"""
+
+import asyncio
+
+import httpx
+
+import services.database as database
+from services.memory_database import InMemoryDatabase
+
+
+async def _get_all(paths):
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        return [await client.get(path) for path in paths]
+
+
+def test_fields_project_route_responses(monkeypatch):
+    engine = InMemoryDatabase()
+    monkeypatch.setattr(database, '_engine', engine)
+
+    async def scenario():
+        for i, points in enumerate([30, 50]):
+            await engine.create_user({'clerk_user_id': f'user_{i}', 'username': f'owl_{i}',
+                                      'email': f'owl_{i}@test.dev', 'total_points': points,
+                                      'level': 1, 'xp': points})
+        await engine.create_habit({'user_id': 'user_0', 'title': 'Read', 'frequency': 'daily',
+                                   'difficulty': 'medium', 'streak': 2, 'best_streak': 2,
+                                   'total_completions': 2})
+        clan = await engine.create_clan_with_owner({'name': 'Owls', 'owner_id': 'user_0', 'max_members': 50})
+        await engine.join_clan(clan['id'], 'user_1', 'owl_1')
+        await engine.increment_clan_member_contribution(clan['id'], 'user_1', 20)
+        return await _get_all([
+            '/profile/user_0?fields=username,xp',
+            '/habits/user/user_0?fields=title,streak',
+            '/leaderboard/users?fields=username,total_points',
+            f"/api/clans/{clan['id']}/members?fields=username",
+            '/profile/user_0?fields=username,password',
+            '/leaderboard/users?fields=email',
+        ])
+
+    profile, habits, leaderboard, members, bad_profile, bad_leaderboard = asyncio.run(scenario())
+    assert profile.json() == {'username': 'owl_0', 'xp': 30}
+    assert habits.json() == [{'title': 'Read', 'streak': 2}]
+    assert [user for user in leaderboard.json()['leaderboard']] == [
+        {'username': 'owl_1', 'total_points': 50, 'rank': 1},
+        {'username': 'owl_0', 'total_points': 30, 'rank': 2},
+    ]
+    # Still ordered by contribution even though it wasn't requested
+    assert members.json()['members'] == [{'username': 'owl_1'}, {'username': 'owl_0'}]
+    assert bad_profile.status_code == 400
+    assert bad_leaderboard.status_code == 400
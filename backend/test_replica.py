@@ -0,0 +1,107 @@
+"""
+Tests for read-replica routing
+Two PostgREST stand-ins play primary and replica. Replication is manual, so
+every read shows which store answered it.
+"""
+
+import asyncio
+import copy
+
+from fake_postgrest import FakePostgrest
+from services import replica as replica_module
+from services.database import Database, SupabaseDatabase
+from services.replica import ReplicaRouter, acting_as
+
+
+def make_stores():
+    primary, replica = FakePostgrest(), FakePostgrest()
+    return primary, replica, SupabaseDatabase(primary.client()), SupabaseDatabase(replica.client())
+
+
+def replicate(primary: FakePostgrest, replica: FakePostgrest):
+    replica.tables = copy.deepcopy(primary.tables)
+
+
+def new_user(clerk_user_id, points):
+    return {'clerk_user_id': clerk_user_id, 'username': clerk_user_id,
+            'email': f'{clerk_user_id}@test.dev', 'total_points': points, 'level': 1, 'xp': points}
+
+
+def test_pure_reads_go_to_the_replica():
+    primary, replica, primary_db, replica_db = make_stores()
+    db = Database(primary_db, replica=replica_db)
+
+    async def scenario():
+        await primary_db.create_user(new_user('user_1', 10))
+        replicate(primary, replica)
+        # Lands on the primary only; the replica hasn't caught up
+        await primary_db.create_user(new_user('user_2', 20))
+        primary.request_count = replica.request_count = 0
+        with acting_as('user_3'):
+            leaders = await db.get_leaderboard(10)
+            await db.get_public_habits(10)
+            await db.get_clan_messages('clan_1')
+            # Not a listed replica read, so it always hits the primary
+            user = await db.get_user('user_2')
+        return leaders, user
+
+    leaders, user = asyncio.run(scenario())
+    assert [u['clerk_user_id'] for u in leaders] == ['user_1']
+    assert user['clerk_user_id'] == 'user_2'
+    assert replica.request_count == 3
+    assert primary.request_count == 1
+
+
+def test_writer_reads_primary_until_pin_expires():
+    primary, replica, primary_db, replica_db = make_stores()
+    router = ReplicaRouter(primary_db, replica_db, pin_seconds=0.05)
+    db = Database(router)
+
+    async def writer_request():
+        with acting_as('user_1'):
+            await db.create_user(new_user('user_1', 10))
+
+    async def leaderboard_as(user_id):
+        with acting_as(user_id):
+            return [u['clerk_user_id'] for u in await db.get_leaderboard(10)]
+
+    async def scenario():
+        # Separate tasks stand in for separate requests
+        await asyncio.create_task(writer_request())
+        own = await asyncio.create_task(leaderboard_as('user_1'))
+        other = await asyncio.create_task(leaderboard_as('user_2'))
+        await asyncio.sleep(0.06)
+        expired = await asyncio.create_task(leaderboard_as('user_1'))
+        return own, other, expired
+
+    pinned_before = replica_module.METRICS['pinned_reads']
+    own, other, expired = asyncio.run(scenario())
+    assert own == ['user_1']
+    assert other == []
+    assert expired == []
+    assert replica_module.METRICS['pinned_reads'] == pinned_before + 1
+
+
+def test_a_write_pins_the_rest_of_its_own_request():
+    primary, replica, primary_db, replica_db = make_stores()
+    db = Database(primary_db, replica=replica_db)
+
+    async def scenario():
+        # No acting user known, but the same context wrote a moment ago
+        await db.create_user(new_user('user_1', 10))
+        return await db.get_leaderboard(10)
+
+    assert [u['clerk_user_id'] for u in asyncio.run(scenario())] == ['user_1']
+
+
+def test_replica_failure_falls_back_to_primary():
+    primary, _, primary_db, _ = make_stores()
+    primary.tables['user_profiles'].append(new_user('user_1', 10))
+
+    class Down:
+        async def get_leaderboard(self, *args, **kwargs):
+            raise ConnectionError('replica unreachable')
+
+    db = Database(primary_db, replica=Down())
+    leaders = asyncio.run(db.get_leaderboard(10))
+    assert [u['clerk_user_id'] for u in leaders] == ['user_1']
@@ -0,0 +1,716 @@
+"""
+Contract tests for the storage engines
+Every engine must behave the same through the Repository protocol. The
+Supabase engine runs against the in-memory PostgREST stand-in.
+"""
+
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from fake_postgrest import FakePostgrest
+from services.cache import CachedDatabase, LRUCache
+from services.completion_bitmap import CompletionHistory, decode
+from services.database import SupabaseDatabase
+from services.memory_database import InMemoryDatabase
+from services.repository import (
+    ClanFullError, ClanNotFoundError, HabitNotFoundError, Repository, StaleWriteError
+)
+from services.sqlite_database import SQLiteDatabase
+
+
+def make_engine(name: str, latency: float = 0.0):
+    if name == 'memory':
+        return InMemoryDatabase()
+    if name == 'sqlite':
+        return SQLiteDatabase(':memory:')
+    if name == 'cached':
+        # Any stale cache entry would break the read-after-write assertions
+        return CachedDatabase(InMemoryDatabase(), LRUCache(max_entries=1000, ttl=60))
+    return SupabaseDatabase(FakePostgrest(latency=latency).client())
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'supabase', 'cached'])
+def engine(request):
+    return make_engine(request.param)
+
+
+@pytest.fixture
+def seed(engine):
+    """Insert rows into tables the Repository only reads from"""
+    async def _seed(table, row):
+        if isinstance(engine, SupabaseDatabase):
+            response = await engine.client.table(table).insert(row).execute()
+            return response.data[0]
+        return await engine._insert(table, row)
+    return _seed
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def new_user(clerk_user_id='user_1', **overrides):
+    return {
+        'clerk_user_id': clerk_user_id,
+        'username': clerk_user_id,
+        'email': f'{clerk_user_id}@test.dev',
+        'total_points': 0,
+        'level': 1,
+        'xp': 0,
+        **overrides,
+    }
+
+
+def new_habit(user_id='user_1', **overrides):
+    return {
+        'user_id': user_id,
+        'title': 'Read',
+        'frequency': 'daily',
+        'difficulty': 'medium',
+        'is_public': False,
+        'streak': 0,
+        'best_streak': 0,
+        'total_completions': 0,
+        **overrides,
+    }
+
+
+def test_engine_satisfies_protocol(engine):
+    assert isinstance(engine, Repository)
+
+
+def test_user_roundtrip(engine):
+    async def scenario():
+        created = await engine.create_user(new_user())
+        assert created['id']
+        assert (await engine.get_user('user_1'))['email'] == 'user_1@test.dev'
+        assert await engine.get_user('missing') is None
+
+        updated = await engine.update_user('user_1', {'xp': 250, 'level': 2})
+        assert (updated['xp'], updated['level']) == (250, 2)
+        assert (await engine.get_user('user_1'))['xp'] == 250
+
+    run(scenario())
+
+
+def test_batch_getters(engine):
+    async def scenario():
+        for user_id in ('user_1', 'user_2', 'user_3'):
+            await engine.create_user(new_user(user_id))
+        await engine.record_xp_transaction('user_2', 40, 'habit_completion')
+        users = await engine.get_users(['user_2', 'user_3', 'missing'])
+        assert sorted((u['clerk_user_id'], u['xp']) for u in users) == [('user_2', 40), ('user_3', 0)]
+
+        habits = [await engine.create_habit(new_habit(title=title)) for title in ('Read', 'Run', 'Nap')]
+        found = await engine.get_habits([habits[0]['id'], habits[2]['id']])
+        assert sorted(h['title'] for h in found) == ['Nap', 'Read']
+
+        clan = await engine.create_clan_with_owner({'name': 'Owls', 'owner_id': 'user_1', 'max_members': 5})
+        assert [c['name'] for c in await engine.get_clans([clan['id']])] == ['Owls']
+
+        for name in ('First Step', 'Week Warrior'):
+            await engine.create_badge_if_not_exists({'name': name, 'badge_type': 'streak', 'requirement': 1})
+        badges = await engine.get_badges_by_name(['Week Warrior', 'Unknown'])
+        assert [b['name'] for b in badges] == ['Week Warrior']
+
+    run(scenario())
+
+
+def test_habit_lifecycle(engine):
+    async def scenario():
+        habit = await engine.create_habit(new_habit())
+        await engine.create_habit(new_habit(title='Run'))
+        await engine.create_habit(new_habit(user_id='user_2'))
+
+        assert (await engine.get_habit(habit['id']))['title'] == 'Read'
+        assert len(await engine.get_user_habits('user_1')) == 2
+
+        updated = await engine.update_habit(habit['id'], {'streak': 3})
+        assert updated['streak'] == 3
+
+        await engine.delete_habit(habit['id'])
+        assert await engine.get_habit(habit['id']) is None
+        assert len(await engine.get_user_habits('user_1')) == 1
+
+    run(scenario())
+
+
+def test_last_completion_is_most_recent(engine):
+    async def scenario():
+        assert await engine.get_last_completion('habit_1', 'user_1') is None
+        yesterday = date.today() - timedelta(days=1)
+        await engine.create_habit_completion('habit_1', 'user_1', 10, completed_on=yesterday)
+        await asyncio.sleep(0.001)
+        latest = await engine.create_habit_completion('habit_1', 'user_1', 15, notes='second')
+        await engine.create_habit_completion('habit_1', 'user_2', 20)
+
+        last = await engine.get_last_completion('habit_1', 'user_1')
+        assert last['id'] == latest['id']
+        assert last['xp_earned'] == 15
+
+    run(scenario())
+
+
+def test_one_completion_per_habit_user_and_day(engine):
+    today = date.today()
+
+    async def scenario():
+        first = await engine.create_habit_completion('habit_1', 'user_1', 10, completed_on=today)
+        again = await engine.create_habit_completion('habit_1', 'user_1', 10, notes='double tap', completed_on=today)
+        other_user = await engine.create_habit_completion('habit_1', 'user_2', 10, completed_on=today)
+        tomorrow = await engine.create_habit_completion('habit_1', 'user_1', 10,
+                                                        completed_on=today + timedelta(days=1))
+        return first, again, other_user, tomorrow
+
+    first, again, other_user, tomorrow = run(scenario())
+    assert first['completed_on'] == today.isoformat()
+    assert again is None
+    assert other_user is not None and tomorrow is not None
+
+
+def test_batch_completions_skip_days_already_logged(engine):
+    today = date.today()
+
+    def log(day, user_id='user_1'):
+        return {'habit_id': 'habit_1', 'user_id': user_id, 'xp_earned': 10, 'notes': None,
+                'completed_at': f'{day.isoformat()}T09:00:00', 'completed_on': day.isoformat()}
+
+    async def scenario():
+        await engine.create_habit_completion('habit_1', 'user_1', 10, completed_on=today)
+        created = await engine.create_habit_completions([
+            log(today - timedelta(days=1)), log(today), log(today, 'user_2')
+        ])
+        return created, await engine.create_habit_completions([])
+
+    created, empty = run(scenario())
+    assert sorted((row['user_id'], row['completed_on']) for row in created) == \
+        [('user_1', (today - timedelta(days=1)).isoformat()), ('user_2', today.isoformat())]
+    assert empty == []
+
+
+def test_complete_habit_procedure(engine):
+    today = date.today()
+
+    async def scenario():
+        await engine.create_user(new_user())
+        yesterday = (today - timedelta(days=1)).isoformat()
+        habit = await engine.create_habit(new_habit(streak=6, best_streak=6, last_completed=yesterday))
+
+        done = await engine.complete_habit(habit['id'], 'user_1', 'felt good', today)
+        again = await engine.complete_habit(habit['id'], 'user_1', None, today)
+        with pytest.raises(HabitNotFoundError):
+            await engine.complete_habit('missing', 'user_1', None, today)
+        return habit, done, again, await engine.get_user('user_1')
+
+    habit, done, again, user = run(scenario())
+    assert done['status'] == 'completed'
+    assert done['habit']['streak'] == done['habit']['best_streak'] == 7
+    assert done['habit']['total_completions'] == 1
+    assert done['habit']['version'] == habit['version'] + 1
+    assert done['completion']['notes'] == 'felt good'
+    # Medium habit with a 7-day streak, plus the weekly bonus on day 7
+    assert done['xp_earned'] == 15
+    assert done['streak_bonus'] == {'reason': 'weekly_streak_bonus', 'xp': 25}
+    assert done['user']['xp'] == user['xp'] == 40
+    assert again['status'] == 'already_completed'
+    assert again['habit']['total_completions'] == 1
+
+
+@pytest.mark.parametrize('name', ['memory', 'sqlite', 'supabase'])
+def test_concurrent_completions_of_one_habit_award_once(name):
+    engine = make_engine(name, latency=0.005)
+
+    async def scenario():
+        await engine.create_user(new_user())
+        habit = await engine.create_habit(new_habit())
+        results = await asyncio.gather(*[
+            engine.complete_habit(habit['id'], 'user_1', None, date.today()) for _ in range(10)
+        ])
+        return results, await engine.get_user('user_1')
+
+    results, user = run(scenario())
+    assert sorted(r['status'] for r in results) == ['already_completed'] * 9 + ['completed']
+    assert user['xp'] == 15
+
+
+def test_side_effect_job_leases(engine):
+    async def scenario():
+        jobs = await engine.enqueue_side_effects(
+            [{'kind': 'analytics', 'payload': {'n': n}} for n in range(3)], 0
+        )
+        await asyncio.sleep(0.01)
+        claimed = await engine.claim_side_effects(10, 60)
+        # Leased now, so a second sweep doesn't get them
+        assert await engine.claim_side_effects(10, 60) == []
+
+        await engine.finish_side_effect(jobs[0]['id'])
+        await engine.retry_side_effect(jobs[1]['id'], 1, 'boom', 0)
+        await engine.retry_side_effect(jobs[2]['id'], 5, 'gave up', None)
+        await asyncio.sleep(0.01)
+        return jobs, claimed, await engine.claim_side_effects(10, 60)
+
+    jobs, claimed, retried = run(scenario())
+    assert sorted(job['payload']['n'] for job in claimed) == [0, 1, 2]
+    assert all(job['status'] == 'pending' and job['attempts'] == 0 for job in jobs)
+    assert [(job['id'], job['attempts'], job['last_error']) for job in retried] == [(jobs[1]['id'], 1, 'boom')]
+
+
+def test_state_changes_write_outbox_events(engine):
+    today = date.today()
+
+    async def scenario():
+        await engine.create_user(new_user())
+        yesterday = (today - timedelta(days=1)).isoformat()
+        habit = await engine.create_habit(new_habit(streak=6, best_streak=6, last_completed=yesterday))
+        await engine.record_xp_transaction('user_1', 40, 'manual_award')
+        await engine.complete_habit(habit['id'], 'user_1', None, today)
+        # Same streak again is not a new milestone
+        await engine.update_habit(habit['id'], {'streak': 7})
+        await engine.create_badge_if_not_exists({'name': 'Week Warrior', 'badge_type': 'streak',
+                                                 'requirement': 7, 'icon': '🔥'})
+        badge = await engine.get_badge_by_name('Week Warrior')
+        await engine.create_user_badge('user_1', badge['id'])
+
+        events = await engine.claim_outbox_events(10, 60)
+        leased = await engine.claim_outbox_events(10, 60)
+        await engine.ack_outbox_events([event['id'] for event in events[:2]])
+        return habit, events, leased
+
+    habit, events, leased = run(scenario())
+    events.sort(key=lambda event: str(event['created_at']))
+    assert [(event['event'], event['user_id']) for event in events] == [
+        ('xp_update', 'user_1'), ('streak_milestone', 'user_1'), ('xp_update', 'user_1'),
+        ('xp_update', 'user_1'), ('badge_earned', 'user_1')
+    ]
+    assert [event['payload']['new_total_xp'] for event in events if event['event'] == 'xp_update'] == \
+        [40, 55, 80]
+    assert events[1]['payload'] == {'habit_id': habit['id'], 'habit_title': 'Read',
+                                    'streak': 7, 'milestone': 7}
+    assert events[4]['payload']['badge_name'] == 'Week Warrior'
+    assert events[4]['payload']['badge_icon'] == '🔥'
+    assert leased == []
+
+
+def test_completions_keep_bitmaps_in_step_with_habit_logs(engine):
+    today = date(2026, 3, 10)
+
+    async def scenario():
+        await engine.create_user(new_user())
+        habit = await engine.create_habit(new_habit())
+        other = await engine.create_habit(new_habit(title='Walk'))
+        await engine.complete_habit(habit['id'], 'user_1', None, today)
+        await engine.create_habit_completions([
+            {'habit_id': habit['id'], 'user_id': 'user_1', 'xp_earned': 10, 'notes': None,
+             'completed_at': f'{day.isoformat()}T09:00:00', 'completed_on': day.isoformat()}
+            for day in (today - timedelta(days=1), date(2025, 12, 31), today)
+        ])
+        await engine.create_habit_completion(other['id'], 'user_1', 10, None, today)
+        live = await engine.get_completion_bitmaps(habit['id'])
+        rebuilt = await engine.backfill_completion_bitmaps([habit['id']])
+        return habit, other, live, rebuilt, await engine.get_completion_bitmaps(habit['id']), \
+            await engine.get_completion_bitmaps(other['id'])
+
+    habit, other, live, rebuilt, backfilled, others = run(scenario())
+    assert [row['year'] for row in live] == [2025, 2026]
+    assert rebuilt == 2
+    history = CompletionHistory.from_rows(live)
+    assert history.total() == 3
+    assert history.days(date(2025, 12, 1), today) == [date(2025, 12, 31), date(2026, 3, 9), today]
+    assert history.current_streak(today) == 2
+    assert [decode(row['days']) for row in backfilled] == [decode(row['days']) for row in live]
+    assert CompletionHistory.from_rows(others).days(today, today) == [today]
+
+
+def test_completions_roll_up_into_daily_activity(engine):
+    today = date(2026, 3, 10)
+
+    async def scenario():
+        await engine.create_user(new_user())
+        read = await engine.create_habit(new_habit(difficulty='easy'))
+        walk = await engine.create_habit(new_habit(title='Walk', difficulty='hard'))
+        await engine.complete_habit(read['id'], 'user_1', None, today)
+        await engine.complete_habit(walk['id'], 'user_1', None, today)
+        # A same-day repeat logs nothing, so it adds nothing
+        await engine.complete_habit(walk['id'], 'user_1', None, today)
+        await engine.create_habit_completions([
+            {'habit_id': read['id'], 'user_id': 'user_1', 'xp_earned': 7, 'notes': None,
+             'completed_at': '2026-03-07T09:00:00', 'completed_on': '2026-03-07'}
+        ])
+        return await engine.get_user_activity('user_1', today - timedelta(days=4), today), \
+            await engine.get_user_activity('user_2', today, today)
+
+    activity, nobody = run(scenario())
+    assert [entry['date'] for entry in activity] == [f'2026-03-{day:02d}' for day in range(6, 11)]
+    assert [entry['completions'] for entry in activity] == [0, 1, 0, 0, 2]
+    assert nobody == [{'date': '2026-03-10', 'completions': 0, 'xp_earned': 0}]
+
+
+def test_ledger_awards_roll_up_into_daily_activity(engine):
+    today = date.today()
+
+    async def scenario():
+        await engine.create_user(new_user())
+        habit = await engine.create_habit(new_habit(difficulty='hard'))
+        await engine.complete_habit(habit['id'], 'user_1', None, today)
+        await engine.record_xp_transaction('user_1', 25, 'weekly_streak_bonus')
+        # Awards land on the day they were recorded, wherever the XP came from
+        await engine.record_xp_transaction('user_1', 5, 'quest_reward')
+        return (await engine.get_user_activity('user_1', today, today))[0], await engine.get_user('user_1')
+
+    day, user = run(scenario())
+    assert (day['completions'], day['xp_earned']) == (1, user['total_points'])
+    assert day['xp_earned'] == 20 + 25 + 5
+
+
+def test_decay_streaks_pages_through_broken_streaks(engine):
+    today = date.today()
+    days_ago = lambda n: (today - timedelta(days=n)).isoformat()
+
+    async def scenario():
+        await engine.create_user(new_user())
+        broken = [await engine.create_habit(new_habit(streak=streak, last_completed=days_ago(n)))
+                  for streak, n in [(5, 3), (2, 2), (9, 30)]]
+        kept = [await engine.create_habit(new_habit(streak=streak, last_completed=last))
+                for streak, last in [(3, days_ago(1)), (1, days_ago(0)), (0, days_ago(10)), (0, None)]]
+        cutoff = today - timedelta(days=1)
+        pages, after = [], None
+        while True:
+            page = await engine.decay_streaks(cutoff, after, 2)
+            if page['cursor'] is None:
+                break
+            pages.append(page['reset'])
+            after = page['cursor']
+
+        assert await engine.get_sweep_checkpoint('sweep') is None
+        await engine.save_sweep_checkpoint('sweep', after, False)
+        await engine.save_sweep_checkpoint('sweep', after, True)
+        checkpoint = await engine.get_sweep_checkpoint('sweep')
+        habits = {habit['id']: habit for habit in await engine.get_user_habits('user_1')}
+        return broken, kept, pages, checkpoint, habits
+
+    broken, kept, pages, checkpoint, habits = run(scenario())
+    # SQL pages over broken streaks only, the table engines over every habit;
+    # either way each page resets at most `limit`, in id order
+    assert all(len(page) <= 2 for page in pages)
+    assert sorted(sum(pages, [])) == sorted(habit['id'] for habit in broken)
+    assert sum(pages, []) == sorted(sum(pages, []))
+    assert all(habits[habit['id']]['streak'] == 0 for habit in broken)
+    assert all(habits[habit['id']]['version'] == habit['version'] + 1 for habit in broken)
+    assert [habits[habit['id']]['streak'] for habit in kept] == [3, 1, 0, 0]
+    assert checkpoint['finished'] and checkpoint['cursor'] >= max(sum(pages, []))
+
+
+def test_badges(engine):
+    async def scenario():
+        badge = {'name': 'Week Warrior', 'badge_type': 'streak', 'requirement': 7, 'xp_reward': 25}
+        await engine.create_badge_if_not_exists(badge)
+        await engine.create_badge_if_not_exists(badge)
+        assert len(await engine.get_all_badges()) == 1
+
+        stored = await engine.get_badge_by_name('Week Warrior')
+        assert (await engine.get_badge_by_type_and_requirement('streak', 7))['id'] == stored['id']
+        assert await engine.get_badge_by_type_and_requirement('streak', 30) is None
+
+        assert not await engine.user_has_badge('user_1', stored['id'])
+        await engine.create_user_badge('user_1', stored['id'])
+        assert await engine.user_has_badge('user_1', stored['id'])
+
+        earned = await engine.get_user_badges('user_1')
+        assert [b['badges']['name'] for b in earned] == ['Week Warrior']
+
+    run(scenario())
+
+
+def test_upsert_badges_is_keyed_on_name(engine):
+    async def scenario():
+        badges = [
+            {'name': 'Week Warrior', 'badge_type': 'streak', 'requirement': 7, 'xp_reward': 25},
+            {'name': 'Getting Started', 'badge_type': 'completion', 'requirement': 10, 'xp_reward': 10},
+        ]
+        await engine.upsert_badges(badges)
+        first = await engine.get_badge_by_name('Week Warrior')
+
+        await engine.upsert_badges([{**badges[0], 'xp_reward': 40}, badges[1]])
+        assert len(await engine.get_all_badges()) == 2
+        updated = await engine.get_badge_by_name('Week Warrior')
+        assert updated['id'] == first['id']
+        assert updated['xp_reward'] == 40
+
+    run(scenario())
+
+
+def test_clan_membership_and_contribution(engine):
+    async def scenario():
+        await engine.create_user(new_user())
+        clan = await engine.create_clan({
+            'name': 'Owls', 'owner_id': 'user_1', 'total_xp': 0,
+            'level': 1, 'member_count': 0, 'max_members': 50,
+        })
+
+        member = await engine.join_clan(clan['id'], 'user_1', 'owl')
+        assert member['xp_contributed'] == 0
+        assert (await engine.get_clan(clan['id']))['member_count'] == 1
+        assert (await engine.get_user('user_1'))['clan_id'] == clan['id']
+
+        await engine.increment_clan_xp(clan['id'], 40)
+        await engine.increment_clan_member_contribution(clan['id'], 'user_1', 40)
+        assert (await engine.get_clan(clan['id']))['total_xp'] == 40
+        assert await engine.get_clan_member_contribution(clan['id'], 'user_1') == 40
+        assert await engine.get_clan_member_contribution(clan['id'], 'user_2') == 0
+        assert len(await engine.get_clan_members(clan['id'])) == 1
+
+    run(scenario())
+
+
+def test_create_clan_adds_owner_as_leader(engine):
+    async def scenario():
+        await engine.create_user(new_user(username='owl'))
+        clan = await engine.create_clan_with_owner({'name': 'Owls', 'owner_id': 'user_1', 'max_members': 50})
+        assert (clan['member_count'], clan['total_xp'], clan['level']) == (1, 0, 1)
+
+        members = await engine.get_clan_members(clan['id'])
+        assert [(m['user_id'], m['username'], m['role']) for m in members] == [('user_1', 'owl', 'leader')]
+        assert (await engine.get_user('user_1'))['clan_id'] == clan['id']
+
+    run(scenario())
+
+
+def test_join_and_leave_clan(engine):
+    async def scenario():
+        await engine.create_user(new_user())
+        await engine.create_user(new_user('user_2'))
+        clan = await engine.create_clan_with_owner({'name': 'Owls', 'owner_id': 'user_1', 'max_members': 2})
+
+        member = await engine.join_clan(clan['id'], 'user_2', 'fox')
+        # Joining twice is a no-op that hands back the existing membership
+        assert (await engine.join_clan(clan['id'], 'user_2', 'fox'))['id'] == member['id']
+        assert (await engine.get_clan(clan['id']))['member_count'] == 2
+
+        with pytest.raises(ClanFullError):
+            await engine.join_clan(clan['id'], 'user_3', 'bat')
+        with pytest.raises(ClanNotFoundError):
+            await engine.join_clan('missing', 'user_3', 'bat')
+
+        assert await engine.leave_clan(clan['id'], 'user_2') is True
+        assert await engine.leave_clan(clan['id'], 'user_2') is False
+        assert (await engine.get_clan(clan['id']))['member_count'] == 1
+        assert (await engine.get_user('user_2'))['clan_id'] is None
+
+    run(scenario())
+
+
+@pytest.mark.parametrize('name', ['memory', 'sqlite', 'supabase'])
+def test_concurrent_joins_never_exceed_capacity(name):
+    capacity, applicants = 5, 30
+    # Latency makes the Supabase joins overlap upstream
+    engine = make_engine(name, latency=0.005)
+
+    async def scenario():
+        clan = await engine.create_clan_with_owner({'name': 'Owls', 'owner_id': 'user_0', 'max_members': capacity})
+
+        async def attempt(i):
+            try:
+                await engine.join_clan(clan['id'], f'user_{i}', f'user_{i}')
+                return True
+            except ClanFullError:
+                return False
+
+        joined = await asyncio.gather(*[attempt(i) for i in range(1, applicants + 1)])
+        return clan, joined
+
+    clan, joined = run(scenario())
+    assert sum(joined) == capacity - 1
+
+    async def check():
+        assert (await engine.get_clan(clan['id']))['member_count'] == capacity
+        assert len(await engine.get_clan_members(clan['id'])) == capacity
+
+    run(check())
+
+
+def test_apply_clan_xp_batches(engine):
+    async def scenario():
+        owls = await engine.create_clan({'name': 'Owls', 'owner_id': 'user_1', 'total_xp': 10,
+                                         'level': 1, 'member_count': 0, 'max_members': 50})
+        foxes = await engine.create_clan({'name': 'Foxes', 'owner_id': 'user_3', 'total_xp': 0,
+                                          'level': 1, 'member_count': 0, 'max_members': 50})
+        for clan, user_id in ((owls, 'user_1'), (owls, 'user_2'), (foxes, 'user_3')):
+            await engine.create_user(new_user(user_id))
+            await engine.join_clan(clan['id'], user_id, user_id)
+
+        await engine.apply_clan_xp(
+            {owls['id']: 45, foxes['id']: 5},
+            {(owls['id'], 'user_1'): 30, (owls['id'], 'user_2'): 15, (foxes['id'], 'user_3'): 5}
+        )
+        assert (await engine.get_clan(owls['id']))['total_xp'] == 55
+        assert (await engine.get_clan(foxes['id']))['total_xp'] == 5
+        assert await engine.get_clan_member_contribution(owls['id'], 'user_1') == 30
+        assert await engine.get_clan_member_contribution(owls['id'], 'user_2') == 15
+
+    run(scenario())
+
+
+def test_clan_messages_newest_first(engine):
+    async def scenario():
+        for i in range(5):
+            await engine.create_clan_message({
+                'clan_id': 'clan_1', 'user_id': 'user_1', 'username': 'owl',
+                'message': f'message {i}', 'timestamp': f'2024-01-01T00:00:0{i}',
+            })
+        messages = await engine.get_clan_messages('clan_1', limit=3)
+        assert [m['message'] for m in messages] == ['message 4', 'message 3', 'message 2']
+
+    run(scenario())
+
+
+def test_leaderboards(engine):
+    async def scenario():
+        for i, points in enumerate([30, 10, 50]):
+            await engine.create_user(new_user(f'user_{i}', total_points=points))
+            await engine.create_clan({'name': f'clan {i}', 'owner_id': f'user_{i}', 'total_xp': points,
+                                      'level': 1, 'member_count': 1, 'max_members': 50})
+
+        leaders = await engine.get_leaderboard(limit=2)
+        assert [u['total_points'] for u in leaders] == [50, 30]
+        clans = await engine.get_clan_leaderboard(limit=3)
+        assert [c['total_xp'] for c in clans] == [50, 30, 10]
+
+    run(scenario())
+
+
+def test_projected_reads_return_only_the_requested_columns(engine):
+    async def scenario():
+        await engine.create_user(new_user('user_1', total_points=40, xp=40))
+        await engine.create_user(new_user('user_2', total_points=10, xp=10))
+        await engine.record_xp_transaction('user_1', 25, 'habit_completion')
+        await engine.create_habit(new_habit(streak=3))
+        clan = await engine.create_clan_with_owner({'name': 'Owls', 'owner_id': 'user_1', 'max_members': 50})
+
+        user = await engine.get_user('user_1', ['username', 'xp'])
+        # Uncompacted ledger XP is still folded into a projected read
+        assert user == {'username': 'user_1', 'xp': 65}
+        assert await engine.get_user('user_1', ['email']) == {'email': 'user_1@test.dev'}
+
+        habits = await engine.get_user_habits('user_1', ['title', 'streak'])
+        assert habits == [{'title': 'Read', 'streak': 3}]
+
+        members = await engine.get_clan_members(clan['id'], ['user_id', 'role'])
+        assert members == [{'user_id': 'user_1', 'role': 'leader'}]
+
+        leaders = await engine.get_leaderboard(2, ['clerk_user_id', 'total_points'])
+        assert [set(u) for u in leaders] == [{'clerk_user_id', 'total_points'}] * 2
+        assert [u['clerk_user_id'] for u in leaders] == ['user_1', 'user_2']
+
+    run(scenario())
+
+
+def test_keyset_pages_cover_every_row_once(engine):
+    async def scenario():
+        # Ties on total_points fall back to id so no row straddles a page edge
+        for i, points in enumerate([30, 10, 30, 50, 30, 20, 10]):
+            await engine.create_user(new_user(f'user_{i}', total_points=points))
+        clan = await engine.create_clan_with_owner({'name': 'Owls', 'owner_id': 'user_0', 'max_members': 50})
+        for i in range(1, 7):
+            await engine.join_clan(clan['id'], f'user_{i}', f'owl_{i}')
+            await engine.increment_clan_member_contribution(clan['id'], f'user_{i}', (i % 3) * 10)
+
+        pages, after = [], None
+        while True:
+            page = await engine.get_leaderboard(3, ['clerk_user_id', 'total_points', 'id'], after)
+            pages.append(page)
+            if len(page) < 3:
+                break
+            after = {'total_points': page[-1]['total_points'], 'id': page[-1]['id']}
+        leaders = [row for page in pages for row in page]
+        assert sorted(row['clerk_user_id'] for row in leaders) == [f'user_{i}' for i in range(7)]
+        assert [row['total_points'] for row in leaders] == [50, 30, 30, 30, 20, 10, 10]
+
+        first = await engine.get_clan_members(clan['id'], limit=4)
+        rest = await engine.get_clan_members(
+            clan['id'], limit=4,
+            after={'xp_contributed': first[-1]['xp_contributed'], 'id': first[-1]['id']}
+        )
+        contributions = [m['xp_contributed'] for m in first + rest]
+        assert contributions == sorted(contributions, reverse=True)
+        assert len({m['user_id'] for m in first + rest}) == 7
+
+    run(scenario())
+
+
+def test_discover_public_habits(engine):
+    async def scenario():
+        await engine.create_habit(new_habit(is_public=True, total_completions=5))
+        await engine.create_habit(new_habit(is_public=True, total_completions=9))
+        await engine.create_habit(new_habit(is_public=False, total_completions=20))
+
+        assert len(await engine.get_public_habits(limit=10)) == 2
+        popular = await engine.get_popular_habits(limit=1)
+        assert [h['total_completions'] for h in popular] == [9]
+
+    run(scenario())
+
+
+def test_active_quests_embed_quest_details(engine, seed):
+    async def scenario():
+        quest = await seed('quests', {'title': 'Weekly Warrior', 'quest_type': 'weekly'})
+        await seed('user_quests', {'user_id': 'user_1', 'quest_id': quest['id'],
+                                   'status': 'active', 'progress': 0})
+
+        active = await engine.get_active_quests('user_1')
+        assert active[0]['quests']['title'] == 'Weekly Warrior'
+
+        await engine.update_quest_progress(active[0]['id'], 5)
+        assert (await engine.get_active_quests('user_1'))[0]['progress'] == 5
+
+    run(scenario())
+
+
+def test_xp_ledger_reads_include_pending_until_compacted(engine):
+    async def scenario():
+        await engine.create_user(new_user(xp=150, total_points=150))
+        await engine.create_user(new_user('user_2'))
+
+        user = await engine.record_xp_transaction('user_1', 30, 'habit_completion')
+        assert (user['xp'], user['total_points'], user['level']) == (180, 180, 1)
+        user = await engine.record_xp_transaction('user_1', 70, 'streak_bonus')
+        assert (user['xp'], user['level']) == (250, 2)
+        await engine.record_xp_transaction('user_2', 10, 'habit_completion')
+        assert await engine.record_xp_transaction('missing', 10, 'habit_completion') is None
+
+        # Profiles are untouched until compaction; reads add the pending delta
+        assert [u['total_points'] for u in await engine.get_leaderboard(limit=1)] == [150]
+        assert (await engine.get_user('user_1'))['xp'] == 250
+
+        assert await engine.compact_xp_ledger(batch_size=2) == 2
+        assert await engine.compact_xp_ledger(batch_size=2) == 1
+        assert await engine.compact_xp_ledger(batch_size=2) == 0
+
+        user = await engine.get_user('user_1')
+        assert (user['xp'], user['total_points'], user['level']) == (250, 250, 2)
+        assert 'pending_xp' not in user
+        assert [u['total_points'] for u in await engine.get_leaderboard(limit=1)] == [250]
+        assert (await engine.get_user('user_2'))['xp'] == 10
+
+    run(scenario())
+
+
+def test_versioned_update_rejects_stale_writes(engine):
+    async def scenario():
+        habit = await engine.create_habit(new_habit())
+        version = habit['version']
+
+        updated = await engine.update_habit(habit['id'], {'streak': 1}, expected_version=version)
+        assert updated['version'] == version + 1
+
+        with pytest.raises(StaleWriteError):
+            await engine.update_habit(habit['id'], {'streak': 5}, expected_version=version)
+        assert (await engine.get_habit(habit['id']))['streak'] == 1
+
+        await engine.create_user(new_user())
+        user = await engine.get_user('user_1')
+        with pytest.raises(StaleWriteError):
+            await engine.update_user('user_1', {'xp': 1, 'level': 1}, expected_version=user['version'] + 1)
+
+    run(scenario())
@@ -0,0 +1,236 @@
+"""
+Tests for deadlines, circuit breakers and stale fallbacks
+A scriptable engine stands in for a database that is slow, failing or
+healthy, so each guard can be driven deterministically.
+"""
+
+import asyncio
+
+import httpx
+import postgrest._async.request_builder
+import pytest
+from postgrest.exceptions import APIError
+
+import services.database as database
+from fake_postgrest import FakePostgrest
+from services.database import SupabaseDatabase
+from services.memory_database import InMemoryDatabase
+from services.repository import StaleWriteError
+from services.resilience import (
+    CircuitOpenError, DatabaseUnavailableError, ResilientDatabase, is_transient, stale_scope
+)
+
+
+class FlakyEngine(InMemoryDatabase):
+    """Fails the next `failures` calls with `error`, or hangs when `hang` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.failures = 0
+        self.error = ConnectionError('connection reset')
+        self.hang = False
+        self.calls = 0
+
+    async def _maybe_fail(self):
+        self.calls += 1
+        if self.hang:
+            await asyncio.sleep(10)
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+
+    async def get_leaderboard(self, limit=100, columns=None, after=None):
+        await self._maybe_fail()
+        return await super().get_leaderboard(limit, columns, after)
+
+    async def get_users(self, user_ids):
+        await self._maybe_fail()
+        return await super().get_users(user_ids)
+
+    async def get_user_habits(self, user_id, columns=None, limit=None, after=None):
+        await self._maybe_fail()
+        return await super().get_user_habits(user_id, columns, limit, after)
+
+    async def get_clan_messages(self, clan_id, limit=50):
+        await self._maybe_fail()
+        return await super().get_clan_messages(clan_id, limit)
+
+    async def create_habit(self, habit_data):
+        await self._maybe_fail()
+        return await super().create_habit(habit_data)
+
+
+def resilient(engine, **overrides):
+    options = {'timeout': 0.05, 'retries': 2, 'breaker_threshold': 3, 'breaker_reset': 0.1}
+    return ResilientDatabase(engine, **{**options, **overrides})
+
+
+def test_reads_retry_transient_failures_but_writes_do_not():
+    engine = FlakyEngine()
+    db = resilient(engine)
+
+    async def scenario():
+        engine.failures = 2
+        leaders = await db.get_leaderboard(10)
+        engine.failures = 1
+        with pytest.raises(DatabaseUnavailableError):
+            await db.create_habit({'user_id': 'user_1', 'title': 'Read'})
+        return leaders
+
+    assert asyncio.run(scenario()) == []
+    assert db.stats['retries'] == 2
+    assert engine.calls == 4
+
+
+def test_deadline_and_stale_fallback_with_warning_marker():
+    engine = FlakyEngine()
+    db = resilient(engine, retries=0)
+
+    async def scenario():
+        await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'total_points': 5})
+        fresh = await db.get_leaderboard(10)
+        fresh[0]['rank'] = 1
+        engine.hang = True
+        with stale_scope() as served:
+            stale = await db.get_leaderboard(10)
+        with pytest.raises(DatabaseUnavailableError):
+            # Never read successfully, so there's nothing stale to fall back to
+            await db.get_user_habits('user_1')
+        return stale, served
+
+    stale, served = asyncio.run(scenario())
+    assert [u['clerk_user_id'] for u in stale] == ['user_1']
+    # Decorations on the earlier result don't leak into the kept copy
+    assert 'rank' not in stale[0]
+    assert served == ['get_leaderboard']
+    assert db.stats['timeouts'] == 2
+
+
+def test_breaker_opens_per_table_then_recovers():
+    engine = FlakyEngine()
+    db = resilient(engine, retries=0)
+
+    async def scenario():
+        engine.failures = 3
+        for _ in range(3):
+            with pytest.raises(DatabaseUnavailableError):
+                await db.get_user_habits('user_1')
+        calls = engine.calls
+        with pytest.raises(CircuitOpenError):
+            await db.get_user_habits('user_1')
+        assert engine.calls == calls
+        # Other tables keep their own breaker
+        assert await db.get_leaderboard(10) == []
+        await asyncio.sleep(0.11)
+        # The half-open trial succeeds and closes the circuit
+        assert await db.get_user_habits('user_1') == []
+        return db.metrics()['circuits']
+
+    circuits = asyncio.run(scenario())
+    assert circuits == {'habits': 'closed', 'user_profiles': 'closed'}
+
+
+def test_domain_errors_pass_through_without_tripping_the_breaker():
+    engine = FlakyEngine()
+    engine.error = StaleWriteError('changed')
+    db = resilient(engine, breaker_threshold=1)
+
+    async def scenario():
+        engine.failures = 2
+        for _ in range(2):
+            with pytest.raises(StaleWriteError):
+                await db.get_user_habits('user_1')
+        return db.breaker('habits').state
+
+    assert asyncio.run(scenario()) == 'closed'
+
+
+def test_unavailable_supabase_trips_the_breaker_and_serves_stale(monkeypatch):
+    # The client retries GETs on 503 by itself; don't sleep between those
+    monkeypatch.setattr(postgrest._async.request_builder, 'get_retry_delay', lambda *a: 0)
+    fake = FakePostgrest()
+    fake.seed('user_profiles', [{'clerk_user_id': 'user_1', 'username': 'owl', 'xp': 5, 'total_points': 5,
+                                 'level': 1}])
+    db = resilient(SupabaseDatabase(fake.client()), retries=1, breaker_threshold=2, timeout=1)
+
+    async def scenario():
+        fresh = await db.get_leaderboard(10)
+        fake.outage_status = 503
+        with stale_scope() as served:
+            stale = await db.get_leaderboard(10)
+        with pytest.raises(DatabaseUnavailableError):
+            await db.create_habit({'user_id': 'user_1', 'title': 'Read'})
+        return fresh, stale, served, db.breaker('user_profiles').state
+
+    fresh, stale, served, state = asyncio.run(scenario())
+    assert stale == fresh and served == ['get_leaderboard']
+    assert state == 'open'
+    assert db.stats['retries'] == 1
+
+
+def test_only_outage_api_errors_are_transient():
+    assert is_transient(APIError({'message': 'Bad Gateway', 'code': 502}))
+    assert is_transient(APIError({'message': 'could not connect', 'code': 'PGRST001'}))
+    assert is_transient(APIError({'message': 'canceling statement due to statement timeout', 'code': '57014'}))
+    assert not is_transient(APIError({'message': 'duplicate key value', 'code': '23505'}))
+    assert not is_transient(APIError({'message': 'not found', 'code': 'PGRST116'}))
+    assert not is_transient(APIError({'message': 'no code'}))
+
+
+def test_routes_serve_stale_with_warning_and_503_without(monkeypatch):
+    engine = FlakyEngine()
+    monkeypatch.setattr(database, '_engine', resilient(engine, retries=0))
+
+    async def scenario():
+        from main import app
+
+        await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'xp': 0, 'level': 1})
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            fresh = await client.get('/profile/user_1')
+            engine.failures = 10
+            stale = await client.get('/profile/user_1')
+            messages = await client.get('/api/clans/clan_1/messages')
+        return fresh, stale, messages
+
+    fresh, stale, messages = asyncio.run(scenario())
+    assert 'warning' not in fresh.headers
+    assert stale.status_code == 200
+    assert stale.json()['username'] == 'owl'
+    assert stale.headers['warning'] == '110 - "Response is Stale"'
+    assert messages.status_code == 503
+
+
+def test_shared_leaderboard_reads_keep_the_stale_warning(monkeypatch):
+    from services.leaderboard_snapshot import leaderboard_snapshot
+    from services.single_flight import hot_reads
+
+    engine = FlakyEngine()
+    monkeypatch.setattr(database, '_engine', resilient(engine, retries=0))
+
+    async def scenario():
+        from main import app
+
+        await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'xp': 0, 'level': 1,
+                                  'total_points': 0})
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            fresh = await client.get('/leaderboard/users')
+            hot_reads.clear()
+            leaderboard_snapshot.snapshot = None
+            engine.failures = 10
+            # One caller runs the shared read, the others join it
+            burst = await asyncio.gather(*[client.get('/leaderboard/users') for _ in range(3)])
+            cached_keys = hot_reads.metrics()['cached_keys']
+            engine.failures = 0
+            await asyncio.sleep(0.15)
+            recovered = await client.get('/leaderboard/users')
+        return fresh, burst, cached_keys, recovered
+
+    fresh, burst, cached_keys, recovered = asyncio.run(scenario())
+    assert 'warning' not in fresh.headers
+    assert all(response.headers.get('warning') == '110 - "Response is Stale"' for response in burst)
+    assert all(response.json() == fresh.json() for response in burst)
+    # Neither the micro-cache nor the snapshot held on to the fallback
+    assert cached_keys == 0
+    assert 'warning' not in recovered.headers and recovered.json() == fresh.json()
@@ -0,0 +1,203 @@
+"""
+Tests for the deferred side-effect pipeline
+Completions must return once their core state is written, leaving badge,
+level-up and analytics work to the workers, which retry failures and pick
+up jobs a crashed process left behind.
+"""
+
+import asyncio
+import time
+
+import posthog
+import pytest
+
+import services.database as database
+from config import settings
+from models.badge import BADGE_DEFINITIONS
+from services import side_effects as side_effects_module
+from services.badge_catalog import badge_catalog
+from services.memory_database import InMemoryDatabase
+from services.side_effects import SideEffectPipeline, defer, side_effects
+from services.streak_service import StreakService
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(posthog, 'capture', lambda *a, **k: None)
+    monkeypatch.setattr(settings, 'SIDE_EFFECT_RETRY_BASE_SECONDS', 0.01)
+    engine = InMemoryDatabase()
+    monkeypatch.setattr(database, '_engine', engine)
+    return engine
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """A scratch handler registry, so test handlers don't leak"""
+    registry = dict(side_effects_module.HANDLERS)
+    monkeypatch.setattr(side_effects_module, 'HANDLERS', registry)
+    return registry
+
+
+async def seed_user_near_level_5(engine):
+    await engine.upsert_badges(BADGE_DEFINITIONS)
+    await badge_catalog.refresh()
+    await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'xp': 1190,
+                              'level': 4, 'total_points': 1190, 'clan_id': None})
+    return await engine.create_habit({'user_id': 'user_1', 'title': 'Read', 'difficulty': 'medium',
+                                      'streak': 0, 'best_streak': 0, 'total_completions': 0})
+
+
+def test_completion_returns_before_its_side_effects_run(engine, monkeypatch):
+    level_up = side_effects_module.HANDLERS['level_up']
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_level_up(payload):
+            await release.wait()
+            await level_up(payload)
+
+        monkeypatch.setitem(side_effects_module.HANDLERS, 'level_up', slow_level_up)
+        habit = await seed_user_near_level_5(engine)
+        side_effects.start()
+        started = time.perf_counter()
+        result = await StreakService().complete_habit('user_1', habit['id'])
+        elapsed = time.perf_counter() - started
+
+        pending = sorted(job['kind'] for job in engine.tables['side_effect_jobs'])
+        badges_before = len(engine.tables['user_badges'])
+        release.set()
+        await side_effects.stop()
+        return result, elapsed, pending, badges_before
+
+    result, elapsed, pending, badges_before = asyncio.run(scenario())
+    assert result['xp_earned'] == 15
+    assert elapsed < 0.5
+    assert pending == ['analytics', 'level_up']
+    # The level 5 badge only lands once the deferred job runs
+    assert badges_before == 0
+    assert len(engine.tables['user_badges']) == 1
+    assert engine.tables['side_effect_jobs'] == []
+
+
+def test_failures_are_retried_then_parked_as_dead(engine, handlers):
+    calls = {'flaky': 0, 'broken': 0}
+
+    async def flaky(payload):
+        calls['flaky'] += 1
+        if calls['flaky'] < 3:
+            raise ConnectionError('badge service down')
+
+    async def broken(payload):
+        calls['broken'] += 1
+        raise ValueError('bad payload')
+
+    handlers['flaky'], handlers['broken'] = flaky, broken
+    pipeline = SideEffectPipeline(workers=1, max_attempts=3)
+
+    async def scenario():
+        pipeline.start()
+        async with pipeline.collect():
+            defer('flaky', {})
+            defer('broken', {})
+        while pipeline._retries or pipeline.queue.qsize():
+            await asyncio.sleep(0.01)
+        await pipeline.stop()
+
+    asyncio.run(scenario())
+    assert calls == {'flaky': 3, 'broken': 3}
+    [dead] = engine.tables['side_effect_jobs']
+    assert (dead['kind'], dead['status'], dead['attempts'], dead['last_error']) == ('broken', 'dead', 3, 'bad payload')
+    assert pipeline.stats['completed'] == 1 and pipeline.stats['dead'] == 1
+
+
+def test_jobs_left_by_a_crashed_process_are_recovered(engine, handlers):
+    ran = []
+
+    async def record(payload):
+        ran.append(payload['n'])
+
+    handlers['record'] = record
+
+    async def scenario():
+        # Written by a process that died before running them; their lease is up
+        await engine.enqueue_side_effects([{'kind': 'record', 'payload': {'n': n}} for n in range(5)], 0)
+        pipeline = SideEffectPipeline(workers=2)
+        pipeline.start()
+        await asyncio.sleep(0.05)
+        await pipeline.stop()
+        return pipeline
+
+    pipeline = asyncio.run(scenario())
+    assert sorted(ran) == [0, 1, 2, 3, 4]
+    assert pipeline.stats['recovered'] == 5
+    assert engine.tables['side_effect_jobs'] == []
+
+
+def test_without_workers_effects_run_inline(engine, handlers):
+    ran = []
+
+    async def record(payload):
+        ran.append(payload)
+
+    handlers['record'] = record
+
+    async def scenario():
+        pipeline = SideEffectPipeline()
+        async with pipeline.collect():
+            defer('record', {'n': 1})
+            async with pipeline.collect():
+                defer('record', {'n': 2})
+            assert ran == []
+        with pytest.raises(RuntimeError):
+            defer('record', {'n': 3})
+        with pytest.raises(KeyError):
+            async with pipeline.collect():
+                defer('record', {'n': 4})
+                raise KeyError('request failed')
+
+    asyncio.run(scenario())
+    assert ran == [{'n': 1}, {'n': 2}]
+    assert 'side_effect_jobs' not in engine.tables or engine.tables['side_effect_jobs'] == []
+
+
+def test_failed_enqueue_runs_the_jobs_inline(engine, handlers, monkeypatch):
+    ran = []
+
+    async def record(payload):
+        ran.append(payload['n'])
+
+    async def unavailable(jobs, lease_seconds):
+        raise ConnectionError('side_effect_jobs unreachable')
+
+    handlers['record'] = record
+    monkeypatch.setattr(engine, 'enqueue_side_effects', unavailable)
+    pipeline = SideEffectPipeline(workers=1)
+
+    async def scenario():
+        pipeline.start()
+        # The completion is committed by now; a lost insert mustn't fail it
+        async with pipeline.collect():
+            defer('record', {'n': 1})
+            defer('record', {'n': 2})
+        await pipeline.stop()
+
+    asyncio.run(scenario())
+    assert ran == [1, 2]
+    assert pipeline.stats['inline'] == 2
+
+
+def test_rerun_analytics_job_sends_the_same_event_uuid(engine, monkeypatch):
+    captured = []
+    monkeypatch.setattr(posthog, 'capture', lambda *args, **kwargs: captured.append(kwargs['uuid']))
+
+    async def scenario():
+        [job] = await engine.enqueue_side_effects([{'kind': 'analytics', 'payload': {
+            'user_id': 'user_1', 'event': 'habit_completed', 'properties': {}}}], 0)
+        pipeline = SideEffectPipeline(workers=1)
+        # Run once, then again as if its lease had run out before it was marked done
+        await pipeline._run(job)
+        await pipeline._run(job)
+
+    asyncio.run(scenario())
+    assert len(captured) == 2 and captured[0] == captured[1]
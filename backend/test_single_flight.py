@@ -0,0 +1,113 @@
+"""
+Tests for single-flight coalescing of hot reads
+Concurrent identical calls must share one upstream call, and the result is
+reused only for the micro-cache TTL.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import services.database as database
+from fake_postgrest import FakePostgrest
+from services.database import SupabaseDatabase
+from services.memory_database import InMemoryDatabase
+from services.single_flight import SingleFlight, hot_reads
+
+
+class Upstream:
+    def __init__(self, delay=0.01, error=None):
+        self.calls = 0
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {'call': self.calls}
+
+
+def flights(monkeypatch, ttl):
+    monkeypatch.setattr(database, '_engine', InMemoryDatabase())
+    return SingleFlight(ttl=ttl)
+
+
+def test_concurrent_identical_calls_share_one_upstream_call(monkeypatch):
+    single = flights(monkeypatch, ttl=0)
+    upstream = Upstream()
+
+    async def scenario():
+        results = await asyncio.gather(*[single.run('key', upstream) for _ in range(100)])
+        other = await single.run('other', upstream)
+        # ttl=0 only coalesces; a later call goes upstream again
+        again = await single.run('key', upstream)
+        return results, other, again
+
+    results, other, again = asyncio.run(scenario())
+    assert all(result is results[0] for result in results)
+    assert other == {'call': 2} and again == {'call': 3}
+    assert single.stats == {'upstream': 3, 'joined': 99, 'cached': 0}
+
+
+def test_micro_cache_expires_and_failures_are_not_kept(monkeypatch):
+    single = flights(monkeypatch, ttl=0.05)
+    failing = Upstream(error=ConnectionError('down'))
+    upstream = Upstream()
+
+    async def scenario():
+        outcomes = await asyncio.gather(*[single.run('key', failing) for _ in range(3)],
+                                        return_exceptions=True)
+        first = await single.run('key', upstream)
+        cached = await single.run('key', upstream)
+        await asyncio.sleep(0.06)
+        return outcomes, first, cached, await single.run('key', upstream)
+
+    outcomes, first, cached, expired = asyncio.run(scenario())
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+    assert failing.calls == 1
+    assert first is cached and expired == {'call': 2}
+
+
+def test_a_cancelled_caller_leaves_the_shared_call_running(monkeypatch):
+    single = flights(monkeypatch, ttl=0)
+    upstream = Upstream(delay=0.02)
+
+    async def scenario():
+        leaver = asyncio.ensure_future(single.run('key', upstream))
+        stayer = asyncio.ensure_future(single.run('key', upstream))
+        await asyncio.sleep(0)
+        leaver.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaver
+        return await stayer
+
+    assert asyncio.run(scenario()) == {'call': 1}
+
+
+def test_clan_leaderboard_burst_costs_one_set_of_queries(monkeypatch):
+    fake = FakePostgrest(latency=0.005)
+    engine = SupabaseDatabase(fake.client())
+    monkeypatch.setattr(database, '_engine', engine)
+    hot_reads.clear()
+
+    async def scenario():
+        from main import app
+
+        for n in range(3):
+            clan = await engine.create_clan({'name': f'clan_{n}', 'total_xp': n, 'owner_id': f'user_{n}',
+                                              'member_count': 0, 'max_members': 50})
+            await engine.join_clan(clan['id'], f'user_{n}', f'user_{n}')
+        fake.request_count = 0
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            responses = await asyncio.gather(*[client.get('/leaderboard/clans?limit=10') for _ in range(50)])
+        return responses
+
+    responses = asyncio.run(scenario())
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.text for response in responses}) == 1
+    # One clan query plus one top-contributors query per clan
+    assert fake.request_count == 1 + 3
@@ -0,0 +1,135 @@
+"""
+Tests for the nightly streak decay sweep
+Broken streaks must be reset chunk by chunk at no more than the configured
+rate, and a sweep cut short must pick up from its last checkpoint.
+"""
+
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from services.database import Database
+from services.memory_database import InMemoryDatabase
+from services.streak_decay import StreakDecaySweeper
+
+TODAY = date(2026, 3, 10)
+
+
+class Flaky(InMemoryDatabase):
+    """Fails the decay_streaks call after `chunks` successful ones"""
+
+    def __init__(self, chunks: int):
+        super().__init__()
+        self.chunks = chunks
+
+    async def decay_streaks(self, cutoff, after, limit):
+        if self.chunks == 0:
+            raise ConnectionError('database went away')
+        self.chunks -= 1
+        return await super().decay_streaks(cutoff, after, limit)
+
+
+async def seed(engine, broken: int):
+    for n in range(broken):
+        await engine.create_habit({'user_id': 'user_1', 'title': f'Habit {n}', 'streak': n + 1,
+                                   'last_completed': (TODAY - timedelta(days=2 + n % 5)).isoformat()})
+    # Completed yesterday, so today's completion still extends it
+    return await engine.create_habit({'user_id': 'user_1', 'title': 'Kept', 'streak': 4,
+                                      'last_completed': (TODAY - timedelta(days=1)).isoformat()})
+
+
+def streaks(engine):
+    return [habit['streak'] for habit in engine.tables['habits']]
+
+
+def test_sweep_resets_broken_streaks_in_chunks():
+    engine = InMemoryDatabase()
+    sweeper = StreakDecaySweeper(Database(engine), chunk_size=4, max_rows_per_second=0)
+
+    async def scenario():
+        kept = await seed(engine, 10)
+        return kept, await sweeper.sweep(TODAY), await sweeper.sweep(TODAY)
+
+    kept, first, again = asyncio.run(scenario())
+    assert (first['rows'], first['chunks'], first['cutoff']) == (10, 3, '2026-03-09')
+    assert first['rows_per_second'] > 0 and not first['resumed']
+    # Already done tonight
+    assert (again['rows'], again['chunks']) == (0, 0)
+    assert streaks(engine) == [0] * 10 + [4]
+    assert engine.tables['sweep_checkpoints'][0]['finished'] is True
+    assert sweeper.metrics()['rows'] == 10 and sweeper.metrics()['sweeps'] == 1
+
+
+def test_interrupted_sweep_resumes_from_its_checkpoint():
+    engine = Flaky(chunks=2)
+    sweeper = StreakDecaySweeper(Database(engine), chunk_size=3, max_rows_per_second=0)
+
+    async def scenario():
+        await seed(engine, 10)
+        with pytest.raises(ConnectionError):
+            await sweeper.sweep(TODAY)
+        done = sum(streak == 0 for streak in streaks(engine))
+        engine.chunks = -1
+        return done, await sweeper.sweep(TODAY)
+
+    done, resumed = asyncio.run(scenario())
+    # Two chunks of three habits went through before the failure, the kept one maybe among them
+    assert done in (5, 6)
+    assert resumed['resumed'] and (resumed['rows'], resumed['chunks']) == (10 - done, 2)
+    assert streaks(engine) == [0] * 10 + [4]
+
+
+def test_each_chunk_reads_only_its_page():
+    class Counting(InMemoryDatabase):
+        read = 0
+
+        async def _select(self, table, filters=None, **kwargs):
+            rows = await super()._select(table, filters, **kwargs)
+            Counting.read += len(rows) if table == 'habits' else 0
+            return rows
+
+        async def _select_after(self, table, column, after, limit, filters=None):
+            rows = await super()._select_after(table, column, after, limit, filters)
+            Counting.read += len(rows)
+            return rows
+
+    engine = Counting()
+    sweeper = StreakDecaySweeper(Database(engine), chunk_size=5, max_rows_per_second=0)
+
+    async def scenario():
+        await seed(engine, 49)
+        Counting.read = 0
+        return await sweeper.sweep(TODAY)
+
+    result = asyncio.run(scenario())
+    assert (result['rows'], result['chunks']) == (49, 10)
+    # One pass over the 50 habits, not one per chunk
+    assert Counting.read == 50
+
+
+def test_sweep_is_paced_to_the_row_limit():
+    engine = InMemoryDatabase()
+    sweeper = StreakDecaySweeper(Database(engine), chunk_size=5, max_rows_per_second=200)
+
+    async def scenario():
+        await seed(engine, 20)
+        return await sweeper.sweep(TODAY)
+
+    result = asyncio.run(scenario())
+    assert result['rows'] == 20
+    # 20 rows at 200/s take at least 0.1s
+    assert result['seconds'] >= 0.1 and result['rows_per_second'] <= 200
+
+
+def test_negative_hour_disables_the_nightly_loop():
+    async def scenario():
+        disabled = StreakDecaySweeper(Database(InMemoryDatabase()), hour=-1)
+        disabled.start()
+        nightly = StreakDecaySweeper(Database(InMemoryDatabase()), hour=23)
+        nightly.start()
+        started = nightly.running
+        await nightly.stop()
+        return disabled.running, started, nightly.running
+
+    assert asyncio.run(scenario()) == (False, True, False)
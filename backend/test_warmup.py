@@ -0,0 +1,69 @@
+"""
+Tests for the startup warm-up
+One run must seed the badges in a single call and leave the badge catalog,
+quest definitions and leaderboard snapshot loaded.
+"""
+
+import asyncio
+
+import services.database as database
+from models.badge import BADGE_DEFINITIONS
+from services.badge_catalog import badge_catalog
+from services.leaderboard_snapshot import leaderboard_snapshot
+from services.memory_database import InMemoryDatabase
+from services.quest_catalog import quest_definitions
+from services.warmup import STEPS, warm_up
+
+
+class CountingEngine(InMemoryDatabase):
+    def __init__(self):
+        super().__init__()
+        self.calls = {'upsert_badges': 0, 'create_badge_if_not_exists': 0, 'get_leaderboard': 0}
+
+    async def upsert_badges(self, badges):
+        self.calls['upsert_badges'] += 1
+        return await super().upsert_badges(badges)
+
+    async def create_badge_if_not_exists(self, badge_data):
+        self.calls['create_badge_if_not_exists'] += 1
+        return await super().create_badge_if_not_exists(badge_data)
+
+    async def get_leaderboard(self, limit=100, columns=None):
+        self.calls['get_leaderboard'] += 1
+        return await super().get_leaderboard(limit, columns)
+
+
+def test_warm_up_seeds_and_loads_everything(monkeypatch):
+    engine = CountingEngine()
+    monkeypatch.setattr(database, '_engine', engine)
+
+    async def scenario():
+        await engine._insert('user_profiles', {'clerk_user_id': 'user_1', 'username': 'a',
+                                               'total_points': 10, 'level': 1, 'xp': 10})
+        timings = await warm_up()
+        # Seeding twice must not duplicate the catalog
+        await warm_up()
+        top = await leaderboard_snapshot.top(10)
+        return timings, top
+
+    timings, top = asyncio.run(scenario())
+    assert set(timings) == set(STEPS)
+    assert engine.calls['upsert_badges'] == 2
+    assert engine.calls['create_badge_if_not_exists'] == 0
+    assert len(badge_catalog.snapshot.badges) == len(BADGE_DEFINITIONS)
+    # Served from the snapshot the warm-up loaded
+    assert engine.calls['get_leaderboard'] == 2
+    assert [user['clerk_user_id'] for user in top] == ['user_1']
+    assert quest_definitions('weekly')[0]['title'] == 'Weekly Warrior'
+
+
+def test_failing_step_does_not_stop_the_rest(monkeypatch):
+    class Broken(CountingEngine):
+        async def upsert_badges(self, badges):
+            raise ConnectionError('database unreachable')
+
+    engine = Broken()
+    monkeypatch.setattr(database, '_engine', engine)
+    timings = asyncio.run(warm_up())
+    assert set(timings) == set(STEPS)
+    assert engine.calls['get_leaderboard'] == 1
@@ -0,0 +1,48 @@
+"""
+Tests for the XP ledger compactor
+Awards only append to xp_transactions; the compactor must fold every entry
+into user_profiles exactly once, including on shutdown.
+"""
+
+import asyncio
+
+from services.database import Database
+from services.memory_database import InMemoryDatabase
+from services.xp_ledger import XPLedgerCompactor
+
+
+async def seeded_engine(awards: int) -> InMemoryDatabase:
+    engine = InMemoryDatabase()
+    await engine.create_user({'clerk_user_id': 'user_1', 'username': 'owl', 'email': 'owl@test.dev',
+                              'xp': 0, 'level': 1, 'total_points': 0})
+    for _ in range(awards):
+        await engine.record_xp_transaction('user_1', 10, 'habit_completion')
+    return engine
+
+
+def test_compact_drains_every_batch():
+    async def scenario():
+        engine = await seeded_engine(awards=25)
+        compactor = XPLedgerCompactor(Database(engine), batch_size=10)
+        assert await compactor.compact() == 25
+        assert await compactor.compact() == 0
+        return engine
+
+    engine = asyncio.run(scenario())
+    profile = engine.tables['user_profiles'][0]
+    assert (profile['xp'], profile['total_points'], profile['level']) == (250, 250, 2)
+    assert all(entry['compacted_at'] for entry in engine.tables['xp_transactions'])
+
+
+def test_stop_flushes_pending_entries():
+    async def scenario():
+        engine = await seeded_engine(awards=0)
+        compactor = XPLedgerCompactor(Database(engine), batch_size=10, interval=60)
+        compactor.start()
+        await asyncio.sleep(0)
+        await engine.record_xp_transaction('user_1', 40, 'habit_completion')
+        await compactor.stop()
+        return engine
+
+    engine = asyncio.run(scenario())
+    assert engine.tables['user_profiles'][0]['xp'] == 40